@@ -3,3 +3,4 @@ Constants for locking behaviors, like advisory locking in Postgres, and mutexes
 """
 TREE_LOCK = 1001
 TASK_LOCK = 1002
+CHANGES_LOCK = 1003
@@ -88,6 +88,24 @@ def advisory_lock(key1, key2=None, shared=False):
         pass
 
 
+@contextmanager
+def session_advisory_lock(key1, key2=None):
+    """
+    Creates a session level advisory lock that blocks until ready, for the duration of the context,
+    so that it can be held across transactions
+
+    :param key1: int
+    :param key2: int
+    """
+    with execute_lock(key1, key2=key2, session=True):
+        pass
+    try:
+        yield
+    finally:
+        with execute_lock(key1, key2=key2, session=True, unlock=True):
+            pass
+
+
 def try_advisory_lock(key1, key2=None, shared=False):
     """
     Creates a transaction level advisory lock that doesn't block
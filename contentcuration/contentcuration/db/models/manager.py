@@ -3,10 +3,15 @@ import logging as logger
 import time
 import uuid
 
+from django.db import connection
 from django.db import transaction
+from django.db.models import AutoField
+from django.db.models import F
 from django.db.models import Manager
 from django.db.models import Q
+from django.db.models.functions import Coalesce
 from django.db.utils import OperationalError
+from django.utils import timezone
 from django_cte import CTEQuerySet
 from le_utils.constants import content_kinds
 from mptt.managers import TreeManager
@@ -34,6 +39,14 @@ logging = logger.getLogger(__name__)
 # topology also, so these rudimentary tests are likely insufficient
 BATCH_SIZE = 100
 
+# SQL for a random version 4 UUID as the 32 hex digits that UUIDField stores, as Postgres 12
+# has no function to generate one without an extension. The seed is a column that is
+# unique to each row, in case two rows get the same random values.
+RANDOM_UUID_SQL = (
+    "overlay(overlay(md5(random()::text || clock_timestamp()::text || {seed}) placing '4' from 13) "
+    "placing substr('89ab', floor(random() * 4)::int + 1, 1) from 17)"
+)
+
 
 class CustomManager(Manager.from_queryset(CTEQuerySet)):
     """
@@ -193,6 +206,33 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 for k, v in values.items():
                     setattr(node, k, v)
 
+    def build_child_nodes(self, parent, nodes):
+        """
+        Sets the mptt fields of new nodes without descendants so that they become the
+        last children of parent, in the order given, and makes space for them in the
+        tree with a single update, rather than one for each node as `insert_node` would.
+        This must be called while the tree of parent is locked, and the nodes must then
+        be bulk created.
+        """
+        if not nodes:
+            return nodes
+        opts = self.model._mptt_meta
+        self._mptt_refresh(parent)
+        tree_id = getattr(parent, opts.tree_id_attr)
+        cursor = getattr(parent, opts.right_attr)
+        level = getattr(parent, opts.level_attr) + 1
+        for node in nodes:
+            node.parent_id = parent.id
+            setattr(node, opts.tree_id_attr, tree_id)
+            setattr(node, opts.level_attr, level)
+            setattr(node, opts.left_attr, cursor)
+            setattr(node, opts.right_attr, cursor + 1)
+            cursor += 2
+        size = cursor - getattr(parent, opts.right_attr)
+        self._create_space(size, getattr(parent, opts.right_attr) - 1, tree_id)
+        setattr(parent, opts.right_attr, cursor)
+        return nodes
+
     def move_node(self, node, target, position="last-child"):
         """
         Vendored from mptt - by default mptt moves then saves
@@ -216,6 +256,8 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         ``MPTTMeta.order_insertion_by``.  In most cases you should just
         move the node yourself by setting node.parent.
         """
+        from contentcuration.utils.node_aggregates import track_subtree_move
+
         old_parent = node.parent
         with self.lock_mptt(node.tree_id, target.tree_id):
             # Call _mptt_refresh to ensure that the mptt fields on
@@ -226,7 +268,8 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             self._mptt_refresh(node, target)
             # N.B. this only calls save if we are running inside a
             # delay MPTT updates context
-            self._move_node(node, target, position=position)
+            with track_subtree_move(node.pk):
+                self._move_node(node, target, position=position)
             node.save(skip_lock=True)
         node_moved.send(
             sender=node.__class__, instance=node, target=target, position=position,
@@ -268,6 +311,15 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             "suggested_duration": source.suggested_duration,
         }
 
+    def _get_allowed_mods(self, mods, fields, can_edit_source_channel):
+        """
+        :return: A dict of the mods to those of the fields that are allowed to be overridden
+        """
+        if not isinstance(mods, dict):
+            return {}
+        allowed_keys = EDIT_ALLOWED_OVERRIDES if can_edit_source_channel else ALLOWED_OVERRIDES
+        return {key: value for key, value in mods.items() if key in fields and key in allowed_keys}
+
     def _clone_node(
         self, source, parent_id, source_channel_id, can_edit_source_channel, pk, mods
     ):
@@ -290,11 +342,7 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
 
         copy.update(self.get_source_attributes(source))
 
-        if isinstance(mods, dict):
-            allowed_keys = EDIT_ALLOWED_OVERRIDES if can_edit_source_channel else ALLOWED_OVERRIDES
-            for key, value in mods.items():
-                if key in copy and key in allowed_keys:
-                    copy[key] = value
+        copy.update(self._get_allowed_mods(mods, copy, can_edit_source_channel))
 
         # There might be some legacy nodes that don't have these, so ensure they are added
         if (
@@ -357,6 +405,9 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             nodes_to_copy = nodes_to_copy.difference(excluded_descendants)
         return nodes_to_copy
 
+    def count_nodes_to_copy(self, node, excluded_descendants=None):
+        return self._all_nodes_to_copy(node, excluded_descendants).count()
+
     def copy_node(
         self,
         node,
@@ -376,10 +427,24 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             batch_size = BATCH_SIZE
         source_channel_id = node.get_channel_id()
 
-        total_nodes = self._all_nodes_to_copy(node, excluded_descendants).count()
+        total_nodes = self.count_nodes_to_copy(node, excluded_descendants)
         if progress_tracker:
             progress_tracker.set_total(total_nodes)
 
+        if self._can_sql_copy(node, excluded_descendants):
+            copied_nodes = self._sql_copy(
+                node,
+                target,
+                position,
+                source_channel_id,
+                pk,
+                mods,
+                can_edit_source_channel,
+            )
+            if progress_tracker:
+                progress_tracker.increment(total_nodes)
+            return copied_nodes
+
         return self._copy(
             node,
             target,
@@ -596,6 +661,8 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         excluded_descendants,
         can_edit_source_channel,
     ):
+        from contentcuration.utils.node_aggregates import subtree_created
+
         # lock mptt source tree with shared advisory lock
         with self.lock_mptt(node.tree_id, shared_tree_ids=[node.tree_id]):
             nodes_to_copy = list(self._all_nodes_to_copy(node, excluded_descendants))
@@ -635,9 +702,417 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 data, target=target, position=position
             )
             new_nodes = self.bulk_create(nodes_to_create)
+            # The nodes are bulk created, so their descendant counts are not stored by `save`
+            subtree_created(data["id"])
         if target:
             self.filter(pk=target.pk).update(changed=True)
 
         self._copy_associated_objects(source_copy_id_map)
 
         return new_nodes
+
+    def _can_sql_copy(self, node, excluded_descendants):
+        """
+        Whether a subtree can be copied by `_sql_copy`, which cannot leave out excluded descendants
+        """
+        return not excluded_descendants
+
+    def _get_legacy_original_channel_ids(self, node):
+        """
+        Legacy nodes without an original channel get the channel of the tree of their
+        original node, or of their own tree, as `_clone_node` does through `get_original_node`
+
+        :return: A dict of the tree ids of the original nodes of the legacy nodes in the subtree
+                 of node to the ids of their channels
+        """
+        tree_ids = (
+            node.get_descendants(include_self=True)
+            .filter(original_channel_id__isnull=True)
+            .annotate(original_tree_id=Coalesce("original_node__tree_id", "tree_id"))
+            .order_by()
+            .values_list("original_tree_id", flat=True)
+            .distinct()
+        )
+        channel_ids = {}
+        for tree_id in tree_ids:
+            root = self.filter(tree_id=tree_id, parent_id__isnull=True).first()
+            channel = root.get_channel() if root else None
+            channel_ids[tree_id] = channel.id if channel else None
+        return channel_ids
+
+    def _copy_columns(self, model, expressions, alias):
+        """
+        :param expressions: A dict of column names to SQL expressions, and lists of their params,
+                            for the columns that are not copied from the row being copied
+        :return: A tuple of the list of columns of the model, without its auto primary key, the
+                 list of SQL expressions that copy a row of it, aliased as alias, and their params
+        """
+        qn = connection.ops.quote_name
+        columns = []
+        selects = []
+        params = []
+        for field in model._meta.concrete_fields:
+            if field.column not in expressions and isinstance(field, AutoField):
+                continue
+            columns.append(qn(field.column))
+            if field.column in expressions:
+                select, select_params = expressions[field.column]
+                selects.append(select)
+                params.extend(select_params)
+            else:
+                selects.append("{}.{}".format(alias, qn(field.column)))
+        return columns, selects, params
+
+    def _get_copy_position(self, node, target, position):
+        """
+        Works out where a copy of node goes, as `build_tree_nodes` does
+        :return: A tuple of the tree_id, parent_id, level and left value of the copy of node
+        """
+        if not target:
+            return self._get_next_tree_id(), None, 0, 1
+        if position in ("left", "right"):
+            lft = target.lft if position == "left" else target.rght + 1
+            return target.tree_id, target.parent_id, target.level, lft
+        lft = target.lft + 1 if position == "first-child" else target.rght
+        return target.tree_id, target.id, target.level + 1, lft
+
+    def _create_copy_map(self, cursor, copy_map, node, pk):
+        """
+        Creates the temporary table copy_map, which maps the nodes of the subtree of node to the
+        ids and node_ids of their copies, and which is dropped at the end of the transaction
+        """
+        node_table = connection.ops.quote_name(self.model._meta.db_table)
+        copy_id = "CASE WHEN s.id = %s THEN %s ELSE {} END".format(RANDOM_UUID_SQL.format(seed="s.id")) if pk else (
+            RANDOM_UUID_SQL.format(seed="s.id")
+        )
+        cursor.execute(
+            "CREATE TEMPORARY TABLE {copy_map} ON COMMIT DROP AS "
+            "SELECT s.id AS source_id, {copy_id} AS copy_id, {copy_node_id} AS copy_node_id "
+            "FROM {node_table} s WHERE s.tree_id = %s AND s.lft >= %s AND s.rght <= %s".format(
+                copy_map=copy_map,
+                copy_id=copy_id,
+                copy_node_id=RANDOM_UUID_SQL.format(seed="s.node_id"),
+                node_table=node_table,
+            ),
+            ([node.id, pk] if pk else []) + [node.tree_id, node.lft, node.rght],
+        )
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY (source_id)".format(copy_map))
+        cursor.execute("ANALYZE {}".format(copy_map))
+
+    def _sql_copy_related(self, cursor, copy_map, now):
+        """
+        Copies the files, assessment items and tags of the nodes in copy_map to their copies
+        :return: The set of ids of the users who uploaded the copied files
+        """
+        from contentcuration.models import AssessmentItem
+        from contentcuration.models import ContentTag
+        from contentcuration.models import File
+
+        qn = connection.ops.quote_name
+        file_table = qn(File._meta.db_table)
+        assessment_item_table = qn(AssessmentItem._meta.db_table)
+        file_id = (RANDOM_UUID_SQL.format(seed="f.id"), [])
+        file_modified = ("%s", [File._meta.get_field("modified").get_db_prep_save(now, connection)])
+
+        # Copy the files of the nodes
+        columns, selects, params = self._copy_columns(
+            File, {"id": file_id, "contentnode_id": ("m.copy_id", []), "modified": file_modified}, "f"
+        )
+        cursor.execute(
+            "INSERT INTO {file_table} ({columns}) SELECT {selects} FROM {file_table} f "
+            "INNER JOIN {copy_map} m ON m.source_id = f.contentnode_id RETURNING uploaded_by_id".format(
+                file_table=file_table, columns=", ".join(columns), selects=", ".join(selects), copy_map=copy_map,
+            ),
+            params,
+        )
+        uploaded_by_ids = {row[0] for row in cursor.fetchall()}
+
+        # Copy the assessment items of the nodes, and then their files, matching the copies
+        # of the assessment items by their node and assessment_id, which are unique together
+        columns, selects, params = self._copy_columns(AssessmentItem, {"contentnode_id": ("m.copy_id", [])}, "a")
+        cursor.execute(
+            "INSERT INTO {assessment_item_table} ({columns}) SELECT {selects} FROM {assessment_item_table} a "
+            "INNER JOIN {copy_map} m ON m.source_id = a.contentnode_id".format(
+                assessment_item_table=assessment_item_table,
+                columns=", ".join(columns),
+                selects=", ".join(selects),
+                copy_map=copy_map,
+            ),
+            params,
+        )
+        columns, selects, params = self._copy_columns(
+            File, {"id": file_id, "assessment_item_id": ("ac.id", []), "modified": file_modified}, "f"
+        )
+        cursor.execute(
+            "INSERT INTO {file_table} ({columns}) SELECT {selects} FROM {file_table} f "
+            "INNER JOIN {assessment_item_table} a ON a.id = f.assessment_item_id "
+            "INNER JOIN {copy_map} m ON m.source_id = a.contentnode_id "
+            "INNER JOIN {assessment_item_table} ac ON ac.contentnode_id = m.copy_id AND ac.assessment_id = a.assessment_id "
+            "RETURNING uploaded_by_id".format(
+                file_table=file_table,
+                assessment_item_table=assessment_item_table,
+                columns=", ".join(columns),
+                selects=", ".join(selects),
+                copy_map=copy_map,
+            ),
+            params,
+        )
+        uploaded_by_ids.update(row[0] for row in cursor.fetchall())
+
+        # Copy the tags of the nodes, replacing channel tags with tags without a channel,
+        # which are created for any tag names that do not have one yet, as `_copy_tags` does
+        tag_table = qn(ContentTag._meta.db_table)
+        node_tag_table = qn(self.model.tags.through._meta.db_table)
+        cursor.execute(
+            "INSERT INTO {tag_table} (id, tag_name, channel_id) "
+            "SELECT {tag_id}, t.tag_name, NULL FROM (SELECT DISTINCT t.tag_name FROM {node_tag_table} nt "
+            "INNER JOIN {copy_map} m ON m.source_id = nt.contentnode_id "
+            "INNER JOIN {tag_table} t ON t.id = nt.contenttag_id WHERE t.channel_id IS NOT NULL) t "
+            "WHERE NOT EXISTS (SELECT 1 FROM {tag_table} e WHERE e.channel_id IS NULL AND e.tag_name = t.tag_name)".format(
+                tag_table=tag_table,
+                tag_id=RANDOM_UUID_SQL.format(seed="t.tag_name"),
+                node_tag_table=node_tag_table,
+                copy_map=copy_map,
+            ),
+        )
+        cursor.execute(
+            "INSERT INTO {node_tag_table} (contentnode_id, contenttag_id) "
+            "SELECT DISTINCT m.copy_id, CASE WHEN t.channel_id IS NULL THEN t.id ELSE ("
+            "SELECT e.id FROM {tag_table} e WHERE e.channel_id IS NULL AND e.tag_name = t.tag_name ORDER BY e.id LIMIT 1"
+            ") END FROM {node_tag_table} nt "
+            "INNER JOIN {copy_map} m ON m.source_id = nt.contentnode_id "
+            "INNER JOIN {tag_table} t ON t.id = nt.contenttag_id".format(
+                node_tag_table=node_tag_table, tag_table=tag_table, copy_map=copy_map,
+            ),
+        )
+        uploaded_by_ids.discard(None)
+        return uploaded_by_ids
+
+    def _get_original_joins(self, node):
+        """
+        Joins the nodes being copied, aliased as s, to their original nodes, aliased as o, and legacy nodes
+        without an original channel or node to the channels of their original nodes
+        :return: A tuple of the joins, their params, and the SQL expression of the original channel id of the copies
+        """
+        node_table = connection.ops.quote_name(self.model._meta.db_table)
+        legacy_channel_ids = self._get_legacy_original_channel_ids(node)
+        original_joins = "LEFT OUTER JOIN {node_table} o ON o.id = s.original_node_id".format(node_table=node_table)
+        if not legacy_channel_ids:
+            return original_joins, [], "s.original_channel_id"
+        original_joins += " LEFT OUTER JOIN unnest(%s::integer[], %s::varchar[]) AS oc(tree_id, channel_id) " \
+            "ON oc.tree_id = COALESCE(o.tree_id, s.tree_id)"
+        original_join_params = [list(legacy_channel_ids.keys()), list(legacy_channel_ids.values())]
+        return original_joins, original_join_params, "COALESCE(s.original_channel_id, oc.channel_id)"
+
+    def _sql_copy(
+        self,
+        node,
+        target,
+        position,
+        source_channel_id,
+        pk,
+        mods,
+        can_edit_source_channel,
+    ):
+        """
+        Copies the whole subtree of node to the target with a single INSERT ... SELECT, which
+        sets the ids, tree and mptt fields of the copies in SQL, and then copies their files,
+        assessment items and tags with a few set based statements, rather than creating and
+        copying nodes in batches through Python as `_copy` does.
+        The same fields are set on the copies as `_clone_node` sets.
+        """
+        from contentcuration.utils.node_aggregates import subtree_created
+        from contentcuration.utils.user import calculate_user_storage
+
+        qn = connection.ops.quote_name
+        opts = self.model._mptt_meta
+        node_table = qn(self.model._meta.db_table)
+        copy_map = qn("contentnode_copy_{}".format(uuid.uuid4().hex))
+        now = timezone.now()
+
+        target_tree_id = target.tree_id if target else None
+        if target_tree_id == node.tree_id:
+            lock = self.lock_mptt(target_tree_id)
+        else:
+            lock = self.lock_mptt(target_tree_id, node.tree_id, shared_tree_ids=[node.tree_id])
+
+        with transaction.atomic(), lock, connection.cursor() as cursor:
+            self._mptt_refresh(*(n for n in (node, target) if n))
+            size = node.rght - node.lft + 1
+            tree_id, parent_id, level, lft = self._get_copy_position(node, target, position)
+            self._create_copy_map(cursor, copy_map, node, pk)
+
+            if target:
+                self._create_space(size, lft - 1, tree_id)
+
+            # Space made in the tree of the subtree shifts the nodes after it, so shift them back
+            # to get the offsets of the nodes in the subtree
+            def position_sql(column):
+                if tree_id == node.tree_id:
+                    return (
+                        "CASE WHEN s.{column} > %s THEN s.{column} - %s ELSE s.{column} END - %s + %s".format(column=column),
+                        [lft - 1, size, node.lft, lft],
+                    )
+                return "s.{} - %s + %s".format(column), [node.lft, lft]
+
+            original_joins, original_join_params, original_channel_id = self._get_original_joins(node)
+
+            expressions = {
+                "id": ("m.copy_id", []),
+                "original_channel_id": (original_channel_id, []),
+                "original_source_node_id": ("COALESCE(s.original_source_node_id, o.node_id, s.node_id)", []),
+                "node_id": ("m.copy_node_id", []),
+                "parent_id": ("COALESCE(p.copy_id, %s)", [parent_id]),
+                "tree_id": ("%s", [tree_id]),
+                opts.left_attr: position_sql(opts.left_attr),
+                opts.right_attr: position_sql(opts.right_attr),
+                opts.level_attr: ("s.{} - %s + %s".format(opts.level_attr), [node.level, level]),
+                "cloned_source_id": ("s.id", []),
+                "source_channel_id": ("%s", [source_channel_id]),
+                "source_node_id": ("s.node_id", []),
+                "freeze_authoring_data": ("s.freeze_authoring_data" if can_edit_source_channel else "TRUE", []),
+                "changed": ("TRUE", []),
+                "published": ("FALSE", []),
+            }
+            # Any other fields that are not copied get their defaults
+            copied_fields = {"aggregator", "complete"}
+            copied_fields.update(self.get_source_attributes(node))
+            template = self.model()
+            for field in self.model._meta.concrete_fields:
+                if field.column not in expressions and field.attname not in copied_fields:
+                    expressions[field.column] = ("%s", [
+                        field.get_db_prep_save(field.pre_save(template, True), connection)
+                    ])
+
+            columns, selects, params = self._copy_columns(self.model, expressions, "s")
+            cursor.execute(
+                "INSERT INTO {node_table} ({columns}) SELECT {selects} FROM {node_table} s "
+                "INNER JOIN {copy_map} m ON m.source_id = s.id "
+                "LEFT OUTER JOIN {copy_map} p ON p.source_id = s.parent_id {original_joins}".format(
+                    node_table=node_table,
+                    columns=", ".join(columns),
+                    selects=", ".join(selects),
+                    copy_map=copy_map,
+                    original_joins=original_joins,
+                ),
+                params + original_join_params,
+            )
+
+            cursor.execute("SELECT copy_id FROM {} WHERE source_id = %s".format(copy_map), [node.id])
+            root_id = cursor.fetchone()[0]
+            root_mods = self._get_allowed_mods(mods, set(self.get_source_attributes(node)) | {"node_id", "aggregator"}, can_edit_source_channel)
+            if root_mods:
+                self.filter(pk=root_id).update(**root_mods)
+
+            # The nodes are inserted in SQL, so their descendant counts are not stored by `save`
+            subtree_created(root_id)
+
+            uploaded_by_ids = self._sql_copy_related(cursor, copy_map, now)
+
+            cursor.execute("DROP TABLE {}".format(copy_map))
+
+        if target:
+            self.filter(pk=target.pk).update(changed=True)
+
+        # The files are inserted in SQL, so the storage used by their uploaders is not updated by
+        # `save`. As the copies have the checksums of the files they copy, there is nothing to add
+        # to it until it is calculated again, as their channels may have changed.
+        for user_id in uploaded_by_ids:
+            calculate_user_storage(user_id)
+
+        return [self.get(pk=root_id)]
+
+    def _copy_chunk_node(self, node_copy, node, target, position, pk, mods, batch_size):
+        """
+        Copies node to the target, with its whole subtree if it fits in a batch, and records it
+        in the checkpoints of node_copy
+
+        :type node_copy: contentcuration.models.ContentNodeCopy
+        :return: The number of nodes copied
+        """
+        from contentcuration.models import ContentNodeCopyMapping
+
+        excluded_descendants = node_copy.excluded_descendants
+        children_copied = node.rght - node.lft < batch_size
+        if not children_copied:
+            node_copy_root = self._shallow_copy(
+                node, target, position, node_copy.source_channel_id, pk, mods, node_copy.can_edit_source_channel,
+            )
+            count = 1
+        elif self._can_sql_copy(node, excluded_descendants):
+            node_copy_root = self._sql_copy(
+                node, target, position, node_copy.source_channel_id, pk, mods, node_copy.can_edit_source_channel,
+            )[0]
+            count = (node_copy_root.rght - node_copy_root.lft + 1) // 2
+        else:
+            new_nodes = self._deep_copy(
+                node,
+                target,
+                position,
+                node_copy.source_channel_id,
+                pk,
+                mods,
+                excluded_descendants,
+                node_copy.can_edit_source_channel,
+            )
+            node_copy_root = new_nodes[0]
+            count = len(new_nodes)
+        ContentNodeCopyMapping.objects.create(
+            node_copy=node_copy, source_id=node.id, copy_id=node_copy_root.id, children_copied=children_copied,
+        )
+        return count
+
+    def copy_node_chunk(self, node_copy, batch_size=None):
+        """
+        Copies the next chunk of about batch_size nodes of a copy that is done in chunks, in a
+        single transaction with the checkpoints of the nodes it copies, so that a copy that is
+        stopped continues after the last chunk that was committed.
+        Nodes with subtrees that fit in a batch are copied with their subtrees, and the children
+        of larger nodes are copied by the following chunks, in order, after their parents.
+
+        :type node_copy: contentcuration.models.ContentNodeCopy
+        :return: The number of nodes copied, which is 0 once the copy is done
+        """
+        from contentcuration.models import ContentNodeCopy
+
+        if batch_size is None:
+            batch_size = BATCH_SIZE
+
+        with transaction.atomic():
+            # Lock the copy so that it is never copied by two processes at once
+            node_copy = ContentNodeCopy.objects.select_for_update().get(pk=node_copy.pk)
+            source = self.get(pk=node_copy.source_node_id)
+            target = self.get(pk=node_copy.target_id)
+            if target.tree_id == source.tree_id:
+                lock = self.lock_mptt(target.tree_id)
+            else:
+                lock = self.lock_mptt(target.tree_id, source.tree_id, shared_tree_ids=[source.tree_id])
+
+            with lock:
+                mappings = node_copy.mappings.all()
+                if not mappings.exists():
+                    copied = self._copy_chunk_node(
+                        node_copy, source, target, node_copy.position, node_copy.id, node_copy.mods, batch_size
+                    )
+                else:
+                    copied = 0
+                    for mapping in mappings.filter(children_copied=False).order_by("id"):
+                        if copied >= batch_size:
+                            break
+                        parent_copy = self.get(pk=mapping.copy_id)
+                        children = (
+                            self.filter(parent_id=mapping.source_id)
+                            .exclude(pk__in=mappings.values("source_id"))
+                            .order_by("lft")
+                        )
+                        if node_copy.excluded_descendants:
+                            children = children.exclude(node_id__in=node_copy.excluded_descendants.keys())
+                        for child in children:
+                            if copied >= batch_size:
+                                break
+                            copied += self._copy_chunk_node(node_copy, child, parent_copy, "last-child", None, None, batch_size)
+                        else:
+                            mappings.filter(pk=mapping.pk).update(children_copied=True)
+
+                ContentNodeCopy.objects.filter(pk=node_copy.pk).update(copied=F("copied") + copied)
+        return copied
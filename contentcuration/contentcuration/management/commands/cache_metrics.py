@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from contentcuration.utils.cache import cache_metrics
+from contentcuration.utils.cache import CacheNamespace
+
+
+class Command(BaseCommand):
+    """
+    Prints the hits, misses, latencies, sets, evictions and early recomputations counted for
+    each cache namespace by all processes. With --reset, the counts are cleared afterwards.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", dest="reset", default=False)
+
+    def handle(self, *args, **options):
+        namespaces = sorted(CacheNamespace.namespaces)
+        metrics = cache_metrics.get(namespaces)
+
+        for namespace in namespaces:
+            counts = metrics[namespace]
+            hits = counts.get("hits", 0)
+            misses = counts.get("misses", 0)
+            sets = counts.get("sets", 0)
+            gets = hits + misses
+            self.stdout.write(
+                "{}: {} hits, {} misses ({:.1%} hit rate), {:.2f}ms per get, {} sets, {:.2f}ms per computation, "
+                "{} evictions, {} early recomputations".format(
+                    namespace,
+                    hits,
+                    misses,
+                    hits / gets if gets else 0,
+                    1000 * counts.get("get_time", 0) / gets if gets else 0,
+                    sets,
+                    1000 * counts.get("compute_time", 0) / sets if sets else 0,
+                    counts.get("evictions", 0),
+                    counts.get("recomputes", 0),
+                )
+            )
+
+        if options["reset"]:
+            cache_metrics.reset(namespaces)
@@ -0,0 +1,62 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
+from contentcuration.utils.node_aggregates import compute_aggregates
+from contentcuration.utils.node_aggregates import get_stored_aggregates
+from contentcuration.utils.node_aggregates import rebuild_aggregates
+
+
+logger = logging.getLogger(__name__)
+
+TREE_FIELDS = ("main_tree_id", "staging_tree_id", "chef_tree_id", "trash_tree_id", "previous_tree_id")
+
+
+class Command(BaseCommand):
+    """
+    Compares the stored descendant counts of the topics in the trees of channels with their
+    actual descendants, and reports the topics whose counts are incorrect or not stored.
+    With --fix, the counts of all the topics in those trees are counted again and stored.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--channel-id", action="append", dest="channel_ids", default=None)
+        parser.add_argument("--fix", action="store_true", dest="fix", default=False)
+
+    def handle(self, *args, **options):
+        channels = Channel.objects.filter(deleted=False)
+        if options["channel_ids"]:
+            channels = Channel.objects.filter(pk__in=options["channel_ids"])
+
+        total_incorrect = 0
+        total_missing = 0
+        for channel_id, *tree_ids in channels.values_list("id", *TREE_FIELDS).iterator():
+            for root in ContentNode.objects.filter(pk__in=[tree_id for tree_id in tree_ids if tree_id]).values(
+                "id", "tree_id", "lft", "rght"
+            ):
+                position = dict(tree_id=root["tree_id"], lft=root["lft"], rght=root["rght"])
+                aggregates, _ = compute_aggregates(**position)
+                stored = get_stored_aggregates(**position)
+                incorrect = [topic_id for topic_id, counts in aggregates.items() if stored.get(topic_id, counts) != counts]
+                missing = [topic_id for topic_id in aggregates if topic_id not in stored]
+                if not incorrect and not missing:
+                    continue
+                total_incorrect += len(incorrect)
+                total_missing += len(missing)
+                logger.info(
+                    "Tree {} of channel {} has {} topics with incorrect counts and {} topics without counts".format(
+                        root["id"], channel_id, len(incorrect), len(missing)
+                    )
+                )
+                for topic_id in incorrect:
+                    logger.debug("Topic {} counts {}, stored {}".format(topic_id, aggregates[topic_id], stored[topic_id]))
+                if options["fix"]:
+                    rebuild_aggregates(root["id"])
+
+        self.stdout.write(
+            "Found {} topics with incorrect counts and {} topics without counts{}".format(
+                total_incorrect, total_missing, ", which have been stored" if options["fix"] else ""
+            )
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from contentcuration.utils.cache import CacheNamespace
+
+
+class Command(BaseCommand):
+    """
+    Invalidates all the cached values of the given versioned cache namespaces, such as
+    node_details after a change to what ContentNode.get_details returns.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("namespaces", nargs="+", type=str)
+
+    def handle(self, *args, **options):
+        for name in options["namespaces"]:
+            namespace = CacheNamespace.namespaces.get(name)
+            if namespace is None or not namespace.versioned:
+                raise CommandError("{} is not a versioned cache namespace".format(name))
+            namespace.invalidate()
+            self.stdout.write("Invalidated cache namespace {}".format(name))
@@ -0,0 +1,33 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import Channel
+from contentcuration.utils.channel_summary import update_channel_summary
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Computes and stores the summaries that channels are listed with, for all channels that are not
+    deleted, or for the given channels.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--channel-id", action="append", dest="channel_ids", default=None)
+
+    def handle(self, *args, **options):
+        channels = Channel.objects.filter(deleted=False)
+        if options["channel_ids"]:
+            channels = Channel.objects.filter(pk__in=options["channel_ids"])
+
+        count = 0
+        for channel_id in channels.values_list("id", flat=True).iterator():
+            if update_channel_summary(channel_id) is not None:
+                count += 1
+            else:
+                logger.info("Channel {} has no main tree to summarize".format(channel_id))
+
+        self.stdout.write("Stored the summaries of {} channels".format(count))
@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import Channel
+from contentcuration.utils.node_details import update_node_details
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Computes and stores the details of the topics of the main trees of all channels that are not
+    deleted, or of the given channels.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--channel-id", action="append", dest="channel_ids", default=None)
+
+    def handle(self, *args, **options):
+        channels = Channel.objects.filter(deleted=False)
+        if options["channel_ids"]:
+            channels = Channel.objects.filter(pk__in=options["channel_ids"])
+
+        count = 0
+        topic_count = 0
+        for channel_id in channels.values_list("id", flat=True).iterator():
+            topics = update_node_details(channel_id, force=True)
+            if topics is not None:
+                count += 1
+                topic_count += topics
+            else:
+                logger.info("Channel {} has no main tree to store the details of".format(channel_id))
+
+        self.stdout.write("Stored the details of {} topics of {} channels".format(topic_count, count))
@@ -0,0 +1,37 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import ContentNodeCopy
+from contentcuration.utils.node_copy import enqueue_copy
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Enqueues the tasks that continue the chunked copies of nodes that have not finished, such as
+    those of workers that were stopped before their tasks could be run again.
+    With --include-errored, copies that stopped because of an error are continued as well.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--include-errored", action="store_true", dest="include_errored", default=False)
+
+    def handle(self, *args, **options):
+        node_copies = ContentNodeCopy.objects.select_related("created_by").order_by("created")
+        if not options["include_errored"]:
+            node_copies = node_copies.filter(errored=False)
+
+        count = 0
+        for node_copy in node_copies:
+            if node_copy.created_by is None:
+                logger.warning("Skipping copy {} as it has no user to run its task".format(node_copy.id))
+                continue
+            if node_copy.errored:
+                ContentNodeCopy.objects.filter(pk=node_copy.pk).update(errored=False)
+            enqueue_copy(node_copy)
+            count += 1
+
+        self.stdout.write("Enqueued {} copies to be continued".format(count))
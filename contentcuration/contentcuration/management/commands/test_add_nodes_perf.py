@@ -0,0 +1,94 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from le_utils.constants import content_kinds
+
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
+from contentcuration.models import File
+from contentcuration.perftools.benchmark import benchmark
+from contentcuration.views.internal import convert_data_to_nodes
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Adds batches of increasing numbers of nodes to a new topic of the main tree of a channel, as "
+        "ricecooker does through api_add_nodes_to_tree, and reports the performance results. "
+        "(Usage: test_add_nodes_perf <channel_id> [--batch-sizes=10,100,1000] [--num-runs=3])\n"
+        "The nodes are resources with a copy of the first default file in the main tree of the channel, or "
+        "topics if it has none. They are created inside a transaction that is rolled back, which blocks "
+        "updates to the tree until the command is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("channel_id", type=str)
+        parser.add_argument("--batch-sizes", type=str, default="10,100,1000")
+        parser.add_argument("--num-runs", type=int, default=3)
+
+    def _node_data(self, sample_file):
+        node_id = uuid.uuid4().hex
+        node_data = {
+            "title": "Node {}".format(node_id),
+            "node_id": node_id,
+            "content_id": uuid.uuid4().hex,
+            "description": "",
+            "author": "",
+            "kind": content_kinds.TOPIC,
+            "license": None,
+            "license_description": None,
+            "copyright_holder": "",
+            "tags": ["perf"],
+            "files": [],
+            "questions": [],
+            "extra_fields": "{}",
+            "role": "learner",
+        }
+        if sample_file:
+            node_data.update({
+                "kind": sample_file.contentnode.kind_id,
+                "license": sample_file.contentnode.license.license_name if sample_file.contentnode.license else None,
+                "copyright_holder": "Copyright holder",
+                "files": [
+                    {
+                        "size": sample_file.file_size,
+                        "preset": sample_file.preset_id,
+                        "filename": sample_file.filename(),
+                        "original_filename": sample_file.original_filename,
+                        "language": sample_file.language_id,
+                        "source_url": None,
+                    }
+                ],
+            })
+        return node_data
+
+    def handle(self, *args, **options):
+        channel = Channel.objects.select_related("main_tree").get(pk=options["channel_id"])
+        user = channel.editors.first()
+        sample_file = (
+            File.objects.filter(
+                contentnode__tree_id=channel.main_tree.tree_id,
+                preset__supplementary=False,
+            )
+            .exclude(contentnode__kind_id=content_kinds.EXERCISE)
+            .select_related("contentnode__license")
+            .first()
+        )
+
+        with transaction.atomic():
+            for batch_size in map(int, options["batch_sizes"].split(",")):
+
+                def setup():
+                    topic = ContentNode.objects.create(
+                        parent=channel.main_tree, kind_id=content_kinds.TOPIC, title="Perf test topic"
+                    )
+                    return topic, [self._node_data(sample_file) for _ in range(batch_size)]
+
+                def add_nodes(args):
+                    topic, content_data = args
+                    convert_data_to_nodes(user, content_data, topic.id)
+
+                stats = benchmark(add_nodes, num_runs=options["num_runs"], num_items=batch_size, setup=setup)
+                self.stdout.write("Stats for adding a batch of {} nodes: {}".format(batch_size, stats))
+            transaction.set_rollback(True)
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from contentcuration.perftools.benchmark import benchmark
+from contentcuration.utils.cache import CacheNamespace
+
+
+FILLER_KEY = "invalidation_perf_filler:{}"
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Fills the cache with keyspaces of increasing sizes and reports how long it takes to invalidate "
+        "a cache namespace by incrementing its generation, and by deleting its keys by pattern. "
+        "(Usage: test_cache_invalidation_perf [--sizes 1000 10000 100000] [--keys=100] [--runs=5])\n"
+        "Note that this requires a Redis cache, and should not be run against a production server, "
+        "as the pattern deletes walk its whole keyspace."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--keys", type=int, default=100)
+        parser.add_argument("--runs", type=int, default=5)
+
+    def _fill(self, start, end):
+        for batch_start in range(start, end, BATCH_SIZE):
+            cache.set_many({FILLER_KEY.format(i): i for i in range(batch_start, min(batch_start + BATCH_SIZE, end))})
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, "delete_pattern"):
+            raise CommandError("The cache does not support deleting keys by pattern, it must be a Redis cache")
+
+        namespace = CacheNamespace("invalidation_perf", versioned=True)
+
+        def fill_namespace():
+            for i in range(options["keys"]):
+                namespace.set(i, i)
+
+        filled = 0
+        try:
+            for size in sorted(options["sizes"]):
+                self._fill(filled, size)
+                filled = size
+
+                stats = benchmark(namespace.invalidate, num_runs=options["runs"])
+                self.stdout.write("Stats for invalidating by generation with {} keys: {}".format(size, stats))
+
+                stats = benchmark(
+                    lambda _: cache.delete_pattern("invalidation_perf:*"),
+                    num_runs=options["runs"],
+                    setup=fill_namespace,
+                )
+                self.stdout.write("Stats for invalidating by pattern with {} keys: {}".format(size, stats))
+        finally:
+            cache.delete_pattern("invalidation_perf*")
+            cache.delete(namespace.generation_key)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from contentcuration.db.models.manager import BATCH_SIZE
+from contentcuration.models import ContentNode
+from contentcuration.perftools.benchmark import benchmark
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Copies the subtree of a node to the end of the main tree of its channel, or of a target node, "
+        "by copying nodes in batches through Python and with SQL, and reports the performance results. "
+        "(Usage: test_copy_perf <node_id> [--target-id=<node_id>] [--num-runs=3] [--batch-size=100])\n"
+        "Note that the copies are created inside a transaction that is rolled back, which blocks updates "
+        "to the target tree until the command is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("node_id", type=str)
+        parser.add_argument("--target-id", type=str, default=None)
+        parser.add_argument("--num-runs", type=int, default=3)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        node = ContentNode.objects.get(pk=options["node_id"])
+        target = ContentNode.objects.get(pk=options["target_id"]) if options["target_id"] else node.get_root()
+        num_nodes = node.get_descendant_count() + 1
+        source_channel_id = node.get_channel_id()
+
+        def batched_copy():
+            ContentNode.objects._copy(
+                node, target, "last-child", source_channel_id, None, None, None, True, options["batch_size"]
+            )
+
+        def sql_copy():
+            ContentNode.objects._sql_copy(node, target, "last-child", source_channel_id, None, None, True)
+
+        for name, copy in (("in batches of {}".format(options["batch_size"]), batched_copy), ("with SQL", sql_copy)):
+            with transaction.atomic():
+                stats = benchmark(copy, num_runs=options["num_runs"], num_items=num_nodes)
+                transaction.set_rollback(True)
+            self.stdout.write("Stats for copying {} nodes {}: {}".format(num_nodes, name, stats))
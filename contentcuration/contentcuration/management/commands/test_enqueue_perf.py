@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from contentcuration.models import User
+from contentcuration.perftools.benchmark import calc_stats
+from contentcuration.tasks import apply_channel_changes_task
+from contentcuration.utils.celery.tasks import TaskSignatureRegistry
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Calls fetch_or_enqueue for the change tasks of a user's channels from concurrent threads, as sync posts do, "
+        "and reports the latency of the calls, with the Redis signature registry and with only the database. "
+        "(Usage: test_enqueue_perf <email> [--threads=10] [--posts=20] [--channels=5])\n"
+        "Note that this enqueues real tasks to apply the changes of the channels, which have no effect if the "
+        "channels have no unapplied changes, so it should be run against a test server with a running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", type=str)
+        parser.add_argument("--threads", type=int, default=10)
+        parser.add_argument("--posts", type=int, default=20)
+        parser.add_argument("--channels", type=int, default=5)
+
+    def _post(self, user, channel_ids):
+        try:
+            start = time.time()
+            for channel_id in channel_ids:
+                apply_channel_changes_task.fetch_or_enqueue(user, channel_id=channel_id)
+            return time.time() - start
+        finally:
+            connection.close()
+
+    def _benchmark(self, user, channel_ids, options):
+        with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+            run_times = list(
+                executor.map(lambda _: self._post(user, channel_ids), range(options["threads"] * options["posts"]))
+            )
+        return calc_stats(run_times, num_items=len(channel_ids))
+
+    def handle(self, *args, **options):
+        user = User.objects.get(email=options["email"])
+        channel_ids = list(user.editable_channels.filter(deleted=False).values_list("id", flat=True)[:options["channels"]])
+
+        stats = self._benchmark(user, channel_ids, options)
+        self.stdout.write("Stats for enqueueing the tasks of {} channels per post with the registry: {}".format(len(channel_ids), stats))
+
+        with patch.object(TaskSignatureRegistry, "redis_client", None):
+            stats = self._benchmark(user, channel_ids, options)
+        self.stdout.write("Stats for enqueueing the tasks of {} channels per post with the database: {}".format(len(channel_ids), stats))
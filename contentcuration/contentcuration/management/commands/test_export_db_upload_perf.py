@@ -0,0 +1,139 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.utils.gcs_storage import GoogleCloudStorage
+
+
+MB = 1024 * 1024
+
+
+class LocalWriter(object):
+    """
+    Writes to a local file in chunks of chunk_size, holding at most one chunk in memory,
+    as the writer of a resumable upload to GCS does.
+    """
+
+    def __init__(self, path, chunk_size):
+        self.file = open(path, "wb")
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.file.write(self.buffer[:self.chunk_size])
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def close(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalBlob(object):
+    """
+    A blob of a local fake bucket, with the methods of a GCS blob that GoogleCloudStorage uses.
+    """
+
+    cache_control = None
+    content_encoding = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, mode="rb", chunk_size=None, **kwargs):
+        if mode == "wb":
+            return LocalWriter(self.path, chunk_size)
+        return open(self.path, "rb", buffering=chunk_size or -1)
+
+    def upload_from_file(self, fobj, **kwargs):
+        with open(self.path, "wb") as f:
+            shutil.copyfileobj(fobj, f)
+
+    def download_to_file(self, fobj):
+        with open(self.path, "rb") as f:
+            shutil.copyfileobj(f, fobj)
+
+
+class LocalClient(object):
+    def get_bucket(self, name):
+        return None
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Creates SQLite databases of increasing sizes and reports the time and peak memory it takes to upload "
+        "them as content databases to a local fake bucket through GoogleCloudStorage, and to compress them "
+        "whole in memory, as they used to be before being uploaded. "
+        "(Usage: test_export_db_upload_perf [--sizes 10 50 200])\n"
+        "The sizes are in MB. The peak memory only includes the memory allocated by Python."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+
+    def _create_database(self, path, size):
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE content (id INTEGER PRIMARY KEY, data BLOB)")
+        for _ in range(size):
+            # half random bytes, so that the database does not compress to nothing
+            connection.executemany(
+                "INSERT INTO content (data) VALUES (?)", ((os.urandom(512) + bytes(512),) for _ in range(1024))
+            )
+        connection.commit()
+        connection.close()
+
+    def _measure(self, func):
+        tracemalloc.start()
+        start = time.time()
+        try:
+            func()
+            return time.time() - start, tracemalloc.get_traced_memory()[1] / MB
+        finally:
+            tracemalloc.stop()
+
+    def handle(self, *args, **options):
+        storage = GoogleCloudStorage(client=LocalClient())
+        directory = tempfile.mkdtemp()
+        try:
+            for size in sorted(options["sizes"]):
+                path = os.path.join(directory, "{}.sqlite3".format(size))
+                self._create_database(path, size)
+                blob = LocalBlob(os.path.join(directory, "uploaded.sqlite3"))
+
+                def upload():
+                    with open(path, "rb") as f:
+                        storage.save("content/databases/{}.sqlite3".format(size), f, blob_object=blob)
+
+                def compress_in_memory():
+                    with open(path, "rb") as f:
+                        gzip.compress(f.read())
+
+                def download():
+                    with storage.open("content/databases/{}.sqlite3".format(size), blob_object=blob) as f, open(os.devnull, "wb") as null:
+                        shutil.copyfileobj(f, null)
+
+                size_mb = os.path.getsize(path) / MB
+                for name, func in (("streaming upload", upload), ("in memory compression", compress_in_memory), ("download", download)):
+                    run_time, peak = self._measure(func)
+                    self.stdout.write(
+                        "{} of a {:.1f}MB database: {:.2f}s, peak memory {:.1f}MB".format(name.capitalize(), size_mb, run_time, peak)
+                    )
+                os.remove(path)
+        finally:
+            shutil.rmtree(directory)
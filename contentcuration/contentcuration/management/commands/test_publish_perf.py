@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from kolibri_content.router import using_content_database
+
+from contentcuration.models import Channel
+from contentcuration.perftools.benchmark import benchmark
+from contentcuration.utils.publish import BatchedTreeMapper
+from contentcuration.utils.publish import TreeMapper
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Maps the main tree of a channel to a Kolibri export database with each tree mapper and reports the performance results. "
+        "(Usage: test_publish_perf <channel_id> [--num-runs=3])\n"
+        "Note that exercises which are changed or have no exercise file get new Perseus files, as during a publish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("channel_id", type=str)
+        parser.add_argument("--num-runs", type=int, default=3)
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def _create_database(self):
+        fh, tempdb = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fh)
+        with using_content_database(tempdb):
+            call_command("migrate", "content", database=tempdb, no_input=True, verbosity=0)
+        return tempdb
+
+    def _delete_database(self, tempdb):
+        if tempdb in connections.databases:
+            connections[tempdb].close()
+            del connections.databases[tempdb]
+        os.remove(tempdb)
+
+    def handle(self, *args, **options):
+        channel = Channel.objects.select_related("main_tree", "language").get(pk=options["channel_id"])
+        num_nodes = channel.main_tree.get_descendant_count() + 1
+
+        mappers = [("TreeMapper", TreeMapper, {}), ("BatchedTreeMapper", BatchedTreeMapper, {})]
+        if options["batch_size"]:
+            mappers[1][2]["batch_size"] = options["batch_size"]
+
+        for name, mapper_class, kwargs in mappers:
+            def map_nodes(tempdb):
+                with using_content_database(tempdb):
+                    mapper_class(
+                        channel.main_tree,
+                        channel.language,
+                        channel.id,
+                        channel.name,
+                        **kwargs
+                    ).map_nodes()
+
+            self.stdout.write("Mapping {} nodes with {} over {} runs".format(num_nodes, name, options["num_runs"]))
+            stats = benchmark(
+                map_nodes,
+                num_runs=options["num_runs"],
+                num_items=num_nodes,
+                setup=self._create_database,
+                teardown=self._delete_database,
+            )
+            self.stdout.write("Stats for {}: {}".format(name, stats))
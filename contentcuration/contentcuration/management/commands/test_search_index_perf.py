@@ -0,0 +1,44 @@
+import random
+
+from django.core.management.base import BaseCommand
+from search.indexing import update_contentnode_tsvectors
+
+from contentcuration.models import Channel
+from contentcuration.perftools.benchmark import benchmark
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Reports the throughput of updating the tsvectors of the nodes of a channel's main tree for batches of "
+        "random nodes of increasing sizes, as edits to them are indexed, and for the whole tree at once. "
+        "(Usage: test_search_index_perf <channel_id> [--batch-sizes 10 100 1000] [--runs=5])\n"
+        "The tsvectors are recomputed from the current state of the nodes, so this leaves the search index "
+        "of the channel up to date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("channel_id", type=str)
+        parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        channel = Channel.objects.select_related("main_tree").get(pk=options["channel_id"])
+        node_ids = list(channel.main_tree.get_descendants(include_self=True).values_list("id", flat=True))
+
+        for batch_size in options["batch_sizes"]:
+            batch_size = min(batch_size, len(node_ids))
+            stats = benchmark(
+                lambda batch: update_contentnode_tsvectors(channel.id, batch),
+                num_runs=options["runs"],
+                num_items=batch_size,
+                setup=lambda: random.sample(node_ids, batch_size),
+            )
+            self.stdout.write("Stats for indexing batches of {} nodes: {}".format(batch_size, stats))
+
+        stats = benchmark(
+            lambda: update_contentnode_tsvectors(channel.id, [], subtree_ids=[channel.main_tree.id]),
+            num_runs=options["runs"],
+            num_items=len(node_ids),
+        )
+        self.stdout.write("Stats for indexing the whole tree of {} nodes: {}".format(len(node_ids), stats))
@@ -0,0 +1,63 @@
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from contentcuration.models import User
+from contentcuration.perftools.benchmark import benchmark
+from contentcuration.utils.change_feed import channel_rev_key
+from contentcuration.utils.change_feed import get_latest_revs
+from contentcuration.utils.change_feed import user_rev_key
+from contentcuration.viewsets.sync.endpoint import SyncView
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Polls the sync endpoint for increasing numbers of a user's channels, with no new changes to return, "
+        "and reports the performance results, with the latest revs cached and with the cache cleared before each poll. "
+        "(Usage: test_sync_perf <email> [--channel-counts=1,10,50,100] [--num-runs=20])"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", type=str)
+        parser.add_argument("--channel-counts", type=str, default="1,10,50,100")
+        parser.add_argument("--num-runs", type=int, default=20)
+
+    def _poll(self, user, channel_revs, user_rev):
+        request = APIRequestFactory().post(
+            "/api/sync/",
+            {"changes": [], "channel_revs": channel_revs, "user_rev": user_rev},
+            format="json",
+        )
+        force_authenticate(request, user=user)
+        request.session = SessionStore()
+        response = SyncView.as_view()(request)
+        if response.status_code != 200:
+            raise RuntimeError("Sync request failed with status {}".format(response.status_code))
+
+    def handle(self, *args, **options):
+        user = User.objects.get(email=options["email"])
+        channel_ids = list(user.editable_channels.filter(deleted=False).values_list("id", flat=True))
+
+        for count in map(int, options["channel_counts"].split(",")):
+            if count > len(channel_ids):
+                self.stdout.write("Skipping {} channels, user only has {}".format(count, len(channel_ids)))
+                continue
+            # Poll as a client that is up to date with all of its channels
+            channel_revs, user_rev = get_latest_revs(channel_ids[:count], user_id=user.id)
+            keys = [channel_rev_key(channel_id) for channel_id in channel_revs] + [user_rev_key(user.id)]
+
+            def poll():
+                self._poll(user, channel_revs, user_rev)
+
+            stats = benchmark(poll, num_runs=options["num_runs"])
+            self.stdout.write("Stats for polling {} channels with cached revs: {}".format(count, stats))
+
+            stats = benchmark(
+                lambda _: poll(),
+                num_runs=options["num_runs"],
+                setup=lambda: cache.delete_many(keys),
+            )
+            self.stdout.write("Stats for polling {} channels without cached revs: {}".format(count, stats))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from le_utils.constants import content_kinds
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeAggregate
+from contentcuration.perftools.benchmark import benchmark
+from contentcuration.utils.node_aggregates import rebuild_aggregates
+from contentcuration.viewsets.contentnode import ContentNodeViewSet
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Lists the children of the largest topic at each level of the main tree of a channel through the "
+        "ContentNodeViewSet, and reports the performance results, with the descendant counts of the topics "
+        "read from the stored counts and with them counted for every request. "
+        "(Usage: test_topic_list_perf <channel_id> [--num-runs=20])\n"
+        "Note that this stores the counts of all the topics of the main tree first, and that the stored counts are "
+        "deleted inside a transaction that is rolled back, which blocks updates to them until the command is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("channel_id", type=str)
+        parser.add_argument("--num-runs", type=int, default=20)
+
+    def _list_children(self, user, parent_id):
+        request = APIRequestFactory().get("/api/contentnode/", {"parent": parent_id})
+        force_authenticate(request, user=user)
+        response = ContentNodeViewSet.as_view({"get": "list"})(request)
+        if response.status_code != 200:
+            raise RuntimeError("List request failed with status {}".format(response.status_code))
+
+    def _benchmark_levels(self, user, topics, label, num_runs):
+        for topic in topics:
+            stats = benchmark(
+                lambda: self._list_children(user, topic["id"]),
+                num_runs=num_runs,
+            )
+            self.stdout.write(
+                "Stats for listing the children of a topic at level {} with {} descendants, {}: {}".format(
+                    topic["level"], topic["size"], label, stats
+                )
+            )
+
+    def handle(self, *args, **options):
+        channel = Channel.objects.select_related("main_tree").get(pk=options["channel_id"])
+        user = channel.editors.first()
+        tree_id = channel.main_tree.tree_id
+
+        topics = []
+        max_level = ContentNode.objects.filter(tree_id=tree_id).order_by("-level").values_list("level", flat=True).first()
+        for level in range(max_level + 1):
+            topic = (
+                ContentNode.objects.filter(tree_id=tree_id, level=level, kind_id=content_kinds.TOPIC)
+                .annotate(size=(F("rght") - F("lft") - 1) / 2)
+                .order_by("-size")
+                .values("id", "level", "size")
+                .first()
+            )
+            if topic and topic["size"]:
+                topics.append(topic)
+
+        self.stdout.write("Storing the descendant counts of the topics of the main tree")
+        rebuild_aggregates(channel.main_tree.id)
+        self._benchmark_levels(user, topics, "reading the stored counts", options["num_runs"])
+
+        with transaction.atomic():
+            ContentNodeAggregate.objects.filter(contentnode__tree_id=tree_id).delete()
+            self._benchmark_levels(user, topics, "counting descendants", options["num_runs"])
+            transaction.set_rollback(True)
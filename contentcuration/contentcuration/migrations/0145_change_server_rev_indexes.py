@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db import models
+
+from contentcuration.models import CHANGE_CHANNEL_REV_INDEX_NAME
+from contentcuration.models import CHANGE_USER_REV_INDEX_NAME
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('contentcuration', '0144_soft_delete_user'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='change',
+                    index=models.Index(fields=['channel', 'server_rev'], name=CHANGE_CHANNEL_REV_INDEX_NAME),
+                ),
+                migrations.AddIndex(
+                    model_name='change',
+                    index=models.Index(fields=['user', 'server_rev'], name=CHANGE_USER_REV_INDEX_NAME),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY "{index_name}" ON "contentcuration_change"("channel_id", "server_rev")'.format(
+                        index_name=CHANGE_CHANNEL_REV_INDEX_NAME
+                    ),
+                    reverse_sql='DROP INDEX "{index_name}"'.format(
+                        index_name=CHANGE_CHANNEL_REV_INDEX_NAME
+                    ),
+                ),
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY "{index_name}" ON "contentcuration_change"("user_id", "server_rev")'.format(
+                        index_name=CHANGE_USER_REV_INDEX_NAME
+                    ),
+                    reverse_sql='DROP INDEX "{index_name}"'.format(
+                        index_name=CHANGE_USER_REV_INDEX_NAME
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contentcuration', '0145_change_server_rev_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentNodeAggregate',
+            fields=[
+                ('contentnode', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='descendant_aggregate', serialize=False, to='contentcuration.contentnode')),
+                ('resource_count', models.IntegerField(default=0)),
+                ('coach_count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('updated_count', models.IntegerField(default=0)),
+                ('new_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
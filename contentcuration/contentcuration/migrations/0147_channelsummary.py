@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contentcuration', '0146_contentnodeaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelSummary',
+            fields=[
+                ('channel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='contentcuration.channel')),
+                ('last_modified', models.DateTimeField(null=True)),
+                ('resource_count', models.IntegerField(default=0)),
+                ('has_unpublished_changes', models.BooleanField(default=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='channelsummary',
+            index=models.Index(fields=['-last_modified'], name='channel_summary_modified_idx'),
+        ),
+    ]
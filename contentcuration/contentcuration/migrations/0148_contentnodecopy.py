@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations
+from django.db import models
+
+import contentcuration.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contentcuration', '0147_channelsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentNodeCopy',
+            fields=[
+                ('id', contentcuration.models.UUIDField(max_length=32, primary_key=True, serialize=False)),
+                ('source_node_id', contentcuration.models.UUIDField(max_length=32)),
+                ('target_id', contentcuration.models.UUIDField(max_length=32)),
+                ('position', models.CharField(max_length=16)),
+                ('mods', models.JSONField(null=True)),
+                ('excluded_descendants', models.JSONField(null=True)),
+                ('can_edit_source_channel', models.BooleanField(null=True)),
+                ('source_channel_id', contentcuration.models.UUIDField(max_length=32, null=True)),
+                ('channel_id', contentcuration.models.UUIDField(max_length=32)),
+                ('task_id', models.CharField(max_length=255)),
+                ('total', models.IntegerField(default=0)),
+                ('copied', models.IntegerField(default=0)),
+                ('errored', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='node_copies', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ContentNodeCopyMapping',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_id', contentcuration.models.UUIDField(max_length=32)),
+                ('copy_id', contentcuration.models.UUIDField(max_length=32)),
+                ('children_copied', models.BooleanField(default=False)),
+                ('node_copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mappings', to='contentcuration.contentnodecopy')),
+            ],
+            options={
+                'unique_together': {('node_copy', 'source_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contentcuration', '0148_contentnodecopy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentNodeDetails',
+            fields=[
+                ('contentnode', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stored_details', serialize=False, to='contentcuration.contentnode')),
+                ('details', models.JSONField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
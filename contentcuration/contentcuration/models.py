@@ -75,7 +75,10 @@ from contentcuration.db.models.functions import Unnest
 from contentcuration.db.models.manager import CustomContentNodeTreeManager
 from contentcuration.db.models.manager import CustomManager
 from contentcuration.statistics import record_channel_stats
+from contentcuration.utils.cache import channel_cache_tag
 from contentcuration.utils.cache import delete_public_channel_cache_keys
+from contentcuration.utils.cache import node_details_cache
+from contentcuration.utils.change_feed import record_changes
 from contentcuration.utils.parser import load_json_string
 from contentcuration.viewsets.sync.constants import ALL_CHANGES
 from contentcuration.viewsets.sync.constants import ALL_TABLES
@@ -286,11 +289,11 @@ class User(AbstractBaseUser, PermissionsMixin):
         if self.is_admin:
             return True
 
-        active_files = self.get_user_active_files()
-        if active_files.filter(checksum=checksum).exists():
+        if self.get_user_active_files().filter(checksum=checksum).exists():
             return True
 
-        space = self.get_available_space(active_files=active_files)
+        # The storage used is kept up to date as files are added and deleted, see contentcuration.utils.user
+        space = float(max(self.disk_space - self.disk_space_used, 0))
         if space < size:
             raise PermissionDenied(_("Not enough space. Check your storage under Settings page."))
 
@@ -949,13 +952,30 @@ class Channel(models.Model):
         if "public" in original_values and (self.main_tree and self.main_tree.published):
             delete_public_channel_cache_keys()
 
+    def on_search_flag_update(self, original_values):
+        """
+        Updates the search rows of the nodes of the channel once it is saved, if whether it is public changed
+        """
+        if "public" in original_values or "deleted" in original_values:
+            self.update_search_public_flag()
+
+    def update_search_public_flag(self):
+        """
+        Updates whether the search rows of the nodes of the channel are found by searches across public channels.
+        """
+        from search.models import ContentNodeFullTextSearch
+        ContentNodeFullTextSearch.objects.filter(channel_id=self.id).update(public=self.public and not self.deleted)
+
     def save(self, *args, **kwargs):
+        original_values = {}
         if self._state.adding:
             self.on_create()
         else:
+            original_values = self._field_updates.changed()
             self.on_update()
 
         super(Channel, self).save(*args, **kwargs)
+        self.on_search_flag_update(original_values)
 
     def get_thumbnail(self):
         return get_channel_thumbnail(self)
@@ -992,6 +1012,7 @@ class Channel(models.Model):
         if bypass_signals:
             self.public = True     # set this attribute still, so the object will be updated
             Channel.objects.filter(id=self.id).update(public=True)
+            self.update_search_public_flag()
             # clear the channel cache
             delete_public_channel_cache_keys()
         else:
@@ -1057,6 +1078,31 @@ class Channel(models.Model):
         ]
 
 
+CHANNEL_SUMMARY_MODIFIED_INDEX_NAME = "channel_summary_modified_idx"
+
+
+class ChannelSummary(models.Model):
+    """
+    Values about the main tree of a channel that are expensive to compute, stored so that they
+    don't have to be computed for every channel that is listed. See contentcuration.utils.channel_summary
+    for when they are updated.
+    """
+    channel = models.OneToOneField(Channel, primary_key=True, related_name="summary", on_delete=models.CASCADE)
+    # The latest modified of the nodes of the main tree
+    last_modified = models.DateTimeField(null=True)
+    # The number of distinct content_ids of the non-topic nodes of the main tree
+    resource_count = models.IntegerField(default=0)
+    has_unpublished_changes = models.BooleanField(default=False)
+    # The total size of the distinct files of the nodes of the main tree
+    size = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-last_modified"], name=CHANNEL_SUMMARY_MODIFIED_INDEX_NAME),
+        ]
+
+
 CHANNEL_HISTORY_CHANNEL_INDEX_NAME = "idx_channel_history_channel_id"
 
 
@@ -1187,6 +1233,19 @@ class License(models.Model):
         return self.license_name
 
 
+# Matches assessment items that make an exercise complete
+COMPLETE_QUESTION_FILTER = (
+    # Item with non-blank raw data
+    ~Q(raw_data="") | (
+        # A non-blank question
+        ~Q(question='')
+        # Non-blank answers
+        & ~Q(answers='[]')
+        # With either an input question or one answer marked as correct
+        & (Q(type=exercises.INPUT_QUESTION) | Q(answers__iregex=r'"correct":\s*true'))
+    )
+)
+
 NODE_ID_INDEX_NAME = "node_id_idx"
 NODE_MODIFIED_INDEX_NAME = "node_modified_idx"
 NODE_MODIFIED_DESC_INDEX_NAME = "node_modified_desc_idx"
@@ -1409,32 +1468,9 @@ class ContentNode(MPTTModel, models.Model):
           tree (dict): starting with self, with children list containing either
                        the just the children's `node_id`s or full recusive tree.
         """
-        if self.kind_id == content_kinds.TOPIC:
-            node_data = {
-                "title": self.title,
-                "kind": self.kind_id,
-                "node_id": self.node_id,
-                "studio_id": self.id,
-            }
-            children = self.children.all()
-            if levels > 0:
-                node_data["children"] = [c.get_tree_data(levels=levels - 1) for c in children]
-            return node_data
-        if self.kind_id == content_kinds.EXERCISE:
-            return {
-                "title": self.title,
-                "kind": self.kind_id,
-                "count": self.assessment_items.count(),
-                "node_id": self.node_id,
-                "studio_id": self.id,
-            }
-        return {
-            "title": self.title,
-            "kind": self.kind_id,
-            "file_size": self.files.values('file_size').aggregate(size=Sum('file_size'))['size'],
-            "node_id": self.node_id,
-            "studio_id": self.id,
-        }
+        from contentcuration.utils.tree_data import get_tree_data
+
+        return get_tree_data(self, levels=levels)
 
     def get_original_node(self):
         original_node = self.original_node or self
@@ -1537,6 +1573,7 @@ class ContentNode(MPTTModel, models.Model):
             channel = Channel.objects.filter(id=channel_id)[0]
         else:
             channel = self.get_channel()
+        tags = (channel_cache_tag(channel.id),) if channel else ()
 
         if not descendants.exists():
             data = {
@@ -1564,7 +1601,7 @@ class ContentNode(MPTTModel, models.Model):
             }
 
             # Set cache with latest data
-            cache.set("details_{}".format(self.node_id), json.dumps(data), None)
+            node_details_cache.set(self.node_id, data, tags=tags)
             return data
 
         # Get resources
@@ -1788,7 +1825,7 @@ class ContentNode(MPTTModel, models.Model):
         }
 
         # Set cache with latest data
-        cache.set("details_{}".format(self.node_id), json.dumps(data), None)
+        node_details_cache.set(self.node_id, data, tags=tags)
         return data
 
     def has_changes(self):
@@ -1811,7 +1848,12 @@ class ContentNode(MPTTModel, models.Model):
         for editor in self.files.values_list('uploaded_by_id', flat=True).distinct():
             calculate_user_storage(editor)
 
-    def mark_complete(self):  # noqa C901
+    def mark_complete(self, has_default_file=None, has_complete_questions=None):  # noqa C901
+        """
+        :param has_default_file: Whether the node has a non-supplementary file, if it is already known
+        :param has_complete_questions: Whether the node has a question with question text and complete
+                                       answers, if it is already known
+        """
         errors = []
         # Is complete if title is falsy but only if not a root node.
         if not (bool(self.title) or self.parent_id is None):
@@ -1823,21 +1865,16 @@ class ContentNode(MPTTModel, models.Model):
                 errors.append("Missing license description for custom license")
             if self.license and self.license.copyright_holder_required and not self.copyright_holder:
                 errors.append("Missing required copyright holder")
-            if self.kind_id != content_kinds.EXERCISE and not self.files.filter(preset__supplementary=False).exists():
-                errors.append("Missing default file")
+            if self.kind_id != content_kinds.EXERCISE:
+                if has_default_file is None:
+                    has_default_file = self.files.filter(preset__supplementary=False).exists()
+                if not has_default_file:
+                    errors.append("Missing default file")
             if self.kind_id == content_kinds.EXERCISE:
-                # Check to see if the exercise has at least one assessment item that has:
-                if not self.assessment_items.filter(
-                    # Item with non-blank raw data
-                    ~Q(raw_data="") | (
-                        # A non-blank question
-                        ~Q(question='')
-                        # Non-blank answers
-                        & ~Q(answers='[]')
-                        # With either an input question or one answer marked as correct
-                        & (Q(type=exercises.INPUT_QUESTION) | Q(answers__iregex=r'"correct":\s*true'))
-                    )
-                ).exists():
+                # Check to see if the exercise has at least one complete assessment item
+                if has_complete_questions is None:
+                    has_complete_questions = self.assessment_items.filter(COMPLETE_QUESTION_FILTER).exists()
+                if not has_complete_questions:
                     errors.append("No questions with question text and complete answers")
                 # Check that it has a mastery model set
                 # Either check for the previous location for the mastery model, or rely on our completion criteria validation
@@ -1891,7 +1928,10 @@ class ContentNode(MPTTModel, models.Model):
                 }
 
     def save(self, skip_lock=False, *args, **kwargs):
-        if self._state.adding:
+        from contentcuration.utils import node_aggregates
+
+        created = self._state.adding
+        if created:
             self.on_create()
         else:
             self.on_update()
@@ -1920,18 +1960,29 @@ class ContentNode(MPTTModel, models.Model):
         else:
             changed_ids = []
 
+        # Keep the stored descendant counts of the ancestors of this node up to date
+        updated = not created and any(
+            field in self._field_updates.changed() for field in node_aggregates.CONTRIBUTION_FIELDS
+        )
+
         if not same_order and not skip_lock:
             # Lock the mptt fields for the trees of the old and new parent
             with ContentNode.objects.lock_mptt(*ContentNode.objects
                                                .filter(id__in=[pid for pid in [old_parent_id, self.parent_id] if pid])
                                                .values_list('tree_id', flat=True).distinct()):
-                super(ContentNode, self).save(*args, **kwargs)
+                with node_aggregates.track_subtree_move(None if created else self.pk, recount=updated):
+                    super(ContentNode, self).save(*args, **kwargs)
+                if created:
+                    node_aggregates.node_created(self)
                 # Always write to the database for the parent change updates, as we have
                 # no persistent object references for the original and new parent to modify
                 if changed_ids:
                     ContentNode.objects.filter(id__in=changed_ids).update(changed=True)
         else:
-            super(ContentNode, self).save(*args, **kwargs)
+            with node_aggregates.track_node_updates([self.pk] if updated else []):
+                super(ContentNode, self).save(*args, **kwargs)
+            if created:
+                node_aggregates.node_created(self)
             # Always write to the database for the parent change updates, as we have
             # no persistent object references for the original and new parent to modify
             if changed_ids:
@@ -1941,6 +1992,8 @@ class ContentNode(MPTTModel, models.Model):
     save.alters_data = True
 
     def delete(self, *args, **kwargs):
+        from contentcuration.utils import node_aggregates
+
         parent = self.parent or self._field_updates.changed().get('parent')
         if parent:
             parent.changed = True
@@ -1950,6 +2003,7 @@ class ContentNode(MPTTModel, models.Model):
 
         # Lock the mptt fields for the tree of this node
         with ContentNode.objects.lock_mptt(self.tree_id):
+            node_aggregates.subtree_deleted(self.pk)
             return super(ContentNode, self).delete(*args, **kwargs)
 
     # Copied from MPTT
@@ -1982,6 +2036,80 @@ class ContentNode(MPTTModel, models.Model):
         ]
 
 
+class ContentNodeAggregate(models.Model):
+    """
+    Counts of the descendants of a topic, stored so that they don't have to be counted every time
+    the topic is returned by the API. See contentcuration.utils.node_aggregates for how they are
+    kept up to date.
+    """
+    contentnode = models.OneToOneField(
+        ContentNode, primary_key=True, related_name="descendant_aggregate", on_delete=models.CASCADE
+    )
+    # Descendants that are not topics
+    resource_count = models.IntegerField(default=0)
+    # Descendants that are not topics and are only visible to coaches
+    coach_count = models.IntegerField(default=0)
+    # Descendants that are not complete
+    error_count = models.IntegerField(default=0)
+    # Descendants that are not topics and have been changed since they were published
+    updated_count = models.IntegerField(default=0)
+    # Descendants that are not topics and have never been published
+    new_count = models.IntegerField(default=0)
+
+
+class ContentNodeDetails(models.Model):
+    """
+    The details of a topic of the main tree of a channel, as returned by ContentNode.get_details,
+    stored so that they don't have to be computed from all of its descendants when they are
+    requested. See contentcuration.utils.node_details for when they are updated.
+    """
+    contentnode = models.OneToOneField(
+        ContentNode, primary_key=True, related_name="stored_details", on_delete=models.CASCADE
+    )
+    details = JSONField()
+    updated = models.DateTimeField(auto_now=True)
+
+
+class ContentNodeCopy(models.Model):
+    """
+    A copy of a subtree that is done in chunks, with checkpoints of the nodes that have been
+    copied, so that the copy can continue from its last chunk if it is stopped before it is done.
+    See contentcuration.utils.node_copy for how the chunks are copied.
+    """
+    # The id of the copy of the source node
+    id = UUIDField(primary_key=True)
+    source_node_id = UUIDField()
+    target_id = UUIDField()
+    position = models.CharField(max_length=16)
+    mods = JSONField(null=True)
+    excluded_descendants = JSONField(null=True)
+    can_edit_source_channel = models.BooleanField(null=True)
+    source_channel_id = UUIDField(null=True)
+    # The channel of the target, where the copy is made
+    channel_id = UUIDField()
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE, related_name="node_copies")
+    # The id of the TaskResult that reports the progress of the copy
+    task_id = models.CharField(max_length=255)
+    total = models.IntegerField(default=0)
+    copied = models.IntegerField(default=0)
+    errored = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class ContentNodeCopyMapping(models.Model):
+    """
+    A node that has been copied by a ContentNodeCopy, with the whole subtree below it unless
+    children_copied is False, in which case its children are copied by the following chunks
+    """
+    node_copy = models.ForeignKey(ContentNodeCopy, related_name="mappings", on_delete=models.CASCADE)
+    source_id = UUIDField()
+    copy_id = UUIDField()
+    children_copied = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ("node_copy", "source_id")
+
+
 class ContentKind(models.Model):
     kind = models.CharField(primary_key=True, max_length=200, choices=content_kinds.choices)
 
@@ -2303,32 +2431,41 @@ class File(models.Model):
             1. generate the MD5 from the content copy
             2. fill the other fields accordingly
         """
-        from contentcuration.utils.user import calculate_user_storage
-
         # check if the file format exists in file_formats.choices
         if self.file_format_id:
             if self.file_format_id not in dict(file_formats.choices):
                 raise ValidationError("Invalid file_format")
 
         if set_by_file_on_disk and self.file_on_disk:  # if file_on_disk is supplied, hash out the file
-            if self.checksum is None or self.checksum == "":
-                md5 = hashlib.md5()
-                for chunk in self.file_on_disk.chunks():
-                    md5.update(chunk)
-
-                self.checksum = md5.hexdigest()
-            if not self.file_size:
-                self.file_size = self.file_on_disk.size
-            if not self.file_format_id:
-                ext = os.path.splitext(self.file_on_disk.name)[1].lstrip('.')
-                if ext in list(dict(file_formats.choices).keys()):
-                    self.file_format_id = ext
-                else:
-                    raise ValueError("Files of type `{}` are not supported.".format(ext))
+            self._set_by_file_on_disk()
 
+        adding = self._state.adding
         super(File, self).save(*args, **kwargs)
+        self._update_user_storage(adding)
+
+    def _set_by_file_on_disk(self):
+        if self.checksum is None or self.checksum == "":
+            md5 = hashlib.md5()
+            for chunk in self.file_on_disk.chunks():
+                md5.update(chunk)
+
+            self.checksum = md5.hexdigest()
+        if not self.file_size:
+            self.file_size = self.file_on_disk.size
+        if not self.file_format_id:
+            ext = os.path.splitext(self.file_on_disk.name)[1].lstrip('.')
+            if ext in list(dict(file_formats.choices).keys()):
+                self.file_format_id = ext
+            else:
+                raise ValueError("Files of type `{}` are not supported.".format(ext))
+
+    def _update_user_storage(self, added):
+        from contentcuration.utils.user import calculate_user_storage
+        from contentcuration.utils.user import update_user_storage
 
         if self.uploaded_by_id:
+            if added:
+                update_user_storage(self, True)
             calculate_user_storage(self.uploaded_by_id)
 
     class Meta:
@@ -2355,7 +2492,9 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
     """
     # Recalculate storage
     from contentcuration.utils.user import calculate_user_storage
+    from contentcuration.utils.user import update_user_storage
     if instance.uploaded_by_id:
+        update_user_storage(instance, False)
         calculate_user_storage(instance.uploaded_by_id)
 
 
@@ -2481,6 +2620,10 @@ class Invitation(models.Model):
         ).distinct()
 
 
+CHANGE_CHANNEL_REV_INDEX_NAME = "change_channel_server_rev_idx"
+CHANGE_USER_REV_INDEX_NAME = "change_user_server_rev_idx"
+
+
 class Change(models.Model):
     server_rev = models.BigAutoField(primary_key=True)
     # We need to store the user who is applying this change
@@ -2538,12 +2681,16 @@ class Change(models.Model):
             change_models.append(cls._create_from_change(created_by_id=created_by_id, session_key=session_key, applied=applied, **change))
 
         cls.objects.bulk_create(change_models)
+        if applied:
+            record_changes(change_models)
         return change_models
 
     @classmethod
     def create_change(cls, change, created_by_id=None, session_key=None, applied=False):
         obj = cls._create_from_change(created_by_id=created_by_id, session_key=session_key, applied=applied, **change)
         obj.save()
+        if applied:
+            record_changes([obj])
         return obj
 
     @classmethod
@@ -2562,6 +2709,13 @@ class Change(models.Model):
     def serialize_to_change_dict(self):
         return self.serialize(self)
 
+    class Meta:
+        # Indexes for fetching the changes to a channel, or a user, after a given server_rev
+        indexes = [
+            models.Index(fields=["channel", "server_rev"], name=CHANGE_CHANNEL_REV_INDEX_NAME),
+            models.Index(fields=["user", "server_rev"], name=CHANGE_USER_REV_INDEX_NAME),
+        ]
+
 
 class TaskResultCustom(object):
     """
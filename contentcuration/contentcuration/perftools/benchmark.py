@@ -0,0 +1,50 @@
+"""
+Helpers for benchmarking alternative implementations of the same operation against each other.
+"""
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def calc_stats(run_times, num_items=1):
+    run_times = sorted(run_times)
+    average = sum(run_times) / len(run_times)
+
+    return {
+        'min': run_times[0],
+        'max': run_times[-1],
+        'average': average,
+        'per_record_average': average / (num_items or 1),
+    }
+
+
+def benchmark(func, num_runs=1, num_items=1, setup=None, teardown=None):
+    """
+    Runs func num_runs times and reports the min, max and average times it takes, along with
+    the number of queries it ran against the default database on its last run.
+
+    :param func: Function to benchmark, called without arguments, or with the return value of setup
+    :param num_runs: Number of times to run the function
+    :param num_items: Number of records the function processes, used for the per record average
+    :param setup: Optional function called before each run, outside of the timed section
+    :param teardown: Optional function called after each run with the return value of setup
+    :return: A dictionary with keys 'min', 'max', 'average', 'per_record_average' and 'queries'
+    """
+    run_times = []
+    queries = 0
+    for i in range(num_runs):
+        args = (setup(),) if setup else ()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                start = time.time()
+                func(*args)
+                run_times.append(time.time() - start)
+            queries = len(context.captured_queries)
+        finally:
+            if teardown:
+                teardown(*args)
+
+    stats = calc_stats(run_times, num_items)
+    stats['queries'] = queries
+    return stats
@@ -407,6 +407,16 @@ ORPHANAGE_ROOT_ID = "00000000000000000000000000000000"
 # do choose to implement restore of old chefs, we will need to ensure moving nodes does not cause a tree sort.
 DELETED_CHEFS_ROOT_ID = "11111111111111111111111111111111"
 
+# Publish channels by updating the export database of their previous version when possible,
+# so that only changed nodes get mapped again
+INCREMENTAL_PUBLISH = bool(os.getenv("INCREMENTAL_PUBLISH"))
+
+# Maximum number of seconds a request to the sync wait endpoint is held open for, waiting for new changes
+SYNC_WAIT_TIMEOUT = int(os.getenv("SYNC_WAIT_TIMEOUT", 25))
+
+# Answer public ContentNode browse requests from an in memory index of the public catalog in each process
+PUBLIC_CATALOG_INDEX = bool(os.getenv("PUBLIC_CATALOG_INDEX"))
+
 # How long we should cache any APIs that return public channel list details, which change infrequently
 PUBLIC_CHANNELS_CACHE_DURATION = 300
 
@@ -8,26 +8,62 @@ from __future__ import unicode_literals
 
 import logging
 import time
+import zlib
 
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.utils.translation import override
+from search.indexing import queue_contentnode_tsvector_updates
+from search.indexing import try_update_queued_contentnode_tsvectors
 
 from contentcuration.celery import app
+from contentcuration.constants.locking import CHANGES_LOCK
+from contentcuration.db.advisory_lock import session_advisory_lock
 from contentcuration.models import Change
 from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeCopy
 from contentcuration.models import User
+from contentcuration.utils.celery.tasks import get_task_model
+from contentcuration.utils.channel_summary import claim_channel_summary_update
+from contentcuration.utils.channel_summary import release_channel_summary_update
+from contentcuration.utils.channel_summary import SUMMARY_UPDATE_DELAY
+from contentcuration.utils.channel_summary import update_channel_summary
 from contentcuration.utils.csv_writer import write_user_csv
+from contentcuration.utils.node_details import try_update_node_details
 from contentcuration.utils.nodes import calculate_resource_size
 from contentcuration.utils.nodes import generate_diff
+from contentcuration.utils.sentry import report_exception
 from contentcuration.viewsets.user import AdminUserFilter
 
 
 logger = get_task_logger(__name__)
 
 
+def _changes_lock(key):
+    """
+    Locks the changes of a channel or a user, so that they are never applied by two tasks at once,
+    even if the signature of the task that is applying them expired from the registry while it ran
+    """
+    return session_advisory_lock(CHANGES_LOCK, key2=zlib.crc32(key.encode("utf-8")))
+
+
+def schedule_channel_summary_update(channel_id, user):
+    """
+    Schedules an update of the summary of the channel, unless one is already pending, see
+    contentcuration.utils.channel_summary
+    """
+    if not claim_channel_summary_update(channel_id):
+        return
+    try:
+        update_channel_summary_task.enqueue(user, channel_id=channel_id, countdown=SUMMARY_UPDATE_DELAY)
+    except Exception as e:
+        release_channel_summary_update(channel_id)
+        logger.exception("Failed to schedule an update of the summary of channel {}".format(channel_id))
+        report_exception(e)
+
+
 @app.task(bind=True, name="apply_user_changes")
 def apply_user_changes_task(self, user_id):
     """
@@ -36,7 +72,8 @@ def apply_user_changes_task(self, user_id):
     """
     from contentcuration.viewsets.sync.base import apply_changes
     changes_qs = Change.objects.filter(applied=False, errored=False, user_id=user_id, channel__isnull=True)
-    apply_changes(changes_qs)
+    with _changes_lock("user:{}".format(user_id)):
+        apply_changes(changes_qs)
     if changes_qs.exists():
         self.requeue()
 
@@ -49,9 +86,53 @@ def apply_channel_changes_task(self, channel_id):
     """
     from contentcuration.viewsets.sync.base import apply_changes
     changes_qs = Change.objects.filter(applied=False, errored=False, channel_id=channel_id)
-    apply_changes(changes_qs)
+    with _changes_lock("channel:{}".format(channel_id)):
+        apply_changes(changes_qs)
     if changes_qs.exists():
         self.requeue()
+    else:
+        schedule_channel_summary_update(channel_id, get_task_model(self, self.request.id).user)
+        try_update_node_details(channel_id)
+        try_update_queued_contentnode_tsvectors(channel_id)
+
+
+@app.task(name="update_channel_summary")
+def update_channel_summary_task(channel_id):
+    # Release the pending update first, so that changes applied while the summary is computed schedule another
+    release_channel_summary_update(channel_id)
+    update_channel_summary(channel_id)
+
+
+@app.task(bind=True, name="copy_node_chunks", acks_late=True, reject_on_worker_lost=True)
+def copy_node_chunks_task(self, copy_id, channel_id):
+    """
+    Copies the chunks of a copy started by `contentcuration.utils.node_copy.start_copy`. The task is
+    acknowledged once it is done, so that it runs again if its worker is stopped, continuing from
+    the last chunk that was copied.
+
+    :type self: contentcuration.utils.celery.tasks.CeleryTask
+    :param copy_id: The id of the ContentNodeCopy
+    :param channel_id: The channel ID of the target of the copy
+    """
+    from contentcuration.utils.node_copy import CHUNKS_PER_TASK
+    from contentcuration.utils.node_copy import copy_chunks
+
+    node_copy = ContentNodeCopy.objects.filter(pk=copy_id).select_related("created_by").first()
+    if node_copy is None:
+        # The task is only enqueued once the copy is committed, so it was removed since
+        logger.warning("Copy {} of channel {} does not exist, so its chunks were not copied".format(copy_id, channel_id))
+        return
+    if node_copy.errored:
+        logger.info("Copy {} of channel {} errored, so its chunks were not copied".format(copy_id, channel_id))
+        return
+    if copy_chunks(node_copy, max_chunks=CHUNKS_PER_TASK):
+        self.requeue()
+    else:
+        schedule_channel_summary_update(channel_id, node_copy.created_by)
+        try_update_node_details(channel_id)
+        # The descendants of the copy did not exist yet when the change that started it was applied
+        queue_contentnode_tsvector_updates(channel_id, subtree_ids=[node_copy.id])
+        try_update_queued_contentnode_tsvectors(channel_id)
 
 
 class CustomEmailMessage(EmailMessage):
@@ -114,6 +195,10 @@ def generatenodediff_task(updated_id, original_id):
 
 @app.task(name="calculate_user_storage_task")
 def calculate_user_storage_task(user_id):
+    from contentcuration.utils.user import clear_pending_user_storage
+
+    # Changes made from now on are not guaranteed to be included, so let them request another calculation
+    clear_pending_user_storage(user_id)
     try:
         user = User.objects.get(pk=user_id)
         user.set_space_used()
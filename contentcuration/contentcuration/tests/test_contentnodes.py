@@ -657,6 +657,90 @@ class NodeOperationsTestCase(StudioTestCase):
             prev_channel.main_tree.refresh_from_db()
             self.assertFalse(prev_channel.main_tree.changed)
 
+    def _assert_tree_valid(self, tree_id):
+        nodes = {
+            node["id"]: node
+            for node in ContentNode.objects.filter(tree_id=tree_id).values("id", "parent_id", "lft", "rght", "level")
+        }
+        positions = sorted(value for node in nodes.values() for value in (node["lft"], node["rght"]))
+        self.assertEqual(positions, list(range(1, 2 * len(nodes) + 1)))
+        for node in nodes.values():
+            self.assertLess(node["lft"], node["rght"])
+            if node["parent_id"] is None:
+                self.assertEqual(node["level"], 0)
+                continue
+            parent = nodes[node["parent_id"]]
+            self.assertLess(parent["lft"], node["lft"])
+            self.assertGreater(parent["rght"], node["rght"])
+            self.assertEqual(node["level"], parent["level"] + 1)
+
+    def test_sql_copy_position_first_child(self):
+        """
+        Ensures that the subtree is copied in SQL to the requested position, leaving a valid tree
+        """
+        new_channel = testdata.channel()
+        first_child = new_channel.main_tree.get_children().first()
+
+        copy = self.channel.main_tree.copy_to(new_channel.main_tree, position="first-child")
+
+        self.assertEqual(new_channel.main_tree.get_children().first().id, copy.id)
+        self.assertEqual(copy.get_next_sibling().id, first_child.id)
+        self._assert_tree_valid(new_channel.main_tree.tree_id)
+        _check_node_copy(
+            self.channel.main_tree,
+            copy,
+            original_channel_id=self.channel.id,
+            channel=new_channel,
+        )
+
+    def test_sql_copy_into_own_descendant(self):
+        """
+        Ensures that a subtree can be copied into one of its own descendants in the same tree
+        """
+        topic = self.channel.main_tree.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        target = topic.get_descendants().filter(kind_id=content_kinds.TOPIC).first() or topic
+        source_count = topic.get_descendant_count()
+
+        copy = topic.copy_to(target, position="first-child")
+
+        topic.refresh_from_db()
+        self.assertEqual(copy.parent_id, target.id)
+        self.assertEqual(copy.get_descendant_count(), source_count)
+        self._assert_tree_valid(self.channel.main_tree.tree_id)
+        self.assertEqual(
+            list(copy.get_descendants().values_list("title", flat=True)),
+            list(topic.get_descendants().exclude(pk__in=copy.get_descendants(include_self=True)).values_list("title", flat=True)),
+        )
+
+    def test_sql_copy_pk_and_mods(self):
+        """
+        Ensures that the pk and mods are applied to the root of the copy only
+        """
+        new_channel = testdata.channel()
+        pk = uuid.uuid4().hex
+
+        copy = self.channel.main_tree.copy_to(new_channel.main_tree, pk=pk, mods={"title": "A new title"})
+
+        self.assertEqual(copy.id, pk)
+        self.assertEqual(copy.title, "A new title")
+        self.assertFalse(copy.get_descendants().filter(title="A new title").exists())
+
+    def test_sql_copy_stores_aggregates(self):
+        """
+        Ensures that the descendant counts of the copied topics and their new ancestors are stored
+        """
+        from contentcuration.utils.node_aggregates import compute_aggregates
+        from contentcuration.utils.node_aggregates import get_stored_aggregates
+
+        new_channel = testdata.channel()
+        self.channel.main_tree.copy_to(new_channel.main_tree)
+
+        root = new_channel.main_tree
+        root.refresh_from_db()
+        position = dict(tree_id=root.tree_id, lft=root.lft, rght=root.rght)
+        aggregates, _ = compute_aggregates(**position)
+        self.assertEqual(get_stored_aggregates(**position), aggregates)
+
     def test_move_nodes(self):
         """
         Ensures that moving nodes properly removes them from the original parent
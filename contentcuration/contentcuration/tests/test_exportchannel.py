@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+import hashlib
 import json
 import os
 import random
@@ -7,12 +8,17 @@ import string
 import tempfile
 
 import pytest
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import connection
 from django.db import connections
+from django.test.utils import CaptureQueriesContext
 from kolibri_content import models as kolibri_models
 from kolibri_content.router import get_active_content_database
 from kolibri_content.router import set_active_content_database
+from kolibri_content.router import using_content_database
 from le_utils.constants import exercises
+from le_utils.constants import format_presets
 from le_utils.constants.labels import accessibility_categories
 from le_utils.constants.labels import learning_activities
 from le_utils.constants.labels import levels
@@ -29,13 +35,22 @@ from .testdata import node as create_node
 from .testdata import slideshow
 from .testdata import thumbnail_bytes
 from contentcuration import models as cc
+from contentcuration.utils.publish import BatchedTreeMapper
 from contentcuration.utils.publish import convert_channel_thumbnail
 from contentcuration.utils.publish import create_content_database
+from contentcuration.utils.publish import create_perseus_zip
 from contentcuration.utils.publish import create_slideshow_manifest
 from contentcuration.utils.publish import fill_published_fields
+from contentcuration.utils.publish import get_assessment_metadata
+from contentcuration.utils.publish import get_perseus_content_hash
+from contentcuration.utils.publish import get_previous_content_database
+from contentcuration.utils.publish import IncrementalTreeMapper
 from contentcuration.utils.publish import map_prerequisites
 from contentcuration.utils.publish import MIN_SCHEMA_VERSION
+from contentcuration.utils.publish import PERSEUS_CACHE_KEY
+from contentcuration.utils.publish import PerseusExerciseGenerator
 from contentcuration.utils.publish import set_channel_icon_encoding
+from contentcuration.utils.publish import TreeMapper
 
 pytestmark = pytest.mark.django_db
 
@@ -401,6 +416,209 @@ class ExportChannelTestCase(StudioTestCase):
         })
 
 
+class TreeMapperExportChannelTestCase(ExportChannelTestCase):
+    """
+    Runs the export tests against the per node TreeMapper too.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(TreeMapperExportChannelTestCase, cls).setUpClass()
+        cls.patch_tree_mapper = patch('contentcuration.utils.publish.BatchedTreeMapper', TreeMapper)
+        cls.patch_tree_mapper.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TreeMapperExportChannelTestCase, cls).tearDownClass()
+        cls.patch_tree_mapper.stop()
+
+
+class TreeMapperComparisonTestCase(StudioTestCase):
+    def setUp(self):
+        super(TreeMapperComparisonTestCase, self).setUp()
+        self.content_channel = channel()
+        self.tempdbs = []
+
+    def tearDown(self):
+        for tempdb in self.tempdbs:
+            connections[tempdb].close()
+            del connections.databases[tempdb]
+            if os.path.exists(tempdb):
+                os.remove(tempdb)
+        super(TreeMapperComparisonTestCase, self).tearDown()
+
+    def _create_database(self):
+        fh, tempdb = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fh)
+        self.tempdbs.append(tempdb)
+        with using_content_database(tempdb):
+            call_command("migrate", "content", database=tempdb, no_input=True)
+        return tempdb
+
+    def _map_channel(self, mapper_class, tempdb=None, **kwargs):
+        tempdb = tempdb or self._create_database()
+        with using_content_database(tempdb):
+            mapper_class(
+                self.content_channel.main_tree,
+                self.content_channel.language,
+                self.content_channel.id,
+                self.content_channel.name,
+                user_id=self.admin_user.id,
+                **kwargs
+            ).map_nodes()
+            return {
+                "nodes": list(kolibri_models.ContentNode.objects.order_by("lft").values()),
+                "files": sorted(
+                    kolibri_models.File.objects.values_list("contentnode_id", "checksum", "preset", "lang_id", "file_size"),
+                ),
+                "local_files": list(kolibri_models.LocalFile.objects.order_by("id").values()),
+                "tags": sorted(kolibri_models.ContentNode.tags.through.objects.values_list("contentnode_id", "contenttag_id")),
+                "assessment_metadata": sorted(
+                    kolibri_models.AssessmentMetaData.objects.values_list(
+                        "contentnode_id", "assessment_item_ids", "number_of_assessments", "mastery_model", "randomize"
+                    ),
+                ),
+            }
+
+
+class BatchedTreeMapperTestCase(TreeMapperComparisonTestCase):
+    def test_same_export_as_tree_mapper(self):
+        expected = self._map_channel(TreeMapper)
+        actual = self._map_channel(BatchedTreeMapper)
+        self.assertTrue(len(expected["nodes"]) > 0)
+        for key in expected:
+            self.assertEqual(expected[key], actual[key], key)
+
+    def test_same_export_as_tree_mapper_small_batches(self):
+        expected = self._map_channel(TreeMapper)
+        actual = self._map_channel(BatchedTreeMapper, batch_size=2)
+        for key in expected:
+            self.assertEqual(expected[key], actual[key], key)
+
+    def test_fewer_queries_than_tree_mapper(self):
+        with CaptureQueriesContext(connection) as tree_mapper_queries:
+            self._map_channel(TreeMapper)
+        with CaptureQueriesContext(connection) as batched_tree_mapper_queries:
+            self._map_channel(BatchedTreeMapper)
+        self.assertLess(len(batched_tree_mapper_queries), len(tree_mapper_queries))
+
+
+class IncrementalTreeMapperTestCase(TreeMapperComparisonTestCase):
+    def setUp(self):
+        super(IncrementalTreeMapperTestCase, self).setUp()
+        self.previous_db = self._create_database()
+        self._map_channel(BatchedTreeMapper, tempdb=self.previous_db)
+        self.content_channel.main_tree.get_family().update(changed=False)
+
+    def _assert_same_export_as_batched_tree_mapper(self):
+        actual = self._map_channel(IncrementalTreeMapper, tempdb=self.previous_db)
+        expected = self._map_channel(BatchedTreeMapper)
+        for key in expected:
+            self.assertEqual(expected[key], actual[key], key)
+
+    def test_no_changes(self):
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_changed_node(self):
+        video = self.content_channel.main_tree.get_descendants().filter(kind_id="video").first()
+        video.title = "Updated title"
+        video.save()
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_changed_inherited_metadata(self):
+        topic = self.content_channel.main_tree.get_descendants().filter(kind_id="topic").first()
+        topic.categories = {subjects.MATHEMATICS: True}
+        topic.save()
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_removed_node(self):
+        self.content_channel.main_tree.get_descendants().filter(kind_id="video").first().delete()
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_added_node(self):
+        topic = self.content_channel.main_tree.get_descendants().filter(kind_id="topic").first()
+        new_video = create_node({'kind_id': 'video', 'title': 'New video', 'children': []})
+        new_video.complete = True
+        new_video.parent = topic
+        new_video.save()
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_moved_node(self):
+        video = self.content_channel.main_tree.get_descendants().filter(kind_id="video").first()
+        video.move_to(self.content_channel.main_tree, "first-child")
+        self._assert_same_export_as_batched_tree_mapper()
+
+    def test_changed_exercise_only_regenerated(self):
+        exercises = self.content_channel.main_tree.get_descendants().filter(kind_id="exercise")
+        changed_exercise = exercises.first()
+        changed_exercise.title = "Updated exercise"
+        changed_exercise.save()
+        with patch("contentcuration.utils.publish.PerseusExerciseGenerator.generate") as generate:
+            self._map_channel(IncrementalTreeMapper, tempdb=self.previous_db)
+        generated_ids = [ccnode.id for call in generate.call_args_list for ccnode, _data, _items in call[0][0]]
+        self.assertEqual(generated_ids, [changed_exercise.id])
+
+    def test_previous_content_database_unpublished_channel(self):
+        self.content_channel.main_tree.published = False
+        self.content_channel.main_tree.save()
+        self.assertIsNone(get_previous_content_database(self.content_channel))
+
+
+class PerseusExerciseGeneratorTestCase(StudioTestCase):
+    def setUp(self):
+        super(PerseusExerciseGeneratorTestCase, self).setUp()
+        self.content_channel = channel()
+        self.exercise = self.content_channel.main_tree.get_descendants().filter(kind_id="exercise").first()
+        self.assessment_items = list(self.exercise.assessment_items.prefetch_related("files__file_format").order_by("order"))
+        self.exercise_data, assessment_metadata = get_assessment_metadata(self.exercise, None, self.assessment_items)
+        content_hash = get_perseus_content_hash(self.exercise_data, self.assessment_items)
+        cache.delete(PERSEUS_CACHE_KEY.format(content_hash=content_hash))
+
+    def _generate(self, **kwargs):
+        generator = PerseusExerciseGenerator(self.content_channel.id, user_id=self.admin_user.id, **kwargs)
+        generator.generate([(self.exercise, self.exercise_data, self.assessment_items)])
+        return self.exercise.files.get(preset_id=format_presets.EXERCISE)
+
+    def _patch_build_zip(self):
+        return patch.object(
+            PerseusExerciseGenerator, "_build_zip", autospec=True, side_effect=PerseusExerciseGenerator._build_zip
+        )
+
+    def test_same_zip_as_create_perseus_zip(self):
+        exercise_file = self._generate()
+        with tempfile.TemporaryFile() as tempf:
+            create_perseus_zip(self.exercise, self.exercise_data, tempf)
+            tempf.seek(0)
+            self.assertEqual(exercise_file.checksum, hashlib.md5(tempf.read()).hexdigest())
+        self.assertEqual(exercise_file.file_size, exercise_file.file_on_disk.size)
+
+    def test_unchanged_exercise_not_rebuilt(self):
+        exercise_file = self._generate()
+        with self._patch_build_zip() as build_zip:
+            self.assertEqual(self._generate().id, exercise_file.id)
+        build_zip.assert_not_called()
+
+    def test_cached_zip_reused(self):
+        exercise_file = self._generate()
+        self.exercise.files.filter(preset_id=format_presets.EXERCISE).delete()
+        with self._patch_build_zip() as build_zip:
+            self.assertEqual(self._generate().checksum, exercise_file.checksum)
+        build_zip.assert_not_called()
+
+    def test_changed_exercise_rebuilt(self):
+        self._generate()
+        self.assessment_items[0].question = "An updated question"
+        with self._patch_build_zip() as build_zip:
+            self._generate()
+        build_zip.assert_called_once()
+
+    def test_no_cache_rebuilt(self):
+        self._generate()
+        with self._patch_build_zip() as build_zip:
+            self._generate(use_cache=False)
+        build_zip.assert_called_once()
+
+
 class ChannelExportUtilityFunctionTestCase(StudioTestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from future import standard_library
 standard_library.install_aliases()
+import gzip
 from io import BytesIO
 
 import pytest
@@ -10,11 +11,22 @@ from google.cloud.storage import Client
 from google.cloud.storage.blob import Blob
 from mixer.main import mixer
 from mock import create_autospec
-from mock import patch
 
+from contentcuration.utils.gcs_storage import CHUNK_SIZE
 from contentcuration.utils.gcs_storage import GoogleCloudStorage as gcs
 
 
+class UploadBuffer(BytesIO):
+    """
+    Keeps the bytes written to it after it is closed, to stand in for the writer of a blob.
+    """
+    uploaded = None
+
+    def close(self):
+        self.uploaded = self.getvalue()
+        super(UploadBuffer, self).close()
+
+
 class GoogleCloudStorageSaveTestCase(TestCase):
     """
     Tests for GoogleCloudStorage.save().
@@ -73,17 +85,29 @@ class GoogleCloudStorageSaveTestCase(TestCase):
         self.storage.save(filename, self.content, blob_object=self.blob_obj)
         assert "private" in self.blob_obj.cache_control
 
-    @patch("contentcuration.utils.gcs_storage.BytesIO")
-    @patch("contentcuration.utils.gcs_storage.GoogleCloudStorage._is_file_empty", return_value=False)
-    def test_gzip_if_content_database(self, bytesio_mock, file_empty_mock):
+    def test_gzip_if_content_database(self):
         """
-        Check that if we're uploading a gzipped content database and
-        if the BytesIO object has been closed.
+        Check that if we're uploading a content database, it is gzipped
+        and streamed to GCS with a chunked upload.
         """
+        upload = UploadBuffer()
+        self.blob_obj.open.return_value = upload
         filename = "content/databases/myfile.sqlite3"
         self.storage.save(filename, self.content, blob_object=self.blob_obj)
         assert self.blob_obj.content_encoding == "gzip"
-        assert bytesio_mock.called
+        self.blob_obj.open.assert_called_once()
+        args, kwargs = self.blob_obj.open.call_args
+        assert args == ("wb",)
+        assert kwargs["chunk_size"] == CHUNK_SIZE
+        assert gzip.decompress(upload.uploaded) == b"content"
+        self.blob_obj.upload_from_file.assert_not_called()
+
+    def test_does_not_upload_empty_content_database(self):
+        """
+        Check that an empty content database is not uploaded.
+        """
+        self.storage.save("content/databases/myfile.sqlite3", BytesIO(), blob_object=self.blob_obj)
+        self.blob_obj.open.assert_not_called()
 
 
 class GoogleCloudStorageOpenTestCase(TestCase):
@@ -104,6 +128,7 @@ class GoogleCloudStorageOpenTestCase(TestCase):
         self.mock_client = create_autospec(Client)
         self.storage = gcs(client=self.mock_client())
         self.local_file = mixer.blend(self.RandomFileSchema)
+        self.blob_obj.content_encoding = "gzip"
 
     def test_raises_error_if_mode_is_not_rb(self):
         """
@@ -130,3 +155,17 @@ class GoogleCloudStorageOpenTestCase(TestCase):
         assert isinstance(f, File)
         # This checks that an actual temp file was written on disk for the file.git
         assert f.name
+
+    def test_streams_blob_if_not_gzipped(self):
+        """
+        Check that open() streams files that are not gzip encoded in chunks, without downloading them.
+        """
+        self.blob_obj.content_encoding = None
+        self.blob_obj.open.return_value = BytesIO(b"content")
+        f = self.storage.open(self.local_file.filename, blob_object=self.blob_obj)
+
+        self.blob_obj.open.assert_called_once_with("rb", chunk_size=CHUNK_SIZE)
+        self.blob_obj.download_to_file.assert_not_called()
+        assert isinstance(f, File)
+        assert f.name == self.local_file.filename
+        assert f.read() == b"content"
@@ -7,10 +7,13 @@ import os
 from builtins import str
 from builtins import zip
 
+from django.db.models import Sum
 from django.urls import reverse_lazy
+from mock import patch
 
 from .base import BaseAPITestCase
 from contentcuration import models as cc
+from contentcuration.utils.tree_data import iter_tree_data_json
 
 
 def rgetattr(obj, attr, *args):
@@ -142,12 +145,42 @@ class SushibarEndpointsTestCase(BaseAPITestCase):
         )
         assert not diff, "Found difference in tree structures:" + str(diff)
 
+    def test_get_tree_data_method_counts_and_sizes(self):
+        def check_node(node_data):
+            node = cc.ContentNode.objects.get(pk=node_data["studio_id"])
+            if node.kind_id == "exercise":
+                self.assertEqual(node_data["count"], node.assessment_items.count())
+            elif node.kind_id != "topic":
+                self.assertEqual(node_data["file_size"], node.files.aggregate(size=Sum("file_size"))["size"])
+            for child_data in node_data.get("children", []):
+                check_node(child_data)
+
+        check_node(self.channel.main_tree.get_tree_data())
+
+    def test_get_tree_data_method_levels(self):
+        main_tree = self.channel.main_tree
+        tree_data = main_tree.get_tree_data(levels=2)
+        for child_data in tree_data["children"]:
+            for grandchild_data in child_data.get("children", []):
+                self.assertNotIn("children", grandchild_data)
+        self.assertNotIn("children", main_tree.get_tree_data(levels=0))
+
+    @patch("contentcuration.utils.tree_data.CHUNK_SIZE", 2)
+    @patch("contentcuration.utils.tree_data.BUFFER_SIZE", 10)
+    def test_iter_tree_data_json(self):
+        main_tree = self.channel.main_tree
+        for levels in (1, 2, float("inf")):
+            self.assertEqual(
+                json.loads("".join(iter_tree_data_json(main_tree, levels=levels))),
+                main_tree.get_tree_data(levels=levels)["children"],
+            )
+
     def test_get_tree_data_endpoint(self):
         channel_id = self.channel.id
         url = reverse_lazy("get_tree_data")
         response = self.post(url, {"channel_id": channel_id})
         assert response.status_code == 200
-        response_json = response.json()
+        response_json = json.loads(b"".join(response.streaming_content))
         response_json["children"] = response_json[
             "tree"
         ]  # hack because diff function checks 'children'
@@ -160,6 +193,29 @@ class SushibarEndpointsTestCase(BaseAPITestCase):
         )
         assert not diff, "Found difference in tree structures:" + str(diff)
 
+    @patch("contentcuration.views.internal.handle_server_error")
+    def test_get_tree_data_endpoint_error_while_streaming(self, handle_server_error):
+        from contentcuration.utils import tree_data
+
+        get_node_data = tree_data.get_node_data
+        calls = []
+
+        def fail_after_first_nodes(node):
+            calls.append(node)
+            if len(calls) > 3:
+                raise Exception("Connection lost")
+            return get_node_data(node)
+
+        url = reverse_lazy("get_tree_data")
+        with patch("contentcuration.utils.tree_data.get_node_data", side_effect=fail_after_first_nodes):
+            response = self.post(url, {"channel_id": self.channel.id})
+            assert response.status_code == 200
+            response_json = json.loads(b"".join(response.streaming_content))
+        assert response_json["success"] is False
+        assert response_json["error"] == "Connection lost"
+        assert response_json["tree"]
+        handle_server_error.assert_called_once()
+
     def test_get_tree_data_endpoint_errors(self):
         url = reverse_lazy("get_tree_data")
         response = self.post(url, {})
@@ -188,7 +244,7 @@ class SushibarEndpointsTestCase(BaseAPITestCase):
         url = reverse_lazy("get_node_tree_data")
         response = self.post(url, {"channel_id": channel_id})
         assert response.status_code == 200
-        response_json = response.json()
+        response_json = json.loads(b"".join(response.streaming_content))
         response_json["children"] = response_json[
             "tree"
         ]  # hack because diff function checks 'children'
@@ -208,7 +264,7 @@ class SushibarEndpointsTestCase(BaseAPITestCase):
         url = reverse_lazy("get_node_tree_data")
         response = self.post(url, {"channel_id": channel_id, "node_id": node.node_id})
         assert response.status_code == 200
-        response_json = response.json()
+        response_json = json.loads(b"".join(response.streaming_content))
         response_json["children"] = response_json[
             "tree"
         ]  # hack because diff function checks 'children'
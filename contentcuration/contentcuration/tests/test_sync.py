@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 import uuid
 
+import mock
 from django.urls import reverse
 from le_utils.constants import content_kinds
 from le_utils.constants import file_formats
@@ -25,6 +26,7 @@ from contentcuration.tests.viewsets.base import generate_create_event
 from contentcuration.tests.viewsets.base import generate_update_event
 from contentcuration.tests.viewsets.base import SyncTestMixin
 from contentcuration.utils.publish import mark_all_nodes_as_published
+from contentcuration.utils.sync import get_original_nodes
 from contentcuration.utils.sync import sync_channel
 from contentcuration.viewsets.sync.constants import ASSESSMENTITEM
 from contentcuration.viewsets.sync.constants import FILE
@@ -395,6 +397,40 @@ class SyncTestCase(StudioTestCase):
         for key, value in labels.items():
             self.assertEqual(getattr(target_child, key), {value: True})
 
+    def test_get_original_nodes(self):
+        """
+        Test that the original nodes are found in bulk as they are for each node.
+        """
+        nodes = list(self.derivative_channel.main_tree.get_descendants())
+        originals = get_original_nodes(nodes)
+        for node in nodes:
+            self.assertEqual(originals[node.id].id, node.get_original_node().id)
+
+    def test_sync_channel_in_batches(self):
+        """
+        Test that sync channel syncs all the nodes and reports its progress when syncing in batches.
+        """
+        contentnodes = self.channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC)
+        for contentnode in contentnodes:
+            contentnode.title = "New title {}".format(contentnode.node_id)
+            contentnode.save()
+
+        progress_tracker = mock.Mock()
+        with mock.patch("contentcuration.utils.sync.SYNC_BATCH_SIZE", 2):
+            sync_channel(
+                self.derivative_channel,
+                sync_titles_and_descriptions=True,
+                progress_tracker=progress_tracker,
+            )
+
+        total = progress_tracker.set_total.call_args[0][0]
+        self.assertEqual(sum(call[0][0] for call in progress_tracker.increment.call_args_list), total)
+        self.assertGreater(progress_tracker.increment.call_count, 1)
+        for contentnode in contentnodes:
+            target_child = self.derivative_channel.main_tree.get_descendants().get(source_node_id=contentnode.node_id)
+            self.assertEqual(target_child.title, contentnode.title)
+            self.assertTrue(target_child.changed)
+
 
 class ContentIDTestCase(SyncTestMixin, StudioAPITestCase):
     def setUp(self):
@@ -7,20 +7,30 @@ import io
 import json
 import sys
 import tempfile
+import uuid
 from builtins import range
 
+import mock
+from django.core.exceptions import PermissionDenied
 from django.core.management import call_command
 from django.test import TransactionTestCase
 from django.urls import reverse_lazy
+from le_utils.constants import file_formats
+from le_utils.constants import format_presets
 
 from .base import BaseAPITestCase
 from .testdata import fileobj_video
 from contentcuration.models import DEFAULT_CONTENT_DEFAULTS
+from contentcuration.models import File
 from contentcuration.models import Invitation
 from contentcuration.models import User
 from contentcuration.tests.utils import mixer
 from contentcuration.utils.csv_writer import _format_size
 from contentcuration.utils.csv_writer import write_user_csv
+from contentcuration.utils.user import add_user_storage
+from contentcuration.utils.user import calculate_user_storage
+from contentcuration.utils.user import clear_pending_user_storage
+from contentcuration.utils.user import STORAGE_CALCULATION_DELAY
 from contentcuration.views.users import send_invitation_email
 
 
@@ -160,3 +170,76 @@ class UserAccountTestCase(BaseAPITestCase):
                         self.assertIn(videos[index - 1].original_filename, row)
                         self.assertIn(_format_size(videos[index - 1].file_size), row)
             self.assertEqual(index, len(videos))
+
+
+class UserStorageTestCase(BaseAPITestCase):
+    def setUp(self):
+        super(UserStorageTestCase, self).setUp()
+        clear_pending_user_storage(self.user.id)
+
+    def _create_file(self, checksum=None):
+        file = File(
+            checksum=checksum or uuid.uuid4().hex,
+            file_size=1000,
+            file_format_id=file_formats.MP4,
+            preset_id=format_presets.VIDEO_HIGH_RES,
+            uploaded_by=self.user,
+        )
+        file.save()
+        return file
+
+    @mock.patch("contentcuration.utils.user.calculate_user_storage_task")
+    def test_calculation_requests_coalesced(self, mock_task):
+        calculate_user_storage(self.user.id)
+        calculate_user_storage(self.user.id)
+        mock_task.enqueue.assert_called_once_with(self.user, user_id=self.user.id, countdown=STORAGE_CALCULATION_DELAY)
+
+        clear_pending_user_storage(self.user.id)
+        calculate_user_storage(self.user.id)
+        self.assertEqual(mock_task.enqueue.call_count, 2)
+
+    @mock.patch("contentcuration.utils.user.calculate_user_storage_task")
+    def test_storage_used_updated_by_files(self, mock_task):
+        self.user.refresh_from_db()
+        space_used = self.user.disk_space_used
+
+        file = self._create_file()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.disk_space_used, space_used + file.file_size)
+
+        duplicate = self._create_file(checksum=file.checksum)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.disk_space_used, space_used + file.file_size)
+
+        duplicate.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.disk_space_used, space_used + file.file_size)
+
+        file.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.disk_space_used, space_used)
+        mock_task.enqueue.assert_called_once()
+
+    @mock.patch("contentcuration.utils.user.calculate_user_storage_task")
+    def test_storage_used_updated_by_bulk_created_files(self, mock_task):
+        existing = self._create_file()
+        self.user.refresh_from_db()
+        space_used = self.user.disk_space_used
+
+        checksum = uuid.uuid4().hex
+        files = [
+            File(checksum=checksum, file_size=1000, file_format_id=file_formats.MP4, uploaded_by=self.user),
+            File(checksum=checksum, file_size=1000, file_format_id=file_formats.MP4, uploaded_by=self.user),
+            File(checksum=existing.checksum, file_size=1000, file_format_id=file_formats.MP4, uploaded_by=self.user),
+        ]
+        File.objects.bulk_create(files)
+        add_user_storage(self.user.id, files)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.disk_space_used, space_used + 1000)
+
+    def test_check_space_reads_storage_used(self):
+        self.user.disk_space = 100
+        self.user.disk_space_used = 50
+        self.assertIsNone(self.user.check_space(50, "a" * 32))
+        with self.assertRaises(PermissionDenied):
+            self.user.check_space(51, "a" * 32)
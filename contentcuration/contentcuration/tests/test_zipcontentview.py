@@ -4,11 +4,18 @@ import os
 import tempfile
 import zipfile
 
+import mock
+from django.core.files.storage import default_storage
+
 from .base import StudioTestCase
+from contentcuration.views.zip import parse_range_header
+from contentcuration.views.zip import RangeNotSatisfiable
 
 
 class ZipFileTestCase(StudioTestCase):
 
+    media_content = bytes(range(256)) * 64
+
     def setUp(self):
         super(ZipFileTestCase, self).setUpBase()
         self.zipfile_url = '/zipcontent/'
@@ -26,9 +33,19 @@ class ZipFileTestCase(StudioTestCase):
 
         with zipfile.ZipFile(zip_filename, 'w') as zip:
             zip.writestr("index.html", "<html><head></head><body><p>Hello World!</p></body></html>")
+            zip.writestr("video.mp4", self.media_content, compress_type=zipfile.ZIP_STORED)
+            zip.writestr("audio.mp3", self.media_content, compress_type=zipfile.ZIP_DEFLATED)
 
         return zip_filename
 
+    def upload_zip(self):
+        myzip = self.do_create_zip()
+        self.sign_in()
+        with open(myzip, 'rb') as f:
+            temp_file, response = self.upload_temp_file(f.read(), preset='html5_zip', ext='zip')
+        assert response.status_code == 200
+        return temp_file
+
     def test_invalid_zip(self):
         temp_file, response = self.upload_temp_file(b"Hello!", ext="zip")
         url = '{}{}/'.format(self.zipfile_url, temp_file['name'])
@@ -74,3 +91,56 @@ class ZipFileTestCase(StudioTestCase):
         url = '{}{}/../outsidejson.js'.format(self.zipfile_url, temp_file['name'])
         response = self.get(url)
         assert response.status_code == 404
+
+    def test_accept_ranges(self):
+        temp_file = self.upload_zip()
+        response = self.get('{}{}/video.mp4'.format(self.zipfile_url, temp_file['name']))
+        assert response.status_code == 200
+        assert response["Accept-Ranges"] == "bytes"
+        assert b"".join(response.streaming_content) == self.media_content
+
+    def test_range_request(self):
+        temp_file = self.upload_zip()
+        for embedded_filepath in ("video.mp4", "audio.mp3"):
+            response = self.client.get(
+                '{}{}/{}'.format(self.zipfile_url, temp_file['name'], embedded_filepath),
+                HTTP_RANGE="bytes=100-1099",
+            )
+            assert response.status_code == 206
+            assert response["Content-Range"] == "bytes 100-1099/{}".format(len(self.media_content))
+            assert response["Content-Length"] == "1000"
+            assert b"".join(response.streaming_content) == self.media_content[100:1100]
+
+    def test_range_request_not_satisfiable(self):
+        temp_file = self.upload_zip()
+        response = self.client.get(
+            '{}{}/video.mp4'.format(self.zipfile_url, temp_file['name']),
+            HTTP_RANGE="bytes={}-".format(len(self.media_content)),
+        )
+        assert response.status_code == 416
+        assert response["Content-Range"] == "bytes */{}".format(len(self.media_content))
+
+    def test_caches_central_directory(self):
+        temp_file = self.upload_zip()
+        url = '{}{}/index.html'.format(self.zipfile_url, temp_file['name'])
+        response = self.get(url)
+        assert response.status_code == 200
+        with mock.patch.object(default_storage, "exists") as exists_mock, mock.patch.object(default_storage, "size") as size_mock:
+            response = self.get('{}{}/video.mp4'.format(self.zipfile_url, temp_file['name']))
+            assert b"".join(response.streaming_content) == self.media_content
+            response = self.get('{}{}/iamjustanillusion.txt'.format(self.zipfile_url, temp_file['name']))
+            assert response.status_code == 404
+        exists_mock.assert_not_called()
+        size_mock.assert_not_called()
+
+    def test_parse_range_header(self):
+        assert parse_range_header(None, 10) is None
+        assert parse_range_header("bytes=0-4", 10) == (0, 4)
+        assert parse_range_header("bytes=5-", 10) == (5, 9)
+        assert parse_range_header("bytes=-3", 10) == (7, 9)
+        assert parse_range_header("bytes=5-100", 10) == (5, 9)
+        # multiple and invalid ranges are ignored, and the whole content is returned
+        assert parse_range_header("bytes=0-1,3-4", 10) is None
+        assert parse_range_header("bytes=4-1", 10) is None
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=10-", 10)
@@ -1,7 +1,18 @@
 import mock
+from django.core.cache.backends.locmem import LocMemCache
 from django.test import SimpleTestCase
+from redis.exceptions import ConnectionError as RedisConnectionError
 
+from ...helpers import mock_class_instance
+from contentcuration.models import User
+from contentcuration.tasks import apply_channel_changes_task
+from contentcuration.utils.celery.tasks import CeleryTask
+from contentcuration.utils.celery.tasks import CLAIM_SIGNATURE_SCRIPT
 from contentcuration.utils.celery.tasks import ProgressTracker
+from contentcuration.utils.celery.tasks import REGISTER_SIGNATURE_SCRIPT
+from contentcuration.utils.celery.tasks import RELEASE_SIGNATURE_SCRIPT
+from contentcuration.utils.celery.tasks import TASK_SIGNATURE_KEY
+from contentcuration.utils.celery.tasks import TaskSignatureRegistry
 
 
 class ProgressTrackerTestCase(SimpleTestCase):
@@ -41,3 +52,94 @@ class ProgressTrackerTestCase(SimpleTestCase):
         self.send_event.assert_not_called()
         self.tracker.track(1.0)
         self.send_event.assert_called_with(progress=1)
+
+    def test_track__notifies_channel(self):
+        tracker = ProgressTracker("abc123", self.send_event, channel_id="def456")
+        with mock.patch("contentcuration.utils.celery.tasks.notify") as notify:
+            tracker.track(0.5)
+            notify.assert_not_called()
+            tracker.track(2)
+            notify.assert_called_once_with(channel_ids=["def456"])
+
+
+class FakeRedis(object):
+    """
+    Runs the scripts of the TaskSignatureRegistry against a dict
+    """
+    def __init__(self):
+        self.data = {}
+
+    def eval(self, script, numkeys, key, task_id, *args):
+        task_id = task_id.encode("utf-8")
+        if script == CLAIM_SIGNATURE_SCRIPT:
+            return self.data.setdefault(key, task_id)
+        if script == REGISTER_SIGNATURE_SCRIPT:
+            self.data[key] = task_id
+            return b"OK"
+        if script == RELEASE_SIGNATURE_SCRIPT and self.data.get(key) == task_id:
+            del self.data[key]
+            return 1
+        return 0
+
+
+class TaskSignatureRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        super(TaskSignatureRegistryTestCase, self).setUp()
+        self.redis = FakeRedis()
+        cache_client = mock_class_instance("django_redis.client.DefaultClient")
+        cache_client.get_client.return_value = self.redis
+        cache = mock.Mock(client=cache_client)
+        cache.make_key.side_effect = lambda key: ":1:" + key
+        self.registry = TaskSignatureRegistry(cache=cache)
+
+    def test_claim(self):
+        self.assertEqual(self.registry.claim("abc", "task1"), "task1")
+        self.assertEqual(self.registry.claim("abc", "task2"), "task1")
+        self.assertIn(":1:" + TASK_SIGNATURE_KEY.format("abc"), self.redis.data)
+
+    def test_release(self):
+        self.registry.claim("abc", "task1")
+        self.registry.release("abc", "task2")
+        self.assertEqual(self.registry.claim("abc", "task3"), "task1")
+        self.registry.release("abc", "task1")
+        self.assertEqual(self.registry.claim("abc", "task3"), "task3")
+
+    def test_register(self):
+        self.registry.claim("abc", "task1")
+        self.registry.register("abc", "task2")
+        self.assertEqual(self.registry.claim("abc", "task3"), "task2")
+
+    def test_unavailable(self):
+        registry = TaskSignatureRegistry(cache=LocMemCache("registry", {}))
+        self.assertIsNone(registry.claim("abc", "task1"))
+        self.redis.eval = mock.Mock(side_effect=RedisConnectionError)
+        self.assertIsNone(self.registry.claim("abc", "task1"))
+
+    def test_fetch_or_enqueue__registered(self):
+        with mock.patch("contentcuration.utils.celery.tasks.TaskSignatureRegistry", return_value=self.registry), \
+                mock.patch.object(apply_channel_changes_task, "enqueue") as enqueue:
+            user = User(pk=1)
+            apply_channel_changes_task.fetch_or_enqueue(user, channel_id="abc")
+            enqueue.assert_called_once()
+            task_id = enqueue.call_args[1]["task_id"]
+            async_result = apply_channel_changes_task.fetch_or_enqueue(user, channel_id="abc")
+            enqueue.assert_called_once()
+            self.assertEqual(async_result.task_id, task_id)
+
+    def test_after_return__releases(self):
+        signature = apply_channel_changes_task.generate_signature({"channel_id": "abc"})
+        self.registry.claim(signature, "task1")
+        with mock.patch("contentcuration.utils.celery.tasks.TaskSignatureRegistry", return_value=self.registry):
+            self.assertEqual(self.registry.claim(signature, "task2"), "task1")
+            apply_channel_changes_task.after_return("SUCCESS", None, "task1", (), {"channel_id": "abc"}, None)
+        self.assertEqual(self.registry.claim(signature, "task2"), "task2")
+
+    def test_revoke__releases(self):
+        signature = apply_channel_changes_task.generate_signature({"channel_id": "abc"})
+        self.registry.claim(signature, "task1")
+        with mock.patch("contentcuration.utils.celery.tasks.TaskSignatureRegistry", return_value=self.registry), \
+                mock.patch.object(apply_channel_changes_task, "find_incomplete_ids", return_value=["task1"]), \
+                mock.patch.object(apply_channel_changes_task.app.control, "revoke"), \
+                mock.patch.object(CeleryTask, "TaskModel", new_callable=mock.PropertyMock):
+            self.assertEqual(apply_channel_changes_task.revoke(channel_id="abc"), 1)
+        self.assertEqual(self.registry.claim(signature, "task2"), "task2")
@@ -1,7 +1,17 @@
+import time
+from datetime import datetime
+
 import mock
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.test import SimpleTestCase
 
 from ..helpers import mock_class_instance
+from contentcuration.utils.cache import cache_stampede
+from contentcuration.utils.cache import CacheMetrics
+from contentcuration.utils.cache import CacheNamespace
+from contentcuration.utils.cache import invalidate_cache_tags
 from contentcuration.utils.cache import ResourceSizeCache
 
 
@@ -10,22 +20,11 @@ class ResourceSizeCacheTestCase(SimpleTestCase):
         super(ResourceSizeCacheTestCase, self).setUp()
         self.node = mock_class_instance("contentcuration.models.ContentNode")
         self.node.pk = "abcdefghijklmnopqrstuvwxyz"
-        self.redis_client = mock_class_instance("redis.client.StrictRedis")
-        self.cache_client = mock_class_instance("django_redis.client.DefaultClient")
-        self.cache_client.get_client.return_value = self.redis_client
-        self.cache = mock.Mock(client=self.cache_client)
-        self.helper = ResourceSizeCache(self.node, self.cache)
-
-    def test_redis_client(self):
-        self.assertEqual(self.helper.redis_client, self.redis_client)
-        self.cache_client.get_client.assert_called_once_with(write=True)
-
-    def test_redis_client__not_redis(self):
-        self.cache.client = mock.Mock()
-        self.assertIsNone(self.helper.redis_client)
-
-    def test_hash_key(self):
-        self.assertEqual("resource_size:abcd", self.helper.hash_key)
+        self.cache = LocMemCache("resource_size", {})
+        self.namespace = CacheNamespace(
+            "resource_size_test", timeout=60, cache=self.cache, metrics=CacheMetrics(cache=self.cache)
+        )
+        self.helper = ResourceSizeCache(self.node, self.namespace)
 
     def test_size_key(self):
         self.assertEqual("abcdefghijklmnopqrstuvwxyz:value", self.helper.size_key)
@@ -33,50 +32,183 @@ class ResourceSizeCacheTestCase(SimpleTestCase):
     def test_modified_key(self):
         self.assertEqual("abcdefghijklmnopqrstuvwxyz:modified", self.helper.modified_key)
 
-    def test_cache_get(self):
-        self.redis_client.hget.return_value = 123
-        self.assertEqual(123, self.helper.cache_get("test_key"))
-        self.redis_client.hget.assert_called_once_with(self.helper.hash_key, "test_key")
-
-    def test_cache_get__not_redis(self):
-        self.cache.client = mock.Mock()
-        self.cache.get.return_value = 123
-        self.assertEqual(123, self.helper.cache_get("test_key"))
-        self.cache.get.assert_called_once_with("{}:{}".format(self.helper.hash_key, "test_key"))
-
-    def test_cache_set(self):
+    def test_cache_get_set(self):
+        self.assertIsNone(self.helper.cache_get("test_key"))
         self.helper.cache_set("test_key", 123)
-        self.redis_client.hset.assert_called_once_with(self.helper.hash_key, "test_key", 123)
+        self.assertEqual(123, self.helper.cache_get("test_key"))
+        self.assertEqual(123, self.namespace.get("test_key"))
 
     def test_cache_set__delete(self):
+        self.helper.cache_set("test_key", 123)
         self.helper.cache_set("test_key", None)
-        self.redis_client.hdel.assert_called_once_with(self.helper.hash_key, "test_key")
+        self.assertIsNone(self.helper.cache_get("test_key"))
 
-    def test_cache_set__not_redis(self):
-        self.cache.client = mock.Mock()
-        self.helper.cache_set("test_key", 123)
-        self.cache.set.assert_called_once_with("{}:{}".format(self.helper.hash_key, "test_key"), 123)
-
-    def test_get_size(self):
-        with mock.patch.object(self.helper, 'cache_get') as cache_get:
-            cache_get.return_value = 123
-            self.assertEqual(123, self.helper.get_size())
-            cache_get.assert_called_once_with(self.helper.size_key)
-
-    def test_set_size(self):
-        with mock.patch.object(self.helper, 'cache_set') as cache_set:
-            self.helper.set_size(123)
-            cache_set.assert_called_once_with(self.helper.size_key, 123)
-
-    def test_get_modified(self):
-        with mock.patch.object(self.helper, 'cache_get') as cache_get:
-            cache_get.return_value = '2021-01-01 00:00:00'
-            modified = self.helper.get_modified()
-            self.assertIsNotNone(modified)
-            self.assertEqual('2021-01-01T00:00:00', modified.isoformat())
-            cache_get.assert_called_once_with(self.helper.modified_key)
-
-    def test_set_modified(self):
-        with mock.patch.object(self.helper, 'cache_set') as cache_set:
-            self.helper.set_modified('2021-01-01 00:00:00')
-            cache_set.assert_called_once_with(self.helper.modified_key, '2021-01-01 00:00:00')
+    def test_get_set_size(self):
+        self.assertIsNone(self.helper.get_size())
+        self.helper.set_size(123)
+        self.assertEqual(123, self.helper.get_size())
+
+    def test_get_set_modified(self):
+        self.helper.set_modified('2021-01-01 00:00:00')
+        modified = self.helper.get_modified()
+        self.assertIsNotNone(modified)
+        self.assertEqual('2021-01-01T00:00:00', modified.isoformat())
+
+    def test_reset_modified(self):
+        self.helper.set_modified(datetime(2021, 1, 2))
+        self.helper.reset_modified(datetime(2021, 1, 1))
+        self.assertEqual(datetime(2021, 1, 1), self.helper.get_modified())
+        self.helper.reset_modified(None)
+        self.assertIsNone(self.helper.get_modified())
+
+
+class CacheNamespaceTestCase(SimpleTestCase):
+    def setUp(self):
+        super(CacheNamespaceTestCase, self).setUp()
+        self.cache = LocMemCache("namespace", {})
+        self.metrics = CacheMetrics(cache=self.cache)
+        self.namespace = CacheNamespace("test", timeout=60, cache=self.cache, metrics=self.metrics)
+
+    def test_get_set(self):
+        self.assertIsNone(self.namespace.get("key"))
+        self.namespace.set("key", 123)
+        self.assertEqual(123, self.namespace.get("key"))
+        self.assertIsNotNone(self.cache.get("test:key"))
+        self.namespace.delete("key")
+        self.assertIsNone(self.namespace.get("key"))
+
+    def test_invalidate_tags(self):
+        self.namespace.set("a", 1, tags=("channel:1",))
+        self.namespace.set("b", 2, tags=("channel:2",))
+        self.namespace.set("c", 3, tags=("channel:1", "channel:2"))
+        invalidate_cache_tags("channel:1", cache=self.cache)
+        self.assertIsNone(self.namespace.get("a"))
+        self.assertEqual(2, self.namespace.get("b"))
+        self.assertIsNone(self.namespace.get("c"))
+
+    def test_evicted_tag_invalidates(self):
+        self.namespace.set("a", 1, tags=("channel:1",))
+        self.cache.delete("cache_tag:channel:1")
+        self.assertIsNone(self.namespace.get("a"))
+
+    def test_get_or_set(self):
+        func = mock.Mock(return_value=123)
+        self.assertEqual(123, self.namespace.get_or_set("key", func))
+        self.assertEqual(123, self.namespace.get_or_set("key", func))
+        func.assert_called_once_with()
+
+    def test_get_or_set__recomputes_in_background(self):
+        func = mock.Mock(return_value=123)
+        self.namespace.get_or_set("key", func)
+        entry = self.cache.get("test:key")
+        # make the value about to expire and slow to compute
+        entry["EXPIRE"] = time.time()
+        entry["DELTA"] = 10
+        self.cache.set("test:key", entry)
+
+        with mock.patch("contentcuration.utils.cache.threading.Thread") as thread:
+            self.assertEqual(123, self.namespace.get_or_set("key", func))
+            self.assertEqual(123, self.namespace.get_or_set("key", func))
+        func.assert_called_once_with()
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+        _, kwargs = thread.call_args
+        kwargs["target"](*kwargs["args"])
+        self.assertEqual(2, func.call_count)
+        self.assertEqual(60, round(self.cache.get("test:key")["EXPIRE"] - time.time()))
+        self.assertIsNone(self.cache.get("test:key:CALCULATING"))
+
+    def test_metrics(self):
+        self.namespace.get_or_set("key", lambda: 123)
+        self.namespace.get("key")
+        counts = self.metrics.get(["test"])["test"]
+        self.assertEqual(1, counts["hits"])
+        self.assertEqual(1, counts["misses"])
+        self.assertEqual(1, counts["sets"])
+        self.assertIn("get_time", counts)
+        self.assertIn("compute_time", counts)
+        self.metrics.reset(["test"])
+        self.assertEqual({}, self.metrics.get(["test"])["test"])
+
+    def test_evict(self):
+        redis_client = mock_class_instance("redis.client.StrictRedis")
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.return_value = [1, 0, 5]
+        redis_client.zpopmin.return_value = [(b"old1", 1.0), (b"old2", 2.0)]
+        namespace = CacheNamespace("bounded", timeout=60, max_entries=3, cache=self.cache, metrics=self.metrics)
+
+        with mock.patch("contentcuration.utils.cache.get_redis_client", return_value=redis_client):
+            namespace.set("key", 123)
+
+        pipeline.zadd.assert_called_once()
+        redis_client.zpopmin.assert_called_once_with(self.cache.make_key("cache_entries:bounded"), 2)
+        redis_client.delete.assert_called_once_with(b"old1", b"old2")
+
+    def test_versioned_invalidate(self):
+        namespace = CacheNamespace("versioned", timeout=60, versioned=True, cache=self.cache, metrics=self.metrics)
+        namespace.set("a", 1)
+        generation = namespace.get_generation()
+        self.assertEqual("versioned:{}:a".format(generation), namespace.make_key("a"))
+
+        namespace.invalidate()
+        self.assertEqual(generation + 1, namespace.get_generation())
+        self.assertIsNone(namespace.get("a"))
+        # the value of the old generation is left to expire
+        self.assertIsNotNone(self.cache.get("versioned:{}:a".format(generation)))
+
+    def test_versioned_invalidate__evicted_generation(self):
+        namespace = CacheNamespace("versioned", timeout=60, versioned=True, cache=self.cache, metrics=self.metrics)
+        namespace.set("a", 1)
+        self.cache.delete(namespace.generation_key)
+        namespace.invalidate()
+        self.assertIsNone(namespace.get("a"))
+
+    def test_versioned_invalidate__during_compute(self):
+        namespace = CacheNamespace("versioned", timeout=60, versioned=True, cache=self.cache, metrics=self.metrics)
+
+        def func():
+            namespace.invalidate()
+            return 1
+
+        self.assertEqual(1, namespace.get_or_set("a", func))
+        # the value was computed before the invalidation, so it is not cached for the new generation
+        self.assertIsNone(namespace.get("a"))
+
+    def test_invalidate_tags__during_compute(self):
+        def func():
+            invalidate_cache_tags("channel:1", cache=self.cache)
+            return 1
+
+        self.assertEqual(1, self.namespace.get_or_set("a", func, tags=("channel:1",)))
+        self.assertIsNone(self.namespace.get("a"))
+
+    def test_invalidate__not_versioned(self):
+        with self.assertRaises(TypeError):
+            self.namespace.invalidate()
+
+    def test_cache_page(self):
+        namespace = CacheNamespace("pages", versioned=True)
+        view = mock.Mock(side_effect=lambda request: HttpResponse("page"))
+        cached_view = namespace.cache_page(60)(view)
+        request = RequestFactory().get("/pages")
+
+        self.assertEqual(b"page", cached_view(request).content)
+        self.assertEqual(b"page", cached_view(request).content)
+        self.assertEqual(1, view.call_count)
+
+        namespace.invalidate()
+        self.assertEqual(b"page", cached_view(request).content)
+        self.assertEqual(2, view.call_count)
+
+    def test_cache_stampede(self):
+        calls = []
+
+        @cache_stampede(60)
+        def stampede_test(key, value):
+            calls.append(key)
+            return value
+
+        self.assertEqual(1, stampede_test("key", 1))
+        self.assertEqual(1, stampede_test("key", 2))
+        self.assertEqual(["key"], calls)
@@ -0,0 +1,299 @@
+import queue
+import threading
+import time
+
+import mock
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from ..base import StudioAPITestCase
+from ..base import StudioTestCase
+from ..helpers import mock_class_instance
+from contentcuration import models
+from contentcuration.tests import testdata
+from contentcuration.tests.viewsets.base import generate_update_event
+from contentcuration.tests.viewsets.base import SyncTestMixin
+from contentcuration.utils.change_feed import CHANGE_FEED_CACHE_TIMEOUT
+from contentcuration.utils.change_feed import channel_rev_key
+from contentcuration.utils.change_feed import get_latest_revs
+from contentcuration.utils.change_feed import notify
+from contentcuration.utils.change_feed import record_changes
+from contentcuration.utils.change_feed import set_latest_revs
+from contentcuration.utils.change_feed import SET_MAX_SCRIPT
+from contentcuration.utils.change_feed import user_rev_key
+from contentcuration.utils.change_feed import wait_for_changes
+from contentcuration.viewsets.sync.constants import CHANNEL
+
+
+class ChangeFeedTestCase(StudioTestCase):
+    def setUp(self):
+        super(ChangeFeedTestCase, self).setUp()
+        self.cache = LocMemCache("change_feed", {})
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+
+    def _create_change(self, applied=True, **kwargs):
+        return models.Change.create_change(
+            generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id, **kwargs),
+            created_by_id=self.user.id,
+            applied=applied,
+        )
+
+    def test_set_latest_revs__only_increases(self):
+        key = channel_rev_key(self.channel.id)
+        set_latest_revs({key: 10}, cache=self.cache)
+        set_latest_revs({key: 5}, cache=self.cache)
+        self.assertEqual(self.cache.get(key), 10)
+        set_latest_revs({key: 15}, cache=self.cache)
+        self.assertEqual(self.cache.get(key), 15)
+
+    def test_set_latest_revs__redis(self):
+        redis_client = mock_class_instance("redis.client.StrictRedis")
+        cache_client = mock_class_instance("django_redis.client.DefaultClient")
+        cache_client.get_client.return_value = redis_client
+        cache = mock.Mock(client=cache_client)
+        cache.make_key.side_effect = lambda key: ":1:" + key
+        key = channel_rev_key(self.channel.id)
+        set_latest_revs({key: 10}, cache=cache)
+        redis_client.eval.assert_called_once_with(SET_MAX_SCRIPT, 1, ":1:" + key, 10, CHANGE_FEED_CACHE_TIMEOUT)
+
+    def test_record_changes(self):
+        change = self._create_change(applied=False)
+        user_change = self._create_change(applied=False, user_id=self.user.id)
+        record_changes([change, user_change], cache=self.cache)
+        self.assertEqual(self.cache.get(channel_rev_key(self.channel.id)), user_change.server_rev)
+        self.assertEqual(self.cache.get(user_rev_key(self.user.id)), user_change.server_rev)
+
+    def test_get_latest_revs__fills_from_db(self):
+        change = self._create_change()
+        self._create_change(applied=False)
+        channel_revs, user_rev = get_latest_revs([self.channel.id], user_id=self.user.id, cache=self.cache)
+        self.assertEqual(channel_revs, {self.channel.id: change.server_rev})
+        self.assertEqual(user_rev, 0)
+        self.assertEqual(self.cache.get(channel_rev_key(self.channel.id)), change.server_rev)
+
+    def test_get_latest_revs__cached(self):
+        set_latest_revs({channel_rev_key(self.channel.id): 10, user_rev_key(self.user.id): 5}, cache=self.cache)
+        with self.assertNumQueries(0):
+            channel_revs, user_rev = get_latest_revs([self.channel.id], user_id=self.user.id, cache=self.cache)
+        self.assertEqual(channel_revs, {self.channel.id: 10})
+        self.assertEqual(user_rev, 5)
+
+    def test_get_latest_revs__cache_error(self):
+        cache = mock.Mock()
+        cache.get_many.side_effect = Exception("Cache unavailable")
+        channel_revs, user_rev = get_latest_revs([self.channel.id], user_id=self.user.id, cache=cache)
+        self.assertEqual(channel_revs, {self.channel.id: None})
+        self.assertIsNone(user_rev)
+
+
+class SyncChangeFeedTestCase(SyncTestMixin, StudioAPITestCase):
+    def setUp(self):
+        super(SyncChangeFeedTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _poll(self, channel_rev, user_rev=0):
+        return self.client.post(
+            self.sync_url,
+            {"changes": [], "channel_revs": {self.channel.id: channel_rev}, "user_rev": user_rev},
+            format="json",
+        )
+
+    def _queries_change_table(self, context):
+        return any(
+            models.Change._meta.db_table in query["sql"] and "server_rev" in query["sql"]
+            for query in context.captured_queries
+        )
+
+    def test_returns_new_changes(self):
+        change = models.Change.create_change(
+            generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id),
+            applied=True,
+        )
+        response = self._poll(change.server_rev - 1)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([c["server_rev"] for c in response.json()["changes"]], [change.server_rev])
+
+    def test_poll_without_new_changes_skips_change_query(self):
+        change = models.Change.create_change(
+            generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id),
+            applied=True,
+        )
+        channel_revs, user_rev = get_latest_revs([self.channel.id], user_id=self.user.id)
+        self.assertEqual(channel_revs[self.channel.id], change.server_rev)
+        with CaptureQueriesContext(connection) as context:
+            response = self._poll(change.server_rev, user_rev=user_rev)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["changes"], [])
+        self.assertFalse(self._queries_change_table(context))
+
+    def test_returns_changes_applied_by_sync(self):
+        response = self.sync_changes(
+            [generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        server_rev = response.json()["allowed"][0]["server_rev"]
+        channel_revs, _ = get_latest_revs([self.channel.id])
+        self.assertEqual(channel_revs[self.channel.id], server_rev)
+        response = self.client.post(
+            self.sync_url,
+            {"changes": [], "channel_revs": {self.channel.id: server_rev}, "unapplied_revs": [server_rev]},
+            format="json",
+        )
+        self.assertEqual([c["server_rev"] for c in response.json()["successes"]], [server_rev])
+
+
+class FakePubSub(object):
+    """
+    Stand-in for a Redis PubSub object, delivering messages published to the FakeRedis it was created from
+    """
+
+    def __init__(self, redis, ignore_subscribe_messages=False):
+        self.redis = redis
+        self.names = set()
+        self.messages = queue.Queue()
+
+    def subscribe(self, *names):
+        self.names.update(names)
+        self.redis.subscribers.append(self)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        if self in self.redis.subscribers:
+            self.redis.subscribers.remove(self)
+
+
+class FakeRedis(object):
+    """
+    Stand-in for a Redis client that only supports pub/sub, so that cached revs are always filled from the database
+    """
+
+    def __init__(self):
+        self.subscribers = []
+
+    def pubsub(self, **kwargs):
+        return FakePubSub(self, **kwargs)
+
+    def pipeline(self, **kwargs):
+        return self
+
+    def execute(self):
+        pass
+
+    def eval(self, *args):
+        pass
+
+    def publish(self, name, message):
+        for subscriber in self.subscribers:
+            if name in subscriber.names:
+                subscriber.messages.put({"type": "message", "channel": name, "data": message})
+
+
+class WaitForChangesTestCase(StudioTestCase):
+    def setUp(self):
+        super(WaitForChangesTestCase, self).setUp()
+        self.cache = LocMemCache("change_feed", {})
+        self.redis = FakeRedis()
+        patcher = mock.patch("contentcuration.utils.change_feed._get_redis_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.change = models.Change.create_change(
+            generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id),
+            applied=True,
+        )
+
+    def test_returns_immediately_with_new_changes(self):
+        self.assertTrue(
+            wait_for_changes({self.channel.id: self.change.server_rev - 1}, user_id=self.user.id, timeout=5, cache=self.cache)
+        )
+        self.assertEqual(self.redis.subscribers, [])
+
+    def test_times_out_without_new_changes(self):
+        self.assertFalse(
+            wait_for_changes({self.channel.id: self.change.server_rev}, user_id=self.user.id, timeout=0.1, cache=self.cache)
+        )
+        self.assertEqual(self.redis.subscribers, [])
+
+    def test_woken_by_notify(self):
+        timer = threading.Timer(0.1, notify, kwargs=dict(channel_ids=[self.channel.id], cache=self.cache))
+        start = time.time()
+        timer.start()
+        try:
+            self.assertTrue(
+                wait_for_changes({self.channel.id: self.change.server_rev}, user_id=self.user.id, timeout=5, cache=self.cache)
+            )
+        finally:
+            timer.cancel()
+        self.assertLess(time.time() - start, 5)
+
+    def test_not_woken_by_other_channels(self):
+        timer = threading.Timer(0.05, notify, kwargs=dict(channel_ids=["other"], cache=self.cache))
+        timer.start()
+        try:
+            self.assertFalse(
+                wait_for_changes({self.channel.id: self.change.server_rev}, user_id=self.user.id, timeout=0.2, cache=self.cache)
+            )
+        finally:
+            timer.cancel()
+
+    def test_no_redis(self):
+        with mock.patch("contentcuration.utils.change_feed._get_redis_client", return_value=None):
+            self.assertTrue(
+                wait_for_changes({self.channel.id: self.change.server_rev}, user_id=self.user.id, timeout=5, cache=self.cache)
+            )
+
+
+@override_settings(SYNC_WAIT_TIMEOUT=0.1)
+class SyncWaitTestCase(StudioAPITestCase):
+    def setUp(self):
+        super(SyncWaitTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+        self.change = models.Change.create_change(
+            generate_update_event(self.channel.id, CHANNEL, {"name": "New name"}, channel_id=self.channel.id),
+            applied=True,
+        )
+        channel_revs, self.user_rev = get_latest_revs([self.channel.id], user_id=self.user.id)
+
+    def _wait(self, channel_rev):
+        with mock.patch("contentcuration.utils.change_feed._get_redis_client", return_value=FakeRedis()):
+            return self.client.post(
+                reverse("sync_wait"),
+                {"channel_revs": {self.channel.id: channel_rev}, "user_rev": self.user_rev},
+                format="json",
+            )
+
+    def test_changed(self):
+        response = self._wait(self.change.server_rev - 1)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()["changed"])
+
+    def test_unchanged(self):
+        response = self._wait(self.change.server_rev)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(response.json()["changed"])
+
+    def test_timeout_capped(self):
+        with mock.patch("contentcuration.viewsets.sync.endpoint.wait_for_changes", return_value=False) as wait:
+            response = self.client.post(
+                reverse("sync_wait"),
+                {"channel_revs": {self.channel.id: self.change.server_rev}, "timeout": 600},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(wait.call_args[1]["timeout"], 0.1)
@@ -0,0 +1,121 @@
+import uuid
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from ..base import StudioAPITestCase
+from ..base import StudioTestCase
+from contentcuration.models import ChannelSummary
+from contentcuration.models import ContentNode
+from contentcuration.tests import testdata
+from contentcuration.tests.viewsets.base import generate_copy_event
+from contentcuration.tests.viewsets.base import generate_delete_event
+from contentcuration.tests.viewsets.base import generate_update_event
+from contentcuration.tests.viewsets.base import SyncTestMixin
+from contentcuration.utils.channel_summary import claim_channel_summary_update
+from contentcuration.utils.channel_summary import compute_channel_summary
+from contentcuration.utils.channel_summary import release_channel_summary_update
+from contentcuration.utils.channel_summary import update_channel_summary
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+
+
+class ChannelSummaryTestCase(StudioTestCase):
+    def setUp(self):
+        super(ChannelSummaryTestCase, self).setUpBase()
+
+    def test_compute_channel_summary(self):
+        summary = compute_channel_summary(self.channel)
+        nodes = self.channel.main_tree.get_descendants(include_self=True)
+        self.assertEqual(summary["last_modified"], nodes.order_by("-modified").values_list("modified", flat=True)[0])
+        self.assertEqual(
+            summary["resource_count"],
+            len(set(nodes.exclude(kind_id="topic").values_list("content_id", flat=True))),
+        )
+        self.assertTrue(summary["has_unpublished_changes"])
+
+    def test_update_channel_summary(self):
+        summary = update_channel_summary(self.channel.id)
+        self.assertEqual(ChannelSummary.objects.get(channel_id=self.channel.id).resource_count, summary.resource_count)
+        self.assertEqual(update_channel_summary(self.channel.id).pk, summary.pk)
+
+    def test_rebuild_command(self):
+        ChannelSummary.objects.filter(channel_id=self.channel.id).delete()
+        call_command("rebuild_channel_summaries", "--channel-id", self.channel.id)
+        self.assertTrue(ChannelSummary.objects.filter(channel_id=self.channel.id).exists())
+
+
+class ChannelSummaryViewSetTestCase(SyncTestMixin, StudioAPITestCase):
+    def setUp(self):
+        super(ChannelSummaryViewSetTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _get_channel(self):
+        response = self.client.get(
+            reverse("channel-detail", kwargs={"pk": self.channel.id}), format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_updated_after_changes(self):
+        node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").first()
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"title": "New title"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        node.refresh_from_db()
+        summary = ChannelSummary.objects.get(channel_id=self.channel.id)
+        self.assertEqual(summary.last_modified, node.modified)
+
+    def test_updated_after_delete(self):
+        count = self._get_channel()["count"]
+        resources = self.channel.main_tree.get_descendants().exclude(kind_id="topic")
+        content_ids = list(resources.values_list("content_id", flat=True))
+        node = next(node for node in resources if content_ids.count(node.content_id) == 1)
+        response = self.sync_changes([generate_delete_event(node.id, CONTENTNODE, channel_id=self.channel.id)])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(ChannelSummary.objects.get(channel_id=self.channel.id).resource_count, count - 1)
+        self.assertEqual(self._get_channel()["count"], count - 1)
+
+    def test_updated_after_copy(self):
+        count = self._get_channel()["count"]
+        other_channel = testdata.channel()
+        other_channel.editors.add(self.user)
+        source = ContentNode.objects.create(title="Video", kind_id="video", parent=other_channel.main_tree)
+        new_node_id = uuid.uuid4().hex
+        response = self.sync_changes(
+            [
+                generate_copy_event(
+                    new_node_id, CONTENTNODE, source.id, self.channel.main_tree_id, channel_id=self.channel.id
+                )
+            ]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(ContentNode.objects.filter(id=new_node_id).exists())
+        self.assertEqual(ChannelSummary.objects.get(channel_id=self.channel.id).resource_count, count + 1)
+        self.assertEqual(self._get_channel()["count"], count + 1)
+
+    def test_not_updated_while_update_pending(self):
+        update_channel_summary(self.channel.id)
+        self.assertTrue(claim_channel_summary_update(self.channel.id))
+        self.addCleanup(release_channel_summary_update, self.channel.id)
+        node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").first()
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"title": "New title"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        node.refresh_from_db()
+        summary = ChannelSummary.objects.get(channel_id=self.channel.id)
+        self.assertNotEqual(summary.last_modified, node.modified)
+        self.assertFalse(claim_channel_summary_update(self.channel.id))
+
+    def test_update_releases_pending_update(self):
+        node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").first()
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"title": "New title"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(claim_channel_summary_update(self.channel.id))
+        release_channel_summary_update(self.channel.id)
@@ -0,0 +1,174 @@
+from django.core.management import call_command
+from django.urls import reverse
+from le_utils.constants import content_kinds
+from le_utils.constants import roles
+
+from ..base import StudioAPITestCase
+from ..base import StudioTestCase
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeAggregate
+from contentcuration.tests import testdata
+from contentcuration.tests.viewsets.base import generate_update_event
+from contentcuration.tests.viewsets.base import SyncTestMixin
+from contentcuration.utils.node_aggregates import AGGREGATE_FIELDS
+from contentcuration.utils.node_aggregates import compute_aggregates
+from contentcuration.utils.node_aggregates import CONTRIBUTION_FIELDS
+from contentcuration.utils.node_aggregates import get_contribution
+from contentcuration.utils.node_aggregates import get_stored_aggregates
+from contentcuration.utils.node_aggregates import get_subtree_counts
+from contentcuration.utils.node_aggregates import rebuild_aggregates
+from contentcuration.utils.node_aggregates import reset_changed_aggregates
+from contentcuration.utils.publish import mark_all_nodes_as_published
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+
+
+class NodeAggregatesTestCase(StudioTestCase):
+    def setUp(self):
+        super(NodeAggregatesTestCase, self).setUpBase()
+        self.root = self.channel.main_tree
+        self.topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        self.other_topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).last()
+
+    def _position(self, node):
+        node.refresh_from_db()
+        return dict(tree_id=node.tree_id, lft=node.lft, rght=node.rght)
+
+    def assertAggregatesCorrect(self, root):
+        """
+        Checks the stored counts of all the topics of the tree against counts of their descendants
+        """
+        expected = {}
+        for topic in ContentNode.objects.filter(tree_id=root.tree_id, kind_id=content_kinds.TOPIC).values(
+            "id", "tree_id", "lft", "rght", *CONTRIBUTION_FIELDS
+        ):
+            own_contribution = get_contribution(*(topic[field] for field in CONTRIBUTION_FIELDS))
+            subtree_counts = get_subtree_counts(topic["tree_id"], topic["lft"], topic["rght"])
+            expected[topic["id"]] = tuple(
+                count - own_count for count, own_count in zip(subtree_counts, own_contribution)
+            )
+        self.assertEqual(get_stored_aggregates(**self._position(root)), expected)
+
+    def test_compute_aggregates(self):
+        aggregates, counts = compute_aggregates(**self._position(self.root))
+        self.assertEqual(counts, get_subtree_counts(**self._position(self.root)))
+        self.assertEqual(aggregates[self.root.id][0], self.root.get_descendants().exclude(kind_id=content_kinds.TOPIC).count())
+
+    def test_stored_on_create(self):
+        self.assertTrue(ContentNodeAggregate.objects.filter(contentnode_id=self.topic.id).exists())
+        self.assertAggregatesCorrect(self.root)
+        testdata.node({"kind_id": "video", "title": "New video"}, parent=self.topic)
+        self.assertAggregatesCorrect(self.root)
+
+    def test_update(self):
+        node = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        node.complete = False
+        node.role_visibility = roles.COACH
+        node.save()
+        self.assertAggregatesCorrect(self.root)
+
+    def test_move(self):
+        node = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        node.move_to(self.other_topic, "last-child")
+        self.assertAggregatesCorrect(self.root)
+
+    def test_move_topic_to_other_tree(self):
+        other_channel = testdata.channel()
+        self.topic.move_to(other_channel.main_tree, "first-child")
+        self.assertAggregatesCorrect(self.root)
+        self.assertAggregatesCorrect(other_channel.main_tree)
+
+    def test_save_with_new_parent(self):
+        node = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        node.parent = self.other_topic
+        node.complete = False
+        node.save()
+        self.assertAggregatesCorrect(self.root)
+
+    def test_delete(self):
+        self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first().delete()
+        self.assertAggregatesCorrect(self.root)
+        self.topic.delete()
+        self.assertAggregatesCorrect(self.root)
+
+    def test_copy(self):
+        self.topic.copy_to(self.other_topic)
+        self.assertAggregatesCorrect(self.root)
+
+    def test_copy_in_batches(self):
+        self.topic.copy_to(self.other_topic, batch_size=2)
+        self.assertAggregatesCorrect(self.root)
+
+    def test_publish(self):
+        mark_all_nodes_as_published(self.channel)
+        self.assertAggregatesCorrect(self.root)
+        self.assertFalse(ContentNodeAggregate.objects.filter(contentnode_id=self.root.id, new_count__gt=0).exists())
+
+    def test_reset_changed_aggregates(self):
+        reset_changed_aggregates(self.root.tree_id)
+        stored = get_stored_aggregates(**self._position(self.root))
+        self.assertEqual(stored[self.root.id][AGGREGATE_FIELDS.index("new_count")], 0)
+
+    def test_rebuild_aggregates(self):
+        ContentNodeAggregate.objects.filter(contentnode__tree_id=self.root.tree_id).delete()
+        ContentNode.objects.filter(parent=self.topic).update(complete=False)
+        rebuild_aggregates(self.root.id)
+        self.assertAggregatesCorrect(self.root)
+
+    def test_check_command(self):
+        ContentNodeAggregate.objects.filter(contentnode_id=self.topic.id).delete()
+        ContentNodeAggregate.objects.filter(contentnode_id=self.root.id).update(resource_count=1000)
+        call_command("check_contentnode_aggregates", "--channel-id", self.channel.id)
+        self.assertFalse(ContentNodeAggregate.objects.filter(contentnode_id=self.topic.id).exists())
+        call_command("check_contentnode_aggregates", "--channel-id", self.channel.id, "--fix")
+        self.assertAggregatesCorrect(self.root)
+
+
+class NodeAggregatesViewSetTestCase(SyncTestMixin, StudioAPITestCase):
+    def setUp(self):
+        super(NodeAggregatesViewSetTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+        self.root = self.channel.main_tree
+        self.topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+
+    def _get_topic(self):
+        response = self.client.get(
+            reverse("contentnode-detail", kwargs={"pk": self.topic.id}), format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_reads_stored_counts(self):
+        ContentNodeAggregate.objects.filter(contentnode_id=self.topic.id).update(resource_count=1000)
+        self.assertEqual(self._get_topic()["resource_count"], 1000)
+
+    def test_counts_without_stored_counts(self):
+        expected = self._get_topic()
+        ContentNodeAggregate.objects.filter(contentnode_id=self.topic.id).delete()
+        data = self._get_topic()
+        for field in ("resource_count", "coach_count", "error_count", "has_updated_descendants", "has_new_descendants"):
+            self.assertEqual(data[field], expected[field], field)
+
+    def test_sync_update(self):
+        node = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        error_count = self._get_topic()["error_count"]
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"complete": False}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self._get_topic()["error_count"], error_count + 1)
+
+    def test_sync_edit_of_published_node(self):
+        mark_all_nodes_as_published(self.channel)
+        self.assertFalse(self._get_topic()["has_updated_descendants"])
+        node = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        # The frontend marks nodes as changed along with every edit
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"title": "New title", "changed": True}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(self._get_topic()["has_updated_descendants"])
+        stored = get_stored_aggregates(tree_id=self.root.tree_id, lft=self.root.lft, rght=self.root.rght)
+        self.assertGreater(stored[self.root.id][AGGREGATE_FIELDS.index("updated_count")], 0)
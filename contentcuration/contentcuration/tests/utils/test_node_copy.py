@@ -0,0 +1,130 @@
+from celery import states
+from django.core.management import call_command
+from mock import patch
+
+from ..base import StudioTestCase
+from ..test_contentnodes import _check_node_copy
+from contentcuration.models import Change
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeCopy
+from contentcuration.models import TaskResult
+from contentcuration.tests import testdata
+from contentcuration.utils.db_tools import TreeBuilder
+from contentcuration.utils.node_copy import copy_chunks
+from contentcuration.utils.node_copy import enqueue_copy
+from contentcuration.utils.node_copy import start_copy
+from contentcuration.viewsets.sync.constants import COPYING_FLAG
+
+
+BATCH_SIZE = 20
+
+
+class NodeCopyTestCase(StudioTestCase):
+    def setUp(self):
+        super(NodeCopyTestCase, self).setUpBase()
+        self.channel.main_tree = TreeBuilder(user=self.user).root
+        self.channel.save()
+        self.source = self.channel.main_tree
+        self.new_channel = testdata.channel()
+        self.target = self.new_channel.main_tree
+        self.pk = "a" * 32
+
+    def _start_copy(self, excluded_descendants=None):
+        with patch("contentcuration.utils.node_copy.enqueue_copy") as enqueue_copy:
+            node_copy = start_copy(
+                self.source,
+                self.target,
+                "last-child",
+                self.pk,
+                None,
+                excluded_descendants,
+                True,
+                self.user,
+                self.new_channel.id,
+                batch_size=BATCH_SIZE,
+            )
+        return node_copy, enqueue_copy
+
+    def _check_copy(self):
+        self.assertFalse(ContentNodeCopy.objects.filter(pk=self.pk).exists())
+        self.assertFalse(TaskResult.objects.filter(channel_id=self.new_channel.id, status=states.STARTED).exists())
+        self.assertTrue(
+            Change.objects.filter(channel_id=self.new_channel.id, kwargs__key=self.pk, kwargs__mods__has_key=COPYING_FLAG).exists()
+        )
+        _check_node_copy(
+            self.source,
+            ContentNode.objects.get(pk=self.pk),
+            original_channel_id=self.channel.id,
+            channel=self.new_channel,
+        )
+
+    def test_small_copy_done_at_start(self):
+        self.source = self.source.get_children().first().get_children().first()
+        _, enqueue_copy = self._start_copy()
+        enqueue_copy.assert_not_called()
+        self._check_copy()
+
+    def test_copy_in_chunks(self):
+        node_copy, enqueue_copy = self._start_copy()
+        enqueue_copy.assert_called_once()
+        self.assertEqual(ContentNode.objects.get(pk=self.pk).parent_id, self.target.id)
+        node_copy.refresh_from_db()
+        self.assertEqual(node_copy.copied, 1)
+        self.assertEqual(node_copy.total, self.source.get_descendant_count() + 1)
+
+        self.assertTrue(copy_chunks(node_copy, max_chunks=1, batch_size=BATCH_SIZE))
+        node_copy.refresh_from_db()
+        self.assertGreater(node_copy.copied, 1)
+        task = TaskResult.objects.get(task_id=node_copy.task_id)
+        self.assertEqual(task.progress, int(100 * node_copy.copied / node_copy.total))
+
+        self.assertFalse(copy_chunks(node_copy, batch_size=BATCH_SIZE))
+        self._check_copy()
+
+    def test_copy_in_chunks_excluded_descendants(self):
+        excluded = self.source.get_children().first()
+        self._start_copy(excluded_descendants={excluded.node_id: True})
+        copy_chunks(ContentNodeCopy.objects.get(pk=self.pk), batch_size=BATCH_SIZE)
+        self.assertEqual(
+            ContentNode.objects.get(pk=self.pk).get_descendant_count(),
+            self.source.get_descendant_count() - excluded.get_descendant_count() - 1,
+        )
+
+    def test_resume_after_error_in_chunk(self):
+        node_copy, _ = self._start_copy()
+        copy_chunk_node = ContentNode.objects._copy_chunk_node
+        calls = []
+
+        def fail_on_third_node(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("Worker stopped")
+            return copy_chunk_node(*args, **kwargs)
+
+        with patch.object(ContentNode.objects, "_copy_chunk_node", side_effect=fail_on_third_node):
+            self.assertFalse(copy_chunks(node_copy, batch_size=BATCH_SIZE))
+
+        node_copy.refresh_from_db()
+        self.assertTrue(node_copy.errored)
+        self.assertEqual(node_copy.copied, 1)
+        self.assertEqual(TaskResult.objects.get(task_id=node_copy.task_id).status, states.FAILURE)
+
+        with patch("contentcuration.management.commands.resume_node_copies.enqueue_copy") as enqueue_copy:
+            call_command("resume_node_copies")
+            enqueue_copy.assert_not_called()
+            call_command("resume_node_copies", "--include-errored")
+            enqueue_copy.assert_called_once()
+
+        node_copy.refresh_from_db()
+        self.assertFalse(copy_chunks(node_copy, batch_size=BATCH_SIZE))
+        self._check_copy()
+
+    def test_enqueue_copy_after_commit(self):
+        node_copy, _ = self._start_copy()
+        with patch("contentcuration.tasks.copy_node_chunks_task") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue_copy(node_copy)
+                task.fetch_or_enqueue.assert_not_called()
+        task.fetch_or_enqueue.assert_called_once_with(
+            node_copy.created_by, copy_id=node_copy.id, channel_id=node_copy.channel_id
+        )
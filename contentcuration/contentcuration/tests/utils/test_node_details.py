@@ -0,0 +1,117 @@
+import json
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from ..base import StudioAPITestCase
+from ..base import StudioTestCase
+from contentcuration.models import ContentNodeDetails
+from contentcuration.tests import testdata
+from contentcuration.tests.viewsets.base import generate_update_event
+from contentcuration.tests.viewsets.base import SyncTestMixin
+from contentcuration.utils.node_details import compute_tree_details
+from contentcuration.utils.node_details import get_stored_details
+from contentcuration.utils.node_details import update_node_details
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+
+
+def _normalize(details):
+    """
+    Orders the values of details whose order ContentNode.get_details does not define
+    """
+    details = dict(details)
+    del details["last_update"]
+    details["resource_size"] = details["resource_size"] or 0
+    for field in ("languages", "accessible_languages", "licenses", "authors", "aggregators", "providers", "copyright_holders", "levels", "categories"):
+        details[field] = sorted(filter(bool, details[field]))
+    details["kind_count"] = sorted(details["kind_count"], key=lambda kind: kind["kind_id"])
+    details["tags"] = sorted(details["tags"], key=lambda tag: tag["tag_name"])
+    details["original_channels"] = sorted(details["original_channels"], key=lambda channel: channel["id"])
+    details["sample_pathway"] = sorted(node["node_id"] for node in details["sample_pathway"])
+    return details
+
+
+class NodeDetailsTestCase(StudioTestCase):
+    def setUp(self):
+        super(NodeDetailsTestCase, self).setUpBase()
+
+    def test_compute_tree_details(self):
+        details = compute_tree_details(self.channel.main_tree.tree_id, channel_id=self.channel.id)
+        topics = self.channel.main_tree.get_descendants(include_self=True).filter(kind_id="topic")
+        self.assertEqual(set(details), set(topics.values_list("id", flat=True)))
+        for topic in topics:
+            self.assertEqual(
+                _normalize(details[topic.id]),
+                _normalize(topic.get_details(channel_id=self.channel.id)),
+                "Details of topic {} differ".format(topic.title),
+            )
+
+    def test_update_node_details(self):
+        count = update_node_details(self.channel.id)
+        self.assertEqual(count, self.channel.main_tree.get_descendants(include_self=True).filter(kind_id="topic").count())
+        details = get_stored_details(self.channel.main_tree.id)
+        self.assertEqual(details["resource_count"], self.channel.main_tree.get_descendants().exclude(kind_id="topic").count())
+        self.assertEqual(update_node_details(self.channel.id), count)
+        self.assertEqual(ContentNodeDetails.objects.filter(contentnode__tree_id=self.channel.main_tree.tree_id).count(), count)
+
+    def test_update_skipped_when_tree_unchanged(self):
+        update_node_details(self.channel.id)
+        root_details = ContentNodeDetails.objects.filter(contentnode_id=self.channel.main_tree.id)
+        root_details.update(details=dict(get_stored_details(self.channel.main_tree.id), resource_count=1000))
+        update_node_details(self.channel.id)
+        self.assertEqual(get_stored_details(self.channel.main_tree.id)["resource_count"], 1000)
+
+        update_node_details(self.channel.id, force=True)
+        self.assertNotEqual(get_stored_details(self.channel.main_tree.id)["resource_count"], 1000)
+
+    def test_update_writes_changed_topics(self):
+        update_node_details(self.channel.id)
+        node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").filter(level__gt=1).first()
+        unchanged = self.channel.main_tree.get_descendants().filter(kind_id="topic").exclude(
+            pk__in=node.get_ancestors().values_list("pk", flat=True)
+        )
+        updated = dict(ContentNodeDetails.objects.filter(contentnode__in=unchanged).values_list("contentnode_id", "updated"))
+        node.author = "New author"
+        node.save()
+
+        update_node_details(self.channel.id)
+        for ancestor in node.get_ancestors():
+            self.assertIn("New author", get_stored_details(ancestor.id)["authors"])
+        self.assertEqual(
+            dict(ContentNodeDetails.objects.filter(contentnode__in=unchanged).values_list("contentnode_id", "updated")),
+            updated,
+        )
+
+    def test_rebuild_command(self):
+        call_command("rebuild_node_details", "--channel-id", self.channel.id)
+        self.assertIsNotNone(get_stored_details(self.channel.main_tree.id))
+
+
+class NodeDetailsViewTestCase(SyncTestMixin, StudioAPITestCase):
+    def setUp(self):
+        super(NodeDetailsViewTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def _get_channel_details(self):
+        response = self.client.get(reverse("get_channel_details", kwargs={"channel_id": self.channel.id}))
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def test_reads_stored_details(self):
+        update_node_details(self.channel.id)
+        ContentNodeDetails.objects.filter(contentnode_id=self.channel.main_tree.id).update(
+            details=dict(get_stored_details(self.channel.main_tree.id), resource_count=1000)
+        )
+        self.assertEqual(self._get_channel_details()["resource_count"], 1000)
+
+    def test_updated_after_changes(self):
+        node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").first()
+        response = self.sync_changes(
+            [generate_update_event(node.id, CONTENTNODE, {"author": "New author"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn("New author", get_stored_details(self.channel.main_tree.id)["authors"])
+        self.assertIn("New author", self._get_channel_details()["authors"])
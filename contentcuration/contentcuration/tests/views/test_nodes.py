@@ -3,13 +3,13 @@ import json
 
 import pytz
 from django.conf import settings
-from django.core.cache import cache
 from django.urls import reverse
 from mock import Mock
 from mock import patch
 
 from contentcuration.tasks import generatenodediff_task
 from contentcuration.tests.base import BaseAPITestCase
+from contentcuration.utils.cache import node_details_cache
 
 
 class NodesViewsTestCase(BaseAPITestCase):
@@ -42,12 +42,10 @@ class NodesViewsTestCase(BaseAPITestCase):
         assert len(details['kind_count']) > 0
 
     def test_get_channel_details_cached(self):
-        cache_key = "details_{}".format(self.channel.main_tree.id)
-
         # force the cache to update by adding a very old cache entry. Since Celery tasks run sync in the test suite,
         # get_channel_details will return an updated cache value rather than generate it async.
         data = {"last_update": pytz.utc.localize(datetime.datetime(1990, 1, 1)).strftime(settings.DATE_TIME_FORMAT)}
-        cache.set(cache_key, json.dumps(data))
+        node_details_cache.set(self.channel.main_tree.node_id, data)
 
         with patch("contentcuration.views.nodes.getnodedetails_task") as task_mock:
             url = reverse('get_channel_details', kwargs={"channel_id": self.channel.id})
@@ -35,6 +35,9 @@ from contentcuration.db.models.manager import ALLOWED_OVERRIDES
 from contentcuration.db.models.manager import EDIT_ALLOWED_OVERRIDES
 from contentcuration.models import Channel
 from contentcuration.models import ContentNode
+from contentcuration.models import ContentTag
+from contentcuration.utils.node_aggregates import compute_aggregates
+from contentcuration.utils.node_aggregates import get_stored_aggregates
 from contentcuration.views import internal
 
 
@@ -249,6 +252,51 @@ class ApiAddNodesToTreeTestCase(StudioTestCase):
 
         self.assertEqual(response.status_code, 400, response.content)
 
+    def test_nodes_created_in_order_as_last_children(self):
+        root_node = ContentNode.objects.get(pk=self.root_node.pk)
+        titles = [node_data["title"] for node_data in self.sample_data["content_data"]]
+        children = list(root_node.get_children().order_by("lft"))
+        self.assertEqual([child.title for child in children[-len(titles):]], titles)
+        for child, next_child in zip(children, children[1:]):
+            self.assertEqual(child.rght + 1, next_child.lft)
+        self.assertEqual(children[-1].rght + 1, root_node.rght)
+
+    def test_tags_associated_with_created_nodes(self):
+        node = ContentNode.objects.get(title=self.title)
+        self.assertEqual(set(node.tags.values_list("tag_name", flat=True)), {"oer", "edtech"})
+        self.assertEqual(ContentTag.objects.filter(channel=self.channel, tag_name="oer").count(), 1)
+
+    def test_descendant_counts_stored(self):
+        root_node = ContentNode.objects.get(pk=self.root_node.pk)
+        position = dict(tree_id=root_node.tree_id, lft=root_node.lft, rght=root_node.rght)
+        aggregates, _ = compute_aggregates(**position)
+        self.assertEqual(get_stored_aggregates(**position)[root_node.id], aggregates[root_node.id])
+
+    def test_second_batch_appended(self):
+        node_data = self._make_node_data()
+        response = self.admin_client().post(
+            reverse_lazy("api_add_nodes_to_tree"),
+            data={"root_id": self.root_node.id, "content_data": [node_data]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        root_node = ContentNode.objects.get(pk=self.root_node.pk)
+        last_child = root_node.get_children().order_by("lft").last()
+        self.assertEqual(last_child.title, node_data["title"])
+        self.assertEqual(last_child.rght + 1, root_node.rght)
+
+    def test_invalid_batch_not_created(self):
+        invalid_license = self._make_node_data()
+        invalid_license["license"] = "not a license"
+        valid_node = self._make_node_data()
+        response = self.admin_client().post(
+            reverse_lazy("api_add_nodes_to_tree"),
+            data={"root_id": self.root_node.id, "content_data": [valid_node, invalid_license]},
+            format="json",
+        )
+        self.assertNotEqual(response.status_code, 200)
+        self.assertFalse(ContentNode.objects.filter(node_id=valid_node["node_id"]).exists())
+
 
 class ApiAddExerciseNodesToTreeTestCase(StudioTestCase):
     """
@@ -0,0 +1,175 @@
+from __future__ import absolute_import
+
+import uuid
+
+import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from le_utils.constants import content_kinds
+
+from contentcuration import models
+from contentcuration.tests import testdata
+from contentcuration.tests.base import StudioTestCase
+from contentcuration.viewsets.contentnode import ContentNodeViewSet
+from contentcuration.viewsets.sync.base import _batch_changes
+from contentcuration.viewsets.sync.base import apply_changes
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+from contentcuration.viewsets.sync.utils import generate_delete_event
+from contentcuration.viewsets.sync.utils import generate_move_event
+from contentcuration.viewsets.sync.utils import generate_update_event
+
+
+class ApplyChangesTestCase(StudioTestCase):
+
+    def setUp(self):
+        super(ApplyChangesTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+
+    def _create_contentnodes(self, count):
+        return [
+            models.ContentNode.objects.create(
+                title="Aron's cool contentnode",
+                id=uuid.uuid4().hex,
+                kind_id=content_kinds.VIDEO,
+                parent_id=self.channel.main_tree_id,
+            )
+            for i in range(count)
+        ]
+
+    def _apply(self, changes, user=None):
+        user = user or self.user
+        models.Change.create_changes(changes, created_by_id=user.id)
+        apply_changes(models.Change.objects.filter(channel_id=self.channel.id, applied=False, errored=False))
+        return models.Change.objects.filter(channel_id=self.channel.id).order_by("server_rev")
+
+    def _update_changes(self, nodes, title="New title"):
+        return [
+            generate_update_event(node.id, CONTENTNODE, {"title": title}, channel_id=self.channel.id)
+            for node in nodes
+        ]
+
+    def test_batches_consecutive_changes(self):
+        nodes = self._create_contentnodes(3)
+        other_user = testdata.user("other@user.com")
+        self.channel.editors.add(other_user)
+        models.Change.create_changes(self._update_changes(nodes[:2]), created_by_id=self.user.id)
+        models.Change.create_changes(self._update_changes(nodes[2:]), created_by_id=other_user.id)
+        models.Change.create_changes(
+            [generate_delete_event(node.id, CONTENTNODE, channel_id=self.channel.id) for node in nodes[:2]],
+            created_by_id=self.user.id
+        )
+        changes = models.Change.objects.filter(channel_id=self.channel.id).order_by("server_rev")
+        batches = [[change.server_rev for change, _ in batch] for batch in _batch_changes(changes)]
+        revs = [change.server_rev for change in changes]
+        self.assertEqual(batches, [revs[:2], revs[2:3], revs[3:]])
+
+    def test_does_not_batch_changes_to_the_same_object(self):
+        node = self._create_contentnodes(1)[0]
+        models.Change.create_changes(
+            self._update_changes([node], title="First") + self._update_changes([node], title="Second"),
+            created_by_id=self.user.id
+        )
+        changes = models.Change.objects.filter(channel_id=self.channel.id).order_by("server_rev")
+        self.assertEqual(len(list(_batch_changes(changes))), 2)
+
+    def test_does_not_batch_moves(self):
+        nodes = self._create_contentnodes(2)
+        models.Change.create_changes(
+            [generate_move_event(node.id, CONTENTNODE, self.channel.main_tree_id, "last-child", channel_id=self.channel.id) for node in nodes],
+            created_by_id=self.user.id
+        )
+        changes = models.Change.objects.filter(channel_id=self.channel.id).order_by("server_rev")
+        self.assertEqual(len(list(_batch_changes(changes))), 2)
+
+    def test_applies_batched_updates(self):
+        nodes = self._create_contentnodes(5)
+        changes = self._apply(self._update_changes(nodes))
+        self.assertTrue(all(change.applied and not change.errored for change in changes))
+        for node in nodes:
+            self.assertEqual(models.ContentNode.objects.get(id=node.id).title, "New title")
+
+    def test_applies_updates_to_the_same_object_in_order(self):
+        node = self._create_contentnodes(1)[0]
+        changes = self._apply(self._update_changes([node], title="First") + self._update_changes([node], title="Second"))
+        self.assertTrue(all(change.applied for change in changes))
+        self.assertEqual(models.ContentNode.objects.get(id=node.id).title, "Second")
+
+    def test_batched_updates_run_fewer_queries(self):
+        nodes = self._create_contentnodes(10)
+        with CaptureQueriesContext(connection) as single_context:
+            self._apply(self._update_changes(nodes[:1]))
+        with CaptureQueriesContext(connection) as batch_context:
+            self._apply(self._update_changes(nodes[1:], title="Other title"))
+        self.assertLess(len(batch_context.captured_queries), len(single_context.captured_queries) * 9)
+
+    def test_errors_only_invalid_changes_in_batch(self):
+        nodes = self._create_contentnodes(2)
+        missing_id = uuid.uuid4().hex
+        changes = self._apply(
+            self._update_changes(nodes[:1])
+            + [generate_update_event(missing_id, CONTENTNODE, {"title": "New title"}, channel_id=self.channel.id)]
+            + self._update_changes(nodes[1:])
+        )
+        self.assertEqual([change.applied for change in changes], [True, False, True])
+        self.assertEqual([change.errored for change in changes], [False, True, False])
+        self.assertIn("errors", changes[1].kwargs)
+        for node in nodes:
+            self.assertEqual(models.ContentNode.objects.get(id=node.id).title, "New title")
+
+    def test_persists_other_changes_when_change_in_batch_fails_in_database(self):
+        nodes = self._create_contentnodes(3)
+        # The tag name is too long for its column, so creating the tag fails in the database,
+        # and aborts the transaction that the batch is applied in
+        changes = self._apply(
+            self._update_changes(nodes[:1])
+            + [generate_update_event(nodes[1].id, CONTENTNODE, {"tags.{}".format("a" * 60): True}, channel_id=self.channel.id)]
+            + self._update_changes(nodes[2:])
+        )
+        self.assertEqual([change.applied for change in changes], [True, False, True])
+        self.assertEqual([change.errored for change in changes], [False, True, False])
+        self.assertEqual(models.ContentNode.objects.get(id=nodes[0].id).title, "New title")
+        self.assertEqual(models.ContentNode.objects.get(id=nodes[2].id).title, "New title")
+        self.assertFalse(models.ContentNode.objects.get(id=nodes[1].id).tags.exists())
+
+    def test_applies_changes_one_by_one_when_batch_raises(self):
+        nodes = self._create_contentnodes(2)
+        original = ContentNodeViewSet.update_from_changes
+
+        def update_from_changes(viewset, changes):
+            if len(changes) > 1:
+                raise Exception("Batch failed")
+            return original(viewset, changes)
+
+        with mock.patch.object(ContentNodeViewSet, "update_from_changes", update_from_changes):
+            changes = self._apply(self._update_changes(nodes))
+        self.assertTrue(all(change.applied and not change.errored for change in changes))
+        for node in nodes:
+            self.assertEqual(models.ContentNode.objects.get(id=node.id).title, "New title")
+
+    def test_applies_unbatched_changes_without_transaction(self):
+        nodes = self._create_contentnodes(2)
+        with mock.patch("contentcuration.viewsets.sync.base._apply_atomic") as apply_atomic:
+            changes = self._apply(
+                [generate_move_event(nodes[0].id, CONTENTNODE, self.channel.main_tree_id, "first-child", channel_id=self.channel.id)]
+            )
+        apply_atomic.assert_not_called()
+        self.assertTrue(all(change.applied for change in changes))
+
+    def test_errors_unbatched_change_that_raises(self):
+        nodes = self._create_contentnodes(1)
+        with mock.patch.object(ContentNodeViewSet, "move_from_changes", side_effect=Exception("Move failed")):
+            changes = self._apply(
+                [generate_move_event(nodes[0].id, CONTENTNODE, self.channel.main_tree_id, "first-child", channel_id=self.channel.id)]
+            )
+        self.assertTrue(all(change.errored for change in changes))
+        self.assertEqual(changes[0].kwargs["errors"], ["Move failed"])
+
+    def test_applies_batched_deletes(self):
+        nodes = self._create_contentnodes(3)
+        changes = self._apply(
+            [generate_delete_event(node.id, CONTENTNODE, channel_id=self.channel.id) for node in nodes]
+        )
+        self.assertTrue(all(change.applied for change in changes))
+        self.assertFalse(models.ContentNode.objects.filter(id__in=[node.id for node in nodes]).exists())
@@ -42,6 +42,7 @@ from contentcuration.viewsets.contentnode import ContentNodeViewSet
 from contentcuration.viewsets.file import FileViewSet
 from contentcuration.viewsets.invitation import InvitationViewSet
 from contentcuration.viewsets.sync.endpoint import SyncView
+from contentcuration.viewsets.sync.endpoint import SyncWaitView
 from contentcuration.viewsets.user import AdminUserViewSet
 from contentcuration.viewsets.user import ChannelUserViewSet
 from contentcuration.viewsets.user import UserViewSet
@@ -80,6 +81,7 @@ urlpatterns = [
     re_path(r'^api/probers/task_queue_status', views.task_queue_status, name='task_queue_status'),
     re_path(r'^api/probers/unapplied_changes_status', views.unapplied_changes_status, name='unapplied_changes_status'),
     re_path(r'^api/sync/$', SyncView.as_view(), name="sync"),
+    re_path(r'^api/sync/wait/$', SyncWaitView.as_view(), name="sync_wait"),
 ]
 
 # if activated, turn on django prometheus urls
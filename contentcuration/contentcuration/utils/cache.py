@@ -1,17 +1,394 @@
 import functools
+import logging
 import math
 import random
+import threading
 import time
+import uuid
+from collections import Counter
+from collections import defaultdict
 from datetime import datetime
 
 from dateutil.parser import isoparse
 from django.core.cache import cache as django_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connection
+from django.views.decorators.cache import cache_page
 from django_redis.client import DefaultClient
-from django_redis.client.default import _main_exceptions
+from redis.exceptions import RedisError
 
+from contentcuration.utils.sentry import report_exception
+
+
+logger = logging.getLogger(__name__)
 
 DEFERRED_FLAG = "__DEFERRED"
 
+CALCULATING_FLAG = "CALCULATING"
+
+# How long an early recomputation keeps others from starting, in case its thread never finishes
+RECOMPUTE_LOCK_TIMEOUT = 60
+
+CACHE_TAG_KEY = "cache_tag:{}"
+CACHE_GENERATION_KEY = "cache_generation:{}"
+CACHE_ENTRIES_KEY = "cache_entries:{}"
+CACHE_METRICS_KEY = "cache_metrics:{}"
+
+# How often the metrics counted by each process are added to the ones stored in Redis
+CACHE_METRICS_FLUSH_INTERVAL = 10
+
+
+def get_redis_client(cache):
+    """
+    Gets the lower level Redis client, if the cache is a Redis cache
+
+    :rtype: redis.client.StrictRedis
+    """
+    redis_client = None
+    cache_client = getattr(cache, 'client', None)
+    if isinstance(cache_client, DefaultClient):
+        redis_client = cache_client.get_client(write=True)
+    return redis_client
+
+
+def channel_cache_tag(channel_id):
+    """
+    :return: The tag of the cached values that are invalidated when the channel is published
+    """
+    return "channel:{}".format(channel_id)
+
+
+def invalidate_cache_tags(*tags, **kwargs):
+    """
+    Invalidates all the values that were cached with any of the tags, by giving the tags new
+    versions, so that nothing has to be deleted or scanned for
+    """
+    cache = kwargs.get("cache") or django_cache
+    cache.set_many({CACHE_TAG_KEY.format(tag): uuid.uuid4().hex for tag in tags}, timeout=None)
+
+
+class CacheMetrics(object):
+    """
+    Counts the hits, misses, sets, evictions and early recomputations of each cache namespace in
+    this process, along with the seconds spent getting and computing their values.
+
+    If the cache is Redis, the counts are added to a hash per namespace every few seconds, so
+    that `get` returns the counts of all processes.
+    """
+
+    def __init__(self, cache=None, flush_interval=CACHE_METRICS_FLUSH_INTERVAL):
+        self.cache = cache or django_cache
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counts = defaultdict(Counter)
+        self._last_flush = time.time()
+
+    def incr(self, namespace, field, amount=1):
+        with self._lock:
+            self._counts[namespace][field] += amount
+            flush = time.time() - self._last_flush >= self.flush_interval
+        if flush:
+            self.flush()
+
+    def _metrics_key(self, namespace):
+        return self.cache.make_key(CACHE_METRICS_KEY.format(namespace))
+
+    def flush(self):
+        redis_client = get_redis_client(self.cache)
+        with self._lock:
+            self._last_flush = time.time()
+            if redis_client is None:
+                return
+            counts, self._counts = self._counts, defaultdict(Counter)
+
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for namespace, fields in counts.items():
+                for field, amount in fields.items():
+                    if isinstance(amount, float):
+                        pipeline.hincrbyfloat(self._metrics_key(namespace), field, amount)
+                    else:
+                        pipeline.hincrby(self._metrics_key(namespace), field, amount)
+            pipeline.execute()
+        except RedisError as e:
+            logger.warning("Failed to store cache metrics: {}".format(e))
+
+    def get(self, namespaces):
+        """
+        :param namespaces: The names of the namespaces to get the metrics of
+        :return: A dict of the counts of each namespace, by field
+        """
+        self.flush()
+        redis_client = get_redis_client(self.cache)
+        if redis_client is None:
+            with self._lock:
+                return {namespace: dict(self._counts[namespace]) for namespace in namespaces}
+
+        pipeline = redis_client.pipeline(transaction=False)
+        for namespace in namespaces:
+            pipeline.hgetall(self._metrics_key(namespace))
+        metrics = {}
+        for namespace, fields in zip(namespaces, pipeline.execute()):
+            metrics[namespace] = {
+                field.decode(): float(value) if field.endswith(b"_time") else int(value)
+                for field, value in fields.items()
+            }
+        return metrics
+
+    def reset(self, namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._counts.pop(namespace, None)
+        self.cache.delete_many([CACHE_METRICS_KEY.format(namespace) for namespace in namespaces])
+
+
+cache_metrics = CacheMetrics()
+
+
+class CacheNamespace(object):
+    """
+    A set of cached values whose keys are prefixed with the name of the namespace, which:
+
+    - counts its hits, misses and latencies in `cache_metrics`
+    - bounds its size with a default timeout and, if the cache is Redis, a maximum number of
+      entries, evicting the oldest ones first
+    - invalidates values by tag, through `invalidate_cache_tags`
+    - if versioned, invalidates all its values at once, through `invalidate`
+    - recomputes values in `get_or_set` before they expire, in a background thread, so that
+      a popular value is not recomputed by every request that sees it expire
+    """
+
+    namespaces = {}
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, max_entries=None, beta=1, versioned=False, cache=None, metrics=None):
+        """
+        :param name: The name of the namespace, which prefixes its keys
+        :param timeout: The default timeout of the values, in seconds
+        :param max_entries: The maximum number of values kept, if the cache is Redis
+        :param beta: Values greater than 1 favor earlier recomputations
+        :param versioned: Whether the keys embed the generation of the namespace
+        """
+        self.name = name
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.beta = beta
+        self.versioned = versioned
+        self.cache = cache or django_cache
+        self.metrics = metrics or cache_metrics
+        CacheNamespace.namespaces[name] = self
+
+    @property
+    def generation_key(self):
+        return CACHE_GENERATION_KEY.format(self.name)
+
+    def get_generation(self):
+        generation = self.cache.get(self.generation_key)
+        if generation is None:
+            self.cache.add(self.generation_key, _new_generation(), timeout=None)
+            generation = self.cache.get(self.generation_key)
+        return generation
+
+    def invalidate(self):
+        """
+        Invalidates all the values of a versioned namespace with a single INCR of its generation,
+        leaving the values of the previous generations to expire, so that no keys have to be
+        deleted or scanned for
+        """
+        if not self.versioned:
+            raise TypeError("Cache namespace {} is not versioned".format(self.name))
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            # the generation was never set or was evicted
+            self.cache.add(self.generation_key, _new_generation(), timeout=None)
+        self.metrics.incr(self.name, "invalidations")
+
+    def make_key(self, key):
+        if self.versioned:
+            return "{}:{}:{}".format(self.name, self.get_generation(), key)
+        return "{}:{}".format(self.name, key)
+
+    def cache_page(self, timeout):
+        """
+        Like Django's `cache_page` decorator, caching the responses of the view in this namespace
+        """
+        def decorator(view_func):
+            @functools.wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                return cache_page(timeout, key_prefix=self.make_key("page"))(view_func)(request, *args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _get_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.cache.default_timeout
+        return timeout
+
+    def _get_tag_versions(self, tags):
+        versions = self.cache.get_many([CACHE_TAG_KEY.format(tag) for tag in tags])
+        return {tag: versions.get(CACHE_TAG_KEY.format(tag)) for tag in tags}
+
+    def _ensure_tag_versions(self, tags):
+        if not tags:
+            return {}
+        versions = self._get_tag_versions(tags)
+        missing = [tag for tag, version in versions.items() if version is None]
+        for tag in missing:
+            self.cache.add(CACHE_TAG_KEY.format(tag), uuid.uuid4().hex, timeout=None)
+        if missing:
+            versions = self._get_tag_versions(tags)
+        return versions
+
+    def _get_entry(self, cache_key):
+        start = time.time()
+        entry = self.cache.get(cache_key)
+        if entry is not None and entry["TAGS"]:
+            versions = self._get_tag_versions(entry["TAGS"])
+            # a tag without a version was evicted, so it may have been invalidated too
+            if any(versions[tag] is None or versions[tag] != version for tag, version in entry["TAGS"].items()):
+                entry = None
+        self.metrics.incr(self.name, "get_time", time.time() - start)
+        self.metrics.incr(self.name, "misses" if entry is None else "hits")
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._get_entry(self.make_key(key))
+        return default if entry is None else entry["VALUE"]
+
+    def set(self, key, value, tags=(), timeout=DEFAULT_TIMEOUT, delta=0):
+        """
+        :param tags: The tags that invalidate the value
+        :param delta: The seconds it took to compute the value, which scales how early it is recomputed
+        """
+        self._set(self.make_key(key), value, self._ensure_tag_versions(tags), timeout, delta)
+
+    def _set(self, cache_key, value, tag_versions, timeout, delta):
+        timeout = self._get_timeout(timeout)
+        entry = {
+            "VALUE": value,
+            "TAGS": tag_versions,
+            "DELTA": delta,
+            "EXPIRE": None if timeout is None else time.time() + timeout,
+        }
+        self.cache.set(cache_key, entry, timeout=timeout)
+        self.metrics.incr(self.name, "sets")
+        if self.max_entries:
+            self._evict(cache_key)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def get_or_set(self, key, func, tags=(), timeout=DEFAULT_TIMEOUT):
+        """
+        Gets the value of the key, calling `func` to compute and set it if it is not cached, or
+        in a background thread if it is close enough to expiring
+
+        :param func: A callable without arguments that returns the value
+        :param tags: The tags that invalidate the value
+        """
+        # The key and the versions of the tags are resolved before the value is computed, so that
+        # a value computed while the namespace or its tags are invalidated is not cached as current
+        cache_key = self.make_key(key)
+        entry = self._get_entry(cache_key)
+        if entry is None:
+            return self._compute(cache_key, func, tags, timeout)
+        if self._should_recompute(entry):
+            self._recompute_in_background(cache_key, func, tags, timeout)
+        return entry["VALUE"]
+
+    def _compute(self, cache_key, func, tags, timeout):
+        tag_versions = self._ensure_tag_versions(tags)
+        start = time.time()
+        value = func()
+        delta = time.time() - start
+        self.metrics.incr(self.name, "compute_time", delta)
+        self._set(cache_key, value, tag_versions, timeout, delta)
+        return value
+
+    def _should_recompute(self, entry):
+        """
+        Decides to recompute a value early with a probability that grows as it gets closer to
+        expiring, and the longer it takes to compute.
+        Based on http://www.vldb.org/pvldb/vol8/p886-vattani.pdf
+        """
+        if entry["EXPIRE"] is None or not entry["DELTA"]:
+            return False
+        ttl = entry["EXPIRE"] - time.time()
+        return -entry["DELTA"] * self.beta * math.log(1 - random.random()) >= ttl
+
+    def _recompute_in_background(self, cache_key, func, tags, timeout):
+        calculating_key = "{}:{}".format(cache_key, CALCULATING_FLAG)
+        # only one process recomputes the value, while the others keep returning the cached one
+        if not self.cache.add(calculating_key, True, timeout=RECOMPUTE_LOCK_TIMEOUT):
+            return
+        self.metrics.incr(self.name, "recomputes")
+        threading.Thread(
+            target=self._recompute, args=(cache_key, func, tags, timeout, calculating_key), daemon=True
+        ).start()
+
+    def _recompute(self, cache_key, func, tags, timeout, calculating_key):
+        try:
+            self._compute(cache_key, func, tags, timeout)
+        except Exception as e:
+            logger.exception("Failed to recompute cached value for {}".format(cache_key))
+            report_exception(e)
+        finally:
+            self.cache.delete(calculating_key)
+            connection.close()
+
+    def _evict(self, cache_key):
+        """
+        Tracks the keys of the namespace in a Redis sorted set, by the time they were set, and
+        deletes the oldest ones while there are more than `max_entries`
+        """
+        redis_client = get_redis_client(self.cache)
+        if redis_client is None:
+            # other backends bound their own number of entries
+            return
+        entries_key = self.cache.make_key(CACHE_ENTRIES_KEY.format(self.name))
+        now = time.time()
+        try:
+            pipeline = redis_client.pipeline()
+            pipeline.zadd(entries_key, {self.cache.make_key(cache_key): now})
+            if self.timeout not in (None, DEFAULT_TIMEOUT):
+                # the keys set before then have already expired
+                pipeline.zremrangebyscore(entries_key, "-inf", now - self.timeout)
+            pipeline.zcard(entries_key)
+            count = pipeline.execute()[-1]
+            if count > self.max_entries:
+                evicted = [member for member, _ in redis_client.zpopmin(entries_key, count - self.max_entries)]
+                if evicted:
+                    redis_client.delete(*evicted)
+                    self.metrics.incr(self.name, "evictions", len(evicted))
+        except RedisError as e:
+            logger.warning("Failed to evict cache entries of {}: {}".format(self.name, e))
+
+
+def _new_generation():
+    # starts from the current time in milliseconds, so that a generation that was evicted
+    # does not start again from a number that its old values were cached with
+    return int(time.time() * 1000)
+
+
+# The values of the public channel list page and the responses of the public channel list API
+public_channels_cache = CacheNamespace("public_channels", timeout=24 * 60 * 60, versioned=True)
+
+# The responses of the public channel catalog
+catalog_cache = CacheNamespace("catalog", versioned=True)
+
+# The details of nodes, returned by ContentNode.get_details
+node_details_cache = CacheNamespace("node_details", timeout=30 * 24 * 60 * 60, max_entries=100000, versioned=True)
+
+# The counts of the queries of paginated viewsets
+query_count_cache = CacheNamespace("query_count", timeout=5 * 60, versioned=True)
+
+# The sizes of the resources of nodes, see ResourceSizeCache
+resource_size_cache = CacheNamespace("resource_size", timeout=30 * 24 * 60 * 60, max_entries=100000)
+
 
 def cache_stampede(expire, beta=1):
     """Cache decorator with cache stampede protection.
@@ -29,7 +406,8 @@ def cache_stampede(expire, beta=1):
     This  decorator implements cache stampede protection through
     early recomputation. Early recomputation of function results will occur
     probabilistically before expiration in a background thread of
-    execution.
+    execution, see `CacheNamespace.get_or_set`. The values are cached in a
+    namespace named after the function.
 
     IMPORTANT:
     The decorated function must have the cache key as its first parameter.
@@ -42,89 +420,23 @@ def cache_stampede(expire, beta=1):
     """
 
     def decorator(func):
-        def timer(*args, **kwargs):
-            "Time execution of `func` and return result and time delta."
-            start = time.time()
-            result = func(*args, **kwargs)
-            delta = time.time() - start
-            # The variable delta represents the time to recompute the value
-            # and is used to scale the probability distribution appropriately.
-            return result, delta
+        namespace = CacheNamespace(func.__name__, timeout=expire, beta=beta)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            key = args[0]
-            cached = django_cache.get(key)
-            if cached is not None:
-                metadata = cached["METADATA"]
-                if cached["CALCULATING"]:
-                    return metadata
-                expire_time = cached["EXPIRE"]
-                now = time.time()
-                ttl = expire_time - now
-                delta = cached["DELTA"]
-                if (-delta * math.log(random.random())) < ttl:
-                    return metadata  # Cache hit.
-            metadata, delta = timer(*args, *kwargs)
-            cached_info = {
-                "CALCULATING": False,
-                "METADATA": metadata,
-                "DELTA": delta,
-                "EXPIRE": time.time() + expire,
-            }
-            django_cache.set(key, cached_info, timeout=None)
+            return namespace.get_or_set(args[0], lambda: func(*args, **kwargs))
 
         return wrapper
 
     return decorator
 
 
-def delete_cache_keys(key_pattern):
-    """
-    Deletes all cache keys that match key_pattern, if found.
-
-    Note that not all cache backends support wildcards, or have a way to retrieve all keys.
-    In this case, this function will just check if the key specified by key_pattern exists,
-    and delete it if so.
-
-    :param key_pattern: A string with a key name, can contain wildcard (*) characters
-    :param for_view:
-    :return: Number of keys deleted
-    """
-    if hasattr(django_cache, "delete_pattern"):
-        return django_cache.delete_pattern(key_pattern)
-    if django_cache.has_key(key_pattern):  # noqa: W601
-        django_cache.delete(key_pattern)
-        return 1
-    return 0
-
-
 def delete_public_channel_cache_keys():
     """
-    Delete all caches related to the public channel caching.
-    """
-    from contentcuration.views.base import PUBLIC_CHANNELS_CACHE_KEYS
-
-    delete_cache_keys("*get_public_channel_list*")
-    delete_cache_keys("*get_user_public_channels*")
-    django_cache.delete_many(list(PUBLIC_CHANNELS_CACHE_KEYS.values()))
-
-
-def redis_retry(func):
-    """
-    This decorator wraps a function using the lower level Redis client to mimic functionality
-    that occurs in the DefaultClient. It attempts a retry for certain exceptions, which this
-    catches and retries once
-
-    @see django_redis.client.default.DefaultClient
+    Invalidates all caches related to the public channels.
     """
-    def redis_retry_func(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except _main_exceptions:
-            # try one more time
-            return func(*args, **kwargs)
-    return redis_retry_func
+    public_channels_cache.invalidate()
+    catalog_cache.invalidate()
 
 
 FILE_MODIFIED = -1
@@ -132,15 +444,13 @@ FILE_MODIFIED = -1
 
 class ResourceSizeCache:
     """
-    Helper class for managing Resource size cache.
-
-    If the django_cache is Redis, then we use the lower level Redis client to use
-    its hash commands, HSET and HGET, to ensure we can store lots of data in performant way
+    Helper class for managing Resource size cache, which keeps the size of the resources of a node,
+    and when it was calculated, in `resource_size_cache`
     """
 
-    def __init__(self, node, cache=None):
+    def __init__(self, node, namespace=None):
         self.node = node
-        self.cache = cache or django_cache
+        self.namespace = namespace or resource_size_cache
 
     @classmethod
     def reset_modified_for_file(cls, file, modified=FILE_MODIFIED):
@@ -153,24 +463,6 @@ class ResourceSizeCache:
         cache = ResourceSizeCache(file.contentnode.get_root())
         cache.reset_modified(file.modified if modified == FILE_MODIFIED else modified)
 
-    @property
-    def redis_client(self):
-        """
-        Gets the lower level Redis client, if the cache is a Redis cache
-
-        :rtype: redis.client.StrictRedis
-        """
-        redis_client = None
-        cache_client = getattr(self.cache, 'client', None)
-        if isinstance(cache_client, DefaultClient):
-            redis_client = cache_client.get_client(write=True)
-        return redis_client
-
-    @property
-    def hash_key(self):
-        # only first four characters
-        return "resource_size:{}".format(self.node.pk[:4])
-
     @property
     def size_key(self):
         return "{}:value".format(self.node.pk)
@@ -179,24 +471,13 @@ class ResourceSizeCache:
     def modified_key(self):
         return "{}:modified".format(self.node.pk)
 
-    @redis_retry
     def cache_get(self, key):
-        if self.redis_client is not None:
-            # notice use of special `HGET`
-            # See: https://redis.io/commands/hget
-            return self.redis_client.hget(self.hash_key, key)
-        return self.cache.get("{}:{}".format(self.hash_key, key))
+        return self.namespace.get(key)
 
-    @redis_retry
     def cache_set(self, key, val):
-        if self.redis_client is not None:
-            # notice use of special `HSET` and `HDEL`
-            # See: https://redis.io/commands/hset
-            # See: https://redis.io/commands/hdel
-            if val is None:
-                return self.redis_client.hdel(self.hash_key, key)
-            return self.redis_client.hset(self.hash_key, key, val)
-        return self.cache.set("{}:{}".format(self.hash_key, key), val)
+        if val is None:
+            return self.namespace.delete(key)
+        return self.namespace.set(key, val)
 
     def get_size(self):
         size = self.cache_get(self.size_key)
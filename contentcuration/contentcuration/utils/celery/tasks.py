@@ -9,11 +9,15 @@ from collections import OrderedDict
 from celery import states
 from celery.app.task import Task
 from celery.result import AsyncResult
+from django.core.cache import cache as django_cache
 from django.db import transaction
 from django.db.utils import IntegrityError
+from django_redis.client import DefaultClient
+from redis.exceptions import RedisError
 
 from contentcuration.constants.locking import TASK_LOCK
 from contentcuration.db.advisory_lock import advisory_lock
+from contentcuration.utils.change_feed import notify
 from contentcuration.utils.sentry import report_exception
 
 
@@ -24,16 +28,18 @@ class ProgressTracker:
     """
     Helper to track task progress
     """
-    __slots__ = ("task_id", "send_event", "total", "progress", "last_reported_progress")
+    __slots__ = ("task_id", "send_event", "channel_id", "total", "progress", "last_reported_progress")
 
-    def __init__(self, task_id, send_event):
+    def __init__(self, task_id, send_event, channel_id=None):
         """
         :param task_id: The ID of the calling task
         :param send_event: Callback to send the task event
         :type send_event: Callable
+        :param channel_id: The ID of the channel the task is for, if any, to notify clients waiting on the channel
         """
         self.task_id = task_id
         self.send_event = send_event
+        self.channel_id = channel_id
         self.total = 100.0
         self.progress = 0.0
         self.last_reported_progress = 0.0
@@ -60,12 +66,94 @@ class ProgressTracker:
         if math.floor(self.last_reported_progress) < math.floor(self.task_progress):
             self.last_reported_progress = self.task_progress
             self.send_event(progress=self.task_progress)
+            if self.channel_id:
+                notify(channel_ids=[self.channel_id])
 
     @property
     def task_progress(self):
         return int(min((100.0 * self.progress / self.total), 100.0))
 
 
+# Signatures of enqueued tasks are registered for this long, in case their tasks never start
+TASK_SIGNATURE_TIMEOUT = 600
+
+TASK_SIGNATURE_KEY = "task_signature:{}"
+
+# Registers the task id in ARGV[1] for the signature key, unless another task is registered for it,
+# and returns the id of the task that is registered
+CLAIM_SIGNATURE_SCRIPT = """
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "EX", ARGV[2]) then
+    return ARGV[1]
+end
+return redis.call("GET", KEYS[1])
+"""
+
+# Registers the task id in ARGV[1] for the signature key, replacing any other task
+REGISTER_SIGNATURE_SCRIPT = """
+return redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+"""
+
+# Removes the signature key if the task id in ARGV[1] is still registered for it
+RELEASE_SIGNATURE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class TaskSignatureRegistry:
+    """
+    Registers the signatures of enqueued and running tasks in Redis, so that `fetch_or_enqueue`
+    can find a matching task, or claim the signature for a new one, with a single atomic command
+    rather than an advisory lock and a TaskResult query. Signatures are released when their tasks
+    return, or are revoked, so that a matching task is only ever queued or running once, as tasks
+    that apply changes rely on. Those tasks requeue themselves for changes made while they run.
+
+    Without a Redis cache, or when Redis fails, the registry is unavailable and `fetch_or_enqueue`
+    finds matching tasks in the database.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or django_cache
+
+    @property
+    def redis_client(self):
+        """
+        Gets the lower level Redis client, if the cache is a Redis cache
+
+        :rtype: redis.client.StrictRedis
+        """
+        cache_client = getattr(self.cache, "client", None)
+        if isinstance(cache_client, DefaultClient):
+            return cache_client.get_client(write=True)
+        return None
+
+    def _eval(self, script, signature, *args):
+        redis_client = self.redis_client
+        if redis_client is None:
+            return None
+        try:
+            result = redis_client.eval(script, 1, self.cache.make_key(TASK_SIGNATURE_KEY.format(signature)), *args)
+        except RedisError as e:
+            logger.warning("Task signature registry is unavailable: {}".format(e))
+            return None
+        return result.decode("utf-8") if isinstance(result, bytes) else result
+
+    def claim(self, signature, task_id):
+        """
+        :return: The id of the task registered for the signature, which is task_id if it was
+                 not registered, or None if the registry is unavailable
+        """
+        return self._eval(CLAIM_SIGNATURE_SCRIPT, signature, task_id, TASK_SIGNATURE_TIMEOUT)
+
+    def register(self, signature, task_id):
+        self._eval(REGISTER_SIGNATURE_SCRIPT, signature, task_id, TASK_SIGNATURE_TIMEOUT)
+
+    def release(self, signature, task_id):
+        self._eval(RELEASE_SIGNATURE_SCRIPT, signature, task_id)
+
+
 def get_task_model(ref, task_id):
     """
     Returns the task model for a task, will create one if not found
@@ -122,6 +210,14 @@ class CeleryTask(Task):
         if not getattr(self, "autoretry_for", None) or not isinstance(exc, self.autoretry_for):
             report_exception(exc)
 
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        """
+        Releases the signature of the task, unless it registered another task by requeuing itself,
+        so that the next matching task is enqueued
+        """
+        if not self.app.conf.task_always_eager:
+            TaskSignatureRegistry().release(self.generate_signature(kwargs), task_id)
+
     def shadow_name(self, *args, **kwargs):
         """
         DO NOT add functionality here as that will make it impossible to rely on `.name` for finding task by name in the
@@ -195,7 +291,8 @@ class CeleryTask(Task):
         passed to the function, that will be set on the TaskResult model as well.
 
         :param user: User object of the user performing the operation
-        :param kwargs: Keyword arguments for task `apply_async`
+        :param kwargs: Keyword arguments for task `apply_async`, and optionally `countdown`, the number of seconds
+                       to wait before running the task
         :return: The celery async result
         :rtype: CeleryAsyncResult
         """
@@ -204,25 +301,47 @@ class CeleryTask(Task):
         if user is None or not isinstance(user, User):
             raise TypeError("All tasks must be assigned to a user.")
 
+        countdown = kwargs.pop('countdown', None)
+        task_id = kwargs.pop('task_id', None) or uuid.uuid4().hex
         signature = kwargs.pop('signature', None)
         if signature is None:
             signature = self.generate_signature(kwargs)
 
-        task_id = uuid.uuid4().hex
         prepared_kwargs = self._prepare_kwargs(kwargs)
         channel_id = prepared_kwargs.get("channel_id")
 
         logging.info(f"Enqueuing task:id {self.name}:{task_id} for user:channel {user.pk}:{channel_id} | {signature}")
 
-        # returns a CeleryAsyncResult
-        async_result = self.apply_async(
-            task_id=task_id,
-            kwargs=prepared_kwargs,
-        )
+        async_result = self._apply_async_registered(task_id, self.generate_signature(kwargs), prepared_kwargs, countdown)
 
         # ensure the result is saved to the backend (database)
         self.backend.add_pending_result(async_result)
+        self._save_task_result(task_id, user, prepared_kwargs, signature)
+        return async_result
 
+    def _apply_async_registered(self, task_id, signature, prepared_kwargs, countdown):
+        """
+        Registers the task before it can return, which releases it, then applies it. This may replace
+        another registered task, which is then found in the database instead.
+        """
+        registry = None
+        if not self.app.conf.task_always_eager:
+            registry = TaskSignatureRegistry()
+            registry.register(signature, task_id)
+
+        try:
+            # returns a CeleryAsyncResult
+            return self.apply_async(
+                task_id=task_id,
+                kwargs=prepared_kwargs,
+                countdown=countdown,
+            )
+        except Exception:
+            if registry is not None:
+                registry.release(signature, task_id)
+            raise
+
+    def _save_task_result(self, task_id, user, prepared_kwargs, signature):
         saved = False
         tries = 0
         while not saved:
@@ -233,7 +352,7 @@ class CeleryTask(Task):
                 task_result.task_name = self.name
                 task_result.task_kwargs = self.backend.encode(prepared_kwargs)
                 task_result.user = user
-                task_result.channel_id = channel_id
+                task_result.channel_id = prepared_kwargs.get("channel_id")
                 task_result.signature = signature
                 task_result.save()
                 saved = True
@@ -241,7 +360,6 @@ class CeleryTask(Task):
                 tries += 1
                 if tries > 3:
                     raise e
-        return async_result
 
     def fetch_or_enqueue(self, user, **kwargs):
         """
@@ -260,7 +378,17 @@ class CeleryTask(Task):
 
         signature = self.generate_signature(kwargs)
 
-        # create an advisory lock to obtain exclusive control on preventing task duplicates
+        # claim the signature in the registry for a new task, unless a matching task is already registered
+        task_id = uuid.uuid4().hex
+        registered_task_id = TaskSignatureRegistry().claim(signature, task_id)
+        if registered_task_id == task_id:
+            kwargs.update(signature=signature, task_id=task_id)
+            return self.enqueue(user, **kwargs)
+        if registered_task_id is not None:
+            logging.info(f"Fetched registered task {self.name} for user {user.pk} with id {registered_task_id} | {signature}")
+            return self.fetch(registered_task_id)
+
+        # otherwise, create an advisory lock to obtain exclusive control on preventing task duplicates
         with self._lock_signature(signature):
             # order by most recently created
             task_ids = self.find_incomplete_ids(signature).order_by("-date_created")[:1]
@@ -303,10 +431,13 @@ class CeleryTask(Task):
 
         if exclude_task_ids is not None:
             task_ids = task_ids.exclude(task_id__in=exclude_task_ids)
+        registry = TaskSignatureRegistry()
         count = 0
         for task_id in task_ids:
             logging.info(f"Revoking task {task_id}")
             self.app.control.revoke(task_id, terminate=True)
+            # revoked tasks may never return, so release them for matching tasks to be enqueued straight away
+            registry.release(signature, task_id)
             count += 1
         # be sure the database backend has these marked appropriately
         self.TaskModel.objects.filter(task_id__in=task_ids).update(status=states.REVOKED)
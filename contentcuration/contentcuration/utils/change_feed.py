@@ -0,0 +1,249 @@
+"""
+Keeps track of the latest server_rev of the changes that clients can receive for each channel and user,
+so that sync polls for channels that have no new changes can be answered without querying the Change table.
+
+Only changes that have been applied or errored are returned to clients, so the latest revs are recorded
+whenever changes are applied or errored. The cached revs only ever increase, and if they are missing
+they are filled from the Change table, using the (channel, server_rev) and (user, server_rev) indexes.
+"""
+import logging
+import time
+
+from django.core.cache import cache as django_cache
+from django.db.models import Q
+from django_redis.client import DefaultClient
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_REV_KEY = "change_feed:channel:{}"
+USER_REV_KEY = "change_feed:user:{}"
+
+# Cached revs are refilled from the database when they expire, which limits how long a
+# rev can be out of date for if recording it fails.
+CHANGE_FEED_CACHE_TIMEOUT = 600
+
+# Names of the pub/sub channels that are notified when there are new changes, or task progress,
+# for a channel or a user
+CHANNEL_EVENTS_NAME = "change_feed:events:channel:{}"
+USER_EVENTS_NAME = "change_feed:events:user:{}"
+
+# Sets each key to the corresponding rev in ARGV, unless it already holds a greater rev,
+# so that concurrent writers can never move the latest rev backwards.
+SET_MAX_SCRIPT = """
+local timeout = ARGV[#ARGV]
+for i, key in ipairs(KEYS) do
+    local current = tonumber(redis.call("GET", key))
+    if current == nil or current < tonumber(ARGV[i]) then
+        redis.call("SET", key, ARGV[i], "EX", timeout)
+    end
+end
+"""
+
+
+def channel_rev_key(channel_id):
+    return CHANNEL_REV_KEY.format(channel_id)
+
+
+def user_rev_key(user_id):
+    return USER_REV_KEY.format(user_id)
+
+
+def _get_redis_client(cache):
+    """
+    Gets the lower level Redis client, if the cache is a Redis cache
+
+    :rtype: redis.client.StrictRedis
+    """
+    cache_client = getattr(cache, "client", None)
+    if isinstance(cache_client, DefaultClient):
+        return cache_client.get_client(write=True)
+    return None
+
+
+def set_latest_revs(revs, cache=None):
+    """
+    Records the latest revs for the given cache keys, unless a greater rev is already recorded.
+
+    :param revs: A dict of rev cache keys to server_revs
+    :param cache: The cache to use, defaults to the django cache
+    """
+    if not revs:
+        return
+    cache = cache or django_cache
+    keys = list(revs.keys())
+    try:
+        redis_client = _get_redis_client(cache)
+        if redis_client is not None:
+            redis_client.eval(
+                SET_MAX_SCRIPT,
+                len(keys),
+                *([cache.make_key(key) for key in keys] + [revs[key] for key in keys] + [CHANGE_FEED_CACHE_TIMEOUT])
+            )
+        else:
+            current_revs = cache.get_many(keys)
+            cache.set_many(
+                {key: rev for key, rev in revs.items() if current_revs.get(key) is None or current_revs[key] < rev},
+                timeout=CHANGE_FEED_CACHE_TIMEOUT,
+            )
+    except Exception as e:
+        # Polls will fill the rev from the database again once it expires
+        logger.warning("Failed to record latest change revs: {}".format(e))
+
+
+def record_changes(changes, cache=None):
+    """
+    Records the server_revs of changes that have been applied or errored as the latest
+    revs for their channels or users.
+
+    :param changes: An iterable of Change objects
+    :param cache: The cache to use, defaults to the django cache
+    """
+    revs = {}
+    channel_ids = set()
+    user_ids = set()
+    for change in changes:
+        keys = []
+        if change.channel_id:
+            channel_ids.add(change.channel_id)
+            keys.append(channel_rev_key(change.channel_id))
+        if change.user_id:
+            user_ids.add(change.user_id)
+            keys.append(user_rev_key(change.user_id))
+        for key in keys:
+            revs[key] = max(revs.get(key, 0), change.server_rev)
+    set_latest_revs(revs, cache=cache)
+    notify(channel_ids=channel_ids, user_ids=user_ids, cache=cache)
+
+
+def _get_latest_rev_from_db(**filters):
+    from contentcuration.models import Change
+
+    return (
+        Change.objects.filter(Q(applied=True) | Q(errored=True), **filters)
+        .order_by("-server_rev")
+        .values_list("server_rev", flat=True)
+        .first()
+    ) or 0
+
+
+def get_latest_revs(channel_ids, user_id=None, cache=None):
+    """
+    Gets the latest server_revs of the changes that clients can receive for the given channels and user,
+    filling any that are missing from the cache from the database.
+
+    :param channel_ids: An iterable of channel ids
+    :param user_id: An optional user id
+    :param cache: The cache to use, defaults to the django cache
+    :return: A tuple of a dict of channel ids to their latest revs and the latest rev for the user.
+             Revs that could not be determined from the cache are None.
+    """
+    cache = cache or django_cache
+    keys = {channel_rev_key(channel_id): channel_id for channel_id in channel_ids}
+    if user_id is not None:
+        keys[user_rev_key(user_id)] = None
+    try:
+        cached_revs = cache.get_many(list(keys.keys()))
+    except Exception as e:
+        logger.warning("Failed to get latest change revs: {}".format(e))
+        return {channel_id: None for channel_id in channel_ids}, None
+
+    missing_revs = {}
+    for key, channel_id in keys.items():
+        if cached_revs.get(key) is None:
+            if channel_id is None:
+                missing_revs[key] = _get_latest_rev_from_db(user_id=user_id)
+            else:
+                missing_revs[key] = _get_latest_rev_from_db(channel_id=channel_id)
+    set_latest_revs(missing_revs, cache=cache)
+    cached_revs.update(missing_revs)
+
+    channel_revs = {channel_id: cached_revs[key] for key, channel_id in keys.items() if channel_id is not None}
+    return channel_revs, cached_revs.get(user_rev_key(user_id)) if user_id is not None else None
+
+
+def _get_event_names(cache, channel_ids, user_ids):
+    return [cache.make_key(CHANNEL_EVENTS_NAME.format(channel_id)) for channel_id in channel_ids] + [
+        cache.make_key(USER_EVENTS_NAME.format(user_id)) for user_id in user_ids
+    ]
+
+
+def notify(channel_ids=(), user_ids=(), cache=None):
+    """
+    Wakes any clients waiting for changes, or task progress, for the given channels and users.
+    This is a no-op if the cache is not a Redis cache.
+
+    :param channel_ids: An iterable of channel ids
+    :param user_ids: An iterable of user ids
+    :param cache: The cache to use, defaults to the django cache
+    """
+    cache = cache or django_cache
+    try:
+        redis_client = _get_redis_client(cache)
+        if redis_client is None:
+            return
+        names = _get_event_names(cache, channel_ids, user_ids)
+        if not names:
+            return
+        pipeline = redis_client.pipeline(transaction=False)
+        for name in names:
+            pipeline.publish(name, 1)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning("Failed to notify change feed: {}".format(e))
+
+
+def has_new_changes(channel_revs, user_id=None, user_rev=0, cache=None):
+    """
+    :param channel_revs: A dict of channel ids to the latest server_rev the client has for them
+    :param user_id: An optional user id
+    :param user_rev: The latest server_rev the client has for the user
+    :param cache: The cache to use, defaults to the django cache
+    :return: Whether there may be changes for the channels or the user after the given revs
+    """
+    latest_channel_revs, latest_user_rev = get_latest_revs(channel_revs.keys(), user_id=user_id, cache=cache)
+    if user_id is not None and (latest_user_rev is None or latest_user_rev > (user_rev or 0)):
+        return True
+    return any(
+        latest_channel_revs.get(channel_id) is None or latest_channel_revs[channel_id] > (rev or 0)
+        for channel_id, rev in channel_revs.items()
+    )
+
+
+def wait_for_changes(channel_revs, user_id=None, user_rev=0, timeout=25, cache=None):
+    """
+    Waits until there are changes for the channels or the user after the given revs, or until task progress
+    is reported for one of the channels, returning immediately if there are already new changes.
+
+    If the cache is not a Redis cache, there is no way to be notified, so this returns immediately
+    as if there were new changes, and clients fall back to polling.
+
+    :param channel_revs: A dict of channel ids to the latest server_rev the client has for them
+    :param user_id: An optional user id
+    :param user_rev: The latest server_rev the client has for the user
+    :param timeout: The maximum number of seconds to wait for
+    :param cache: The cache to use, defaults to the django cache
+    :return: True if there are changes or task progress, False if the timeout was reached
+    """
+    cache = cache or django_cache
+    redis_client = _get_redis_client(cache)
+    if redis_client is None:
+        return True
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before checking the latest revs, so that no changes can be missed in between
+        pubsub.subscribe(*_get_event_names(cache, channel_revs.keys(), [user_id] if user_id is not None else []))
+        if has_new_changes(channel_revs, user_id=user_id, user_rev=user_rev, cache=cache):
+            return True
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if pubsub.get_message(timeout=remaining) is not None:
+                return True
+    except Exception as e:
+        logger.warning("Failed to wait for change feed: {}".format(e))
+        return True
+    finally:
+        pubsub.close()
@@ -0,0 +1,101 @@
+"""
+Maintains the ChannelSummary table, which stores values about the main trees of channels that
+listing channels used to compute for every listed channel, scanning their whole main trees.
+
+As the summary is computed from the whole main tree, it is not updated after every batch of changes
+applied to a channel. Once changes have been applied, which includes edits, moves, copies and deploys
+of its main tree and the changes that publish it, an update is scheduled to run SUMMARY_UPDATE_DELAY
+seconds later, unless one is already pending, so that it is updated at most once in that time however
+many changes are applied. It is also updated whenever the channel is published outside of the change
+queue. Channels without a summary are computed on the fly by the viewsets, until their summaries are
+stored by the `rebuild_channel_summaries` command.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models import Sum
+from le_utils.constants import content_kinds
+
+from contentcuration.models import Channel
+from contentcuration.models import ChannelSummary
+from contentcuration.models import ContentNode
+from contentcuration.models import File
+from contentcuration.utils.sentry import report_exception
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_UPDATE_DELAY = 30
+
+# Set while an update of the summary of a channel is scheduled. It expires in case the update never runs.
+SUMMARY_UPDATE_PENDING_KEY = "channel_summary_update_pending:{}"
+SUMMARY_UPDATE_PENDING_TIMEOUT = 600
+
+
+def compute_channel_summary(channel):
+    """
+    :type channel: Channel
+    :return: A dict of the values of the summary of the channel
+    """
+    from contentcuration.viewsets.channel import _unpublished_changes_query
+
+    tree_id = channel.main_tree.tree_id
+    nodes = ContentNode.objects.filter(tree_id=tree_id)
+    return {
+        "last_modified": nodes.aggregate(last_modified=Max("modified"))["last_modified"],
+        "resource_count": (
+            nodes.exclude(kind_id=content_kinds.TOPIC).values("content_id").order_by().distinct().count()
+        ),
+        "has_unpublished_changes": _unpublished_changes_query(channel).exists(),
+        "size": (
+            File.objects.filter(contentnode__tree_id=tree_id)
+            .values("checksum", "file_size")
+            .order_by()
+            .distinct()
+            .aggregate(size=Sum("file_size"))["size"]
+        ) or 0,
+    }
+
+
+def update_channel_summary(channel_id):
+    """
+    Computes and stores the summary of a channel
+
+    :return: The ChannelSummary, or None if the channel does not exist or has no main tree
+    """
+    channel = Channel.objects.select_related("main_tree").filter(pk=channel_id).first()
+    if channel is None or channel.main_tree is None:
+        return None
+    summary, _ = ChannelSummary.objects.update_or_create(
+        channel_id=channel.id, defaults=compute_channel_summary(channel)
+    )
+    return summary
+
+
+def claim_channel_summary_update(channel_id):
+    """
+    :return: Whether an update of the summary of the channel should be scheduled, which is when none is pending
+    """
+    return cache.add(SUMMARY_UPDATE_PENDING_KEY.format(channel_id), True, timeout=SUMMARY_UPDATE_PENDING_TIMEOUT)
+
+
+def release_channel_summary_update(channel_id):
+    """
+    Allows another update of the summary of the channel to be scheduled
+    """
+    cache.delete(SUMMARY_UPDATE_PENDING_KEY.format(channel_id))
+
+
+def try_update_channel_summary(channel_id):
+    """
+    Updates the summary of a channel, logging rather than raising any errors, for use after
+    operations that should not fail because the summary could not be updated. The summary will
+    then be out of date until the channel is changed again, or the summaries are rebuilt.
+    """
+    try:
+        return update_channel_summary(channel_id)
+    except Exception as e:
+        logger.exception("Failed to update the summary of channel {}".format(channel_id))
+        report_exception(e)
+        return None
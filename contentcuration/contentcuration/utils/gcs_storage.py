@@ -1,7 +1,7 @@
 import logging
+import shutil
 import tempfile
 from gzip import GzipFile
-from io import BytesIO
 
 import backoff
 from django.conf import settings
@@ -17,6 +17,13 @@ CONTENT_DATABASES_MAX_AGE = 5  # seconds
 
 MAX_RETRY_TIME = 60  # seconds
 
+# The size of the chunks of resumable uploads and streaming downloads, which GCS requires to be
+# a multiple of 256KB. Only one chunk is held in memory at a time.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# The size of the reads from the file being uploaded
+COPY_BUFFER_SIZE = 1024 * 1024
+
 
 class GoogleCloudStorage(Storage):
     def __init__(self, client=None):
@@ -36,9 +43,12 @@ class GoogleCloudStorage(Storage):
         You can pass in an optional 'mode' argument, but is only there for Django Storage class
         compatibility. It would error out if given any other argument than "rb".
 
-        You can also pass in an object in the blob_object argument. This must have a method called
-        `download_to_file` that accepts as writeable file object as an argument, and writes the
-        bytes to it. (this is mainly used for mocking in tests.)
+        The bytes are streamed from GCS in chunks of CHUNK_SIZE as they are read, except for gzip
+        encoded files, like content databases, which GCS can't serve ranges of, and which are
+        downloaded to a temporary file on disk.
+
+        You can also pass in an object in the blob_object argument. This must have the `open` and
+        `download_to_file` methods of a blob. (this is mainly used for mocking in tests.)
         """
         # We don't have any logic for returning the file object in write
         # so just raise an error if we get any mode other than rb
@@ -61,6 +71,9 @@ class GoogleCloudStorage(Storage):
         if blob is None:
             raise FileNotFoundError("{} not found".format(name))
 
+        if blob.content_encoding != "gzip":
+            return File(blob.open("rb", chunk_size=CHUNK_SIZE), name=name)
+
         fobj = tempfile.NamedTemporaryFile()
         blob.download_to_file(fobj)
         # flush it to disk
@@ -71,6 +84,18 @@ class GoogleCloudStorage(Storage):
         django_file.just_downloaded = True
         return django_file
 
+    def read_range(self, name, start, end):
+        """
+        Read only the bytes from start up to, but not including, end of the resource with the given name,
+        without downloading the rest of it.
+        """
+        # the old studio storage had a prefix if /contentworkshop_content/
+        # before the path; remove that first before passing it in to GCS
+        if name.startswith(OLD_STUDIO_STORAGE_PREFIX):
+            name = name.split(OLD_STUDIO_STORAGE_PREFIX).pop()
+        # GCS byte ranges are inclusive of the end byte
+        return self.bucket.blob(name).download_as_bytes(start=start, end=end - 1)
+
     @backoff.on_exception(backoff.expo, InternalServerError, max_time=MAX_RETRY_TIME)
     def exists(self, name):
         """
@@ -91,22 +116,6 @@ class GoogleCloudStorage(Storage):
         else:
             blob = blob_object
 
-        buffer = None
-        # set a max-age of 5 if we're uploading to content/databases
-        if self.is_database_file(name):
-            blob.cache_control = "private, max-age={}, no-transform".format(
-                CONTENT_DATABASES_MAX_AGE
-            )
-
-            # Compress the database file so that users can save bandwith and download faster.
-            buffer = BytesIO()
-            compressed = GzipFile(fileobj=buffer, mode="w")
-            compressed.write(fobj.read())
-            compressed.close()
-
-            blob.content_encoding = "gzip"
-            fobj = buffer
-
         # determine the current file's mimetype based on the name
         # import determine_content_type lazily in here, so we don't get into an infinite loop with circular dependencies
         from contentcuration.utils.storage_common import determine_content_type
@@ -120,14 +129,25 @@ class GoogleCloudStorage(Storage):
             logging.warning("Stopping the upload of an empty file: {}".format(name))
             return name
 
+        # set a max-age of 5 if we're uploading to content/databases
+        if self.is_database_file(name):
+            blob.cache_control = "private, max-age={}, no-transform".format(
+                CONTENT_DATABASES_MAX_AGE
+            )
+            blob.content_encoding = "gzip"
+
+            # Compress the database file so that users can save bandwith and download faster.
+            # The file is compressed as it is read and uploaded in chunks with a resumable upload,
+            # so that neither the file nor its compressed bytes are ever held in memory whole.
+            with blob.open("wb", chunk_size=CHUNK_SIZE, content_type=content_type) as upload:
+                with GzipFile(fileobj=upload, mode="wb") as compressed:
+                    shutil.copyfileobj(fobj, compressed, COPY_BUFFER_SIZE)
+            return name
+
         blob.upload_from_file(
             fobj, content_type=content_type,
         )
 
-        # Close StringIO object and discard memory buffer if created
-        if buffer:
-            buffer.close()
-
         return name
 
     def url(self, name):
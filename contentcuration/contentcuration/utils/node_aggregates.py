@@ -0,0 +1,344 @@
+"""
+Maintains the ContentNodeAggregate table, which stores counts of the descendants of topics, so that
+the ContentNodeViewSet can read them rather than counting the descendants of every topic it returns,
+which gets slower the larger and deeper the subtree of the topic is.
+
+Every node contributes to the counts of all of its ancestors, so whenever nodes are created, updated,
+moved, copied or deleted, the change in their contribution, or in that of their whole subtree, is added
+to the stored counts of the ancestors it affects, with a single UPDATE. Files are not counted, so
+changes to files never affect the stored counts.
+
+Only the counts of topics that already have stored counts are updated. The counts of any other topics,
+such as those in trees created before the table existed, are computed on the fly by the viewset
+until they are stored by the `check_contentnode_aggregates` command.
+"""
+import contextlib
+
+from django.db import transaction
+from django.db.models import BooleanField
+from django.db.models import Count
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from le_utils.constants import content_kinds
+from le_utils.constants import roles
+
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeAggregate
+
+
+AGGREGATE_FIELDS = ("resource_count", "coach_count", "error_count", "updated_count", "new_count")
+
+# The fields of a node that determine what it adds to the counts of its ancestors
+CONTRIBUTION_FIELDS = ("kind_id", "role_visibility", "complete", "changed", "published")
+
+EMPTY_COUNTS = (0,) * len(AGGREGATE_FIELDS)
+
+REBUILD_CHUNK_SIZE = 1000
+
+
+def get_contribution(kind_id, role_visibility, complete, changed, published):
+    """
+    :return: A tuple of what a node with the given values adds to each of the AGGREGATE_FIELDS of its ancestors
+    """
+    is_resource = kind_id != content_kinds.TOPIC
+    return (
+        int(is_resource),
+        int(is_resource and role_visibility == roles.COACH),
+        int(complete is False),
+        int(is_resource and bool(changed) and bool(published)),
+        int(is_resource and bool(changed) and not published),
+    )
+
+
+def _add(counts, other_counts, sign=1):
+    return tuple(count + sign * other_count for count, other_count in zip(counts, other_counts))
+
+
+def _subtree_filter(tree_id, lft, rght, prefix=""):
+    return {
+        prefix + "tree_id": tree_id,
+        prefix + "lft__gte": lft,
+        prefix + "rght__lte": rght,
+    }
+
+
+def _ancestors_filter(tree_id, lft, rght):
+    return {
+        "contentnode__tree_id": tree_id,
+        "contentnode__lft__lt": lft,
+        "contentnode__rght__gt": rght,
+    }
+
+
+def _update_counts(queryset, counts, sign=1):
+    updates = {
+        field: F(field) + sign * count for field, count in zip(AGGREGATE_FIELDS, counts) if count
+    }
+    if updates:
+        queryset.update(**updates)
+
+
+def update_ancestor_aggregates(tree_id, lft, rght, counts, sign=1):
+    """
+    Adds counts to the stored counts of the ancestors of the node at the given position
+    """
+    _update_counts(ContentNodeAggregate.objects.filter(**_ancestors_filter(tree_id, lft, rght)), counts, sign=sign)
+
+
+def _get_ancestor_ids(tree_id, lft, rght):
+    """
+    :return: The set of ids of the ancestors with stored counts of the node at the given position
+    """
+    return set(
+        ContentNodeAggregate.objects.filter(**_ancestors_filter(tree_id, lft, rght)).values_list(
+            "contentnode_id", flat=True
+        )
+    )
+
+
+def _get_position(node_id):
+    return ContentNode.objects.filter(pk=node_id).values("tree_id", "lft", "rght").first()
+
+
+def get_subtree_counts(tree_id, lft, rght):
+    """
+    :return: A tuple of what the node at the given position and its descendants add to the counts of its ancestors
+    """
+    is_resource = ~Q(kind_id=content_kinds.TOPIC)
+    is_changed_resource = is_resource & Q(changed=True)
+    counts = ContentNode.objects.filter(**_subtree_filter(tree_id, lft, rght)).aggregate(
+        resource_count=Count("id", filter=is_resource),
+        coach_count=Count("id", filter=is_resource & Q(role_visibility=roles.COACH)),
+        error_count=Count("id", filter=Q(complete=False)),
+        updated_count=Count("id", filter=is_changed_resource & Q(published=True)),
+        new_count=Count("id", filter=is_changed_resource & Q(published=False)),
+    )
+    return tuple(counts[field] for field in AGGREGATE_FIELDS)
+
+
+def node_created(node):
+    """
+    Adds a newly created node to the stored counts of its ancestors, and stores empty counts for it if it is a topic
+    """
+    nodes_created([node])
+
+
+def nodes_created(nodes):
+    """
+    Adds newly created nodes without descendants, such as those bulk created as the children of
+    a node, to the stored counts of their ancestors, and stores empty counts for those that are topics
+    """
+    ContentNodeAggregate.objects.bulk_create(
+        [ContentNodeAggregate(contentnode_id=node.id) for node in nodes if node.kind_id == content_kinds.TOPIC],
+        ignore_conflicts=True,
+    )
+    # Sum what the nodes add to their ancestors by parent, so that siblings are added with a single update
+    positions_and_counts = {}
+    for node in nodes:
+        if node.parent_id:
+            position, counts = positions_and_counts.get(node.parent_id, ((node.tree_id, node.lft, node.rght), EMPTY_COUNTS))
+            positions_and_counts[node.parent_id] = (
+                position,
+                _add(counts, get_contribution(*(getattr(node, field) for field in CONTRIBUTION_FIELDS))),
+            )
+    for position, counts in positions_and_counts.values():
+        update_ancestor_aggregates(*position, counts)
+
+
+def subtree_created(node_id):
+    """
+    Stores counts for all the topics of a newly created subtree, such as a copy, that was not
+    created through `ContentNode.save`, and adds the subtree to the stored counts of its ancestors
+    """
+    position = _get_position(node_id)
+    if position is None:
+        return
+    aggregates, counts = compute_aggregates(**position)
+    ContentNodeAggregate.objects.bulk_create(
+        [
+            ContentNodeAggregate(contentnode_id=topic_id, **dict(zip(AGGREGATE_FIELDS, topic_counts)))
+            for topic_id, topic_counts in aggregates.items()
+        ],
+        batch_size=REBUILD_CHUNK_SIZE,
+    )
+    update_ancestor_aggregates(counts=counts, **position)
+
+
+def subtree_deleted(node_id):
+    """
+    Removes a node and its descendants from the stored counts of its ancestors, before it is deleted
+    """
+    position = _get_position(node_id)
+    if position is None or not _get_ancestor_ids(**position):
+        return
+    update_ancestor_aggregates(counts=get_subtree_counts(**position), sign=-1, **position)
+
+
+@contextlib.contextmanager
+def track_node_updates(node_ids):
+    """
+    Updates the stored counts of the ancestors of the given nodes with any changes to what the nodes
+    add to them that are made within the context. Moves must be tracked with `track_subtree_move`.
+
+    :param node_ids: A list of the ids of the nodes that may be updated
+    """
+    if not node_ids:
+        yield
+        return
+
+    def get_contributions():
+        return {
+            values["id"]: (values, get_contribution(*(values[field] for field in CONTRIBUTION_FIELDS)))
+            for values in ContentNode.objects.filter(pk__in=node_ids).values(
+                "id", "tree_id", "lft", "rght", "parent_id", *CONTRIBUTION_FIELDS
+            )
+        }
+
+    before = get_contributions()
+    yield
+    for node_id, (values, contribution) in get_contributions().items():
+        if node_id in before and values["parent_id"] and before[node_id][1] != contribution:
+            update_ancestor_aggregates(
+                values["tree_id"], values["lft"], values["rght"], _add(contribution, before[node_id][1], sign=-1)
+            )
+
+
+@contextlib.contextmanager
+def track_subtree_move(node_id, recount=False):
+    """
+    Moves a node and its descendants from the stored counts of its old ancestors to those of
+    its new ancestors, if it is moved within the context. This must be used while the tree of
+    the node is locked, so that the position of the node cannot change outside of the context.
+
+    :param node_id: The id of the node that may be moved, or None to track nothing
+    :param recount: Whether the node may also be updated within the context, so that what
+                    it adds to its new ancestors has to be counted again after the move
+    """
+    old_position = _get_position(node_id) if node_id else None
+    if old_position is None:
+        yield
+        return
+    old_ancestor_ids = _get_ancestor_ids(**old_position)
+    old_counts = get_subtree_counts(**old_position)
+    yield
+    new_position = _get_position(node_id)
+    if new_position == old_position:
+        new_ancestor_ids = old_ancestor_ids
+    else:
+        new_ancestor_ids = _get_ancestor_ids(**new_position) if new_position else set()
+    new_counts = get_subtree_counts(**new_position) if recount and new_position else old_counts
+    _update_counts(
+        ContentNodeAggregate.objects.filter(contentnode_id__in=old_ancestor_ids - new_ancestor_ids), old_counts, sign=-1
+    )
+    _update_counts(
+        ContentNodeAggregate.objects.filter(contentnode_id__in=new_ancestor_ids - old_ancestor_ids), new_counts
+    )
+    _update_counts(
+        ContentNodeAggregate.objects.filter(contentnode_id__in=old_ancestor_ids & new_ancestor_ids),
+        _add(new_counts, old_counts, sign=-1),
+    )
+
+
+def reset_changed_aggregates(tree_id):
+    """
+    Clears the counts of changed descendants of all the topics of a tree, once all of its nodes are published
+    """
+    ContentNodeAggregate.objects.filter(contentnode__tree_id=tree_id).update(updated_count=0, new_count=0)
+
+
+def compute_aggregates(tree_id, lft, rght):
+    """
+    Counts the descendants of all the topics in the subtree of the node at the given position, including
+    the node itself, in a single pass over the subtree in tree order.
+
+    :return: A tuple of a dict of topic ids to tuples of their counts, and a tuple of what the whole
+             subtree adds to the counts of the ancestors of the node
+    """
+    aggregates = {}
+    total_counts = EMPTY_COUNTS
+    # The ids, rght values and counts of the topics that the current node is a descendant of
+    stack = []
+
+    def close_topic():
+        topic_id, _, topic_counts = stack.pop()
+        aggregates[topic_id] = topic_counts
+        if stack:
+            stack[-1][2] = _add(stack[-1][2], topic_counts)
+
+    nodes = (
+        ContentNode.objects.filter(**_subtree_filter(tree_id, lft, rght))
+        .order_by("lft")
+        .values_list("id", "lft", "rght", *CONTRIBUTION_FIELDS)
+    )
+    for node_id, node_lft, node_rght, *values in nodes.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        while stack and stack[-1][1] < node_lft:
+            close_topic()
+        contribution = get_contribution(*values)
+        total_counts = _add(total_counts, contribution)
+        if stack:
+            stack[-1][2] = _add(stack[-1][2], contribution)
+        if values[0] == content_kinds.TOPIC:
+            stack.append([node_id, node_rght, EMPTY_COUNTS])
+    while stack:
+        close_topic()
+    return aggregates, total_counts
+
+
+def get_stored_aggregates(tree_id, lft, rght):
+    """
+    :return: A dict of topic ids to tuples of their stored counts, for the topics in the subtree of the node at the given position
+    """
+    return {
+        row[0]: tuple(row[1:])
+        for row in ContentNodeAggregate.objects.filter(
+            **_subtree_filter(tree_id, lft, rght, prefix="contentnode__")
+        ).values_list("contentnode_id", *AGGREGATE_FIELDS)
+    }
+
+
+def rebuild_aggregates(node_id):
+    """
+    Counts the descendants of all the topics in the subtree of a node, including the node itself,
+    and replaces their stored counts.
+
+    :return: A dict of topic ids to tuples of their counts
+    """
+    position = _get_position(node_id)
+    if position is None:
+        return {}
+    with transaction.atomic(), ContentNode.objects.lock_mptt(position["tree_id"]):
+        # The node may have been moved or deleted before the tree was locked
+        position = _get_position(node_id)
+        if position is None:
+            return {}
+        aggregates, _ = compute_aggregates(**position)
+        ContentNodeAggregate.objects.filter(**_subtree_filter(prefix="contentnode__", **position)).delete()
+        ContentNodeAggregate.objects.bulk_create(
+            [
+                ContentNodeAggregate(contentnode_id=topic_id, **dict(zip(AGGREGATE_FIELDS, topic_counts)))
+                for topic_id, topic_counts in aggregates.items()
+            ],
+            batch_size=REBUILD_CHUNK_SIZE,
+        )
+    return aggregates
+
+
+def stored_aggregate(field):
+    """
+    :return: A subquery of a stored count of the outer node, which is null if it has no stored counts
+    """
+    return Subquery(ContentNodeAggregate.objects.filter(contentnode_id=OuterRef("id")).values(field)[:1])
+
+
+def stored_aggregate_exists(field):
+    """
+    :return: A subquery of whether a stored count of the outer node is more than 0, which is null if it has no stored counts
+    """
+    return Subquery(
+        ContentNodeAggregate.objects.filter(contentnode_id=OuterRef("id"))
+        .annotate(exists=ExpressionWrapper(Q(**{"{}__gt".format(field): 0}), output_field=BooleanField()))
+        .values("exists")[:1]
+    )
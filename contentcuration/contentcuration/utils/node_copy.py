@@ -0,0 +1,156 @@
+"""
+Copies subtrees for the ContentNodeViewSet in chunks, through ContentNodeCopy checkpoints, so
+that a large copy doesn't hold a lock on the target tree for the whole copy, and continues from
+its last chunk if the worker copying it is stopped, rather than leaving a partial copy behind.
+
+The first chunk is copied when the copy is started, so that the copy of the source node exists
+once the copy change has been applied, and small copies are done straight away. The rest of the
+chunks are copied by `copy_node_chunks_task`, which requeues itself after every few chunks. Any
+copies left unfinished can be continued with the `resume_node_copies` command.
+"""
+import logging
+
+from celery import states
+from django.db import transaction
+
+from contentcuration.models import Change
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeCopy
+from contentcuration.models import TaskResult
+from contentcuration.utils.sentry import report_exception
+from contentcuration.viewsets.base import create_change_task
+from contentcuration.viewsets.base import fail_change_task
+from contentcuration.viewsets.base import finish_change_task
+from contentcuration.viewsets.base import get_change_task_tracker
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+from contentcuration.viewsets.sync.constants import COPYING_FLAG
+from contentcuration.viewsets.sync.utils import generate_update_event
+
+
+logger = logging.getLogger(__name__)
+
+COPY_TASK_NAME = "copy_nodes"
+
+# The number of chunks copied by each run of the task before it requeues itself
+CHUNKS_PER_TASK = 10
+
+
+def start_copy(
+    source,
+    target,
+    position,
+    pk,
+    mods,
+    excluded_descendants,
+    can_edit_source_channel,
+    user,
+    channel_id,
+    batch_size=None,
+):
+    """
+    Starts copying source to the target, with pk as the id of its copy, and copies the first chunk
+
+    :type source: ContentNode
+    :type target: ContentNode
+    :param channel_id: The id of the channel of the target
+    :rtype: ContentNodeCopy
+    """
+    task_object = create_change_task(pk, CONTENTNODE, channel_id, user, COPY_TASK_NAME)
+    node_copy = ContentNodeCopy.objects.create(
+        id=pk,
+        source_node_id=source.id,
+        target_id=target.id,
+        position=position,
+        mods=mods,
+        excluded_descendants=excluded_descendants,
+        can_edit_source_channel=can_edit_source_channel,
+        source_channel_id=source.get_channel_id(),
+        channel_id=channel_id,
+        created_by=user,
+        task_id=task_object.task_id,
+        total=ContentNode.objects.count_nodes_to_copy(source, excluded_descendants),
+    )
+    if copy_chunks(node_copy, max_chunks=1, batch_size=batch_size):
+        enqueue_copy(node_copy)
+    return node_copy
+
+
+def enqueue_copy(node_copy):
+    """
+    Enqueues the task that copies the rest of the chunks of the copy, once the transaction that the
+    copy was saved in is committed, so that the task finds it
+    """
+    from contentcuration.tasks import copy_node_chunks_task
+
+    user = node_copy.created_by
+    copy_id = node_copy.id
+    channel_id = node_copy.channel_id
+    transaction.on_commit(
+        lambda: copy_node_chunks_task.fetch_or_enqueue(user, copy_id=copy_id, channel_id=channel_id)
+    )
+
+
+def _get_task_object(node_copy):
+    """
+    Returns the TaskResult that reports the progress of the copy, creating another one if it
+    failed or was removed, as when an errored copy is resumed
+    """
+    task_object = TaskResult.objects.filter(task_id=node_copy.task_id, status=states.STARTED).first()
+    if task_object is None:
+        task_object = create_change_task(node_copy.id, CONTENTNODE, node_copy.channel_id, node_copy.created_by, COPY_TASK_NAME)
+        node_copy.task_id = task_object.task_id
+        node_copy.save(update_fields=["task_id"])
+    return task_object
+
+
+def _is_done(node_copy):
+    mappings = node_copy.mappings.all()
+    return mappings.exists() and not mappings.filter(children_copied=False).exists()
+
+
+def _finish_copy(node_copy, task_object):
+    new_node = ContentNode.objects.get(pk=node_copy.id)
+    Change.create_change(
+        generate_update_event(
+            node_copy.id,
+            CONTENTNODE,
+            {COPYING_FLAG: False, "node_id": new_node.node_id},
+            channel_id=node_copy.channel_id
+        ),
+        applied=True,
+        created_by_id=node_copy.created_by_id,
+    )
+    finish_change_task(node_copy.id, CONTENTNODE, node_copy.channel_id, task_object)
+    node_copy.delete()
+
+
+def copy_chunks(node_copy, max_chunks=None, batch_size=None):
+    """
+    Copies up to max_chunks chunks of the copy, reporting its progress, and finishes the copy
+    once there are no chunks left. Errors are recorded on the task of the copy, as
+    `create_change_tracker` does, and stop the copy until it is resumed.
+
+    :type node_copy: ContentNodeCopy
+    :return: Whether the copy has chunks left to copy
+    """
+    task_object = _get_task_object(node_copy)
+    tracker = get_change_task_tracker(task_object, node_copy.channel_id)
+    tracker.set_total(max(node_copy.total, 1))
+    tracker.track(node_copy.copied)
+
+    chunks = 0
+    try:
+        while not _is_done(node_copy):
+            if max_chunks is not None and chunks >= max_chunks:
+                return True
+            ContentNode.objects.copy_node_chunk(node_copy, batch_size=batch_size)
+            chunks += 1
+            node_copy.refresh_from_db(fields=["copied"])
+            tracker.track(node_copy.copied)
+        _finish_copy(node_copy, task_object)
+    except Exception as e:
+        logger.exception("Failed to copy node {} to {}".format(node_copy.source_node_id, node_copy.id))
+        report_exception(e)
+        fail_change_task(task_object)
+        ContentNodeCopy.objects.filter(pk=node_copy.pk).update(errored=True)
+    return False
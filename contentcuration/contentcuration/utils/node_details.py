@@ -0,0 +1,447 @@
+"""
+Maintains the ContentNodeDetails table, which stores the details of the topics of the main trees of
+channels, so that the channel and node details views can read them rather than calling
+ContentNode.get_details, which runs a dozen aggregate subqueries over all the descendants of a topic.
+
+The details of all the topics of a tree are computed together, in a single pass over the nodes of the
+tree in tree order. Each topic that has not been passed yet has a partial aggregate, that the values of
+its descendants are added to as they are visited, and which is merged into the aggregate of its parent
+once all of its descendants have been visited.
+
+Like the channel summaries, the details of the main tree of a channel are updated whenever its changes
+have been applied and whenever it is published outside of the change queue. The details of any other
+topics are computed on the fly by `get_node_details_cached`, until they are stored by the
+`rebuild_node_details` command.
+
+Updates are skipped when the nodes and files of the tree have not changed since the details were last
+stored, which is checked with a fingerprint of their counts and last modified times, and only the rows of
+the topics whose details changed are written.
+"""
+import logging
+from collections import Counter
+from collections import defaultdict
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import Max
+from django.utils import timezone
+from le_utils.constants import content_kinds
+from le_utils.constants import format_presets
+from le_utils.constants import roles
+
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeDetails
+from contentcuration.models import File
+from contentcuration.models import generate_storage_url
+from contentcuration.utils.parser import load_json_string
+from contentcuration.utils.sentry import report_exception
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+SAMPLE_NODE_COUNT = 4
+
+NODE_FIELDS = (
+    "id",
+    "node_id",
+    "parent_id",
+    "lft",
+    "rght",
+    "level",
+    "kind_id",
+    "title",
+    "description",
+    "thumbnail_encoding",
+    "created",
+    "language__native_name",
+    "license__license_name",
+    "author",
+    "aggregator",
+    "provider",
+    "copyright_holder",
+    "role_visibility",
+    "grade_levels",
+    "categories",
+    "original_channel_id",
+)
+
+SAMPLE_NODE_FIELDS = ("id", "node_id", "title", "description", "kind_id", "thumbnail_encoding")
+
+# The fingerprint of a tree when the details of its topics were last stored
+TREE_FINGERPRINT_KEY = "node_details_fingerprint:{}"
+
+
+class DetailsAggregate(object):
+    """
+    The partial details of a topic, of those of its descendants that have been added
+    """
+
+    def __init__(self):
+        self.resource_count = 0
+        self.coach_content = 0
+        self.exercises = 0
+        # The sizes of the distinct files of the resources, by checksum
+        self.files = {}
+        self.kinds = Counter()
+        self.tags = Counter()
+        self.original_channels = Counter()
+        self.languages = set()
+        self.accessible_languages = set()
+        self.licenses = set()
+        self.authors = set()
+        self.aggregators = set()
+        self.providers = set()
+        self.copyright_holders = set()
+        self.levels = set()
+        self.categories = set()
+        # A tuple of the level, parent id and pathway of the first of the deepest resources
+        self.deepest = None
+
+    def add_node(self, node, files, tags, get_pathway):
+        """
+        Adds a descendant of the topic
+
+        :param node: A dict of the NODE_FIELDS of the descendant
+        :param files: A list of tuples of the checksum, size, preset and language of the files of the descendant
+        :param tags: A list of the names of the tags of the descendant
+        :param get_pathway: A callable that returns the pathway to the descendant
+        """
+        if node["language__native_name"]:
+            self.languages.add(node["language__native_name"])
+        self.tags.update(tags)
+        self.levels.update((node["grade_levels"] or {}).keys())
+        self.categories.update((node["categories"] or {}).keys())
+        if node["kind_id"] == content_kinds.TOPIC:
+            return
+
+        self.resource_count += 1
+        self.coach_content += int(node["role_visibility"] == roles.COACH)
+        self.exercises += int(node["kind_id"] == content_kinds.EXERCISE)
+        self.kinds[node["kind_id"]] += 1
+        if node["original_channel_id"]:
+            self.original_channels[node["original_channel_id"]] += 1
+        if node["license__license_name"]:
+            self.licenses.add(node["license__license_name"])
+        self.authors.add(node["author"])
+        self.aggregators.add(node["aggregator"])
+        self.providers.add(node["provider"])
+        self.copyright_holders.add(node["copyright_holder"])
+        for checksum, file_size, preset_id, language in files:
+            self.files[checksum] = file_size or 0
+            if preset_id == format_presets.VIDEO_SUBTITLE and language:
+                self.accessible_languages.add(language)
+        if self.deepest is None or node["level"] > self.deepest[0]:
+            self.deepest = (node["level"], node["parent_id"], get_pathway())
+
+    def merge(self, other):
+        """
+        Adds the details of a child topic, once all of its descendants have been added to them
+        """
+        self.resource_count += other.resource_count
+        self.coach_content += other.coach_content
+        self.exercises += other.exercises
+        self.files.update(other.files)
+        self.kinds.update(other.kinds)
+        self.tags.update(other.tags)
+        self.original_channels.update(other.original_channels)
+        for field in (
+            "languages",
+            "accessible_languages",
+            "licenses",
+            "authors",
+            "aggregators",
+            "providers",
+            "copyright_holders",
+            "levels",
+            "categories",
+        ):
+            getattr(self, field).update(getattr(other, field))
+        if other.deepest is not None and (self.deepest is None or other.deepest[0] > self.deepest[0]):
+            self.deepest = other.deepest
+
+    def to_details(self, created, last_update):
+        """
+        :return: The details, in the format of ContentNode.get_details, without their sample
+                 nodes and original channels, which are added by `add_related_details`
+        """
+        return {
+            "last_update": last_update,
+            "created": created.strftime(settings.DATE_TIME_FORMAT),
+            "resource_count": self.resource_count,
+            "resource_size": sum(self.files.values()),
+            "includes": {"coach_content": self.coach_content, "exercises": self.exercises},
+            "kind_count": [{"kind_id": kind, "count": count} for kind, count in sorted(self.kinds.items())],
+            "languages": sorted(self.languages),
+            "accessible_languages": sorted(self.accessible_languages),
+            "licenses": sorted(self.licenses),
+            "tags": [{"tag_name": tag, "count": count} for tag, count in sorted(self.tags.items())],
+            "original_channels": dict(self.original_channels),
+            "sample_pathway": self.deepest[2] if self.deepest else [],
+            "sample_nodes": self.deepest[1] if self.deepest else None,
+            # source model fields for the below default to an empty string, but can also be null
+            "authors": sorted(filter(bool, self.authors)),
+            "aggregators": sorted(filter(bool, self.aggregators)),
+            "providers": sorted(filter(bool, self.providers)),
+            "copyright_holders": sorted(filter(bool, self.copyright_holders)),
+            "levels": sorted(self.levels),
+            "categories": sorted(self.categories),
+        }
+
+
+def _get_files(tree_id):
+    files = defaultdict(list)
+    file_values = (
+        File.objects.filter(contentnode__tree_id=tree_id)
+        .exclude(contentnode__kind_id=content_kinds.TOPIC)
+        .values_list("contentnode_id", "checksum", "file_size", "preset_id", "language__native_name")
+        .order_by()
+    )
+    for contentnode_id, *values in file_values.iterator(chunk_size=CHUNK_SIZE):
+        files[contentnode_id].append(values)
+    return files
+
+
+def _get_tags(tree_id):
+    tags = defaultdict(list)
+    tag_values = (
+        ContentNode.tags.through.objects.filter(contentnode__tree_id=tree_id)
+        .values_list("contentnode_id", "contenttag__tag_name")
+        .order_by()
+    )
+    for contentnode_id, tag_name in tag_values.iterator(chunk_size=CHUNK_SIZE):
+        tags[contentnode_id].append(tag_name)
+    return tags
+
+
+def _get_thumbnail(thumbnail_encoding, thumbnail_filename):
+    # See ContentNode.get_thumbnail
+    if thumbnail_encoding:
+        thumbnail_data = load_json_string(thumbnail_encoding)
+        if type(thumbnail_data) is dict and thumbnail_data.get("base64"):
+            return thumbnail_data["base64"]
+    if thumbnail_filename:
+        return generate_storage_url(thumbnail_filename)
+    return ""
+
+
+def _get_sample_nodes(parent_ids, first_children):
+    """
+    :return: A dict of the first children of the given parents, as the sample nodes of the details, by parent id
+    """
+    sample_ids = [node["id"] for parent_id in parent_ids for node in first_children[parent_id]]
+    thumbnail_filenames = {}
+    for i in range(0, len(sample_ids), CHUNK_SIZE):
+        thumbnail_files = File.objects.filter(
+            contentnode_id__in=sample_ids[i:i + CHUNK_SIZE], preset__thumbnail=True
+        ).values_list("contentnode_id", "checksum", "file_format__extension")
+        for contentnode_id, checksum, extension in thumbnail_files:
+            thumbnail_filenames.setdefault(contentnode_id, "{}.{}".format(checksum, extension))
+    return {
+        parent_id: [
+            {
+                "node_id": node["node_id"],
+                "title": node["title"],
+                "description": node["description"],
+                "thumbnail": _get_thumbnail(node["thumbnail_encoding"], thumbnail_filenames.get(node["id"])),
+                "kind": node["kind_id"],
+            }
+            for node in first_children[parent_id]
+        ]
+        for parent_id in parent_ids
+    }
+
+
+def _get_original_channels(channel_ids, channel_id):
+    """
+    :return: A dict of the channels nodes were imported from, other than the given channel, by id
+    """
+    return {
+        channel.id: {"id": channel.id, "name": channel.name, "thumbnail": channel.get_thumbnail()}
+        for channel in Channel.objects.exclude(pk=channel_id).filter(pk__in=channel_ids, deleted=False).order_by()
+    }
+
+
+def add_related_details(details, first_children, channel_id):
+    """
+    Replaces the parent ids and original channel counts that `DetailsAggregate.to_details` leaves in the
+    details with their sample nodes and original channels, querying them once for all the topics
+    """
+    sample_nodes = _get_sample_nodes(
+        {topic_details["sample_nodes"] for topic_details in details.values() if topic_details["sample_nodes"]},
+        first_children,
+    )
+    original_channels = _get_original_channels(
+        {original_id for topic_details in details.values() for original_id in topic_details["original_channels"]},
+        channel_id,
+    )
+    for topic_details in details.values():
+        topic_details["sample_nodes"] = sample_nodes.get(topic_details["sample_nodes"], [])
+        topic_details["original_channels"] = [
+            dict(original_channels[original_id], count=count)
+            for original_id, count in sorted(topic_details["original_channels"].items())
+            if original_id in original_channels
+        ]
+
+
+class TreeWalk(object):
+    """
+    A single pass over the nodes of a tree in tree order, which adds each node to the partial aggregates
+    of the topics it is a descendant of, and stores the details of each topic once it has been passed
+    """
+
+    def __init__(self, files, tags, last_update):
+        """
+        :param files: A dict of the lists of files of the nodes, by node id, see `DetailsAggregate.add_node`
+        :param tags: A dict of the lists of tag names of the nodes, by node id
+        """
+        self.files = files
+        self.tags = tags
+        self.last_update = last_update
+        # The details of the topics that have been passed, by topic id
+        self.details = {}
+        # The values and partial aggregates of the nodes that the current node is a descendant of
+        self.stack = []
+        # The first children of each node, which are the sample nodes of the details of the topics
+        # whose deepest resource they are siblings of
+        self.first_children = defaultdict(list)
+
+    def get_pathway(self):
+        return [
+            {"title": node["title"], "node_id": node["node_id"], "kind_id": node["kind_id"]}
+            for node, _ in self.stack
+            if node["parent_id"]
+        ]
+
+    def close_node(self):
+        node, aggregate = self.stack.pop()
+        if node["kind_id"] == content_kinds.TOPIC:
+            self.details[node["id"]] = aggregate.to_details(node["created"], self.last_update)
+        if self.stack:
+            self.stack[-1][1].merge(aggregate)
+
+    def visit(self, node):
+        """
+        :param node: A dict of the NODE_FIELDS of the next node of the tree
+        """
+        while self.stack and self.stack[-1][0]["rght"] < node["lft"]:
+            self.close_node()
+        if node["parent_id"] and len(self.first_children[node["parent_id"]]) < SAMPLE_NODE_COUNT:
+            self.first_children[node["parent_id"]].append({field: node[field] for field in SAMPLE_NODE_FIELDS})
+        if self.stack:
+            self.stack[-1][1].add_node(node, self.files.get(node["id"], ()), self.tags.get(node["id"], ()), self.get_pathway)
+        if node["kind_id"] == content_kinds.TOPIC or node["rght"] - node["lft"] > 1:
+            self.stack.append((node, DetailsAggregate()))
+
+    def close(self):
+        while self.stack:
+            self.close_node()
+
+
+def compute_tree_details(tree_id, channel_id=None):
+    """
+    Computes the details of all the topics of a tree, in a single pass over its nodes in tree order.
+
+    :param channel_id: The id of the channel of the tree, which is left out of the original channels
+    :return: A dict of the details of the topics, by topic id
+    """
+    last_update = pytz.utc.localize(datetime.now()).strftime(settings.DATE_TIME_FORMAT)
+    walk = TreeWalk(_get_files(tree_id), _get_tags(tree_id), last_update)
+    nodes = ContentNode.objects.filter(tree_id=tree_id).order_by("lft").values(*NODE_FIELDS)
+    for node in nodes.iterator(chunk_size=CHUNK_SIZE):
+        walk.visit(node)
+    walk.close()
+
+    add_related_details(walk.details, walk.first_children, channel_id)
+    return walk.details
+
+
+def get_tree_fingerprint(tree_id):
+    """
+    :return: A string that changes whenever a node or file of the tree is added, removed or saved
+    """
+    nodes = ContentNode.objects.filter(tree_id=tree_id).order_by().aggregate(count=Count("id"), modified=Max("modified"))
+    files = File.objects.filter(contentnode__tree_id=tree_id).order_by().aggregate(count=Count("id"), modified=Max("modified"))
+    return "{}:{}:{}:{}".format(nodes["count"], nodes["modified"], files["count"], files["modified"])
+
+
+def _without_last_update(details):
+    return {field: value for field, value in details.items() if field != "last_update"}
+
+
+def store_tree_details(tree_id, details):
+    """
+    Stores the details of the topics of a tree, only writing those that changed
+
+    :param details: A dict of the details of all the topics of the tree, by topic id
+    """
+    stored = dict(
+        ContentNodeDetails.objects.filter(contentnode__tree_id=tree_id).values_list("contentnode_id", "details")
+    )
+    now = timezone.now()
+    changed = [
+        ContentNodeDetails(contentnode_id=topic_id, details=topic_details, updated=now)
+        for topic_id, topic_details in details.items()
+        if topic_id in stored and _without_last_update(stored[topic_id]) != _without_last_update(topic_details)
+    ]
+    with transaction.atomic():
+        ContentNodeDetails.objects.filter(contentnode_id__in=set(stored) - set(details)).delete()
+        ContentNodeDetails.objects.bulk_create(
+            [
+                ContentNodeDetails(contentnode_id=topic_id, details=topic_details)
+                for topic_id, topic_details in details.items()
+                if topic_id not in stored
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+        ContentNodeDetails.objects.bulk_update(changed, ["details", "updated"], batch_size=CHUNK_SIZE)
+
+
+def update_node_details(channel_id, force=False):
+    """
+    Computes and stores the details of all the topics of the main tree of a channel, unless its nodes and
+    files have not changed since they were last stored
+
+    :param force: Whether to compute the details even if the tree has not changed
+    :return: The number of topics whose details are stored, or None if the channel does not exist or has no main tree
+    """
+    channel = Channel.objects.select_related("main_tree").filter(pk=channel_id).first()
+    if channel is None or channel.main_tree is None:
+        return None
+    tree_id = channel.main_tree.tree_id
+    # The fingerprint is taken before the details are computed, so that changes made meanwhile update them again
+    fingerprint = get_tree_fingerprint(tree_id)
+    fingerprint_key = TREE_FINGERPRINT_KEY.format(tree_id)
+    if not force and cache.get(fingerprint_key) == fingerprint:
+        return ContentNodeDetails.objects.filter(contentnode__tree_id=tree_id).count()
+    details = compute_tree_details(tree_id, channel_id=channel.id)
+    store_tree_details(tree_id, details)
+    cache.set(fingerprint_key, fingerprint, timeout=None)
+    return len(details)
+
+
+def try_update_node_details(channel_id):
+    """
+    Updates the details of the topics of a channel, logging rather than raising any errors, for use
+    after operations that should not fail because the details could not be updated. The details
+    will then be out of date until the channel is changed again, or the details are rebuilt.
+    """
+    try:
+        return update_node_details(channel_id)
+    except Exception as e:
+        logger.exception("Failed to update the node details of channel {}".format(channel_id))
+        report_exception(e)
+        return None
+
+
+def get_stored_details(node_id):
+    """
+    :return: The stored details of a node, or None if they are not stored
+    """
+    return ContentNodeDetails.objects.filter(contentnode_id=node_id).values_list("details", flat=True).first()
@@ -3,7 +3,6 @@ from base64 import b64encode
 from collections import OrderedDict
 from urllib.parse import urlencode
 
-from django.core.cache import cache
 from django.core.exceptions import EmptyResultSet
 from django.core.paginator import InvalidPage
 from django.core.paginator import Page
@@ -16,6 +15,8 @@ from rest_framework.pagination import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from contentcuration.utils.cache import query_count_cache
+
 
 class ValuesPage(Page):
     def __init__(self, object_list, number, paginator):
@@ -48,14 +49,11 @@ class CachedValuesViewsetPaginator(ValuesViewsetPaginator):
         """
         try:
             query_string = str(self.object_list.query).encode("utf8")
-            cache_key = (
-                "query-count:"
-                + hashlib.md5(query_string).hexdigest()
-            )
-            value = cache.get(cache_key)
+            cache_key = hashlib.md5(query_string).hexdigest()
+            value = query_count_cache.get(cache_key)
             if value is None:
                 value = super(CachedValuesViewsetPaginator, self).count
-                cache.set(cache_key, value, 300)  # save the count for 5 minutes
+                query_count_cache.set(cache_key, value)  # save the count for 5 minutes
         except EmptyResultSet:
             # If the query is an empty result set, then this error will be raised by
             # Django - this happens, for example when doing a pk__in=[] query
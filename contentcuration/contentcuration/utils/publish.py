@@ -1,23 +1,31 @@
 from __future__ import division
 
+import bisect
+import hashlib
 import itertools
 import json
 import logging as logmodule
 import os
 import re
+import shutil
 import tempfile
 import time
 import traceback
 import uuid
 import zipfile
 from builtins import str
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
 
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.files import File
 from django.core.files.storage import default_storage as storage
 from django.core.management import call_command
+from django.db import connections
+from django.db import transaction
 from django.db.models import Count
 from django.db.models import Exists
 from django.db.models import Max
@@ -42,17 +50,24 @@ from le_utils.constants import format_presets
 from le_utils.constants import roles
 from past.builtins import basestring
 from past.utils import old_div
+from search.constants import CONTENTNODE_FILTER_FIELDS
 from search.models import ChannelFullTextSearch
 from search.models import ContentNodeFullTextSearch
 from search.utils import get_fts_annotated_channel_qs
 from search.utils import get_fts_annotated_contentnode_qs
+from search.utils import is_channel_public
 
 from contentcuration import models as ccmodels
 from contentcuration.decorators import delay_user_storage_calculation
 from contentcuration.statistics import record_publish_stats
+from contentcuration.utils.cache import channel_cache_tag
 from contentcuration.utils.cache import delete_public_channel_cache_keys
+from contentcuration.utils.cache import invalidate_cache_tags
+from contentcuration.utils.channel_summary import try_update_channel_summary
 from contentcuration.utils.files import create_thumbnail_from_base64
 from contentcuration.utils.files import get_thumbnail_encoding
+from contentcuration.utils.node_aggregates import reset_changed_aggregates
+from contentcuration.utils.node_details import try_update_node_details
 from contentcuration.utils.nodes import migrate_extra_fields
 from contentcuration.utils.parser import extract_value
 from contentcuration.utils.parser import load_json_string
@@ -63,9 +78,20 @@ logmodule.basicConfig()
 logging = logmodule.getLogger(__name__)
 
 PERSEUS_IMG_DIR = exercises.IMG_PLACEHOLDER + "/images"
+MARKDOWN_IMAGE_REGEX = r'!\[(?:[^\]]*)]\(([^\)]+)\)'
+PERSEUS_IMAGE_REGEX = r'(.+/images/[^\s]+)(?:\s=([0-9\.]+)x([0-9\.]+))*'
+# Number of threads used to build Perseus zips, and number of exercises whose images are prefetched at a time
+PERSEUS_WORKERS = 8
+PERSEUS_PREFETCH_SIZE = 100
+PERSEUS_CACHE_KEY = "perseus_zip:{content_hash}"
+PERSEUS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
 THUMBNAIL_DIMENSION = 128
 MIN_SCHEMA_VERSION = "1"
 PUBLISHING_UPDATE_THRESHOLD = 3600
+# Number of nodes written to the export database at a time by the BatchedTreeMapper
+PUBLISH_BATCH_SIZE = 1000
+# The export database only contains a single tree
+EXPORT_TREE_ID = 1
 
 
 class NoNodesChangedError(Exception):
@@ -111,14 +137,24 @@ def send_emails(channel, user_id, version_notes=''):
             user.email_user(subject, message, settings.DEFAULT_FROM_EMAIL, html_message=message)
 
 
-def create_content_database(channel, force, user_id, force_exercises, progress_tracker=None):
+def create_content_database(channel, force, user_id, force_exercises, progress_tracker=None, incremental=False):
     """
     :type progress_tracker: contentcuration.utils.celery.ProgressTracker|None
+    :param incremental: Update the export database of the previous version of the channel when possible,
+        rather than building a new one.
     """
     # increment the channel version
     if not force:
         raise_if_nodes_are_all_unchanged(channel)
-    fh, tempdb = tempfile.mkstemp(suffix=".sqlite3")
+
+    previous_db = None
+    if incremental and not force_exercises:
+        previous_db = get_previous_content_database(channel)
+
+    if previous_db:
+        tempdb = previous_db
+    else:
+        fh, tempdb = tempfile.mkstemp(suffix=".sqlite3")
 
     with using_content_database(tempdb):
         if not channel.main_tree.publishing:
@@ -130,7 +166,8 @@ def create_content_database(channel, force, user_id, force_exercises, progress_t
                      no_input=True)
         if progress_tracker:
             progress_tracker.track(10)
-        tree_mapper = TreeMapper(
+        tree_mapper_class = IncrementalTreeMapper if previous_db else BatchedTreeMapper
+        tree_mapper = tree_mapper_class(
             channel.main_tree,
             channel.language,
             channel.id,
@@ -153,6 +190,48 @@ def create_content_database(channel, force, user_id, force_exercises, progress_t
     return tempdb
 
 
+def get_previous_content_database(channel):
+    """
+    Returns the path to a local copy of the export database of the current version of the channel,
+    or None if there is no such database that can be updated for the next version.
+    """
+    if not channel.main_tree.published:
+        return None
+
+    export_db_location = os.path.join(settings.DB_ROOT, "{id}.sqlite3".format(id=channel.id))
+    if not storage.exists(export_db_location):
+        return None
+
+    logging.debug("Copying previous export database")
+    fh, tempdb = tempfile.mkstemp(suffix=".sqlite3")
+    with storage.open(export_db_location, 'rb') as storage_file, os.fdopen(fh, 'wb') as db_file:
+        shutil.copyfileobj(storage_file, db_file)
+
+    with using_content_database(tempdb):
+        # Run migration to handle content databases published prior to current fields being added.
+        call_command("migrate",
+                     "content",
+                     database=get_active_content_database(),
+                     no_input=True)
+        previous_channel = kolibrimodels.ChannelMetadata.objects.filter(id=channel.id).first()
+        is_current_version = (
+            previous_channel is not None
+            and previous_channel.version == channel.version
+            and previous_channel.root_id == channel.main_tree.node_id
+            and previous_channel.min_schema_version == MIN_SCHEMA_VERSION
+            and not kolibrimodels.ContentNode.objects.exclude(tree_id=EXPORT_TREE_ID).exists()
+        )
+
+    if is_current_version:
+        return tempdb
+
+    logging.info("Previous export database of channel {} can not be updated, building a new one".format(channel.id))
+    connections[tempdb].close()
+    del connections.databases[tempdb]
+    os.remove(tempdb)
+    return None
+
+
 def create_kolibri_license_object(ccnode):
     use_license_description = not ccnode.license.is_custom
     return kolibrimodels.License.objects.get_or_create(
@@ -182,6 +261,32 @@ inheritable_simple_value_fields = [
 ]
 
 
+def get_inherited_metadata(node, inherited_fields):
+    """
+    Merge the inheritable metadata of a node with the metadata inherited from its ancestors.
+    Less specific label values are dropped in favour of more specific ones.
+    """
+    metadata = {}
+
+    for field in inheritable_map_fields:
+        metadata[field] = {}
+        inherited_keys = (inherited_fields.get(field) or {}).keys()
+        own_keys = (getattr(node, field) or {}).keys()
+        # Get a list of all keys in reverse order of length so we can remove any less specific values
+        all_keys = sorted(set(inherited_keys).union(set(own_keys)), key=len, reverse=True)
+        for key in all_keys:
+            if not any(k != key and k.startswith(key) for k in all_keys):
+                metadata[field][key] = True
+
+    for field in inheritable_simple_value_fields:
+        if field in inherited_fields:
+            metadata[field] = inherited_fields[field]
+        if getattr(node, field):
+            metadata[field] = getattr(node, field)
+
+    return metadata
+
+
 class TreeMapper:
     def __init__(
         self,
@@ -220,23 +325,7 @@ class TreeMapper:
         # Only process nodes that are either non-topics or have non-topic descendants
         if node.get_descendants(include_self=True).exclude(kind_id=content_kinds.TOPIC).exists() and node.complete:
 
-            metadata = {}
-
-            for field in inheritable_map_fields:
-                metadata[field] = {}
-                inherited_keys = (inherited_fields.get(field) or {}).keys()
-                own_keys = (getattr(node, field) or {}).keys()
-                # Get a list of all keys in reverse order of length so we can remove any less specific values
-                all_keys = sorted(set(inherited_keys).union(set(own_keys)), key=len, reverse=True)
-                for key in all_keys:
-                    if not any(k != key and k.startswith(key) for k in all_keys):
-                        metadata[field][key] = True
-
-            for field in inheritable_simple_value_fields:
-                if field in inherited_fields:
-                    metadata[field] = inherited_fields[field]
-                if getattr(node, field):
-                    metadata[field] = getattr(node, field)
+            metadata = get_inherited_metadata(node, inherited_fields)
 
             kolibrinode = create_bare_contentnode(node, self.default_language, self.channel_id, self.channel_name, metadata)
 
@@ -256,6 +345,317 @@ class TreeMapper:
         self._node_completed()
 
 
+class BatchedTreeMapper(TreeMapper):
+    """
+    Maps the same nodes as TreeMapper, but does so using a constant number of queries per batch
+    of nodes rather than several queries per node.
+
+    The whole tree is read in MPTT order, which lets inherited metadata, availability and
+    the MPTT values of the exported tree be computed in a single pass in memory.
+    The Kolibri nodes and their associated objects are then written with bulk_create in batches.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.batch_size = kwargs.pop("batch_size", PUBLISH_BATCH_SIZE)
+        super(BatchedTreeMapper, self).__init__(*args, **kwargs)
+        self._licenses = {}
+        self._languages = {}
+        self.perseus_generator = PerseusExerciseGenerator(
+            self.channel_id,
+            user_id=self.user_id,
+            use_cache=not self.force_exercises,
+        )
+
+    def map_nodes(self):
+        nodes_to_map = self._get_nodes_to_map()
+        with transaction.atomic(using=get_active_content_database()):
+            for i in range(0, len(nodes_to_map), self.batch_size):
+                batch = nodes_to_map[i:i + self.batch_size]
+                self._map_batch(batch)
+                if self.progress_tracker:
+                    self.progress_tracker.increment(increment=self.percent_per_node * len(batch))
+
+    def _get_tree_queryset(self):
+        return self.root_node.get_descendants(include_self=True).order_by()
+
+    def _get_nodes_to_map(self):  # noqa C901
+        """
+        Returns a list of (ccnode, kolibrinode) tuples, in MPTT order, for all nodes that should be
+        exported. A node is exported if it is complete, its parent is exported, and it is either
+        not a topic or has descendants that are not topics.
+        """
+        non_topic_lfts = list(
+            self._get_tree_queryset().exclude(kind_id=content_kinds.TOPIC).order_by("lft").values_list("lft", flat=True)
+        )
+
+        def has_non_topic_descendants(node):
+            if node.kind_id != content_kinds.TOPIC:
+                return True
+            index = bisect.bisect_right(non_topic_lfts, node.lft)
+            return index < len(non_topic_lfts) and non_topic_lfts[index] < node.rght
+
+        self.files_duration = dict(
+            ccmodels.File.objects.filter(
+                contentnode__tree_id=self.root_node.tree_id,
+                contentnode__kind_id__in=[content_kinds.AUDIO, content_kinds.VIDEO],
+            ).values("contentnode_id").annotate(duration=Max("duration")).order_by().values_list("contentnode_id", "duration")
+        )
+
+        self.nodes_with_exercise_file = set(
+            ccmodels.File.objects.filter(
+                contentnode__tree_id=self.root_node.tree_id,
+                preset_id=format_presets.EXERCISE,
+            ).values_list("contentnode_id", flat=True)
+        )
+
+        nodes_to_map = []
+        # Stack of the ancestors of the current node that will be exported, as
+        # (ccnode, kolibrinode, metadata) tuples.
+        ancestors = []
+        # Counter for the MPTT values of the exported tree
+        mptt_counter = 0
+
+        nodes = self._get_tree_queryset().select_related("license", "language").order_by("lft")
+        for node in nodes.iterator(chunk_size=self.batch_size):
+            while ancestors and ancestors[-1][0].rght < node.lft:
+                mptt_counter += 1
+                ancestors.pop()[1].rght = mptt_counter
+
+            if node.pk == self.root_node.pk:
+                inherited_fields = {}
+            elif ancestors and ancestors[-1][0].pk == node.parent_id:
+                inherited_fields = ancestors[-1][2]
+            else:
+                # The parent of this node is not exported, so neither is this node.
+                continue
+
+            if not node.complete or not has_non_topic_descendants(node):
+                continue
+
+            metadata = get_inherited_metadata(node, inherited_fields)
+            mptt_counter += 1
+            kolibrinode = self._create_bare_contentnode(node, metadata)
+            kolibrinode.lft = mptt_counter
+            kolibrinode.level = len(ancestors)
+            kolibrinode.tree_id = EXPORT_TREE_ID
+            kolibrinode.parent_id = ancestors[-1][1].id if ancestors else None
+            nodes_to_map.append((node, kolibrinode))
+
+            if node.kind_id == content_kinds.TOPIC:
+                ancestors.append((node, kolibrinode, metadata))
+            else:
+                mptt_counter += 1
+                kolibrinode.rght = mptt_counter
+
+        while ancestors:
+            mptt_counter += 1
+            ancestors.pop()[1].rght = mptt_counter
+
+        return nodes_to_map
+
+    def _get_license(self, ccnode):
+        if ccnode.license is None:
+            return None
+        key = (ccnode.license_id, ccnode.license.is_custom and ccnode.license_description)
+        if key not in self._licenses:
+            self._licenses[key] = create_kolibri_license_object(ccnode)[0]
+        return self._licenses[key]
+
+    def _get_language(self, language):
+        if not language:
+            return None
+        if language.pk not in self._languages:
+            self._languages[language.pk] = get_or_create_language(language)[0]
+        return self._languages[language.pk]
+
+    def _create_bare_contentnode(self, ccnode, metadata):
+        language = (ccnode.language if ccnode.kind_id == content_kinds.TOPIC else metadata.get("language")) or self.default_language
+        fields = get_kolibri_contentnode_fields(
+            ccnode,
+            self.channel_id,
+            self.channel_name,
+            metadata,
+            self._get_license(ccnode),
+            self._get_language(language),
+            self.files_duration.get(ccnode.id),
+            True,  # Only nodes with non-topic descendants are exported
+        )
+        return kolibrimodels.ContentNode(id=ccnode.node_id, **fields)
+
+    def _map_batch(self, batch):
+        kolibrimodels.ContentNode.objects.bulk_create([kolibrinode for ccnode, kolibrinode in batch])
+        self._map_associated_objects(batch)
+
+    def _map_associated_objects(self, batch):
+        self._map_exercises(batch)
+        for ccnode, kolibrinode in batch:
+            if ccnode.kind_id == content_kinds.SLIDESHOW:
+                create_slideshow_manifest(ccnode, user_id=self.user_id)
+        self._map_files(batch)
+        self._map_tags(batch)
+
+    def _map_exercises(self, batch):
+        exercise_nodes = [(ccnode, kolibrinode) for ccnode, kolibrinode in batch if ccnode.kind_id == content_kinds.EXERCISE]
+        if not exercise_nodes:
+            return
+
+        assessment_items = defaultdict(list)
+        for item in ccmodels.AssessmentItem.objects.filter(
+            contentnode_id__in=[ccnode.id for ccnode, kolibrinode in exercise_nodes]
+        ).prefetch_related("files__file_format").order_by("order"):
+            assessment_items[item.contentnode_id].append(item)
+
+        assessment_metadata = []
+        perseus_exercises = []
+        for ccnode, kolibrinode in exercise_nodes:
+            exercise_data, metadata = get_assessment_metadata(ccnode, kolibrinode, assessment_items[ccnode.id])
+            assessment_metadata.append(metadata)
+            if self.force_exercises or ccnode.changed or ccnode.id not in self.nodes_with_exercise_file:
+                perseus_exercises.append((ccnode, exercise_data, assessment_items[ccnode.id]))
+        kolibrimodels.AssessmentMetaData.objects.bulk_create(assessment_metadata)
+        self.perseus_generator.generate(perseus_exercises)
+
+    def _map_files(self, batch):
+        nodes_by_id = {ccnode.id: (ccnode, kolibrinode) for ccnode, kolibrinode in batch}
+        ccfiles = ccmodels.File.objects.filter(contentnode_id__in=nodes_by_id.keys()).exclude(
+            Q(preset_id=format_presets.EXERCISE_IMAGE) | Q(preset_id=format_presets.EXERCISE_GRAPHIE)
+        ).select_related("preset", "file_format", "language")
+
+        local_files = {}
+        files = []
+        for ccfilemodel in ccfiles:
+            ccnode, kolibrinode = nodes_by_id[ccfilemodel.contentnode_id]
+            preset = ccfilemodel.preset
+            fformat = ccfilemodel.file_format
+
+            if preset.thumbnail:
+                ccfilemodel = create_associated_thumbnail(ccnode, ccfilemodel) or ccfilemodel
+            language = self._get_language(ccfilemodel.language)
+
+            if ccfilemodel.checksum not in local_files:
+                local_files[ccfilemodel.checksum] = kolibrimodels.LocalFile(
+                    id=ccfilemodel.checksum,
+                    extension=fformat.extension,
+                    file_size=ccfilemodel.file_size,
+                )
+
+            files.append(kolibrimodels.File(
+                id=ccfilemodel.pk,
+                checksum=ccfilemodel.checksum,
+                extension=fformat.extension,
+                available=True,  # TODO: Set this to False, once we have availability stamping implemented in Kolibri
+                file_size=ccfilemodel.file_size,
+                contentnode_id=kolibrinode.id,
+                preset=preset.pk,
+                supplementary=preset.supplementary,
+                lang=language,
+                thumbnail=preset.thumbnail,
+                priority=preset.order,
+                local_file_id=ccfilemodel.checksum,
+            ))
+
+        kolibrimodels.LocalFile.objects.bulk_create(local_files.values(), ignore_conflicts=True)
+        kolibrimodels.File.objects.bulk_create(files)
+
+    def _map_tags(self, batch):
+        node_ids = {ccnode.id: kolibrinode.id for ccnode, kolibrinode in batch}
+        tags = {}
+        node_tags = []
+        for contentnode_id, tag_id, tag_name in ccmodels.ContentNode.tags.through.objects.filter(
+            contentnode_id__in=node_ids.keys()
+        ).values_list("contentnode_id", "contenttag_id", "contenttag__tag_name"):
+            if len(tag_name) <= 30:
+                tags[tag_id] = kolibrimodels.ContentTag(id=tag_id, tag_name=tag_name)
+                node_tags.append(kolibrimodels.ContentNode.tags.through(
+                    contentnode_id=node_ids[contentnode_id],
+                    contenttag_id=tag_id,
+                ))
+
+        kolibrimodels.ContentTag.objects.bulk_create(tags.values(), ignore_conflicts=True)
+        kolibrimodels.ContentNode.tags.through.objects.bulk_create(node_tags)
+
+
+class IncrementalTreeMapper(BatchedTreeMapper):
+    """
+    Updates the export database of the previous version of a channel instead of writing a new one.
+
+    Only new nodes and nodes that have changed since the last publish are mapped again, along with
+    their files, tags and assessment metadata, so only the Perseus files of changed exercises get rebuilt.
+    Nodes that are no longer exported are deleted. Any other node whose exported values changed as
+    a consequence, such as the MPTT values of ancestors and siblings, or metadata inherited from a
+    changed topic, is updated in place.
+    """
+
+    def map_nodes(self):
+        nodes_to_map = self._get_nodes_to_map()
+        fields = [field for field in kolibrimodels.ContentNode._meta.concrete_fields if not field.primary_key]
+        connection = connections[get_active_content_database()]
+
+        def db_values(values):
+            return tuple(field.get_db_prep_value(value, connection) for field, value in zip(fields, values))
+
+        previous_nodes = {
+            values[0]: db_values(values[1:])
+            for values in kolibrimodels.ContentNode.objects.values_list("id", *[field.attname for field in fields]).iterator()
+        }
+
+        nodes_to_create = []
+        nodes_to_remap = []
+        nodes_to_update = []
+        for ccnode, kolibrinode in nodes_to_map:
+            previous_values = previous_nodes.pop(kolibrinode.id, None)
+            if previous_values is None:
+                nodes_to_create.append((ccnode, kolibrinode))
+            elif ccnode.changed:
+                nodes_to_remap.append((ccnode, kolibrinode))
+            elif previous_values != db_values(getattr(kolibrinode, field.attname) for field in fields):
+                nodes_to_update.append(kolibrinode)
+        removed_node_ids = list(previous_nodes)
+
+        logging.info(
+            "Incrementally publishing channel {}: {} new, {} changed, {} updated and {} removed nodes".format(
+                self.channel_id, len(nodes_to_create), len(nodes_to_remap), len(nodes_to_update), len(removed_node_ids)
+            )
+        )
+
+        with transaction.atomic(using=get_active_content_database()):
+            # The channel metadata and prerequisites are mapped again for every version
+            kolibrimodels.ChannelMetadata.objects.all().delete()
+            kolibrimodels.ContentNode.has_prerequisite.through.objects.all().delete()
+
+            self._delete_associated_objects([kolibrinode.id for ccnode, kolibrinode in nodes_to_remap] + removed_node_ids)
+
+            # Update existing nodes first, so that no node that is kept is a descendant of a removed node
+            kolibrimodels.ContentNode.objects.bulk_update(
+                [kolibrinode for ccnode, kolibrinode in nodes_to_remap] + nodes_to_update,
+                [field.name for field in fields],
+                batch_size=self.batch_size,
+            )
+            kolibrimodels.ContentNode.objects.bulk_create(
+                [kolibrinode for ccnode, kolibrinode in nodes_to_create],
+                batch_size=self.batch_size,
+            )
+            for i in range(0, len(removed_node_ids), self.batch_size):
+                kolibrimodels.ContentNode.objects.filter(id__in=removed_node_ids[i:i + self.batch_size]).delete()
+
+            nodes_to_map = nodes_to_create + nodes_to_remap
+            for i in range(0, len(nodes_to_map), self.batch_size):
+                batch = nodes_to_map[i:i + self.batch_size]
+                self._map_associated_objects(batch)
+                if self.progress_tracker:
+                    self.progress_tracker.increment(increment=self.percent_per_node * len(batch))
+
+            # Remove any local files that are no longer used by the channel
+            kolibrimodels.LocalFile.objects.filter(files__isnull=True).delete()
+
+    def _delete_associated_objects(self, node_ids):
+        for i in range(0, len(node_ids), self.batch_size):
+            batch = node_ids[i:i + self.batch_size]
+            kolibrimodels.File.objects.filter(contentnode_id__in=batch).delete()
+            kolibrimodels.AssessmentMetaData.objects.filter(contentnode_id__in=batch).delete()
+            kolibrimodels.ContentNode.tags.through.objects.filter(contentnode_id__in=batch).delete()
+
+
 def create_slideshow_manifest(ccnode, user_id=None):
     print("Creating slideshow manifest...")
 
@@ -286,7 +686,7 @@ def create_slideshow_manifest(ccnode, user_id=None):
         temp_manifest.close()
 
 
-def create_bare_contentnode(ccnode, default_language, channel_id, channel_name, metadata):  # noqa: C901
+def create_bare_contentnode(ccnode, default_language, channel_id, channel_name, metadata):
     logging.debug("Creating a Kolibri contentnode for instance id {}".format(
         ccnode.node_id))
 
@@ -298,11 +698,55 @@ def create_bare_contentnode(ccnode, default_language, channel_id, channel_name,
     if language:
         language, _new = get_or_create_language(language)
 
-    duration = None
+    files_duration = None
     if ccnode.kind_id in [content_kinds.AUDIO, content_kinds.VIDEO]:
         # aggregate duration from associated files, choosing maximum if there are multiple, like hi and lo res videos
-        duration = ccnode.files.aggregate(duration=Max("duration")).get("duration")
+        files_duration = ccnode.files.aggregate(duration=Max("duration")).get("duration")
+
+    kolibrinode, is_new = kolibrimodels.ContentNode.objects.update_or_create(
+        pk=ccnode.node_id,
+        defaults=get_kolibri_contentnode_fields(
+            ccnode,
+            channel_id,
+            channel_name,
+            metadata,
+            kolibri_license,
+            language,
+            files_duration,
+            ccnode.get_descendants(include_self=True).exclude(kind_id=content_kinds.TOPIC).exists(),  # Hide empty topics
+        )
+    )
+
+    if ccnode.parent:
+        logging.debug("Associating {child} with parent {parent}".format(
+            child=kolibrinode.pk,
+            parent=ccnode.parent.node_id
+        ))
+        kolibrinode.parent = kolibrimodels.ContentNode.objects.get(pk=ccnode.parent.node_id)
 
+    kolibrinode.save()
+    logging.debug("Created Kolibri ContentNode with node id {}".format(ccnode.node_id))
+    logging.debug("Kolibri node count: {}".format(kolibrimodels.ContentNode.objects.all().count()))
+
+    return kolibrinode
+
+
+def get_kolibri_contentnode_fields(  # noqa: C901
+    ccnode,
+    channel_id,
+    channel_name,
+    metadata,
+    kolibri_license,
+    language,
+    files_duration,
+    available,
+):
+    """
+    Returns the field values of the Kolibri ContentNode exported for ccnode.
+    Anything that requires a query (license, language, file durations, availability)
+    is resolved by the caller and passed in, so this can be used both for single
+    node saves and for bulk creation.
+    """
     options = {}
     if ccnode.extra_fields and 'options' in ccnode.extra_fields:
         options = ccnode.extra_fields['options']
@@ -313,8 +757,8 @@ def create_bare_contentnode(ccnode, default_language, channel_id, channel_name,
         if ccnode_completion_criteria["model"] == completion_criteria.TIME or ccnode_completion_criteria["model"] == completion_criteria.APPROX_TIME:
             duration = ccnode_completion_criteria["threshold"]
     if duration is None and ccnode.kind_id in [content_kinds.AUDIO, content_kinds.VIDEO]:
-        # aggregate duration from associated files, choosing maximum if there are multiple, like hi and lo res videos.
-        duration = ccnode.files.aggregate(duration=Max("duration")).get("duration")
+        # use the maximum duration of the associated files if there are multiple, like hi and lo res videos.
+        duration = files_duration
 
     learning_activities = None
     accessibility_labels = None
@@ -330,48 +774,32 @@ def create_bare_contentnode(ccnode, default_language, channel_id, channel_name,
     categories = ccnode.categories if ccnode.kind_id == content_kinds.TOPIC else metadata["categories"]
     learner_needs = ccnode.learner_needs if ccnode.kind_id == content_kinds.TOPIC else metadata["learner_needs"]
 
-    kolibrinode, is_new = kolibrimodels.ContentNode.objects.update_or_create(
-        pk=ccnode.node_id,
-        defaults={
-            'kind': ccnode.kind.kind,
-            'title': ccnode.title if ccnode.parent else channel_name,
-            'content_id': ccnode.content_id,
-            'channel_id': channel_id,
-            'author': ccnode.author or "",
-            'description': ccnode.description,
-            'sort_order': ccnode.sort_order,
-            'license_owner': ccnode.copyright_holder or "",
-            'license': kolibri_license,
-            'available': ccnode.get_descendants(include_self=True).exclude(kind_id=content_kinds.TOPIC).exists(),  # Hide empty topics
-            'stemmed_metaphone': "",  # Stemmed metaphone is no longer used, and will cause no harm if blank
-            'lang': language,
-            'license_name': kolibri_license.license_name if kolibri_license is not None else None,
-            'license_description': kolibri_license.license_description if kolibri_license is not None else None,
-            'coach_content': ccnode.role_visibility == roles.COACH,
-            'duration': duration,
-            'options': json.dumps(options),
-            # Fields for metadata labels
-            "grade_levels": ",".join(grade_levels.keys()) if grade_levels else None,
-            "resource_types": ",".join(resource_types.keys()) if resource_types else None,
-            "learning_activities": learning_activities,
-            "accessibility_labels": accessibility_labels,
-            "categories": ",".join(categories.keys()) if categories else None,
-            "learner_needs": ",".join(learner_needs.keys()) if learner_needs else None,
-        }
-    )
-
-    if ccnode.parent:
-        logging.debug("Associating {child} with parent {parent}".format(
-            child=kolibrinode.pk,
-            parent=ccnode.parent.node_id
-        ))
-        kolibrinode.parent = kolibrimodels.ContentNode.objects.get(pk=ccnode.parent.node_id)
-
-    kolibrinode.save()
-    logging.debug("Created Kolibri ContentNode with node id {}".format(ccnode.node_id))
-    logging.debug("Kolibri node count: {}".format(kolibrimodels.ContentNode.objects.all().count()))
-
-    return kolibrinode
+    return {
+        'kind': ccnode.kind_id,
+        'title': ccnode.title if ccnode.parent_id else channel_name,
+        'content_id': ccnode.content_id,
+        'channel_id': channel_id,
+        'author': ccnode.author or "",
+        'description': ccnode.description,
+        'sort_order': ccnode.sort_order,
+        'license_owner': ccnode.copyright_holder or "",
+        'license': kolibri_license,
+        'available': available,
+        'stemmed_metaphone': "",  # Stemmed metaphone is no longer used, and will cause no harm if blank
+        'lang': language,
+        'license_name': kolibri_license.license_name if kolibri_license is not None else None,
+        'license_description': kolibri_license.license_description if kolibri_license is not None else None,
+        'coach_content': ccnode.role_visibility == roles.COACH,
+        'duration': duration,
+        'options': json.dumps(options),
+        # Fields for metadata labels
+        "grade_levels": ",".join(grade_levels.keys()) if grade_levels else None,
+        "resource_types": ",".join(resource_types.keys()) if resource_types else None,
+        "learning_activities": learning_activities,
+        "accessibility_labels": accessibility_labels,
+        "categories": ",".join(categories.keys()) if categories else None,
+        "learner_needs": ",".join(learner_needs.keys()) if learner_needs else None,
+    }
 
 
 def get_or_create_language(language):
@@ -485,14 +913,26 @@ def create_perseus_exercise(ccnode, kolibrinode, exercise_data, user_id=None):
 
 
 def process_assessment_metadata(ccnode, kolibrinode):
+    assessment_items = list(ccnode.assessment_items.all().order_by('order'))
+    exercise_data, assessment_metadata = get_assessment_metadata(ccnode, kolibrinode, assessment_items)
+    assessment_metadata.save(force_insert=True)
+    return exercise_data
+
+
+def get_assessment_metadata(ccnode, kolibrinode, assessment_items):
+    """
+    Returns the exercise data used to build the Perseus zip for ccnode, and an unsaved
+    AssessmentMetaData for kolibrinode.
+    :param assessment_items: the node's assessment items, sorted by order
+    """
     # Get mastery model information, set to default if none provided
-    assessment_items = ccnode.assessment_items.all().order_by('order')
     extra_fields = ccnode.extra_fields
     if isinstance(extra_fields, basestring):
         extra_fields = json.loads(extra_fields)
     extra_fields = migrate_extra_fields(extra_fields) or {}
     randomize = extra_fields.get('randomize') if extra_fields.get('randomize') is not None else True
     assessment_item_ids = [a.assessment_id for a in assessment_items]
+    assessment_count = len(assessment_items)
 
     exercise_data = extra_fields.get('options').get('completion_criteria').get('threshold')
 
@@ -500,10 +940,10 @@ def process_assessment_metadata(ccnode, kolibrinode):
 
     mastery_model = {'type': exercise_data_type or exercises.M_OF_N}
     if mastery_model['type'] == exercises.M_OF_N:
-        mastery_model.update({'n': exercise_data.get('n') or min(5, assessment_items.count()) or 1})
-        mastery_model.update({'m': exercise_data.get('m') or min(5, assessment_items.count()) or 1})
+        mastery_model.update({'n': exercise_data.get('n') or min(5, assessment_count) or 1})
+        mastery_model.update({'m': exercise_data.get('m') or min(5, assessment_count) or 1})
     elif mastery_model['type'] == exercises.DO_ALL:
-        mastery_model.update({'n': assessment_items.count() or 1, 'm': assessment_items.count() or 1})
+        mastery_model.update({'n': assessment_count or 1, 'm': assessment_count or 1})
     elif mastery_model['type'] == exercises.NUM_CORRECT_IN_A_ROW_2:
         mastery_model.update({'n': 2, 'm': 2})
     elif mastery_model['type'] == exercises.NUM_CORRECT_IN_A_ROW_3:
@@ -523,20 +963,27 @@ def process_assessment_metadata(ccnode, kolibrinode):
         'assessment_mapping': {a.assessment_id: a.type if a.type != 'true_false' else exercises.SINGLE_SELECTION for a in assessment_items},
     })
 
-    kolibrimodels.AssessmentMetaData.objects.create(
+    assessment_metadata = kolibrimodels.AssessmentMetaData(
         id=uuid.uuid4(),
         contentnode=kolibrinode,
         assessment_item_ids=json.dumps(assessment_item_ids),
-        number_of_assessments=assessment_items.count(),
+        number_of_assessments=assessment_count,
         mastery_model=json.dumps(mastery_model),
         randomize=randomize,
         is_manipulable=ccnode.kind_id == content_kinds.EXERCISE,
     )
 
-    return exercise_data
+    return exercise_data, assessment_metadata
 
 
-def create_perseus_zip(ccnode, exercise_data, write_to_path):
+def create_perseus_zip(ccnode, exercise_data, write_to_path, assessment_items=None, channel_id=None, read_file=None):
+    """
+    :param assessment_items: The assessment items of ccnode sorted by order, with their files prefetched.
+        Queried when not provided.
+    :param channel_id: The id of the channel of ccnode, looked up when not provided.
+    :param read_file: Function returning the contents of a file in storage, defaults to reading it from storage.
+    """
+    read_file = read_file or read_storage_file
     with zipfile.ZipFile(write_to_path, "w") as zf:
         try:
             exercise_context = {
@@ -545,27 +992,15 @@ def create_perseus_zip(ccnode, exercise_data, write_to_path):
             exercise_result = render_to_string('perseus/exercise.json', exercise_context)
             write_to_zipfile("exercise.json", exercise_result, zf)
 
-            channel_id = ccnode.get_channel_id()
+            channel_id = channel_id or ccnode.get_channel_id()
+
+            if assessment_items is None:
+                assessment_items = ccnode.assessment_items.prefetch_related('files__file_format').all().order_by('order')
 
-            for question in ccnode.assessment_items.prefetch_related('files').all().order_by('order'):
+            for question in assessment_items:
                 try:
-                    for image in question.files.filter(preset_id=format_presets.EXERCISE_IMAGE).order_by('checksum'):
-                        image_name = "images/{}.{}".format(image.checksum, image.file_format_id)
-                        if image_name not in zf.namelist():
-                            with storage.open(ccmodels.generate_object_storage_name(image.checksum, str(image)), 'rb') as content:
-                                write_to_zipfile(image_name, content.read(), zf)
-
-                    for image in question.files.filter(preset_id=format_presets.EXERCISE_GRAPHIE).order_by('checksum'):
-                        svg_name = "images/{0}.svg".format(image.original_filename)
-                        json_name = "images/{0}-data.json".format(image.original_filename)
-                        if svg_name not in zf.namelist() or json_name not in zf.namelist():
-                            with storage.open(ccmodels.generate_object_storage_name(image.checksum, str(image)), 'rb') as content:
-                                content = content.read()
-                                # in Python 3, delimiter needs to be in bytes format
-                                content = content.split(exercises.GRAPHIE_DELIMITER.encode('ascii'))
-                                write_to_zipfile(svg_name, content[0], zf)
-                                write_to_zipfile(json_name, content[1], zf)
-                    write_assessment_item(question, zf, channel_id)
+                    write_question_files(question, zf, read_file)
+                    write_assessment_item(question, zf, channel_id, read_file=read_file)
                 except Exception as e:
                     logging.error("Error while publishing channel `{}`: {}".format(channel_id, str(e)))
                     logging.error(traceback.format_exc())
@@ -582,6 +1017,36 @@ def create_perseus_zip(ccnode, exercise_data, write_to_path):
             zf.close()
 
 
+def write_question_files(question, zf, read_file):
+    """
+    Writes the image and graphie files of an assessment item that are not in the zip yet.
+    """
+    question_files = sorted(question.files.all(), key=lambda f: f.checksum)
+    for image in question_files:
+        if image.preset_id != format_presets.EXERCISE_IMAGE:
+            continue
+        image_name = "images/{}.{}".format(image.checksum, image.file_format_id)
+        if image_name not in zf.namelist():
+            write_to_zipfile(image_name, read_file(ccmodels.generate_object_storage_name(image.checksum, str(image))), zf)
+
+    for image in question_files:
+        if image.preset_id != format_presets.EXERCISE_GRAPHIE:
+            continue
+        svg_name = "images/{0}.svg".format(image.original_filename)
+        json_name = "images/{0}-data.json".format(image.original_filename)
+        if svg_name not in zf.namelist() or json_name not in zf.namelist():
+            content = read_file(ccmodels.generate_object_storage_name(image.checksum, str(image)))
+            # in Python 3, delimiter needs to be in bytes format
+            content = content.split(exercises.GRAPHIE_DELIMITER.encode('ascii'))
+            write_to_zipfile(svg_name, content[0], zf)
+            write_to_zipfile(json_name, content[1], zf)
+
+
+def read_storage_file(path):
+    with storage.open(path, 'rb') as content:
+        return content.read()
+
+
 def write_to_zipfile(filename, content, zf):
     info = zipfile.ZipInfo(filename, date_time=(2013, 3, 14, 1, 59, 26))
     info.comment = "Perseus file generated during export process".encode()
@@ -590,7 +1055,7 @@ def write_to_zipfile(filename, content, zf):
     zf.writestr(info, content)
 
 
-def write_assessment_item(assessment_item, zf, channel_id):  # noqa C901
+def write_assessment_item(assessment_item, zf, channel_id, read_file=None):  # noqa C901
     if assessment_item.type == exercises.MULTIPLE_SELECTION:
         template = 'perseus/multiple_selection.json'
     elif assessment_item.type == exercises.SINGLE_SELECTION or assessment_item.type == 'true_false':
@@ -603,7 +1068,7 @@ def write_assessment_item(assessment_item, zf, channel_id):  # noqa C901
         raise TypeError("Unrecognized question type on item {}".format(assessment_item.assessment_id))
 
     question = process_formulas(assessment_item.question)
-    question, question_images = process_image_strings(question, zf, channel_id)
+    question, question_images = process_image_strings(question, zf, channel_id, read_file=read_file)
 
     answer_data = json.loads(assessment_item.answers)
     for answer in answer_data:
@@ -613,14 +1078,14 @@ def write_assessment_item(assessment_item, zf, channel_id):  # noqa C901
             answer['answer'] = answer['answer'].replace(exercises.CONTENT_STORAGE_PLACEHOLDER, PERSEUS_IMG_DIR)
             answer['answer'] = process_formulas(answer['answer'])
             # In case perseus doesn't support =wxh syntax, use below code
-            answer['answer'], answer_images = process_image_strings(answer['answer'], zf, channel_id)
+            answer['answer'], answer_images = process_image_strings(answer['answer'], zf, channel_id, read_file=read_file)
             answer.update({'images': answer_images})
 
     answer_data = [a for a in answer_data if a['answer'] or a['answer'] == 0]  # Filter out empty answers, but not 0
     hint_data = json.loads(assessment_item.hints)
     for hint in hint_data:
         hint['hint'] = process_formulas(hint['hint'])
-        hint['hint'], hint_images = process_image_strings(hint['hint'], zf, channel_id)
+        hint['hint'], hint_images = process_image_strings(hint['hint'], zf, channel_id, read_file=read_file)
         hint.update({'images': hint_images})
 
     answers_sorted = answer_data
@@ -655,11 +1120,12 @@ def process_formulas(content):
     return content
 
 
-def process_image_strings(content, zf, channel_id):
+def process_image_strings(content, zf, channel_id, read_file=None):
+    read_file = read_file or read_storage_file
     image_list = []
     content = content.replace(exercises.CONTENT_STORAGE_PLACEHOLDER, PERSEUS_IMG_DIR)
-    for match in re.finditer(r'!\[(?:[^\]]*)]\(([^\)]+)\)', content):
-        img_match = re.search(r'(.+/images/[^\s]+)(?:\s=([0-9\.]+)x([0-9\.]+))*', match.group(1))
+    for match in re.finditer(MARKDOWN_IMAGE_REGEX, content):
+        img_match = re.search(PERSEUS_IMAGE_REGEX, match.group(1))
         if img_match:
             # Add any image files that haven't been written to the zipfile
             filename = img_match.group(1).split('/')[-1]
@@ -680,8 +1146,7 @@ def process_image_strings(content, zf, channel_id):
 
             image_name = "images/{}.{}".format(checksum, ext[1:])
             if image_name not in zf.namelist():
-                with storage.open(ccmodels.generate_object_storage_name(checksum, filename), 'rb') as imgfile:
-                    write_to_zipfile(image_name, imgfile.read(), zf)
+                write_to_zipfile(image_name, read_file(ccmodels.generate_object_storage_name(checksum, filename)), zf)
 
             # Add resizing data
             if img_match.group(2) and img_match.group(3):
@@ -694,6 +1159,198 @@ def process_image_strings(content, zf, channel_id):
     return content, image_list
 
 
+def get_perseus_image_paths(assessment_items):
+    """
+    Returns the storage paths of all the images that the Perseus zip of the assessment items includes.
+    """
+    paths = set()
+    for assessment_item in assessment_items:
+        for image in assessment_item.files.all():
+            if image.preset_id in (format_presets.EXERCISE_IMAGE, format_presets.EXERCISE_GRAPHIE):
+                paths.add(ccmodels.generate_object_storage_name(image.checksum, str(image)))
+
+        for content in _get_assessment_item_contents(assessment_item):
+            paths.update(_get_content_image_paths(content))
+    return paths
+
+
+def _get_assessment_item_contents(assessment_item):
+    contents = [assessment_item.question]
+    try:
+        if assessment_item.type != exercises.INPUT_QUESTION:
+            contents.extend(answer['answer'] for answer in json.loads(assessment_item.answers))
+        contents.extend(hint['hint'] for hint in json.loads(assessment_item.hints))
+    except (ValueError, TypeError, KeyError):
+        # Any invalid data gets reported when the zip is built
+        pass
+    return [content for content in contents if isinstance(content, basestring)]
+
+
+def _get_content_image_paths(content):
+    content = content.replace(exercises.CONTENT_STORAGE_PLACEHOLDER, PERSEUS_IMG_DIR)
+    for match in re.finditer(MARKDOWN_IMAGE_REGEX, content):
+        img_match = re.search(PERSEUS_IMAGE_REGEX, match.group(1))
+        if img_match:
+            filename = img_match.group(1).split('/')[-1]
+            checksum, ext = os.path.splitext(filename)
+            yield ccmodels.generate_object_storage_name(checksum, filename)
+
+
+def get_perseus_content_hash(exercise_data, assessment_items):
+    """
+    Returns a hash of everything that determines the contents of the Perseus zip of an exercise.
+    """
+    content = {
+        "exercise": exercise_data,
+        "assessment_items": [
+            {
+                "assessment_id": assessment_item.assessment_id,
+                "type": assessment_item.type,
+                "question": assessment_item.question,
+                "answers": assessment_item.answers,
+                "hints": assessment_item.hints,
+                "raw_data": assessment_item.raw_data,
+                "randomize": assessment_item.randomize,
+                "files": sorted(
+                    (image.checksum, image.file_format_id, image.preset_id, image.original_filename)
+                    for image in assessment_item.files.all()
+                ),
+            }
+            for assessment_item in assessment_items
+        ],
+    }
+    return hashlib.md5(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PerseusExerciseGenerator(object):
+    """
+    Creates the Perseus zip files of many exercises at once.
+
+    Zips are built in a pool of worker threads, which also prefetch the images included in
+    the zips from storage. Only storage is accessed from the workers, all queries are run
+    from the calling thread.
+
+    Built zips are stored under their checksum and cached by a hash of the exercise content, so
+    an exercise whose content is unchanged reuses the zip that was built for it previously.
+    """
+
+    def __init__(self, channel_id, user_id=None, use_cache=True, max_workers=PERSEUS_WORKERS):
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.use_cache = use_cache
+        self.max_workers = max_workers
+
+    def generate(self, exercises):
+        """
+        :param exercises: A list of (ccnode, exercise_data, assessment_items) tuples, with the assessment
+            items sorted by order and their files prefetched.
+        """
+        for i in range(0, len(exercises), PERSEUS_PREFETCH_SIZE):
+            self._generate_batch(exercises[i:i + PERSEUS_PREFETCH_SIZE])
+
+    def _generate_batch(self, exercises):  # noqa C901
+        content_hashes = {
+            ccnode.id: get_perseus_content_hash(exercise_data, assessment_items)
+            for ccnode, exercise_data, assessment_items in exercises
+        }
+        cached_zips = {}
+        if self.use_cache:
+            cached_zips = cache.get_many([PERSEUS_CACHE_KEY.format(content_hash=h) for h in content_hashes.values()])
+        current_checksums = dict(
+            ccmodels.File.objects.filter(
+                contentnode_id__in=content_hashes.keys(),
+                preset_id=format_presets.EXERCISE,
+            ).values_list("contentnode_id", "checksum")
+        )
+
+        exercises_to_build = []
+        for ccnode, exercise_data, assessment_items in exercises:
+            cached_zip = cached_zips.get(PERSEUS_CACHE_KEY.format(content_hash=content_hashes[ccnode.id]))
+            if cached_zip is None:
+                exercises_to_build.append((ccnode, exercise_data, assessment_items))
+            elif current_checksums.get(ccnode.id) == cached_zip["checksum"]:
+                logging.debug("Exercise {} is unchanged, keeping its Perseus file".format(ccnode.id))
+            elif storage.exists(get_perseus_storage_name(cached_zip["checksum"])):
+                self._save_exercise_file(ccnode, cached_zip["checksum"], cached_zip["file_size"])
+            else:
+                exercises_to_build.append((ccnode, exercise_data, assessment_items))
+
+        if not exercises_to_build:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # The images are submitted first, so they are all fetched or being fetched before any zip gets built
+            image_futures = {}
+            for ccnode, exercise_data, assessment_items in exercises_to_build:
+                for path in get_perseus_image_paths(assessment_items):
+                    if path not in image_futures:
+                        image_futures[path] = executor.submit(read_storage_file, path)
+
+            def read_file(path):
+                future = image_futures.get(path)
+                if future is not None and future.exception() is None:
+                    return future.result()
+                return read_storage_file(path)
+
+            zip_futures = [
+                (ccnode, executor.submit(self._build_zip, ccnode, exercise_data, assessment_items, read_file))
+                for ccnode, exercise_data, assessment_items in exercises_to_build
+            ]
+
+            built_zips = {}
+            for ccnode, future in zip_futures:
+                checksum, file_size = future.result()
+                self._save_exercise_file(ccnode, checksum, file_size)
+                built_zips[PERSEUS_CACHE_KEY.format(content_hash=content_hashes[ccnode.id])] = {
+                    "checksum": checksum,
+                    "file_size": file_size,
+                }
+            cache.set_many(built_zips, timeout=PERSEUS_CACHE_TIMEOUT)
+
+    def _build_zip(self, ccnode, exercise_data, assessment_items, read_file):
+        logging.debug("Creating Perseus Exercise for Node {}".format(ccnode.title))
+        with tempfile.TemporaryFile() as tempf:
+            create_perseus_zip(
+                ccnode,
+                exercise_data,
+                tempf,
+                assessment_items=assessment_items,
+                channel_id=self.channel_id,
+                read_file=read_file,
+            )
+            file_size = tempf.tell()
+            tempf.seek(0)
+            md5 = hashlib.md5()
+            for chunk in iter(lambda: tempf.read(65536), b""):
+                md5.update(chunk)
+            checksum = md5.hexdigest()
+
+            storage_name = get_perseus_storage_name(checksum)
+            if not storage.exists(storage_name):
+                tempf.seek(0)
+                storage.save(storage_name, File(tempf))
+        return checksum, file_size
+
+    def _save_exercise_file(self, ccnode, checksum, file_size):
+        filename = "{0}.{ext}".format(ccnode.title, ext=file_formats.PERSEUS)
+        ccnode.files.filter(preset_id=format_presets.EXERCISE).delete()
+        assessment_file_obj = ccmodels.File.objects.create(
+            file_on_disk=get_perseus_storage_name(checksum),
+            checksum=checksum,
+            contentnode=ccnode,
+            file_format_id=file_formats.PERSEUS,
+            preset_id=format_presets.EXERCISE,
+            original_filename=filename,
+            file_size=file_size,
+            uploaded_by_id=self.user_id,
+        )
+        logging.debug("Created exercise for {0} with checksum {1}".format(ccnode.title, assessment_file_obj.checksum))
+
+
+def get_perseus_storage_name(checksum):
+    return ccmodels.generate_object_storage_name(checksum, "{}.{}".format(checksum, file_formats.PERSEUS))
+
+
 def map_prerequisites(root_node):
 
     for n in ccmodels.PrerequisiteContentRelationship.objects.filter(prerequisite__tree_id=root_node.tree_id)\
@@ -784,6 +1441,7 @@ def mark_all_nodes_as_published(channel):
     logging.debug("Marking all nodes as published.")
 
     channel.main_tree.get_family().update(changed=False, published=True)
+    reset_changed_aggregates(channel.main_tree.tree_id)
 
     logging.info("Marked all nodes as published.")
 
@@ -866,10 +1524,13 @@ def sync_contentnode_and_channel_tsvectors(channel_id):
         # Now, all remaining nodes are in main_tree, so let's update them.
         # Update only changed nodes.
         node_tsv_subquery = get_fts_annotated_contentnode_qs(channel_id).filter(id=OuterRef("contentnode_id")).order_by()
+        node_subquery = ccmodels.ContentNode.objects.filter(id=OuterRef("contentnode_id")).order_by()
         ContentNodeFullTextSearch.objects.filter(channel_id=channel_id, contentnode__complete=True, contentnode__changed=True).update(
             keywords_tsvector=Subquery(node_tsv_subquery.values("keywords_tsvector")[:1]),
-            author_tsvector=Subquery(node_tsv_subquery.values("author_tsvector")[:1])
+            author_tsvector=Subquery(node_tsv_subquery.values("author_tsvector")[:1]),
+            **{field: Subquery(node_subquery.values(lookup)[:1]) for field, lookup in CONTENTNODE_FILTER_FIELDS.items()}
         )
+        ContentNodeFullTextSearch.objects.filter(channel_id=channel_id).update(public=is_channel_public(channel_id))
 
     # Insert newly created nodes.
     # "set_contentnode_tsvectors" command is defined in "search/management/commands" directory.
@@ -886,16 +1547,20 @@ def publish_channel(
     send_email=False,
     progress_tracker=None,
     language=settings.LANGUAGE_CODE,
+    incremental=settings.INCREMENTAL_PUBLISH,
 ):
     """
     :type progress_tracker: contentcuration.utils.celery.ProgressTracker|None
+    :param incremental: Update the export database of the previous version of the channel when possible
     """
     channel = ccmodels.Channel.objects.get(pk=channel_id)
     kolibri_temp_db = None
     start = time.time()
     try:
         set_channel_icon_encoding(channel)
-        kolibri_temp_db = create_content_database(channel, force, user_id, force_exercises, progress_tracker=progress_tracker)
+        kolibri_temp_db = create_content_database(
+            channel, force, user_id, force_exercises, progress_tracker=progress_tracker, incremental=incremental
+        )
         increment_channel_version(channel)
         add_tokens_to_channel(channel)
         sync_contentnode_and_channel_tsvectors(channel_id=channel.id)
@@ -908,7 +1573,8 @@ def publish_channel(
         channel.main_tree.published = True
         channel.main_tree.save()
 
-        # Delete public channel cache.
+        # Invalidate everything cached for the channel, and the public channel cache.
+        invalidate_cache_tags(channel_cache_tag(channel.id))
         if channel.public:
             delete_public_channel_cache_keys()
 
@@ -920,6 +1586,8 @@ def publish_channel(
         # Then we can use the empty db name to have SQLite use a temporary DB (https://www.sqlite.org/inmemorydb.html)
 
         record_publish_stats(channel)
+        try_update_channel_summary(channel.id)
+        try_update_node_details(channel.id)
 
         if progress_tracker:
             progress_tracker.track(100)
@@ -2,15 +2,42 @@ from __future__ import division
 
 import copy
 import logging
+from collections import defaultdict
 
 from django.db.models import Q
+from django.utils import timezone
 from django_bulk_update.helper import bulk_update
 from le_utils.constants import content_kinds
 from le_utils.constants import format_presets
 
 from contentcuration.models import AssessmentItem
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
 from contentcuration.models import ContentTag
 from contentcuration.models import File
+from contentcuration.utils import node_aggregates
+
+
+# The number of nodes that are synced together, with a fixed number of queries per batch
+SYNC_BATCH_SIZE = 500
+
+title_and_description_fields = (
+    "title",
+    "description",
+)
+
+resource_detail_fields = (
+    "license_id",
+    "copyright_holder",
+    "author",
+    "extra_fields",
+    "categories",
+    "learner_needs",
+    "accessibility_labels",
+    "grade_levels",
+    "resource_types",
+    "learning_activities",
+)
 
 
 def sync_channel(
@@ -22,30 +49,317 @@ def sync_channel(
     progress_tracker=None,
 ):
     """
+    Syncs the imported nodes of the channel from their original nodes, in batches of SYNC_BATCH_SIZE
+    nodes in tree order, see `sync_nodes`
+
     :type progress_tracker: contentcuration.utils.celery.ProgressTracker|None
     """
     nodes_to_sync = channel.main_tree.get_descendants().filter(
         Q(original_node__isnull=False)
         | Q(original_channel_id__isnull=False, original_source_node_id__isnull=False)
-    )
+    ).order_by("lft")
     sync_node_count = nodes_to_sync.count()
     if not sync_node_count:
         raise ValueError("Tried to sync a channel that has no imported content")
     if progress_tracker:
         progress_tracker.set_total(sync_node_count)
 
-    for node in nodes_to_sync:
-        node = sync_node(
-            node,
+    lft = channel.main_tree.lft
+    while True:
+        nodes = list(nodes_to_sync.filter(lft__gt=lft)[:SYNC_BATCH_SIZE])
+        if not nodes:
+            return
+        sync_nodes(
+            nodes,
             sync_titles_and_descriptions=sync_titles_and_descriptions,
             sync_resource_details=sync_resource_details,
             sync_files=sync_files,
             sync_assessment_items=sync_assessment_items,
         )
         if progress_tracker:
-            progress_tracker.increment()
+            progress_tracker.increment(len(nodes))
+        lft = nodes[-1].lft
+
+
+def _first_by(queryset, field):
+    """
+    :return: A dict of the first node in tree order of each tree for each value of field
+    """
+    nodes = {}
+    for node in queryset.order_by("tree_id", "lft"):
+        nodes.setdefault((node.tree_id, getattr(node, field)), node)
+    return nodes
+
+
+def get_original_nodes(nodes):
+    """
+    Finds the original nodes of the nodes, as ContentNode.get_original_node does for a single node,
+    with a fixed number of queries for all of them
+
+    :return: A dict of the original node of each node by the id of the node, which is the node itself
+        if its original node can't be found
+    """
+    original_nodes = ContentNode.objects.in_bulk({node.original_node_id for node in nodes if node.original_node_id})
+    originals = {node.id: original_nodes.get(node.original_node_id, node) for node in nodes}
+
+    nodes = [node for node in nodes if node.original_channel_id and node.original_source_node_id]
+    if not nodes:
+        return originals
+    tree_ids = dict(
+        Channel.objects.filter(pk__in={node.original_channel_id for node in nodes}, main_tree__isnull=False)
+        .values_list("id", "main_tree__tree_id")
+    )
+    nodes = [node for node in nodes if node.original_channel_id in tree_ids]
+    by_node_id = _first_by(
+        ContentNode.objects.filter(
+            tree_id__in=set(tree_ids.values()), node_id__in={node.original_source_node_id for node in nodes}
+        ),
+        "node_id",
+    )
+    # fall back to matching by content_id for the nodes whose source node is no longer in the channel
+    missing = [
+        node for node in nodes if (tree_ids[node.original_channel_id], node.original_source_node_id) not in by_node_id
+    ]
+    by_content_id = _first_by(
+        ContentNode.objects.filter(tree_id__in=set(tree_ids.values()), content_id__in={node.content_id for node in missing}),
+        "content_id",
+    ) if missing else {}
+    for node in nodes:
+        tree_id = tree_ids[node.original_channel_id]
+        originals[node.id] = (
+            by_node_id.get((tree_id, node.original_source_node_id))
+            or by_content_id.get((tree_id, node.content_id))
+            or node
+        )
+    return originals
+
+
+def sync_nodes(
+    nodes,
+    sync_titles_and_descriptions=False,
+    sync_resource_details=False,
+    sync_files=False,
+    sync_assessment_items=False,
+):
+    """
+    Syncs the nodes from their original nodes, as `sync_node` does for a single node, but comparing
+    the tags, files and assessment items of all of the nodes and their original nodes at once, and
+    writing the changes with bulk queries.
+
+    :return: The nodes that were changed
+    """
+    originals = get_original_nodes(nodes)
+    # Only update if node is not original
+    pairs = [(node, originals[node.id]) for node in nodes if originals[node.id].node_id != node.node_id]
+    if not pairs:
+        return []
+    logging.info("----- Syncing {} nodes".format(len(pairs)))
+
+    fields = _sync_pairs(
+        pairs,
+        sync_titles_and_descriptions=sync_titles_and_descriptions,
+        sync_resource_details=sync_resource_details,
+        sync_files=sync_files,
+        sync_assessment_items=sync_assessment_items,
+    )
+
+    changed = []
+    now = timezone.now()
+    for node, _ in pairs:
+        # Set changed for any of the changes to the fields of the node, as saving the node would
+        node.on_update()
         if node.changed:
-            node.save()
+            node.modified = now
+            changed.append(node)
+    if changed:
+        with node_aggregates.track_node_updates([node.id for node in changed]):
+            bulk_update(changed, update_fields=fields + ["content_id", "changed", "modified"])
+    return changed
+
+
+def _sync_pairs(
+    pairs,
+    sync_titles_and_descriptions=False,
+    sync_resource_details=False,
+    sync_files=False,
+    sync_assessment_items=False,
+):
+    """
+    Syncs the fields, tags, files and assessment items of the nodes of the pairs from their original nodes
+
+    :param pairs: A list of tuples of the nodes and their original nodes
+    :return: The fields of the nodes that were synced
+    """
+    fields = []
+    if sync_titles_and_descriptions:
+        fields.extend(title_and_description_fields)
+    if sync_resource_details:
+        fields.extend(resource_detail_fields)
+    if fields:
+        for node, original in pairs:
+            sync_node_data(node, original, fields)
+    if sync_resource_details:
+        _sync_tags(pairs)
+    if sync_files:
+        _sync_files(pairs)
+    if sync_assessment_items:
+        exercise_pairs = [(node, original) for node, original in pairs if node.kind_id == content_kinds.EXERCISE]
+        _sync_assessment_items(exercise_pairs)
+        if exercise_pairs and "extra_fields" not in fields:
+            fields.append("extra_fields")
+    return fields
+
+
+def _group_by(objects, field):
+    groups = defaultdict(list)
+    for obj in objects:
+        groups[getattr(obj, field)].append(obj)
+    return groups
+
+
+def _sync_tags(pairs):
+    """
+    Syncs the tags of the nodes from the tags of their original nodes, see `sync_node_tags`
+    """
+    Tag = ContentNode.tags.through
+    tags = defaultdict(lambda: defaultdict(list))
+    for tag_id, contentnode_id, tag_name in Tag.objects.filter(
+        contentnode_id__in={node_id for pair in pairs for node_id in (pair[0].id, pair[1].id)}
+    ).values_list("id", "contentnode_id", "contenttag__tag_name"):
+        tags[contentnode_id][tag_name].append(tag_id)
+
+    tags_to_remove = []
+    tag_names_to_add = {}
+    for node, original in pairs:
+        node_tags = tags[node.id]
+        original_tag_names = set(tags[original.id])
+        # Remove tags that aren't in original
+        removed = [tag_id for tag_name, tag_ids in node_tags.items() if tag_name not in original_tag_names for tag_id in tag_ids]
+        # Add tags that are in original
+        added = original_tag_names.difference(node_tags)
+        if removed or added:
+            tags_to_remove.extend(removed)
+            tag_names_to_add[node.id] = added
+            node.changed = True
+
+    if tags_to_remove:
+        Tag.objects.filter(id__in=tags_to_remove).delete()
+    if not tag_names_to_add:
+        return
+    all_tag_names = set().union(*tag_names_to_add.values())
+    new_tags = {}
+    for tag in ContentTag.objects.filter(tag_name__in=all_tag_names, channel_id=None):
+        new_tags.setdefault(tag.tag_name, tag)
+    created = [ContentTag(tag_name=tag_name, channel_id=None) for tag_name in all_tag_names.difference(new_tags)]
+    ContentTag.objects.bulk_create(created)
+    new_tags.update((tag.tag_name, tag) for tag in created)
+    Tag.objects.bulk_create(
+        Tag(contentnode_id=node_id, contenttag_id=new_tags[tag_name].id)
+        for node_id, tag_names in tag_names_to_add.items()
+        for tag_name in tag_names
+    )
+
+
+def _sync_files(pairs):
+    """
+    Syncs the files of the nodes from the files of their original nodes, see `sync_node_files`
+    """
+    files = _group_by(
+        File.objects.filter(
+            contentnode_id__in={node_id for pair in pairs for node_id in (pair[0].id, pair[1].id)}
+        ).select_related("preset"),
+        "contentnode_id",
+    )
+    files_to_delete = []
+    files_to_create = []
+    for node, original in pairs:
+        node_files_to_delete, node_files_to_create, is_node_uploaded_file = _diff_files(
+            node, files[node.id], files[original.id]
+        )
+        if node_files_to_delete or node_files_to_create:
+            files_to_delete.extend(node_files_to_delete)
+            files_to_create.extend(node_files_to_create)
+            node.changed = True
+        if node.changed and is_node_uploaded_file:
+            node.content_id = original.content_id
+
+    if files_to_delete:
+        File.objects.filter(id__in=files_to_delete).delete()
+    if files_to_create:
+        File.objects.bulk_create(files_to_create)
+
+
+def _sync_assessment_items(pairs):  # noqa C901
+    """
+    Syncs the assessment items of the exercises, and their files, from the assessment items of their
+    original nodes, see `sync_node_assessment_items`
+    """
+    if not pairs:
+        return
+    node_ids = {node_id for pair in pairs for node_id in (pair[0].id, pair[1].id)}
+    assessment_items = _group_by(AssessmentItem.objects.filter(contentnode_id__in=node_ids), "contentnode_id")
+    assessment_item_files = _group_by(
+        File.objects.filter(assessment_item__contentnode_id__in=node_ids), "assessment_item_id"
+    )
+
+    ai_to_create = []
+    ai_to_update = []
+    ai_to_delete = []
+    files_to_delete = []
+    # the files to create for each assessment item, as the new assessment items have no id yet
+    files_to_create = []
+
+    for node, original in pairs:
+        node.extra_fields = original.extra_fields
+        node_assessment_items = {ai.assessment_id: ai for ai in assessment_items[node.id]}
+        for source_ai in assessment_items[original.id]:
+            node_ai = node_assessment_items.pop(source_ai.assessment_id, None)
+            if not node_ai:
+                node_ai = copy.copy(source_ai)
+                node_ai.id = None
+                node_ai.contentnode_id = node.id
+                ai_to_create.append(node_ai)
+                node.changed = True
+            else:
+                for field in assessment_item_fields:
+                    setattr(node_ai, field, getattr(source_ai, field))
+                if node_ai.has_changes():
+                    ai_to_update.append(node_ai)
+                    node.changed = True
+            node_ai_files = {file.checksum: file for file in assessment_item_files[node_ai.id]} if node_ai.id else {}
+            for file in assessment_item_files[source_ai.id]:
+                if file.checksum not in node_ai_files:
+                    files_to_create.append((node_ai, file))
+                    node.changed = True
+                else:
+                    node_ai_files.pop(file.checksum)
+            if node_ai_files:
+                files_to_delete.extend(file.id for file in node_ai_files.values())
+                node.changed = True
+        if node_assessment_items:
+            ai_to_delete.extend(ai.id for ai in node_assessment_items.values())
+            node.changed = True
+        # Now, node and its original have same content so
+        # let us equalize its content_id.
+        if node.changed:
+            node.content_id = original.content_id
+
+    if ai_to_delete:
+        AssessmentItem.objects.filter(id__in=ai_to_delete).delete()
+    if ai_to_create:
+        AssessmentItem.objects.bulk_create(ai_to_create)
+    if ai_to_update:
+        bulk_update(ai_to_update, update_fields=assessment_item_fields)
+    if files_to_delete:
+        File.objects.filter(id__in=files_to_delete).delete()
+    if files_to_create:
+        new_files = []
+        for node_ai, file in files_to_create:
+            file = copy.copy(file)
+            file.id = None
+            file.assessment_item_id = node_ai.id
+            new_files.append(file)
+        File.objects.bulk_create(new_files)
 
 
 def sync_node(
@@ -63,25 +377,9 @@ def sync_node(
             )
         )
         if sync_titles_and_descriptions:
-            fields = [
-                "title",
-                "description",
-            ]
-            sync_node_data(node, original_node, fields)
+            sync_node_data(node, original_node, title_and_description_fields)
         if sync_resource_details:
-            fields = [
-                "license_id",
-                "copyright_holder",
-                "author",
-                "extra_fields",
-                "categories",
-                "learner_needs",
-                "accessibility_labels",
-                "grade_levels",
-                "resource_types",
-                "learning_activities",
-            ]
-            sync_node_data(node, original_node, fields)
+            sync_node_data(node, original_node, resource_detail_fields)
             sync_node_tags(node, original_node)
         if sync_files:
             sync_node_files(node, original_node)
@@ -119,21 +417,26 @@ def sync_node_tags(node, original):
         node.changed = True
 
 
-def sync_node_files(node, original):  # noqa C901
+def _file_key(file):
+    if file.preset_id == format_presets.VIDEO_SUBTITLE:
+        return "{}:{}".format(file.preset_id, file.language_id)
+    return file.preset_id
+
+
+def _diff_files(node, node_files, original_files):
     """
-    Sync all files in ``node`` from the files in ``original`` node.
+    Compares the files of a node with the files of its original node.
+
+    :return: A tuple of the ids of the files of the node to delete, the copies of the files of the
+        original node to create for the node, and whether the node is an uploaded file
     """
     is_node_uploaded_file = False
 
     source_files = {}
 
     # 1. Build a hashmap of all original node files.
-    for file in original.files.all():
-        if file.preset_id == format_presets.VIDEO_SUBTITLE:
-            file_key = "{}:{}".format(file.preset_id, file.language_id)
-        else:
-            file_key = file.preset_id
-        source_files[file_key] = file
+    for file in original_files:
+        source_files[_file_key(file)] = file
         # If node has any non-thumbnail file then it means the node
         # is an uploaded file.
         if file.preset.thumbnail is False:
@@ -143,11 +446,8 @@ def sync_node_files(node, original):  # noqa C901
     # source file are same then we remove it from source_files hashmap.
     # Else we mark that file for deletion.
     files_to_delete = []
-    for file in node.files.all():
-        if file.preset_id == format_presets.VIDEO_SUBTITLE:
-            file_key = "{}:{}".format(file.preset_id, file.language_id)
-        else:
-            file_key = file.preset_id
+    for file in node_files:
+        file_key = _file_key(file)
         source_file = source_files.get(file_key)
         if source_file and source_file.checksum == file.checksum:
             del source_files[file_key]
@@ -159,10 +459,23 @@ def sync_node_files(node, original):  # noqa C901
     # will be present in source_files hashmap.
     files_to_create = []
     for source_file in source_files.values():
+        # copy the file, as the same original files may be copied to several nodes
+        source_file = copy.copy(source_file)
         source_file.id = None
         source_file.contentnode_id = node.id
         files_to_create.append(source_file)
 
+    return files_to_delete, files_to_create, is_node_uploaded_file
+
+
+def sync_node_files(node, original):
+    """
+    Sync all files in ``node`` from the files in ``original`` node.
+    """
+    files_to_delete, files_to_create, is_node_uploaded_file = _diff_files(
+        node, node.files.all(), original.files.select_related("preset")
+    )
+
     if files_to_delete:
         File.objects.filter(id__in=files_to_delete).delete()
         node.changed = True
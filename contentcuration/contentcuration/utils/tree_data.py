@@ -0,0 +1,201 @@
+"""
+Builds the tree data of a node, as returned by ContentNode.get_tree_data, from its descendants in tree
+order, reading them in chunks with a single annotated query per chunk, rather than querying the children,
+assessment items and files of every node.
+
+As every node comes after its parent and before its next sibling in tree order, the nested structure is
+built in a single pass with a stack of the topics that the current node is a descendant of. The same pass
+can write the tree data as JSON as it goes, so that large trees are streamed without being held in memory.
+"""
+import json
+
+from django.db.models import Case
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import When
+from le_utils.constants import content_kinds
+
+from contentcuration.models import AssessmentItem
+from contentcuration.models import ContentNode
+from contentcuration.models import File
+
+
+CHUNK_SIZE = 1000
+
+# The size of the fragments of JSON that are yielded when streaming the tree data
+BUFFER_SIZE = 64 * 1024
+
+
+def _annotate(queryset):
+    from contentcuration.viewsets.common import SQCount
+    from contentcuration.viewsets.common import SQSum
+
+    # the subqueries are only run for the nodes of the kinds that need them
+    return queryset.annotate(
+        assessment_count=Case(
+            When(
+                kind_id=content_kinds.EXERCISE,
+                then=SQCount(AssessmentItem.objects.filter(contentnode_id=OuterRef("id")).values("id"), field="id"),
+            ),
+        ),
+        file_size=Case(
+            When(
+                ~Q(kind_id=content_kinds.TOPIC),
+                then=SQSum(File.objects.filter(contentnode_id=OuterRef("id")).values("file_size"), field="file_size"),
+            ),
+        ),
+    )
+
+
+def get_node_data(node):
+    """
+    :param node: A dict of the values of a node returned by `iter_tree_nodes`
+    :return: The tree data of the node, without its children
+    """
+    if node["kind_id"] == content_kinds.TOPIC:
+        return {
+            "title": node["title"],
+            "kind": node["kind_id"],
+            "node_id": node["node_id"],
+            "studio_id": node["id"],
+        }
+    if node["kind_id"] == content_kinds.EXERCISE:
+        return {
+            "title": node["title"],
+            "kind": node["kind_id"],
+            "count": node["assessment_count"],
+            "node_id": node["node_id"],
+            "studio_id": node["id"],
+        }
+    return {
+        "title": node["title"],
+        "kind": node["kind_id"],
+        "file_size": node["file_size"],
+        "node_id": node["node_id"],
+        "studio_id": node["id"],
+    }
+
+
+def iter_tree_nodes(root, levels=float("inf")):
+    """
+    Yields the values of the descendants of a node up to `levels` deep, in tree order, reading them
+    in chunks of consecutive ranges of the tree
+    """
+    queryset = ContentNode.objects.filter(tree_id=root.tree_id, lft__gt=root.lft, rght__lt=root.rght)
+    if levels != float("inf"):
+        queryset = queryset.filter(level__lte=root.level + levels)
+    queryset = _annotate(queryset).values(
+        "id", "node_id", "title", "kind_id", "lft", "rght", "level", "assessment_count", "file_size"
+    ).order_by("lft")
+
+    lft = root.lft
+    while True:
+        nodes = list(queryset.filter(lft__gt=lft)[:CHUNK_SIZE])
+        for node in nodes:
+            yield node
+        if len(nodes) < CHUNK_SIZE:
+            return
+        lft = nodes[-1]["lft"]
+
+
+def _has_children(root, node, levels):
+    # topics at the last level are listed without their children
+    return node["kind_id"] == content_kinds.TOPIC and node["level"] - root.level < levels
+
+
+def _walk_tree(root, levels):
+    """
+    Yields a tuple of each descendant of the node up to `levels` deep, in tree order, and of the
+    number of lists of children that were closed before it, ending with None and the number of
+    lists of children that are still open.
+    """
+    # the rght values of the topics with lists of children that the current node is in
+    stack = []
+    for node in iter_tree_nodes(root, levels=levels):
+        closed = 0
+        while stack and stack[-1] < node["lft"]:
+            stack.pop()
+            closed += 1
+        yield node, closed
+        if _has_children(root, node, levels):
+            stack.append(node["rght"])
+    yield None, len(stack)
+
+
+def get_tree_data(root, levels=float("inf")):
+    """
+    :return: The tree data of a node with the tree data of its descendants up to `levels` deep, see ContentNode.get_tree_data
+    """
+    if root.kind_id != content_kinds.TOPIC:
+        return get_node_data(
+            _annotate(ContentNode.objects.filter(pk=root.pk)).values(
+                "id", "node_id", "title", "kind_id", "assessment_count", "file_size"
+            ).first()
+        )
+    root_data = get_node_data({"id": root.id, "node_id": root.node_id, "title": root.title, "kind_id": root.kind_id})
+    if levels <= 0:
+        return root_data
+
+    root_data["children"] = []
+    # the tree data of the topics whose lists of children the current node is in
+    stack = [root_data]
+    for node, closed in _walk_tree(root, levels):
+        del stack[len(stack) - closed:]
+        if node is None:
+            break
+        node_data = get_node_data(node)
+        stack[-1]["children"].append(node_data)
+        if _has_children(root, node, levels):
+            node_data["children"] = []
+            stack.append(node_data)
+    return root_data
+
+
+def _iter_json_fragments(root, levels, errors):
+    yield "["
+    # whether each of the lists of children that the current node is in has any items yet
+    has_items = [False]
+    try:
+        for node, closed in _walk_tree(root, levels):
+            for _ in range(closed):
+                has_items.pop()
+                yield "]}"
+            if node is None:
+                break
+            fragment = "," if has_items[-1] else ""
+            has_items[-1] = True
+            if _has_children(root, node, levels):
+                # leave the object open, for the children that follow it
+                yield fragment + json.dumps(get_node_data(node))[:-1] + ', "children": ['
+                has_items.append(False)
+            else:
+                yield fragment + json.dumps(get_node_data(node))
+    except Exception as e:
+        if errors is None:
+            raise
+        errors.append(e)
+        # close the lists of children that are still open, so that the JSON stays valid
+        yield "]}" * (len(has_items) - 1)
+    yield "]"
+
+
+def iter_tree_data_json(root, levels=float("inf"), errors=None):
+    """
+    Yields the JSON of the list of the tree data of the children of a node, with the tree data of their
+    descendants up to `levels` deep, in fragments of about BUFFER_SIZE, as it is built from the
+    descendants in tree order
+
+    :param errors: A list that, if given, an error raised while the tree data is built is added to, rather
+                   than raised, ending the JSON with the tree data that was built before it
+    """
+    buffer = []
+    size = 0
+    for fragment in _iter_json_fragments(root, levels, errors):
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
@@ -1,10 +1,28 @@
 import logging
 
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models import Value
+from django.db.models.functions import Greatest
+
 from contentcuration.tasks import calculate_user_storage_task
 
 
+# Requests to calculate the storage of a user are coalesced for this many seconds, so that
+# many file changes in a row only calculate the storage of their users once
+STORAGE_CALCULATION_DELAY = 10
+
+# How long a pending calculation blocks others, in case its task never runs
+STORAGE_CALCULATION_PENDING_TIMEOUT = 300
+
+STORAGE_CALCULATION_PENDING_KEY = "user_storage_calculation_pending_{}"
+
+
 def calculate_user_storage(user_id):
-    """TODO: Perhaps move this to User model to avoid unnecessary User lookups"""
+    """
+    Enqueues the calculation of the storage used by a user, unless one is already pending, in
+    which case it will include any changes made until it runs
+    """
     from contentcuration.models import User
     from contentcuration.decorators import delay_user_storage_calculation
 
@@ -12,11 +30,66 @@ def calculate_user_storage(user_id):
         delay_user_storage_calculation.add(user_id)
         return
 
-    try:
-        if user_id is None:
-            raise User.DoesNotExist
-        user = User.objects.get(pk=user_id)
-        if not user.is_admin:
-            calculate_user_storage_task.fetch_or_enqueue(user, user_id=user_id)
-    except User.DoesNotExist:
+    if user_id is None:
+        logging.error("Tried to calculate user storage for user with id {} but they do not exist".format(user_id))
+        return
+
+    pending_key = STORAGE_CALCULATION_PENDING_KEY.format(user_id)
+    if not cache.add(pending_key, True, timeout=STORAGE_CALCULATION_PENDING_TIMEOUT):
+        return
+
+    user = User.objects.filter(pk=user_id).only("id", "is_admin").first()
+    if user is None:
+        cache.delete(pending_key)
         logging.error("Tried to calculate user storage for user with id {} but they do not exist".format(user_id))
+    elif not user.is_admin:
+        calculate_user_storage_task.enqueue(user, user_id=user_id, countdown=STORAGE_CALCULATION_DELAY)
+
+
+def clear_pending_user_storage(user_id):
+    """
+    Lets the calculation of the storage of a user be requested again, once the pending one starts
+    """
+    cache.delete(STORAGE_CALCULATION_PENDING_KEY.format(user_id))
+
+
+def update_user_storage(file, added):
+    """
+    Adds the size of a file that was added, or subtracts the size of one that was deleted, to or
+    from the storage used by the user who uploaded it, unless the user has other files with the
+    same checksum, so that the stored storage used is close to the actual one until it is next
+    calculated
+    """
+    from contentcuration.models import File
+    from contentcuration.models import User
+
+    if not file.uploaded_by_id or not file.file_size:
+        return
+    if File.objects.filter(uploaded_by_id=file.uploaded_by_id, checksum=file.checksum).exclude(pk=file.pk).exists():
+        return
+    size = file.file_size if added else -file.file_size
+    User.objects.filter(pk=file.uploaded_by_id).update(
+        disk_space_used=Greatest(F("disk_space_used") + size, Value(0.0))
+    )
+
+
+def add_user_storage(user_id, files):
+    """
+    Adds the sizes of files that were bulk created, and so not saved one by one, to the storage
+    used by the user who uploaded them, counting each checksum once and skipping the checksums
+    of other files of the user, as `update_user_storage` does for a single file
+    """
+    from contentcuration.models import File
+    from contentcuration.models import User
+
+    sizes = {f.checksum: f.file_size for f in files if f.uploaded_by_id == user_id and f.file_size}
+    if not sizes:
+        return
+    existing = set(
+        File.objects.filter(uploaded_by_id=user_id, checksum__in=sizes.keys())
+        .exclude(pk__in=[f.pk for f in files])
+        .values_list("checksum", flat=True)
+    )
+    size = sum(file_size for checksum, file_size in sizes.items() if checksum not in existing)
+    if size:
+        User.objects.filter(pk=user_id).update(disk_space_used=F("disk_space_used") + size)
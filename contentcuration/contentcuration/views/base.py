@@ -4,7 +4,6 @@ from urllib.parse import urlsplit
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.db.models import Count
 from django.db.models import IntegerField
@@ -52,6 +51,7 @@ from contentcuration.models import Language
 from contentcuration.models import License
 from contentcuration.models import TaskResult
 from contentcuration.serializers import SimplifiedChannelProbeCheckSerializer
+from contentcuration.utils.cache import public_channels_cache
 from contentcuration.utils.messages import get_messages
 from contentcuration.viewsets.channelset import PublicChannelSetSerializer
 
@@ -209,6 +209,66 @@ def unapplied_changes_status(request):
 """ END HEALTH CHECKS """
 
 
+def _get_public_channel_list():
+    return public_channels_cache.get_or_set(
+        PUBLIC_CHANNELS_CACHE_KEYS["list"],
+        lambda: list(
+            Channel.objects.filter(
+                public=True, main_tree__published=True, deleted=False,
+            ).values_list("main_tree__tree_id", flat=True)
+        ),
+    )
+
+
+def _get_public_languages():
+    public_lang_query = (
+        Language.objects.filter(
+            channel_language__public=True,
+            channel_language__main_tree__published=True,
+            channel_language__deleted=False,
+        )
+        .values("lang_code")
+        .annotate(count=Count("lang_code"))
+        .order_by("lang_code")
+    )
+    return json_for_parse_from_data({lang["lang_code"]: lang["count"] for lang in public_lang_query})
+
+
+def _get_public_licenses():
+    public_license_query = (
+        License.objects.filter(contentnode__tree_id__in=_get_public_channel_list())
+        .values_list("id", flat=True)
+        .order_by("id")
+        .distinct()
+    )
+    return json_for_parse_from_data(list(public_license_query))
+
+
+def _get_public_kinds():
+    public_kind_query = (
+        ContentKind.objects.filter(contentnodes__tree_id__in=_get_public_channel_list())
+        .values_list("kind", flat=True)
+        .order_by("kind")
+        .distinct()
+    )
+    return json_for_parse_from_data(list(public_kind_query))
+
+
+def _get_public_collections():
+    public_channelset_query = ChannelSet.objects.filter(public=True).annotate(
+        count=SQCountDistinct(
+            Channel.objects.filter(
+                secret_tokens=OuterRef("secret_token"),
+                public=True,
+                main_tree__published=True,
+                deleted=False,
+            ).values_list("id", flat=True),
+            field="id",
+        )
+    )
+    return json_for_parse_from_serializer(PublicChannelSetSerializer(public_channelset_query, many=True))
+
+
 @browser_is_supported
 @permission_classes((AllowAny,))
 def channel_list(request):
@@ -216,69 +276,10 @@ def channel_list(request):
     current_user = current_user_for_context(request.user)
     preferences = DEFAULT_USER_PREFERENCES if anon else request.user.content_defaults
 
-    public_channel_list = cache.get(PUBLIC_CHANNELS_CACHE_KEYS["list"])
-    if public_channel_list is None:
-        public_channel_list = Channel.objects.filter(
-            public=True, main_tree__published=True, deleted=False,
-        ).values_list("main_tree__tree_id", flat=True)
-        cache.set(PUBLIC_CHANNELS_CACHE_KEYS["list"], public_channel_list, None)
-
-    # Get public channel languages
-    languages = cache.get(PUBLIC_CHANNELS_CACHE_KEYS["languages"])
-    if languages is None:
-        public_lang_query = (
-            Language.objects.filter(
-                channel_language__public=True,
-                channel_language__main_tree__published=True,
-                channel_language__deleted=False,
-            )
-            .values("lang_code")
-            .annotate(count=Count("lang_code"))
-            .order_by("lang_code")
-        )
-        languages = {lang["lang_code"]: lang["count"] for lang in public_lang_query}
-        cache.set(PUBLIC_CHANNELS_CACHE_KEYS["languages"], json_for_parse_from_data(languages), None)
-
-    # Get public channel licenses
-    licenses = cache.get(PUBLIC_CHANNELS_CACHE_KEYS["licenses"])
-    if licenses is None:
-        public_license_query = (
-            License.objects.filter(contentnode__tree_id__in=public_channel_list)
-            .values_list("id", flat=True)
-            .order_by("id")
-            .distinct()
-        )
-        licenses = list(public_license_query)
-        cache.set(PUBLIC_CHANNELS_CACHE_KEYS["licenses"], json_for_parse_from_data(licenses), None)
-
-    # Get public channel kinds
-    kinds = cache.get(PUBLIC_CHANNELS_CACHE_KEYS["kinds"])
-    if kinds is None:
-        public_kind_query = (
-            ContentKind.objects.filter(contentnodes__tree_id__in=public_channel_list)
-            .values_list("kind", flat=True)
-            .order_by("kind")
-            .distinct()
-        )
-        kinds = list(public_kind_query)
-        cache.set(PUBLIC_CHANNELS_CACHE_KEYS["kinds"], json_for_parse_from_data(kinds), None)
-
-    # Get public channel sets
-    collections = cache.get(PUBLIC_CHANNELS_CACHE_KEYS["collections"])
-    if collections is None:
-        public_channelset_query = ChannelSet.objects.filter(public=True).annotate(
-            count=SQCountDistinct(
-                Channel.objects.filter(
-                    secret_tokens=OuterRef("secret_token"),
-                    public=True,
-                    main_tree__published=True,
-                    deleted=False,
-                ).values_list("id", flat=True),
-                field="id",
-            )
-        )
-        cache.set(PUBLIC_CHANNELS_CACHE_KEYS["collections"], json_for_parse_from_serializer(
-            PublicChannelSetSerializer(public_channelset_query, many=True)), None)
+    languages = public_channels_cache.get_or_set(PUBLIC_CHANNELS_CACHE_KEYS["languages"], _get_public_languages)
+    licenses = public_channels_cache.get_or_set(PUBLIC_CHANNELS_CACHE_KEYS["licenses"], _get_public_licenses)
+    kinds = public_channels_cache.get_or_set(PUBLIC_CHANNELS_CACHE_KEYS["kinds"], _get_public_kinds)
+    collections = public_channels_cache.get_or_set(PUBLIC_CHANNELS_CACHE_KEYS["collections"], _get_public_collections)
 
     return render(
         request,
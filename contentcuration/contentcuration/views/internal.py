@@ -1,5 +1,6 @@
 import json
 import logging
+import os
 from builtins import str
 from collections import namedtuple
 
@@ -8,13 +9,16 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import PermissionDenied
 from django.core.exceptions import SuspiciousOperation
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.db import transaction
 from django.http import HttpResponseBadRequest
 from django.http import HttpResponseForbidden
 from django.http import HttpResponseNotFound
 from django.http import HttpResponseServerError
 from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from le_utils.constants import content_kinds
+from le_utils.constants import file_formats
 from le_utils.constants import roles
 from le_utils.constants.labels.accessibility_categories import ACCESSIBILITYCATEGORIESLIST
 from le_utils.constants.labels.learning_activities import LEARNINGACTIVITIESLIST
@@ -40,8 +44,14 @@ from contentcuration.decorators import delay_user_storage_calculation
 from contentcuration.models import AssessmentItem
 from contentcuration.models import Change
 from contentcuration.models import Channel
+from contentcuration.models import COMPLETE_QUESTION_FILTER
+from contentcuration.models import ContentKind
 from contentcuration.models import ContentNode
 from contentcuration.models import ContentTag
+from contentcuration.models import File
+from contentcuration.models import FormatPreset
+from contentcuration.models import generate_object_storage_name
+from contentcuration.models import Language
 from contentcuration.models import License
 from contentcuration.models import SlideshowSlide
 from contentcuration.models import StagedFile
@@ -49,11 +59,16 @@ from contentcuration.serializers import GetTreeDataSerializer
 from contentcuration.tasks import apply_channel_changes_task
 from contentcuration.tasks import generatenodediff_task
 from contentcuration.utils.files import get_file_diff
+from contentcuration.utils.files import get_thumbnail_encoding
 from contentcuration.utils.garbage_collect import get_deleted_chefs_root
-from contentcuration.utils.nodes import map_files_to_assessment_item
+from contentcuration.utils.node_aggregates import nodes_created
+from contentcuration.utils.nodes import filter_out_nones
 from contentcuration.utils.nodes import map_files_to_node
 from contentcuration.utils.nodes import map_files_to_slideshow_slide_item
 from contentcuration.utils.sentry import report_exception
+from contentcuration.utils.tree_data import iter_tree_data_json
+from contentcuration.utils.user import add_user_storage
+from contentcuration.utils.user import calculate_user_storage
 from contentcuration.viewsets.sync.constants import CHANNEL
 from contentcuration.viewsets.sync.utils import generate_publish_event
 from contentcuration.viewsets.sync.utils import generate_update_event
@@ -277,6 +292,8 @@ def api_add_nodes_to_tree(request):
     in a linear fashion, from first to last topic, recursively iterating through
     children. This ensures that MPTT updates take the least amount of time
     necessary, and removes the need to delay or disable MPTT updates.
+    The nodes of each call are validated together and then bulk created, see
+    `BulkNodeCreator`, so larger batches of children take fewer queries per node.
 
     Response is of the form
     ```
@@ -357,13 +374,35 @@ def check_user_is_editor(request):
         raise HttpResponseBadRequest("Missing attribute from data: {}".format(data))
 
 
+def _tree_data_response(request, node, levels=float("inf"), **data):
+    """
+    Streams the JSON of the data, with the tree data of the children of the node as its `tree`,
+    as it is built from the descendants of the node, see contentcuration.utils.tree_data.
+    The status has been sent by the time the tree data is built, so if building it fails,
+    `success` is false and the error is added as `error`, after the tree data built before it.
+    """
+    def stream():
+        errors = []
+        yield json.dumps(data)[:-1] + (", " if data else "") + '"tree": '
+        for fragment in iter_tree_data_json(node, levels=levels, errors=errors):
+            yield fragment
+        if errors:
+            logging.error("Failed to stream the tree data of node {}: {}".format(node.pk, errors[0]))
+            handle_server_error(errors[0], request)
+            yield ', "success": false, "error": {}}}'.format(json.dumps(str(errors[0])))
+        else:
+            yield ', "success": true}'
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
+
+
 @api_view(["POST"])
 @authentication_classes((TokenAuthentication, SessionAuthentication,))
 @permission_classes((IsAuthenticated,))
 def get_tree_data(request):
     """
     Get the tree data for the `tree` tree of channel `channel_id`.
-    WARNING: this endpoint timesouts for large channels.
+    The tree is streamed as it is read, so that large channels are not held in memory.
     Returns { success: true, tree:[ nodes in channel_id ] }
     """
     serializer = GetTreeDataSerializer(data=request.data)
@@ -376,9 +415,7 @@ def get_tree_data(request):
         tree_root = getattr(channel, tree_name, None)
         if tree_root is None:
             raise ValueError("Invalid tree name")
-        tree_data = tree_root.get_tree_data()
-        children_data = tree_data.get("children", [])
-        return Response({"success": True, "tree": children_data})
+        return _tree_data_response(request, tree_root)
     except (Channel.DoesNotExist, PermissionDenied):
         return HttpResponseNotFound("No channel matching: {}".format(channel_id))
     except ValueError:
@@ -413,14 +450,9 @@ def get_node_tree_data(request):
             )
         else:
             node = tree_root
-        tree_data = node.get_tree_data(levels=1)
-        children_data = tree_data.get("children", [])
-        response_data = {
-            "success": True,
-            "tree": children_data,
-            "staged": channel.staging_tree is not None,
-        }
-        return Response(response_data)
+        if node is None:
+            return HttpResponseNotFound("No node matching: {}".format(serializer.validated_data["node_id"]))
+        return _tree_data_response(request, node, levels=1, staged=channel.staging_tree is not None)
     except Channel.DoesNotExist:
         return HttpResponseNotFound("No channel matching: {}".format(channel_id))
     except Exception as e:
@@ -631,6 +663,314 @@ def handle_remote_node(user, node_data, parent_node):
     return contentnode.copy_to(target=parent_node, mods=node_data, can_edit_source_channel=can_edit_source_channel)
 
 
+class NodeDataLookups(object):
+    """
+    Caches the licenses, languages, kinds and format presets that node data refers to, and the
+    files that have been found in storage, so that they are looked up once for a whole batch of
+    nodes rather than once for every node or file.
+    """
+
+    def __init__(self):
+        self.licenses = {license.license_name.lower(): license for license in License.objects.all()}
+        self.language_ids = set(Language.objects.values_list("id", flat=True))
+        self.kinds = {kind.kind: kind for kind in ContentKind.objects.all()}
+        self.presets = {preset.id: preset for preset in FormatPreset.objects.all()}
+        # The first displayed preset for each extension, as FormatPreset.guess_format_preset returns
+        self.extension_presets = {}
+        for extension, preset_id in (
+            FormatPreset.allowed_formats.through.objects.filter(formatpreset__display=True)
+            .order_by("formatpreset_id")
+            .values_list("fileformat_id", "formatpreset_id")
+        ):
+            self.extension_presets.setdefault(extension, self.presets[preset_id])
+        self.existing_file_paths = set()
+
+    def get_license(self, license_name):
+        if license_name is None:
+            return None
+        try:
+            return self.licenses[license_name.lower()]
+        except KeyError:
+            raise ObjectDoesNotExist("Invalid license found")
+
+    def get_kind(self, kind_id):
+        try:
+            return self.kinds[kind_id]
+        except KeyError:
+            raise NodeValidationError("{} is not a valid kind".format(kind_id))
+
+    def get_preset(self, preset_name, filename):
+        """
+        Get the preset with that name, or guess it from the extension of the filename if there is none
+        """
+        return self.presets.get(preset_name) or self.extension_presets.get(os.path.splitext(filename)[1].lstrip("."))
+
+    def check_file_exists(self, file_path):
+        if file_path not in self.existing_file_paths:
+            if not default_storage.exists(file_path):
+                raise IOError("{} not found".format(file_path))
+            self.existing_file_paths.add(file_path)
+
+
+class BulkNodeCreator(object):
+    """
+    Creates nodes from node data as the last children of a parent node. All of the data is
+    validated, and its files are checked in storage, as it is added, before anything is written.
+    The nodes, their tags, files and assessment items are then written with one bulk insert for
+    each table, with the space for the nodes made in the tree of the parent with a single update.
+    """
+
+    def __init__(self, user, parent_node, lookups):
+        self.user = user
+        self.parent_node = parent_node
+        self.lookups = lookups
+        self.channel = parent_node.get_channel()
+        self.nodes = []
+        self.node_tags = []
+        self.files = []
+        self.questions = []
+        self.slideshows = []
+
+    def _build_file(self, file_data, filename, checksum, ext, **kwargs):
+        # Files are bulk created, so check what File.save would
+        if ext and ext not in dict(file_formats.choices):
+            raise ValidationError("Invalid file_format")
+        file_path = generate_object_storage_name(checksum, filename)
+        self.lookups.check_file_exists(file_path)
+        file_obj = File(
+            checksum=checksum,
+            file_format_id=ext,
+            original_filename=file_data.get("original_filename") or "file",
+            source_url=file_data.get("source_url"),
+            file_size=file_data["size"],
+            uploaded_by=self.user,
+            **kwargs
+        )
+        file_obj.file_on_disk.name = file_path
+        if not file_obj.file_size:
+            file_obj.file_size = file_obj.file_on_disk.size
+        return file_obj
+
+    def _add_node_files(self, node, data):
+        """ Generate files that reference the node, as map_files_to_node does """
+        files = []
+        for file_data in filter_out_nones(data):
+            filename = file_data["filename"]
+            checksum, ext = os.path.splitext(filename)
+            preset = self.lookups.get_preset(file_data["preset"], filename)
+            language_id = file_data.get("language")
+            if language_id and language_id not in self.lookups.language_ids:
+                # As map_files_to_node does, skip this and the remaining files of the node
+                logging.warning("file_data with language {} does not exist.".format(language_id))
+                break
+            file_obj = self._build_file(
+                file_data,
+                filename,
+                checksum,
+                ext.lstrip("."),
+                contentnode=node,
+                preset=preset,
+                language_id=language_id,
+                duration=file_data.get("duration"),
+            )
+            if preset and preset.thumbnail:
+                # A thumbnail replaces any other thumbnails with the same preset
+                files = [f for f in files if f.preset_id != preset.id]
+                node.thumbnail_encoding = json.dumps({
+                    "base64": get_thumbnail_encoding(filename),
+                    "points": [],
+                    "zoom": 0
+                })
+            files.append(file_obj)
+        self.files.extend(files)
+
+    def _add_questions(self, node, data):
+        """ Generate the assessment items of an exercise, and their files, as create_exercises did """
+        for order, question in enumerate(data):
+            assessment_item = AssessmentItem(
+                type=question.get("type"),
+                question=question.get("question"),
+                hints=question.get("hints"),
+                answers=question.get("answers"),
+                order=order,
+                contentnode=node,
+                assessment_id=question.get("assessment_id"),
+                raw_data=question.get("raw_data"),
+                source_url=question.get("source_url"),
+                randomize=question.get("randomize") or False,
+            )
+            files = []
+            for file_data in filter_out_nones(question["files"]):
+                filename = file_data["filename"]
+                checksum, ext = filename.split(".")
+                # assessment item files always have a preset
+                files.append(self._build_file(file_data, filename, checksum, ext, preset_id=file_data["preset"]))
+            self.questions.append((assessment_item, files))
+
+    def add(self, node_data, sort_order):  # noqa: C901
+        """
+        Validate node data and generate its node and related objects, without writing anything
+        """
+        license = self.lookups.get_license(node_data["license"])
+        kind = self.lookups.get_kind(node_data["kind"])
+
+        extra_fields = node_data["extra_fields"] or {}
+        if isinstance(extra_fields, basestring):
+            extra_fields = json.loads(extra_fields)
+
+        # validate completion criteria
+        if "options" in extra_fields and "completion_criteria" in extra_fields["options"]:
+            try:
+                completion_criteria.validate(extra_fields["options"]["completion_criteria"], kind=node_data['kind'])
+            except completion_criteria.ValidationError:
+                raise NodeValidationError("Node {} has invalid completion criteria".format(node_data["node_id"]))
+
+        metadata_labels = validate_metadata_labels(node_data)
+
+        language_id = node_data.get("language")
+        if language_id and language_id not in self.lookups.language_ids:
+            raise NodeValidationError("{} is not a valid language".format(language_id))
+
+        tag_names = node_data.get("tags") or []
+        for tag_name in tag_names:
+            if len(tag_name) > 30:
+                raise ValidationError("tag is greater than 30 characters")
+
+        node = ContentNode(
+            title=node_data.get('title', ""),
+            kind=kind,
+            node_id=node_data["node_id"],
+            content_id=node_data["content_id"],
+            description=node_data["description"],
+            author=node_data["author"],
+            aggregator=node_data.get("aggregator") or "",
+            provider=node_data.get("provider") or "",
+            license=license,
+            license_description=node_data.get('license_description', ""),
+            copyright_holder=node_data.get('copyright_holder', ""),
+            extra_fields=extra_fields,
+            sort_order=sort_order,
+            source_id=node_data.get("source_id"),
+            source_domain=node_data.get("source_domain"),
+            language_id=language_id,
+            freeze_authoring_data=True,
+            role_visibility=node_data.get('role') or roles.LEARNER,
+            # Assume it is complete to start with, we will do validation
+            # later when we have all data available to determine if it is
+            # complete or not.
+            complete=True,
+            changed=True,
+            suggested_duration=node_data.get("suggested_duration"),
+            **metadata_labels
+        )
+        # The node is bulk created, so do what ContentNode.on_create would
+        node.set_default_learning_activity()
+
+        self.nodes.append(node)
+        self.node_tags.append((node, tag_names))
+        self._add_node_files(node, node_data["files"])
+        self._add_questions(node, node_data["questions"])
+        if node_data["kind"] == "slideshow":
+            self.slideshows.append((node, node_data))
+        return node
+
+    def _create_tags(self):
+        tag_names = set(tag_name for _, names in self.node_tags for tag_name in names)
+        if not tag_names:
+            return
+        tags = ContentTag.objects.filter(channel=self.channel, tag_name__in=tag_names)
+        existing_tag_names = set(tags.values_list("tag_name", flat=True))
+        ContentTag.objects.bulk_create(
+            [ContentTag(tag_name=tag_name, channel=self.channel) for tag_name in tag_names - existing_tag_names],
+            ignore_conflicts=True,
+        )
+        tag_ids = dict(tags.values_list("tag_name", "id"))
+        ContentNode.tags.through.objects.bulk_create(
+            [
+                ContentNode.tags.through(contentnode_id=node.id, contenttag_id=tag_ids[tag_name])
+                for node, names in self.node_tags
+                for tag_name in set(names)
+            ]
+        )
+
+    def _create_slideshows(self):
+        for node, node_data in self.slideshows:
+            extra_fields_unicode = node_data["extra_fields"]
+
+            # Extra Fields comes as type<unicode> - convert it to a dict and get slideshow_data
+            extra_fields_json = extra_fields_unicode.encode(
+                "ascii", "ignore"
+            )
+            extra_fields = json.loads(extra_fields_json)
+
+            slides = create_slides(
+                self.user, node, extra_fields.get("slideshow_data")
+            )
+            map_files_to_slideshow_slide_item(
+                self.user, node, slides, node_data["files"]
+            )
+
+    def _report_incomplete_nodes(self):
+        node_ids = [node.id for node in self.nodes]
+        with_default_file = set(
+            File.objects.filter(contentnode_id__in=node_ids, preset__supplementary=False)
+            .values_list("contentnode_id", flat=True)
+        )
+        with_complete_questions = set(
+            AssessmentItem.objects.filter(COMPLETE_QUESTION_FILTER, contentnode_id__in=node_ids)
+            .values_list("contentnode_id", flat=True)
+        )
+        for node in self.nodes:
+            completion_errors = node.mark_complete(
+                has_default_file=node.id in with_default_file,
+                has_complete_questions=node.id in with_complete_questions,
+            )
+            if completion_errors:
+                try:
+                    # we need to raise it to get Python to fill out the stack trace.
+                    raise IncompleteNodeError(node, completion_errors)
+                except IncompleteNodeError as e:
+                    report_exception(e)
+
+    def create(self):
+        """
+        Write the nodes that have been added, and their related objects
+
+        :return: A dict of the node_id of each node to its pk
+        """
+        if not self.nodes:
+            return {}
+
+        with ContentNode.objects.lock_mptt(self.parent_node.tree_id):
+            ContentNode.objects.bulk_create(ContentNode.objects.build_child_nodes(self.parent_node, self.nodes))
+            # The nodes are bulk created, so their contributions to the descendant counts of their
+            # ancestors are not added by `save`. As with nodes created by `save`, they are all counted
+            # as complete until they are next saved.
+            nodes_created(self.nodes)
+        ContentNode.objects.filter(pk=self.parent_node.pk).update(changed=True)
+
+        self._create_tags()
+        File.objects.bulk_create(self.files)
+        AssessmentItem.objects.bulk_create([assessment_item for assessment_item, _ in self.questions])
+        question_files = []
+        for assessment_item, files in self.questions:
+            for file_obj in files:
+                file_obj.assessment_item_id = assessment_item.id
+                question_files.append(file_obj)
+        File.objects.bulk_create(question_files)
+        self._create_slideshows()
+
+        if self.files or question_files:
+            add_user_storage(self.user.id, self.files + question_files)
+            calculate_user_storage(self.user.id)
+
+        # Wait until after files have been created for the nodes to check for node completeness
+        # as some node kinds are counted as incomplete if they lack a default file.
+        self._report_incomplete_nodes()
+
+        return {node.node_id: node.pk for node in self.nodes}
+
+
 @delay_user_storage_calculation
 def convert_data_to_nodes(user, content_data, parent_node):
     """ Parse dict and create nodes accordingly """
@@ -638,47 +978,26 @@ def convert_data_to_nodes(user, content_data, parent_node):
         root_mapping = {}
         parent_node = ContentNode.objects.get(pk=parent_node)
         sort_order = parent_node.children.count() + 1
-        existing_node_ids = ContentNode.objects.filter(
-            parent_id=parent_node.pk
-        ).values_list("node_id", flat=True)
+        existing_node_ids = set(
+            ContentNode.objects.filter(parent_id=parent_node.pk).values_list("node_id", flat=True)
+        )
+        lookups = NodeDataLookups()
         with transaction.atomic():
+            creator = BulkNodeCreator(user, parent_node, lookups)
             for node_data in content_data:
                 # Check if node id is already in the tree to avoid duplicates
-                if node_data["node_id"] not in existing_node_ids:
-                    if "source_channel_id" in node_data:
-                        new_node = handle_remote_node(user, node_data, parent_node)
+                if node_data["node_id"] in existing_node_ids:
+                    continue
+                if "source_channel_id" in node_data:
+                    # Create the nodes before the remote node first, so that they stay in order
+                    root_mapping.update(creator.create())
+                    creator = BulkNodeCreator(user, parent_node, lookups)
 
-                        map_files_to_node(user, new_node, node_data.get("files", []))
+                    new_node = handle_remote_node(user, node_data, parent_node)
 
-                        add_tags(new_node, node_data)
+                    map_files_to_node(user, new_node, node_data.get("files", []))
 
-                    else:
-                        # Create the node
-                        new_node = create_node(node_data, parent_node, sort_order)
-
-                        # Create files associated with node
-                        map_files_to_node(user, new_node, node_data["files"])
-
-                        # Create questions associated exercise nodes
-                        create_exercises(user, new_node, node_data["questions"])
-                        sort_order += 1
-
-                        # Create Slideshow slides (if slideshow kind)
-                        if node_data["kind"] == "slideshow":
-                            extra_fields_unicode = node_data["extra_fields"]
-
-                            # Extra Fields comes as type<unicode> - convert it to a dict and get slideshow_data
-                            extra_fields_json = extra_fields_unicode.encode(
-                                "ascii", "ignore"
-                            )
-                            extra_fields = json.loads(extra_fields_json)
-
-                            slides = create_slides(
-                                user, new_node, extra_fields.get("slideshow_data")
-                            )
-                            map_files_to_slideshow_slide_item(
-                                user, new_node, slides, node_data["files"]
-                            )
+                    add_tags(new_node, node_data)
 
                     # Wait until after files have been set on the node to check for node completeness
                     # as some node kinds are counted as incomplete if they lack a default file.
@@ -693,6 +1012,10 @@ def convert_data_to_nodes(user, content_data, parent_node):
 
                     # Track mapping between newly created node and node id
                     root_mapping.update({node_data["node_id"]: new_node.pk})
+                else:
+                    creator.add(node_data, sort_order)
+                    sort_order += 1
+            root_mapping.update(creator.create())
             return root_mapping
 
     except KeyError as e:
@@ -709,92 +1032,6 @@ METADATA = {
 }
 
 
-def create_node(node_data, parent_node, sort_order):  # noqa: C901
-    """ Generate node based on node dict """
-    # Make sure license is valid
-    license = None
-    license_name = node_data["license"]
-    if license_name is not None:
-        try:
-            license = License.objects.get(license_name__iexact=license_name)
-        except ObjectDoesNotExist:
-            raise ObjectDoesNotExist("Invalid license found")
-
-    extra_fields = node_data["extra_fields"] or {}
-    if isinstance(extra_fields, basestring):
-        extra_fields = json.loads(extra_fields)
-
-    # validate completion criteria
-    if "options" in extra_fields and "completion_criteria" in extra_fields["options"]:
-        try:
-            completion_criteria.validate(extra_fields["options"]["completion_criteria"], kind=node_data['kind'])
-        except completion_criteria.ValidationError:
-            raise NodeValidationError("Node {} has invalid completion criteria".format(node_data["node_id"]))
-
-    # Validate title and license fields
-    title = node_data.get('title', "")
-    license_description = node_data.get('license_description', "")
-    copyright_holder = node_data.get('copyright_holder', "")
-
-    metadata_labels = validate_metadata_labels(node_data)
-
-    node = ContentNode.objects.create(
-        title=title,
-        tree_id=parent_node.tree_id,
-        kind_id=node_data["kind"],
-        node_id=node_data["node_id"],
-        content_id=node_data["content_id"],
-        description=node_data["description"],
-        author=node_data["author"],
-        aggregator=node_data.get("aggregator") or "",
-        provider=node_data.get("provider") or "",
-        license=license,
-        license_description=license_description,
-        copyright_holder=copyright_holder,
-        parent=parent_node,
-        extra_fields=extra_fields,
-        sort_order=sort_order,
-        source_id=node_data.get("source_id"),
-        source_domain=node_data.get("source_domain"),
-        language_id=node_data.get("language"),
-        freeze_authoring_data=True,
-        role_visibility=node_data.get('role') or roles.LEARNER,
-        # Assume it is complete to start with, we will do validation
-        # later when we have all data available to determine if it is
-        # complete or not.
-        complete=True,
-        suggested_duration=node_data.get("suggested_duration"),
-        **metadata_labels
-    )
-
-    add_tags(node, node_data)
-
-    return node
-
-
-def create_exercises(user, node, data):
-    """ Generate exercise from data """
-    with transaction.atomic():
-        order = 0
-
-        for question in data:
-            question_obj = AssessmentItem(
-                type=question.get("type"),
-                question=question.get("question"),
-                hints=question.get("hints"),
-                answers=question.get("answers"),
-                order=order,
-                contentnode=node,
-                assessment_id=question.get("assessment_id"),
-                raw_data=question.get("raw_data"),
-                source_url=question.get("source_url"),
-                randomize=question.get("randomize") or False,
-            )
-            order += 1
-            question_obj.save()
-            map_files_to_assessment_item(user, question_obj, question["files"])
-
-
 def create_slides(user, node, slideshow_data):
     """ Generate SlideshowSlides from data """
     """ Returns a collection of SlideshowSlide objects """
@@ -2,7 +2,6 @@ import json
 from datetime import datetime
 
 from django.conf import settings
-from django.core.cache import cache
 from django.db.models import Max
 from django.http import Http404
 from django.http import HttpResponse
@@ -22,6 +21,8 @@ from contentcuration.models import Channel
 from contentcuration.models import ContentNode
 from contentcuration.tasks import generatenodediff_task
 from contentcuration.tasks import getnodedetails_task
+from contentcuration.utils.cache import node_details_cache
+from contentcuration.utils.node_details import get_stored_details
 from contentcuration.utils.nodes import get_diff
 
 
@@ -52,7 +53,12 @@ def get_node_details(request, node_id):
 
 
 def get_node_details_cached(user, node, channel_id=None):
-    cached_data = cache.get("details_{}".format(node.node_id))
+    # The details of the topics of main trees are stored, see contentcuration.utils.node_details
+    stored_details = get_stored_details(node.pk)
+    if stored_details is not None:
+        return stored_details
+
+    cached_data = node_details_cache.get(node.node_id)
     if cached_data:
         descendants = (
             node.get_descendants()
@@ -73,12 +79,12 @@ def get_node_details_cached(user, node, channel_id=None):
 
         if last_update:
             last_cache_update = datetime.strptime(
-                json.loads(cached_data)["last_update"], settings.DATE_TIME_FORMAT
+                cached_data["last_update"], settings.DATE_TIME_FORMAT
             )
             if not user.is_anonymous and last_update.replace(tzinfo=None) > last_cache_update:
                 # update the stats async, then return the cached value
                 getnodedetails_task.enqueue(user, node_id=node.pk)
-        return json.loads(cached_data)
+        return cached_data
 
     return node.get_details(channel_id=channel_id)
 
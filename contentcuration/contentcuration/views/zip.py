@@ -3,12 +3,15 @@ import logging
 import mimetypes
 import os
 import re
+import struct
 import time
 import zipfile
+from contextlib import closing
 from xml.etree.ElementTree import SubElement
 
 import html5lib
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.http import HttpResponse
 from django.http import HttpResponseNotFound
@@ -36,6 +39,24 @@ VALID_STORAGE_FILENAME = re.compile("[0-9a-f]{32}(-data)?\\.[0-9a-z]+")
 # set of file extensions that should be considered zip files and allow access to internal files
 POSSIBLE_ZIPPED_FILE_EXTENSIONS = set([".perseus", ".zip", ".epub", ".epub3"])
 
+# zip files are named by the MD5 of their contents, so their central directories can be cached indefinitely,
+# the timeout only serves to evict the indexes of zip files that are no longer being viewed
+ZIP_INDEX_CACHE_KEY = "zipcontent:index:{}"
+ZIP_INDEX_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# the minimum number of bytes to read from storage at once, so that a small embedded file and its
+# local header, or the end of a zip file and its central directory, can be read in a single request
+MIN_RANGED_READ_SIZE = 64 * 1024
+
+# the maximum number of bytes to read from storage at once, and hold in memory, while serving large embedded files
+MAX_RANGED_READ_SIZE = 8 * 1024 * 1024
+
+# allow for a local header extra field that differs in length from the central directory one,
+# when reading an embedded file and its local header in a single request
+LOCAL_HEADER_EXTRA_SIZE = 1024
+
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
 
 def _add_access_control_headers(request, response):
     response["Access-Control-Allow-Origin"] = "*"
@@ -100,6 +121,222 @@ def parse_html(content):
 # DISK PATHS
 
 
+class StorageRangeFile(object):
+    """
+    A read only, seekable file object for a file in storage, that only reads the byte ranges that are
+    requested from storage, rather than downloading the whole file.
+
+    Storage backends that provide a `read_range(name, start, end)` method are read with ranged requests,
+    other backends fall back to opening the whole file once, and seeking within it.
+    """
+
+    def __init__(self, storage, name, size):
+        self.storage = storage
+        self.name = name
+        self.size = size
+        self.position = 0
+        self.read_size = MIN_RANGED_READ_SIZE
+        self._buffer = b""
+        self._buffer_start = 0
+        self._file = None
+
+    def _read_range(self, start, end):
+        read_range = getattr(self.storage, "read_range", None)
+        if read_range is not None:
+            return read_range(self.name, start, end)
+        if self._file is None:
+            self._file = self.storage.open(self.name)
+        self._file.seek(start)
+        return self._file.read(end - start)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            # raise the same error as seeking a real file would, which zipfile expects for files that are too short
+            raise OSError("Negative seek position {}".format(offset))
+        self.position = offset
+        return self.position
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.position
+        n = min(n, self.size - self.position)
+        if n <= 0:
+            return b""
+        if self.position < self._buffer_start or self.position + n > self._buffer_start + len(self._buffer):
+            end = min(self.size, self.position + max(n, self.read_size))
+            self._buffer = self._read_range(self.position, end)
+            self._buffer_start = self.position
+        offset = self.position - self._buffer_start
+        data = self._buffer[offset:offset + n]
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self._buffer = b""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class IndexedZipFile(zipfile.ZipFile):
+    """
+    A ZipFile that uses an already parsed list of ZipInfo objects, rather than reading and parsing
+    the central directory of the zip file again.
+    """
+
+    def __init__(self, file, infolist):
+        self._infolist = infolist
+        super(IndexedZipFile, self).__init__(file)
+
+    def _RealGetContents(self):
+        for info in self._infolist:
+            self.filelist.append(info)
+            self.NameToInfo[info.filename] = info
+
+
+class LimitedReader(object):
+    """
+    Reads at most `length` bytes from a file object, so that responses can stream part of an embedded file,
+    and so that FileResponse does not try to determine the length of the file by seeking to its end.
+    Closing it also closes the StorageRangeFile of the zip file.
+    """
+
+    def __init__(self, fileobj, length, name, storage_file):
+        self.fileobj = fileobj
+        self.remaining = length
+        self.name = name
+        self.storage_file = storage_file
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.fileobj.read(n)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+        self.storage_file.close()
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header, size):
+    """
+    Parses a single byte range from the value of a Range header.
+
+    :param range_header: The value of the Range header, or None
+    :param size: The size of the content
+    :return: An inclusive (start, end) tuple, or None if the whole content should be returned,
+             as there is no range, or it is not a single byte range.
+    :raises: RangeNotSatisfiable if the range does not overlap with the content
+    """
+    match = RANGE_HEADER.match(range_header or "")
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # a suffix range of the last bytes of the content
+        if int(end) == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - int(end)), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def get_zip_index(storage, zipped_path, zipped_filename):
+    """
+    Gets the size and list of ZipInfo objects of a zip file in storage, reading only the end of
+    the zip file from storage the first time, and caching them after that.
+
+    :return: A dict with the size and infolist of the zip file, or None if it does not exist in storage
+    :raises: zipfile.BadZipfile if the file is not a valid zip file
+    """
+    cache_key = ZIP_INDEX_CACHE_KEY.format(zipped_filename)
+    index = cache.get(cache_key)
+    if index is None:
+        if not storage.exists(zipped_path):
+            return None
+        size = storage.size(zipped_path)
+        zf_obj = StorageRangeFile(storage, zipped_path, size)
+        try:
+            # the central directory is at the end of the zip file, so read it along with the end record
+            zf_obj.read_size = MIN_RANGED_READ_SIZE
+            zf_obj.seek(max(0, size - MIN_RANGED_READ_SIZE))
+            zf_obj.read(1)
+            with zipfile.ZipFile(zf_obj) as zf:
+                index = {"size": size, "infolist": zf.infolist()}
+        except zipfile.BadZipfile:
+            capture_message("Unable to open zip file. File info: name={}, size={}".format(zipped_path, size))
+            raise
+        finally:
+            zf_obj.close()
+        cache.set(cache_key, index, timeout=ZIP_INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def _get_data_offset(zf_obj, info):
+    """
+    Gets the offset of the data of an embedded file in the zip file, from its local header
+    """
+    zf_obj.seek(info.header_offset)
+    fheader = struct.unpack(zipfile.structFileHeader, zf_obj.read(zipfile.sizeFileHeader))
+    # the last two fields of the local header are the lengths of the filename and the extra field
+    return info.header_offset + zipfile.sizeFileHeader + fheader[-2] + fheader[-1]
+
+
+def open_embedded_file(zf_obj, zf, info, byte_range=None):
+    """
+    Opens an embedded file for streaming, reading only its bytes from storage.
+
+    :param zf_obj: The StorageRangeFile of the zip file
+    :param zf: The IndexedZipFile of the zip file
+    :param info: The ZipInfo of the embedded file
+    :param byte_range: An optional inclusive (start, end) range of the embedded file to read
+    :return: A file object that reads the embedded file, or the range of it
+    """
+    start, end = byte_range or (0, info.file_size - 1)
+    length = end - start + 1
+    local_header_size = zipfile.sizeFileHeader + len(info.orig_filename) + LOCAL_HEADER_EXTRA_SIZE
+    if info.compress_type == zipfile.ZIP_STORED:
+        # the bytes of the embedded file are stored as they are, so the range can be read directly,
+        # along with the local header if they are close enough to it
+        span = local_header_size + start + length
+        zf_obj.read_size = max(MIN_RANGED_READ_SIZE, span) if span <= MAX_RANGED_READ_SIZE else MIN_RANGED_READ_SIZE
+        data_offset = _get_data_offset(zf_obj, info)
+        zf_obj.read_size = min(MAX_RANGED_READ_SIZE, max(MIN_RANGED_READ_SIZE, length))
+        zf_obj.seek(data_offset + start)
+        return LimitedReader(zf_obj, length, info.filename, zf_obj)
+    # read the local header along with the compressed data of the embedded file
+    zf_obj.read_size = min(MAX_RANGED_READ_SIZE, max(MIN_RANGED_READ_SIZE, local_header_size + info.compress_size))
+    embedded_file = zf.open(info)
+    # compressed data can only be read from the start, so read through up to the start of the range
+    remaining = start
+    while remaining > 0:
+        remaining -= len(embedded_file.read(min(remaining, MAX_RANGED_READ_SIZE)))
+    return LimitedReader(embedded_file, length, info.filename, zf_obj)
+
+
 class ZipContentView(View):
 
     @xframe_options_exempt
@@ -128,57 +365,75 @@ class ZipContentView(View):
         # file size
         file_size = 0
 
+        try:
+            index = get_zip_index(storage, zipped_path, zipped_filename)
+        except zipfile.BadZipfile:
+            return HttpResponseServerError(
+                "Attempt to open zip file failed. Please try again, and if you continue to receive this message, please check that the zip file is valid."
+            )
+
         # if the zipfile does not exist on disk, return a 404
-        if not storage.exists(zipped_path):
+        if index is None:
             return HttpResponseNotFound('"%(filename)s" does not exist in storage' % {'filename': zipped_path})
 
         # if client has a cached version, use that (we can safely assume nothing has changed, due to MD5)
         if request.META.get('HTTP_IF_MODIFIED_SINCE'):
             return HttpResponseNotModified()
 
-        zf_obj = storage.open(zipped_path)
+        # if no path, or a directory, is being referenced, look for an index.html file
+        if not embedded_filepath or embedded_filepath.endswith("/"):
+            embedded_filepath += "index.html"
 
-        try:
-            with zipfile.ZipFile(zf_obj) as zf:
-                # if no path, or a directory, is being referenced, look for an index.html file
-                if not embedded_filepath or embedded_filepath.endswith("/"):
-                    embedded_filepath += "index.html"
+        zf_obj = StorageRangeFile(storage, zipped_path, index["size"])
 
-                # get the details about the embedded file, and ensure it exists
-                try:
-                    info = zf.getinfo(embedded_filepath)
-                except KeyError:
-                    return HttpResponseNotFound('"{}" does not exist inside "{}"'.format(embedded_filepath, zipped_filename))
+        with IndexedZipFile(zf_obj, index["infolist"]) as zf:
+            # get the details about the embedded file, and ensure it exists
+            try:
+                info = zf.getinfo(embedded_filepath)
+            except KeyError:
+                return HttpResponseNotFound('"{}" does not exist inside "{}"'.format(embedded_filepath, zipped_filename))
 
-                # try to guess the MIME type of the embedded file being referenced
-                content_type = mimetypes.guess_type(embedded_filepath)[0] or 'application/octet-stream'
+            # try to guess the MIME type of the embedded file being referenced
+            content_type = mimetypes.guess_type(embedded_filepath)[0] or 'application/octet-stream'
 
-                if embedded_filepath.endswith(".html") and request.GET.get("screenshot"):
-                    content_type = 'text/html'
+            # whether the response is the embedded file as it is, so that byte ranges of it can be requested
+            accept_ranges = False
 
-                    content = zf.open(info).read()
+            if embedded_filepath.endswith(".html") and request.GET.get("screenshot"):
+                content_type = 'text/html'
 
-                    response = HttpResponse(parse_html(content), content_type=content_type)
-                    file_size = info.file_size
-                elif not os.path.splitext(embedded_filepath)[1] == '.json':
-                    # generate a streaming response object, pulling data from within the zip  file
-                    response = FileResponse(zf.open(info), content_type=content_type)
-                    file_size = info.file_size
+                with closing(open_embedded_file(zf_obj, zf, info)) as embedded_file:
+                    content = embedded_file.read()
+
+                response = HttpResponse(parse_html(content), content_type=content_type)
+                file_size = info.file_size
+            elif not os.path.splitext(embedded_filepath)[1] == '.json':
+                accept_ranges = True
+                try:
+                    byte_range = parse_range_header(request.META.get("HTTP_RANGE"), info.file_size)
+                except RangeNotSatisfiable:
+                    response = HttpResponse(status=416)
+                    response["Content-Range"] = "bytes */{}".format(info.file_size)
+                    _add_access_control_headers(request, response)
+                    return response
+                # generate a streaming response object, pulling data from within the zip file
+                response = FileResponse(open_embedded_file(zf_obj, zf, info, byte_range), content_type=content_type)
+                if byte_range:
+                    start, end = byte_range
+                    response.status_code = 206
+                    response["Content-Range"] = "bytes {}-{}/{}".format(start, end, info.file_size)
+                    file_size = end - start + 1
                 else:
-                    # load the stream from json file into memory, replace the path_place_holder.
-                    content = zf.open(info).read()
-                    str_to_be_replaced = ('$' + exercises.IMG_PLACEHOLDER).encode()
-                    zipcontent = ('/' + request.resolver_match.url_name + "/" + zipped_filename).encode()
-                    content_with_path = content.replace(str_to_be_replaced, zipcontent)
-                    response = HttpResponse(content_with_path, content_type=content_type)
-                    file_size = len(content_with_path)
-        except zipfile.BadZipfile:
-            just_downloaded = getattr(zf_obj, 'just_downloaded', "Unknown (Most likely local file)")
-            capture_message("Unable to open zip file. File info: name={}, size={}, mode={}, just_downloaded={}".format(
-                zf_obj.name, zf_obj.size, zf_obj.mode, just_downloaded))
-            return HttpResponseServerError(
-                "Attempt to open zip file failed. Please try again, and if you continue to receive this message, please check that the zip file is valid."
-            )
+                    file_size = info.file_size
+            else:
+                # load the stream from json file into memory, replace the path_place_holder.
+                with closing(open_embedded_file(zf_obj, zf, info)) as embedded_file:
+                    content = embedded_file.read()
+                str_to_be_replaced = ('$' + exercises.IMG_PLACEHOLDER).encode()
+                zipcontent = ('/' + request.resolver_match.url_name + "/" + zipped_filename).encode()
+                content_with_path = content.replace(str_to_be_replaced, zipcontent)
+                response = HttpResponse(content_with_path, content_type=content_type)
+                file_size = len(content_with_path)
 
         # set the last-modified header to the date marked on the embedded file
         if info.date_time:
@@ -187,12 +442,12 @@ class ZipContentView(View):
         # cache these resources forever; this is safe due to the MD5-naming used on content files
         response["Expires"] = "Sun, 17-Jan-2038 19:14:07 GMT"
 
-        # set the content-length header to the size of the embedded file
+        # set the content-length header to the size of the embedded file, or the requested range of it
         if file_size:
             response["Content-Length"] = file_size
 
-        # ensure the browser knows not to try byte-range requests, as we don't support them here
-        response["Accept-Ranges"] = "none"
+        # byte ranges are only supported when serving the embedded file without modification
+        response["Accept-Ranges"] = "bytes" if accept_ranges else "none"
 
         _add_access_control_headers(request, response)
 
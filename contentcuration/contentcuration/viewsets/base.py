@@ -828,10 +828,10 @@ class BulkCreateMixin(CreateModelMixin):
                 errors.extend(changes)
         else:
             valid_data = []
-            for error, datum in zip(serializer.errors, data):
+            for error, datum, change in zip(serializer.errors, data, changes):
                 if error:
-                    datum.update({"errors": error})
-                    errors.append(datum)
+                    change.update({"errors": error})
+                    errors.append(change)
                 else:
                     valid_data.append(datum)
             if valid_data:
@@ -877,7 +877,7 @@ class BulkUpdateMixin(UpdateModelMixin):
                 ]
         else:
             valid_data = []
-            for error, datum in zip(serializer.errors, data):
+            for error, datum, change in zip(serializer.errors, data, changes):
                 if error:
                     # If the user does not have permission to write to this object
                     # it will throw a uniqueness validation error when trying to
@@ -891,8 +891,8 @@ class BulkUpdateMixin(UpdateModelMixin):
                         )
                     ):
                         error = ValidationError("Not found").detail
-                    datum.update({"errors": error})
-                    errors.append(datum)
+                    change.update({"errors": error})
+                    errors.append(change)
                 else:
                     valid_data.append(datum)
             if valid_data:
@@ -927,15 +927,17 @@ class BulkDeleteMixin(DestroyModelMixin):
         return errors
 
 
-@contextmanager
-def create_change_tracker(pk, table, channel_id, user, task_name):
+def create_change_task(pk, table, channel_id, user, task_name):
+    """
+    Creates the TaskResult that reports the progress of a change to clients, replacing any left
+    from earlier failures, and sets its id on the object of the change
+    """
     # Clean up any previous tasks specific to this in case there were failures.
     meta = json.dumps(dict(pk=pk, table=table))
     TaskResult.objects.filter(channel_id=channel_id, task_name=task_name, meta=meta).delete()
 
-    task_id = uuid.uuid4().hex
     task_object = TaskResult.objects.create(
-        task_id=task_id,
+        task_id=uuid.uuid4().hex,
         status=states.STARTED,
         channel_id=channel_id,
         task_name=task_name,
@@ -943,27 +945,52 @@ def create_change_tracker(pk, table, channel_id, user, task_name):
         meta=meta
     )
 
+    Change.create_change(
+        generate_update_event(pk, table, {TASK_ID: task_object.task_id}, channel_id=channel_id), applied=True
+    )
+    return task_object
+
+
+def get_change_task_tracker(task_object, channel_id):
+    """
+    :type task_object: TaskResult
+    :rtype: ProgressTracker
+    """
     def update_progress(progress=None):
         if progress:
             task_object.progress = progress
             task_object.save()
 
-    Change.create_change(
-        generate_update_event(pk, table, {TASK_ID: task_object.task_id}, channel_id=channel_id), applied=True
-    )
+    return ProgressTracker(task_object.task_id, update_progress, channel_id=channel_id)
+
+
+def fail_change_task(task_object):
+    """
+    Marks the task of a change as failed with the exception being handled
+    """
+    task_object.status = states.FAILURE
+    task_object.traceback = traceback.format_exc()
+    task_object.save()
+
+
+def finish_change_task(pk, table, channel_id, task_object):
+    """
+    Removes the task of a change that is done, unless it failed
+    """
+    if task_object.status == states.STARTED:
+        # No error reported, cleanup.
+        Change.create_change(
+            generate_update_event(pk, table, {TASK_ID: None}, channel_id=channel_id), applied=True
+        )
+        task_object.delete()
 
-    tracker = ProgressTracker(task_id, update_progress)
 
+@contextmanager
+def create_change_tracker(pk, table, channel_id, user, task_name):
+    task_object = create_change_task(pk, table, channel_id, user, task_name)
     try:
-        yield tracker
+        yield get_change_task_tracker(task_object, channel_id)
     except Exception:
-        task_object.status = states.FAILURE
-        task_object.traceback = traceback.format_exc()
-        task_object.save()
+        fail_change_task(task_object)
     finally:
-        if task_object.status == states.STARTED:
-            # No error reported, cleanup.
-            Change.create_change(
-                generate_update_event(pk, table, {TASK_ID: None}, channel_id=channel_id), applied=True
-            )
-            task_object.delete()
+        finish_change_task(pk, table, channel_id, task_object)
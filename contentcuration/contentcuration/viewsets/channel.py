@@ -5,13 +5,13 @@ from operator import or_
 from django.conf import settings
 from django.db import IntegrityError
 from django.db.models import Exists
+from django.db.models import F
 from django.db.models import OuterRef
 from django.db.models import Q
 from django.db.models import Subquery
 from django.db.models import Value
 from django.db.models.functions import Coalesce
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from django_cte import With
 from django_filters.rest_framework import BooleanFilter
 from django_filters.rest_framework import CharFilter
@@ -37,6 +37,7 @@ from contentcuration.models import File
 from contentcuration.models import generate_storage_url
 from contentcuration.models import SecretToken
 from contentcuration.models import User
+from contentcuration.utils.cache import catalog_cache
 from contentcuration.utils.garbage_collect import get_deleted_chefs_root
 from contentcuration.utils.pagination import CachedListPagination
 from contentcuration.utils.pagination import ValuesViewsetPageNumberPagination
@@ -378,6 +379,30 @@ channel_field_map = {
 }
 
 
+# Values of the main tree of channels are read from their ChannelSummary, and only computed
+# for channels without one, see contentcuration.utils.channel_summary
+_summary_modified = Coalesce(
+    F("summary__last_modified"),
+    Subquery(
+        ContentNode.objects.filter(tree_id=OuterRef("main_tree__tree_id"))
+        .values("modified")
+        .order_by("-modified")[:1]
+    ),
+)
+
+_summary_count = Coalesce(
+    F("summary__resource_count"),
+    SQCount(
+        ContentNode.objects.filter(tree_id=OuterRef("main_tree__tree_id"))
+        .exclude(kind_id=content_kinds.TOPIC)
+        .order_by("content_id")
+        .distinct("content_id")
+        .values_list("content_id", flat=True),
+        field="content_id",
+    ),
+)
+
+
 def _unpublished_changes_query(channel):
     """
     :param channel: Either an `OuterRef` or `Channel` object
@@ -421,14 +446,7 @@ class ChannelViewSet(ValuesViewset):
         user_id = not self.request.user.is_anonymous and self.request.user.id
         user_queryset = User.objects.filter(id=user_id)
         # Add the last modified node modified value as the channel last modified
-        channel_main_tree_nodes = ContentNode.objects.filter(
-            tree_id=OuterRef("main_tree__tree_id")
-        )
-        queryset = queryset.annotate(
-            modified=Subquery(
-                channel_main_tree_nodes.values("modified").order_by("-modified")[:1]
-            )
-        )
+        queryset = queryset.annotate(modified=_summary_modified)
 
         return queryset.annotate(
             edit=Exists(user_queryset.filter(editable_channels=OuterRef("id"))),
@@ -437,23 +455,17 @@ class ChannelViewSet(ValuesViewset):
 
     def annotate_queryset(self, queryset):
         queryset = queryset.annotate(primary_token=primary_token_subquery)
-        channel_main_tree_nodes = ContentNode.objects.filter(
-            tree_id=OuterRef("main_tree__tree_id")
-        )
 
         # Add the unique count of distinct non-topic node content_ids
-        non_topic_content_ids = (
-            channel_main_tree_nodes.exclude(kind_id=content_kinds.TOPIC)
-            .values_list("content_id", flat=True)
-            .order_by()
-        )
+        queryset = queryset.annotate(count=_summary_count)
 
         queryset = queryset.annotate(
-            count=SQCount(non_topic_content_ids, field="content_id"),
+            unpublished_changes=Coalesce(
+                F("summary__has_unpublished_changes"),
+                Exists(_unpublished_changes_query(OuterRef("id"))),
+            )
         )
 
-        queryset = queryset.annotate(unpublished_changes=Exists(_unpublished_changes_query(OuterRef("id"))))
-
         return queryset
 
     def publish_from_changes(self, changes):
@@ -608,9 +620,7 @@ class ChannelViewSet(ValuesViewset):
 
 
 @method_decorator(
-    cache_page(
-        settings.PUBLIC_CHANNELS_CACHE_DURATION, key_prefix="public_catalog_list"
-    ),
+    catalog_cache.cache_page(settings.PUBLIC_CHANNELS_CACHE_DURATION),
     name="dispatch",
 )
 @method_decorator(cache_no_user_data, name="dispatch")
@@ -646,26 +656,10 @@ class CatalogViewSet(ReadOnlyValuesViewset):
 
     def annotate_queryset(self, queryset):
         queryset = queryset.annotate(primary_token=primary_token_subquery)
-        channel_main_tree_nodes = ContentNode.objects.filter(
-            tree_id=OuterRef("main_tree__tree_id")
-        )
         # Add the last modified node modified value as the channel last modified
-        queryset = queryset.annotate(
-            modified=Subquery(
-                channel_main_tree_nodes.values("modified").order_by("-modified")[:1]
-            )
-        )
+        queryset = queryset.annotate(modified=_summary_modified)
         # Add the unique count of distinct non-topic node content_ids
-        non_topic_content_ids = (
-            channel_main_tree_nodes.exclude(kind_id=content_kinds.TOPIC)
-            .order_by("content_id")
-            .distinct("content_id")
-            .values_list("content_id", flat=True)
-        )
-
-        queryset = queryset.annotate(
-            count=SQCount(non_topic_content_ids, field="content_id"),
-        )
+        queryset = queryset.annotate(count=_summary_count)
         return queryset
 
 
@@ -741,13 +735,8 @@ class AdminChannelViewSet(ChannelViewSet):
         instance.delete()
 
     def get_queryset(self):
-        channel_main_tree_nodes = ContentNode.objects.filter(
-            tree_id=OuterRef("main_tree__tree_id")
-        )
         queryset = Channel.objects.all().annotate(
-            modified=Subquery(
-                channel_main_tree_nodes.values("modified").order_by("-modified")[:1]
-            ),
+            modified=_summary_modified,
             primary_token=primary_token_subquery,
         )
         return queryset
@@ -784,7 +773,7 @@ class AdminChannelViewSet(ChannelViewSet):
         queryset = queryset.annotate(
             editors_count=SQCount(editors_query, field="id"),
             viewers_count=SQCount(viewers_query, field="id"),
-            size=SQSum(file_query, field="file_size"),
+            size=Coalesce(F("summary__size"), SQSum(file_query, field="file_size")),
         )
         return queryset
 
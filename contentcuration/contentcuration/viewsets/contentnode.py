@@ -46,18 +46,23 @@ from contentcuration.models import AssessmentItem
 from contentcuration.models import Change
 from contentcuration.models import Channel
 from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeCopy
 from contentcuration.models import ContentTag
 from contentcuration.models import File
 from contentcuration.models import generate_storage_url
 from contentcuration.models import PrerequisiteContentRelationship
 from contentcuration.models import UUIDField
 from contentcuration.tasks import calculate_resource_size_task
+from contentcuration.utils.node_aggregates import CONTRIBUTION_FIELDS
+from contentcuration.utils.node_aggregates import stored_aggregate
+from contentcuration.utils.node_aggregates import stored_aggregate_exists
+from contentcuration.utils.node_aggregates import track_node_updates
+from contentcuration.utils.node_copy import start_copy
 from contentcuration.utils.nodes import calculate_resource_size
 from contentcuration.utils.nodes import migrate_extra_fields
 from contentcuration.viewsets.base import BulkListSerializer
 from contentcuration.viewsets.base import BulkModelSerializer
 from contentcuration.viewsets.base import BulkUpdateMixin
-from contentcuration.viewsets.base import create_change_tracker
 from contentcuration.viewsets.base import RequiredFilterSet
 from contentcuration.viewsets.base import ValuesViewset
 from contentcuration.viewsets.common import DotPathValueMixin
@@ -67,7 +72,6 @@ from contentcuration.viewsets.common import SQCount
 from contentcuration.viewsets.common import UserFilteredPrimaryKeyRelatedField
 from contentcuration.viewsets.common import UUIDInFilter
 from contentcuration.viewsets.sync.constants import CONTENTNODE
-from contentcuration.viewsets.sync.constants import COPYING_FLAG
 from contentcuration.viewsets.sync.constants import CREATED
 from contentcuration.viewsets.sync.constants import DELETED
 from contentcuration.viewsets.sync.utils import generate_update_event
@@ -243,9 +247,17 @@ class ContentNodeListSerializer(BulkListSerializer):
         modified = now()
         for data in all_validated_data:
             data["modified"] = modified
-        all_objects = super(ContentNodeListSerializer, self).update(
-            queryset, all_validated_data
-        )
+        # Keep the stored descendant counts of the ancestors of the updated nodes up to date,
+        # the validated data of the kind being keyed by the name of the relation
+        tracked_ids = [
+            self.child.id_value_lookup(data)
+            for data in all_validated_data
+            if any(field in data for field in CONTRIBUTION_FIELDS + ("kind",))
+        ]
+        with track_node_updates(tracked_ids):
+            all_objects = super(ContentNodeListSerializer, self).update(
+                queryset, all_validated_data
+            )
         if tags:
             set_tags(tags)
         return all_objects
@@ -825,18 +837,31 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             .distinct()
         )
 
+        # Read the stored descendant counts, and only count the descendants of
+        # nodes that don't have them, see contentcuration.utils.node_aggregates
         queryset = queryset.annotate(
-            resource_count=SQCount(descendant_resources, field="id"),
-            coach_count=SQCount(
-                descendant_resources.filter(role_visibility=roles.COACH), field="id",
+            resource_count=Coalesce(
+                stored_aggregate("resource_count"),
+                SQCount(descendant_resources, field="id"),
+            ),
+            coach_count=Coalesce(
+                stored_aggregate("coach_count"),
+                SQCount(
+                    descendant_resources.filter(role_visibility=roles.COACH), field="id",
+                ),
             ),
             assessment_item_count=SQCount(assessment_items, field="assessment_id"),
-            error_count=SQCount(descendant_errors, field="id"),
-            has_updated_descendants=Exists(
-                changed_descendants.filter(published=True).values("id")
+            error_count=Coalesce(
+                stored_aggregate("error_count"),
+                SQCount(descendant_errors, field="id"),
             ),
-            has_new_descendants=Exists(
-                changed_descendants.filter(published=False).values("id")
+            has_updated_descendants=Coalesce(
+                stored_aggregate_exists("updated_count"),
+                Exists(changed_descendants.filter(published=True).values("id")),
+            ),
+            has_new_descendants=Coalesce(
+                stored_aggregate_exists("new_count"),
+                Exists(changed_descendants.filter(published=False).values("id")),
             ),
             thumbnail_checksum=Subquery(thumbnails.values("checksum")[:1]),
             thumbnail_extension=Subquery(
@@ -938,7 +963,7 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
         # Affected channel for the copy is the target's channel
         channel_id = target.channel_id
 
-        if ContentNode.filter_by_pk(pk=pk).exists():
+        if ContentNode.filter_by_pk(pk=pk).exists() or ContentNodeCopy.objects.filter(pk=pk).exists():
             error = ValidationError("Copy pk already exists")
             return str(error)
 
@@ -946,28 +971,18 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             ContentNode.filter_by_pk(pk=source.id), user=self.request.user
         ).exists()
 
-        with create_change_tracker(pk, CONTENTNODE, channel_id, self.request.user, "copy_nodes") as progress_tracker:
-
-            new_node = source.copy_to(
-                target,
-                position,
-                pk,
-                mods,
-                excluded_descendants,
-                can_edit_source_channel=can_edit_source_channel,
-                progress_tracker=progress_tracker,
-            )
-
-            Change.create_change(
-                generate_update_event(
-                    pk,
-                    CONTENTNODE,
-                    {COPYING_FLAG: False, "node_id": new_node.node_id},
-                    channel_id=channel_id
-                ),
-                applied=True,
-                created_by_id=self.request.user.id,
-            )
+        # Large copies are continued in the background, see contentcuration.utils.node_copy
+        start_copy(
+            source,
+            target,
+            position,
+            pk,
+            mods,
+            excluded_descendants,
+            can_edit_source_channel,
+            self.request.user,
+            channel_id,
+        )
 
         return None
 
@@ -1,8 +1,12 @@
 from collections import OrderedDict
 
+from django.db import transaction
+from search.indexing import queue_search_index_changes
 from search.viewsets.savedsearch import SavedSearchViewSet
 
 from contentcuration.decorators import delay_user_storage_calculation
+from contentcuration.models import Change
+from contentcuration.utils.change_feed import record_changes
 from contentcuration.viewsets.assessmentitem import AssessmentItemViewSet
 from contentcuration.viewsets.bookmark import BookmarkViewSet
 from contentcuration.viewsets.channel import ChannelViewSet
@@ -97,33 +101,191 @@ event_handlers = {
 }
 
 
-@delay_user_storage_calculation
-def apply_changes(changes_queryset):
-    changes = changes_queryset.order_by("server_rev").select_related("created_by")
+# Change types whose handlers operate on the whole list of changes at once, so that
+# consecutive changes of the same type can be applied together. Other change types
+# (moves, copies, publishes...) are long running or depend on the result of the
+# previous change, so are still applied one at a time.
+BATCHED_CHANGE_TYPES = {CREATED, UPDATED, DELETED}
+
+# Maximum number of changes passed to a single event handler call
+CHANGE_BATCH_SIZE = 100
+
+
+def _get_batch_key(change):
+    return change.table, int(change.change_type), change.created_by_id
+
+
+def _key_in_batch(key, batch):
+    return any(change_dict["key"] == key for _, change_dict in batch)
+
+
+def _batch_changes(changes):
+    """
+    Groups consecutive changes made by the same user to the same table with the same
+    change type, yielding lists of (change, change_dict) tuples in server_rev order.
+    A change to an object that already has a change in the current batch starts a new batch,
+    so that it is applied after the change it follows.
+    """
+    batch = []
+    batch_key = None
     for change in changes:
-        # Assume an error, this will be updated
-        # in the case there isn't!
-        changed_fields = ("errored", "kwargs")
-        table_name = change.table
+        change_dict = change.serialize_to_change_dict()
+        key = _get_batch_key(change)
+        if (
+            batch
+            and key == batch_key
+            and key[1] in BATCHED_CHANGE_TYPES
+            and len(batch) < CHANGE_BATCH_SIZE
+            and not _key_in_batch(change_dict["key"], batch)
+        ):
+            batch.append((change, change_dict))
+        else:
+            if batch:
+                yield batch
+            batch = [(change, change_dict)]
+            batch_key = key
+    if batch:
+        yield batch
+
+
+def _match_errors(batch, errors):
+    """
+    Event handlers return errors either as the change dicts they were passed, updated with an
+    `errors` value, or as new dicts containing the key of the change, so match them up with
+    the changes in the batch, by identity first, and then by key.
+    """
+    change_errors = {}
+    unmatched = []
+    by_identity = {id(change_dict): change for change, change_dict in batch}
+    for error in errors:
+        change = by_identity.get(id(error))
+        if change is not None:
+            change_errors[change.server_rev] = error["errors"]
+        else:
+            unmatched.append(error)
+    for error in unmatched:
+        for change, change_dict in batch:
+            if change.server_rev not in change_errors and change_dict["key"] == error.get("key"):
+                change_errors[change.server_rev] = error["errors"]
+                break
+        else:
+            # If an error can't be matched to a change, we can't tell which changes
+            # were applied, so mark them all as errored.
+            for change, _ in batch:
+                change_errors.setdefault(change.server_rev, error["errors"])
+    return change_errors
+
+
+def _apply_batch(batch):
+    """
+    Applies a batch of changes with a single call to the event handler of the viewset.
+    Returns a dict of errors for the changes in the batch that were not applied,
+    keyed by their server_rev, or None if there is no event handler for the change type.
+    """
+    change = batch[0][0]
+    viewset_class = viewset_mapping[change.table]
+    change_type = int(change.change_type)
+    viewset = viewset_class()
+    viewset.sync_initial(change.created_by)
+    if change_type not in event_handlers:
+        return None
+    event_handler = getattr(viewset, event_handlers[change_type], None)
+    if event_handler is None:
+        raise ChangeNotAllowed(change_type, viewset_class)
+    errors = event_handler([change_dict for _, change_dict in batch])
+    return _match_errors(batch, errors or [])
+
+
+class ChangesErrored(Exception):
+    """
+    Raised to roll back the writes of changes that an event handler returned errors for, as the
+    handlers catch their own exceptions, including database errors that abort the transaction.
+    """
+
+    def __init__(self, change_errors):
+        self.change_errors = change_errors
+        super(ChangesErrored, self).__init__("{} changes errored".format(len(change_errors)))
+
+
+def _apply_atomic(batch):
+    with transaction.atomic():
+        change_errors = _apply_batch(batch)
+        if change_errors:
+            raise ChangesErrored(change_errors)
+    return change_errors
+
+
+def _apply_each(batch):
+    """
+    Applies the changes of a batch one by one, each in its own transaction or savepoint, so
+    that only the changes that fail are errored and rolled back.
+    """
+    change_errors = {}
+    for change, _ in batch:
+        # Serialize the change again, as the handler may have updated the dict in the failed batch
+        change_dict = change.serialize_to_change_dict()
         try:
-            viewset_class = viewset_mapping[table_name]
-            change_type = change.change_type
-            change_type = int(change_type)
-            viewset = viewset_class()
-            viewset.sync_initial(change.created_by)
-            if change_type in event_handlers:
-                event_handler = getattr(viewset, event_handlers[change_type], None)
-                if event_handler is None:
-                    raise ChangeNotAllowed(change_type, viewset_class)
-                errors = event_handler([change.serialize_to_change_dict()])
-                if errors:
-                    change.errored = True
-                    change.kwargs["errors"] = errors[0]["errors"]
-                else:
-                    change.applied = True
-                    changed_fields = ("applied",)
+            if _apply_atomic([(change, change_dict)]) is None:
+                return None
+        except ChangesErrored as e:
+            change_errors.update(e.change_errors)
         except Exception as e:
-            log_sync_exception(e, user=change.created_by, change=change.serialize_to_change_dict())
-            change.errored = True
-            change.kwargs["errors"] = [str(e)]
-        change.save(update_fields=changed_fields)
+            log_sync_exception(e, user=change.created_by, change=change_dict)
+            change_errors[change.server_rev] = [str(e)]
+    return change_errors
+
+
+def _apply_unwrapped(batch):
+    """
+    Applies a change that is not batched without a wrapping transaction, as its handler may run
+    for a long time and commits writes of its own, such as the progress or failure of its task,
+    or rows that the tasks it enqueues need to see.
+    """
+    change, change_dict = batch[0]
+    try:
+        return _apply_batch(batch)
+    except Exception as e:
+        log_sync_exception(e, user=change.created_by, change=change_dict)
+        return {change.server_rev: [str(e)]}
+
+
+def _apply_batch_or_each(batch):
+    """
+    Applies a batch of changes atomically, falling back to applying the changes one by one if
+    any change in the batch errors, so that one bad change does not cause the rest of its batch
+    to error, nor roll back the changes that were applied before it.
+    Changes of types that are not batched are applied as they are, see `_apply_unwrapped`.
+    """
+    if int(batch[0][0].change_type) not in BATCHED_CHANGE_TYPES:
+        return _apply_unwrapped(batch)
+    if len(batch) > 1:
+        try:
+            return _apply_atomic(batch)
+        except Exception:
+            pass
+    return _apply_each(batch)
+
+
+@delay_user_storage_calculation
+def apply_changes(changes_queryset):
+    changes = changes_queryset.order_by("server_rev").select_related("created_by")
+    for batch in _batch_changes(changes):
+        change_errors = _apply_batch_or_each(batch)
+        if change_errors is None:
+            continue
+        applied = []
+        errored = []
+        for change, _ in batch:
+            if change.server_rev in change_errors:
+                change.errored = True
+                change.kwargs["errors"] = change_errors[change.server_rev]
+                errored.append(change)
+            else:
+                change.applied = True
+                applied.append(change)
+        if applied:
+            Change.objects.filter(server_rev__in=[change.server_rev for change in applied]).update(applied=True)
+            queue_search_index_changes(applied)
+        if errored:
+            Change.objects.bulk_update(errored, ["errored", "kwargs"])
+        record_changes(applied + errored)
@@ -4,6 +4,7 @@ and deals with processing all the changes to make appropriate
 bulk creates, updates, and deletes.
 """
 from celery import states
+from django.conf import settings
 from django.db.models import Q
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.permissions import IsAuthenticated
@@ -15,6 +16,8 @@ from contentcuration.models import Channel
 from contentcuration.models import TaskResult
 from contentcuration.tasks import apply_channel_changes_task
 from contentcuration.tasks import apply_user_changes_task
+from contentcuration.utils.change_feed import get_latest_revs
+from contentcuration.utils.change_feed import wait_for_changes
 from contentcuration.viewsets.sync.constants import CHANNEL
 from contentcuration.viewsets.sync.constants import CREATED
 
@@ -72,20 +75,44 @@ class SyncView(APIView):
             channel_revs = {channel_id: channel_revs[channel_id] for channel_id in channel_ids}
         return channel_revs
 
-    def return_changes(self, request, channel_revs):
+    def get_change_filter(self, request, channel_revs):
         user_rev = request.data.get("user_rev") or 0
         unapplied_revs = request.data.get("unapplied_revs", [])
-        session_key = request.session.session_key
 
-        unapplied_revs_filter = Q(server_rev__in=unapplied_revs)
+        # Only query for changes to channels, or the user, that have had changes since the last poll,
+        # according to the latest revs recorded in the change feed.
+        latest_channel_revs, latest_user_rev = get_latest_revs(channel_revs.keys(), user_id=request.user.id)
 
-        # Create a filter that returns all applied changes, and any errored changes made by this session
-        relevant_to_session_filter = (Q(applied=True) | Q(errored=True, session_id=session_key))
+        change_filter = Q()
 
-        change_filter = (Q(user=request.user) & (unapplied_revs_filter | Q(server_rev__gt=user_rev)) & relevant_to_session_filter)
+        if latest_user_rev is None or latest_user_rev > user_rev:
+            change_filter |= Q(user=request.user, server_rev__gt=user_rev)
 
         for channel_id, rev in channel_revs.items():
-            change_filter |= (Q(channel_id=channel_id) & (unapplied_revs_filter | Q(server_rev__gt=rev)) & relevant_to_session_filter)
+            rev = rev or 0
+            latest_rev = latest_channel_revs.get(channel_id)
+            if latest_rev is None or latest_rev > rev:
+                change_filter |= Q(channel_id=channel_id, server_rev__gt=rev)
+
+        if unapplied_revs:
+            # Changes made by this session may be applied after changes that have already been returned,
+            # so look them up by their server_rev.
+            change_filter |= Q(server_rev__in=unapplied_revs) & (Q(user=request.user) | Q(channel_id__in=list(channel_revs.keys())))
+
+        return change_filter
+
+    def return_changes(self, request, channel_revs):
+        session_key = request.session.session_key
+
+        change_filter = self.get_change_filter(request, channel_revs)
+
+        if not change_filter:
+            return {}
+
+        # Only return applied changes, and any errored changes made by this session
+        relevant_to_session_filter = (Q(applied=True) | Q(errored=True, session_id=session_key))
+
+        change_filter &= relevant_to_session_filter
 
         changes_to_return = list(
             Change.objects.filter(
@@ -157,3 +184,32 @@ class SyncView(APIView):
         response_payload.update(self.return_tasks(request, channel_revs))
 
         return Response(response_payload)
+
+
+class SyncWaitView(SyncView):
+    """
+    A long poll endpoint that holds the request open until there are new changes for the channels,
+    or the user, after the revs the client has, or until task progress is reported for the channels.
+    Clients then fetch the changes from the sync endpoint, so idle clients don't have to poll it.
+    """
+
+    def get_timeout(self, request):
+        """
+        :return: The number of seconds to wait for, which clients can lower with `timeout`, but never
+                 above SYNC_WAIT_TIMEOUT, as a worker is held for as long as the request waits
+        """
+        try:
+            timeout = float(request.data.get("timeout", settings.SYNC_WAIT_TIMEOUT))
+        except (TypeError, ValueError):
+            timeout = settings.SYNC_WAIT_TIMEOUT
+        return min(max(timeout, 0), settings.SYNC_WAIT_TIMEOUT)
+
+    def post(self, request):
+        channel_revs = self.get_channel_revs(request)
+        changed = wait_for_changes(
+            channel_revs,
+            user_id=request.user.id,
+            user_rev=request.data.get("user_rev") or 0,
+            timeout=self.get_timeout(request),
+        )
+        return Response({"changed": changed})
@@ -1,7 +1,9 @@
 import logging
+import multiprocessing
 import os
 import shutil
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from datetime import timedelta
 
@@ -9,6 +11,7 @@ from django.conf import settings
 from django.core.files.storage import default_storage as storage
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.db.models import F
 from django.db.models import Q
 from django.utils import timezone
@@ -26,8 +29,23 @@ from contentcuration.utils.publish import create_content_database
 logger = logging.getLogger(__file__)
 
 
+def _export_channel_in_worker(channel_id):
+    try:
+        return Command()._try_export_channel(channel_id)
+    finally:
+        connections.close_all()
+
+
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="The number of worker processes to export channels with, each exporting one channel at a time",
+        )
+
     def _republish_problem_channels(self):
         twenty_19 = datetime(year=2019, month=1, day=1)
         five_minutes = timedelta(minutes=5)
@@ -66,18 +84,29 @@ class Command(BaseCommand):
                     mapper = ChannelMapper(channel)
                     mapper.run()
 
+    def _try_export_channel(self, channel_id):
+        """
+        :return: Whether the channel was exported
+        """
+        try:
+            self._export_channel(channel_id)
+            return True
+        except FileNotFoundError:
+            logger.warning("Tried to export channel {} to kolibri_public but its published channel database could not be found".format(channel_id))
+        except Exception as e:
+            logger.exception("Failed to export channel {} to kolibri_public because of error: {}".format(channel_id, e))
+        return False
+
     def handle(self, *args, **options):
         self._republish_problem_channels()
         public_channel_ids = set(Channel.objects.filter(public=True, deleted=False, main_tree__published=True).values_list("id", flat=True))
         kolibri_public_channel_ids = set(ChannelMetadata.objects.all().values_list("id", flat=True))
         ids_to_export = public_channel_ids.difference(kolibri_public_channel_ids)
-        count = 0
-        for channel_id in ids_to_export:
-            try:
-                self._export_channel(channel_id)
-                count += 1
-            except FileNotFoundError:
-                logger.warning("Tried to export channel {} to kolibri_public but its published channel database could not be found".format(channel_id))
-            except Exception as e:
-                logger.exception("Failed to export channel {} to kolibri_public because of error: {}".format(channel_id, e))
+        if options["workers"] > 1:
+            # Close the connections of this process, so that the forked worker processes do not share them
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options["workers"], mp_context=multiprocessing.get_context("fork")) as executor:
+                count = sum(executor.map(_export_channel_in_worker, ids_to_export))
+        else:
+            count = sum(map(self._try_export_channel, ids_to_export))
         logger.info("Successfully put {} channels into kolibri_public".format(count))
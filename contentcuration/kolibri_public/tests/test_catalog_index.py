@@ -0,0 +1,213 @@
+import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from kolibri_public import models
+from kolibri_public.search import annotate_label_bitmasks
+from kolibri_public.tests.base import ChannelBuilder
+from kolibri_public.utils import catalog_index
+from kolibri_public.utils.catalog_index import CatalogIndex
+from kolibri_public.utils.catalog_index import get_catalog_index
+from kolibri_public.utils.catalog_index import invalidate_catalog_index
+from kolibri_public.views import ContentNodeFilter
+from le_utils.constants import content_kinds
+from le_utils.constants.labels.learning_activities import LEARNINGACTIVITIESLIST
+from le_utils.constants.labels.subjects import SUBJECTSLIST
+from rest_framework.test import APITestCase
+
+from contentcuration.models import Language
+
+
+class CatalogIndexTestBase(object):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("loadconstants")
+        builder = ChannelBuilder()
+        builder.insert_into_default_db()
+        other_builder = ChannelBuilder(levels=2, num_children=4)
+        other_builder.insert_into_default_db()
+        models.ContentNode.objects.all().update(available=True)
+        annotate_label_bitmasks(models.ContentNode.objects.all())
+        cls.root = models.ContentNode.objects.get(id=builder.root_node["id"])
+        cls.other_root = models.ContentNode.objects.get(id=other_builder.root_node["id"])
+        cls.language = Language.objects.first()
+        leaves = models.ContentNode.objects.exclude(kind=content_kinds.TOPIC).order_by("id")
+        models.ContentNode.objects.filter(id__in=leaves.values_list("id", flat=True)[:5]).update(
+            lang=cls.language
+        )
+        models.ContentNode.objects.filter(id__in=leaves.values_list("id", flat=True)[5:10]).update(
+            coach_content=True
+        )
+        models.ContentNode.objects.filter(id__in=leaves.values_list("id", flat=True)[10:12]).update(
+            available=False
+        )
+        cls.topic = models.ContentNode.objects.filter(kind=content_kinds.TOPIC, parent=cls.root).first()
+
+
+class CatalogIndexTestCase(CatalogIndexTestBase, TestCase):
+    def setUp(self):
+        super(CatalogIndexTestCase, self).setUp()
+        self.index = CatalogIndex.build()
+
+    def _assert_filter(self, params):
+        filterset = ContentNodeFilter(
+            params, queryset=models.ContentNode.objects.filter(available=True)
+        )
+        self.assertTrue(filterset.is_valid())
+        expected = list(
+            filterset.qs.order_by("lft", "id").distinct().values_list("id", flat=True)
+        )
+        matches = self.index.filter(
+            {name: value for name, value in filterset.form.cleaned_data.items() if name in params}
+        )
+        self.assertIsNotNone(matches)
+        self.assertEqual([node_id for _, node_id in self.index.iter_matches(matches)], expected)
+        return expected
+
+    def test_all(self):
+        self.assertEqual(len(self._assert_filter({})), models.ContentNode.objects.filter(available=True).count())
+
+    def test_channels(self):
+        self.assertTrue(self._assert_filter({"channels": self.root.channel_id}))
+        self.assertTrue(self._assert_filter({"channel_id": self.other_root.channel_id}))
+        self._assert_filter({"channels": ",".join([self.root.channel_id, self.other_root.channel_id])})
+
+    def test_tree_id(self):
+        self.assertTrue(self._assert_filter({"tree_id": self.other_root.tree_id}))
+
+    def test_kind(self):
+        self.assertTrue(self._assert_filter({"kind": content_kinds.TOPIC}))
+        self.assertTrue(self._assert_filter({"kind": "content"}))
+        self._assert_filter({"kind_in": ",".join([content_kinds.VIDEO, content_kinds.EXERCISE])})
+
+    def test_languages(self):
+        self.assertEqual(len(self._assert_filter({"languages": self.language.id})), 5)
+
+    def test_include_coach_content(self):
+        self._assert_filter({"include_coach_content": "false"})
+        self._assert_filter({"include_coach_content": "true"})
+
+    def test_labels(self):
+        self._assert_filter({"learning_activities": ",".join(LEARNINGACTIVITIESLIST[:2])})
+        self._assert_filter({"categories": SUBJECTSLIST[0], "learning_activities": LEARNINGACTIVITIESLIST[0]})
+        self._assert_filter({"categories": "not_a_category"})
+
+    def test_descendant_of(self):
+        self.assertTrue(self._assert_filter({"descendant_of": self.topic.id}))
+        self.assertFalse(self._assert_filter({"descendant_of": "a" * 32}))
+
+    def test_parent(self):
+        self.assertTrue(self._assert_filter({"parent": self.root.id}))
+        self._assert_filter({"parent": self.topic.id, "kind": "content"})
+
+    def test_lft__gt(self):
+        self._assert_filter({"lft__gt": 5})
+        self._assert_filter({"lft__gt": 5, "channels": self.root.channel_id})
+
+    def test_unsupported_filter(self):
+        self.assertIsNone(self.index.filter({"keywords": "Test"}))
+
+    def test_iter_matches_lft__gt(self):
+        expected = list(
+            models.ContentNode.objects.filter(available=True, lft__gt=3)
+            .order_by("lft", "id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(
+            [node_id for _, node_id in self.index.iter_matches(self.index.all, lft__gt=3)], expected
+        )
+
+    def test_labels_output(self):
+        matches = self.index.filter({"channels": [self.root.channel_id]})
+        labels = self.index.get_labels(matches)
+        self.assertEqual(labels["channels"], [{"id": self.root.channel_id, "name": "testing"}])
+        self.assertEqual(labels["languages"], [{"id": self.language.id, "lang_name": self.language.native_name}])
+        self.assertEqual(labels["learning_activities"], [
+            label for label in LEARNINGACTIVITIESLIST
+            if models.ContentNode.objects.filter(
+                available=True, channel_id=self.root.channel_id, learning_activities__contains=label
+            ).exists()
+        ])
+
+
+class CatalogIndexVersionTestCase(TestCase):
+    def tearDown(self):
+        catalog_index._catalog_index = None
+        cache.clear()
+        super(CatalogIndexVersionTestCase, self).tearDown()
+
+    @override_settings(PUBLIC_CATALOG_INDEX=False)
+    def test_disabled(self):
+        self.assertIsNone(get_catalog_index())
+
+    @override_settings(PUBLIC_CATALOG_INDEX=True)
+    @mock.patch("kolibri_public.utils.catalog_index.threading.Thread")
+    def test_rebuilds_when_invalidated(self, thread_mock):
+        self.assertIsNone(get_catalog_index())
+        self.assertEqual(thread_mock.call_count, 1)
+        version = thread_mock.call_args[1]["args"][0]
+        catalog_index._build_lock.release()
+
+        catalog_index._catalog_index = CatalogIndex.build(version=version)
+        self.assertIs(get_catalog_index(), catalog_index._catalog_index)
+
+        invalidate_catalog_index()
+        self.assertIsNone(get_catalog_index())
+        self.assertEqual(thread_mock.call_count, 2)
+        catalog_index._build_lock.release()
+
+
+class CatalogIndexAPITestCase(CatalogIndexTestBase, APITestCase):
+    def tearDown(self):
+        cache.clear()
+        super(CatalogIndexAPITestCase, self).tearDown()
+
+    def _get_all_pages(self, data):
+        ids = []
+        response = self.client.get(reverse("publiccontentnode-list"), data=data)
+        labels = response.data["labels"]
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(node["id"] for node in response.data["results"])
+            if response.data["more"] is None:
+                return ids, labels
+            response = self.client.get(reverse("publiccontentnode-list"), data=response.data["more"])
+
+    def _assert_same_as_database(self, data):
+        expected_ids, expected_labels = self._get_all_pages(data)
+        cache.clear()
+        index = CatalogIndex.build()
+        with mock.patch("kolibri_public.views.get_catalog_index", return_value=index), mock.patch.object(
+            CatalogIndex, "iter_matches", autospec=True, side_effect=CatalogIndex.iter_matches
+        ) as iter_matches:
+            ids, labels = self._get_all_pages(data)
+        self.assertTrue(iter_matches.called)
+        self.assertEqual(ids, expected_ids)
+        for key in expected_labels:
+            self.assertEqual(
+                sorted(expected_labels[key], key=str), sorted(labels[key], key=str), key
+            )
+
+    def test_list(self):
+        self._assert_same_as_database({"max_results": 7})
+
+    def test_list_filtered(self):
+        self._assert_same_as_database(
+            {"max_results": 3, "descendant_of": self.root.id, "include_coach_content": False}
+        )
+        self._assert_same_as_database(
+            {"max_results": 5, "channels": self.other_root.channel_id, "kind": "content"}
+        )
+
+    def test_unsupported_filter_uses_database(self):
+        with mock.patch(
+            "kolibri_public.views.get_catalog_index", return_value=CatalogIndex.build()
+        ), mock.patch.object(CatalogIndex, "iter_matches") as iter_matches:
+            response = self.client.get(
+                reverse("publiccontentnode-list"), data={"max_results": 5, "keywords": "Test"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertFalse(iter_matches.called)
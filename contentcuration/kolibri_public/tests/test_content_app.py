@@ -7,6 +7,9 @@ from calendar import timegm
 
 from django.core.cache import cache
 from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.http import http_date
 from kolibri_public import models
@@ -375,6 +378,40 @@ class ContentNodeAPITestCase(ContentNodeAPIBase, APITestCase):
         )
         self.assertEqual(set(response.data["tags"]), set(tags))
 
+    def _get_ids_num_queries(self, nodes):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("publiccontentnode-list"),
+                data={"ids": ",".join(node.id for node in nodes)},
+            )
+        self.assertEqual(len(response.data), len(nodes))
+        return len(context.captured_queries)
+
+    def test_contentnode_list_constant_queries(self):
+        nodes = list(models.ContentNode.objects.filter(available=True))
+        self.assertEqual(
+            self._get_ids_num_queries(nodes[:2]), self._get_ids_num_queries(nodes)
+        )
+
+    def test_contentnode_payload_cached_for_channel_version(self):
+        url = reverse("publiccontentnode-detail", kwargs={"pk": self.root.id})
+        with CaptureQueriesContext(connection) as uncached_context:
+            response = self.client.get(url)
+        self.assertEqual(response.data["title"], self.root.title)
+        models.ContentNode.objects.filter(id=self.root.id).update(title="New title")
+
+        with CaptureQueriesContext(connection) as cached_context:
+            response = self.client.get(url)
+        self.assertEqual(response.data["title"], self.root.title)
+        self.assertEqual(
+            len(cached_context.captured_queries), len(uncached_context.captured_queries) - 2
+        )
+
+        models.ChannelMetadata.objects.filter(id=self.root.channel_id).update(version=F("version") + 1)
+        response = self.client.get(url)
+        self.assertEqual(response.data["title"], "New title")
+
     def test_channelmetadata_list(self):
         response = self.client.get(reverse("publicchannel-list", kwargs={}))
         self.assertEqual(response.data[0]["name"], "testing")
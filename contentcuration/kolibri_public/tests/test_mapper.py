@@ -1,6 +1,7 @@
 import os
 import tempfile
 
+import mock
 from django.core.management import call_command
 from django.db import connections
 from django.test import TestCase
@@ -94,6 +95,21 @@ class ChannelMapperTest(TestCase):
             self._recurse_and_assert([self.source_root], [mapper.mapped_root])
             self._assert_model(self.channel, self.mapper.mapped_channel, kolibri_public_models.ChannelMetadata)
 
+    def test_map_in_batches(self):
+        with using_content_database(self.tempdb):
+            mapper = ChannelMapper(self.channel)
+            with mock.patch("kolibri_public.utils.mapper.BATCH_SIZE", 3):
+                mapper.run()
+            self._recurse_and_assert([self.source_root], [mapper.mapped_root])
+            self.assertEqual(
+                set(kolibri_content_models.ContentNode.tags.through.objects.values_list("contentnode_id", "contenttag_id")),
+                set(
+                    kolibri_public_models.ContentNode.tags.through.objects.filter(
+                        contentnode__tree_id=mapper.tree_id
+                    ).values_list("contentnode_id", "contenttag_id")
+                ),
+            )
+
     @classmethod
     def tearDownClass(cls):
         # Clean up datbase connection after the test
@@ -0,0 +1,393 @@
+"""
+An in memory, per process index of the available public ContentNodes, used to answer the
+most common browse queries of the public ContentNode API without scanning the ContentNode table.
+
+The index stores the nodes as rows ordered by (tree_id, lft), so that every channel, and every
+subtree of a channel, is a contiguous range of rows. Every other filterable value (kind, language,
+level, coach content and each metadata label) is stored as a bitset, a Python integer with one bit
+per row, so that filters are combined with bitwise operations that run over the whole catalog in C.
+
+Each process builds its own index in a background thread, and rebuilds it whenever the catalog
+version in the cache is changed by `invalidate_catalog_index`, answering queries from the
+database until the index is ready.
+"""
+import heapq
+import logging
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from kolibri_public import models
+from kolibri_public.search import bitmask_fieldnames
+from kolibri_public.search import metadata_bitmasks
+from le_utils.constants import content_kinds
+
+from contentcuration.models import Language
+from contentcuration.utils.sentry import report_exception
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_VERSION_KEY = "kolibri_public:catalog_index_version"
+
+BUILD_CHUNK_SIZE = 10000
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _to_bitset(positions, num_rows):
+    bits = bytearray((num_rows + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _range_mask(start, end):
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def _uuid_hex(value):
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    return uuid.UUID(str(value)).hex
+
+
+class CatalogIndex(object):
+    """
+    Supports the subset of the ContentNodeFilter filters that browsing the catalog uses.
+    The `filter` method returns None for any other filter, and the query should then be
+    answered from the database.
+    """
+
+    def __init__(
+        self,
+        version,
+        ids,
+        lfts,
+        tree_ranges,
+        tree_channels,
+        kinds,
+        languages,
+        levels,
+        coach_content,
+        labels,
+        channel_names,
+        language_names,
+    ):
+        self.version = version
+        # The ids of the nodes, as packed 16 byte UUIDs
+        self.ids = ids
+        self.lfts = lfts
+        self.num_rows = len(lfts)
+        self.all = _range_mask(0, self.num_rows)
+        # The (start, end) row range of each tree
+        self.tree_ranges = tree_ranges
+        self.tree_channels = tree_channels
+        self.channel_ranges = {
+            channel_id: tree_ranges[tree_id] for tree_id, channel_id in tree_channels.items()
+        }
+        # Bitsets of the rows for each kind, language, level and (bitmask_field_name, bits) label
+        self.kinds = kinds
+        self.languages = languages
+        self.levels = levels
+        self.coach_content = coach_content
+        self.labels = labels
+        self.channel_names = channel_names
+        self.language_names = language_names
+
+    @classmethod
+    def build(cls, version=None):
+        ids = bytearray()
+        lfts = array("L")
+        tree_ranges = {}
+        tree_channels = {}
+        positions = {
+            "kinds": {},
+            "languages": {},
+            "levels": {},
+            "labels": {
+                (field_name, info["bits"]): array("L")
+                for field_name, infos in bitmask_fieldnames.items()
+                for info in infos
+            },
+        }
+        coach_content = array("L")
+        # The index in each row of the bitmask field of each label
+        label_columns = [
+            (8 + i, info["bits"], positions["labels"][(field_name, info["bits"])])
+            for i, (field_name, infos) in enumerate(bitmask_fieldnames.items())
+            for info in infos
+        ]
+
+        queryset = (
+            models.ContentNode.objects.filter(available=True)
+            .order_by("tree_id", "lft")
+            .values_list(
+                "id",
+                "lft",
+                "tree_id",
+                "level",
+                "channel_id",
+                "kind",
+                "lang_id",
+                "coach_content",
+                *bitmask_fieldnames.keys()
+            )
+        )
+        for position, row in enumerate(queryset.iterator(chunk_size=BUILD_CHUNK_SIZE)):
+            node_id, lft, tree_id, level, channel_id, kind, lang_id, is_coach_content = row[:8]
+            ids.extend(uuid.UUID(node_id).bytes)
+            lfts.append(lft)
+            if tree_id not in tree_ranges:
+                tree_ranges[tree_id] = [position, position]
+                tree_channels[tree_id] = channel_id
+            tree_ranges[tree_id][1] = position + 1
+            positions["kinds"].setdefault(kind, array("L")).append(position)
+            positions["levels"].setdefault(level, array("L")).append(position)
+            if lang_id is not None:
+                positions["languages"].setdefault(lang_id, array("L")).append(position)
+            if is_coach_content:
+                coach_content.append(position)
+            for column, bits, label_positions in label_columns:
+                if row[column] and row[column] & bits:
+                    label_positions.append(position)
+
+        num_rows = len(lfts)
+        bitsets = {
+            column: {key: _to_bitset(values, num_rows) for key, values in column_positions.items()}
+            for column, column_positions in positions.items()
+        }
+        channel_names = dict(
+            models.ChannelMetadata.objects.filter(id__in=set(tree_channels.values())).values_list("id", "name")
+        )
+        language_names = dict(
+            Language.objects.filter(id__in=bitsets["languages"].keys()).values_list("id", "native_name")
+        )
+        return cls(
+            version,
+            bytes(ids),
+            lfts,
+            {tree_id: tuple(tree_range) for tree_id, tree_range in tree_ranges.items()},
+            tree_channels,
+            bitsets["kinds"],
+            bitsets["languages"],
+            bitsets["levels"],
+            _to_bitset(coach_content, num_rows),
+            bitsets["labels"],
+            channel_names,
+            language_names,
+        )
+
+    def get_id(self, position):
+        return uuid.UUID(bytes=self.ids[position * 16:(position + 1) * 16]).hex
+
+    def _lft_range(self, tree_id, lft, rght):
+        """
+        The rows of the given tree with a lft greater than `lft` and less than `rght`
+        """
+        if tree_id not in self.tree_ranges:
+            return 0
+        start, end = self.tree_ranges[tree_id]
+        return _range_mask(
+            bisect_right(self.lfts, lft, start, end),
+            bisect_left(self.lfts, rght, start, end) if rght is not None else end,
+        )
+
+    def _get_node(self, node_id):
+        try:
+            return models.ContentNode.objects.values("lft", "rght", "tree_id", "level").get(pk=node_id)
+        except (models.ContentNode.DoesNotExist, ValueError):
+            return None
+
+    def _filter_channels(self, value):
+        mask = 0
+        for channel_id in value:
+            channel_range = self.channel_ranges.get(_uuid_hex(channel_id))
+            if channel_range:
+                mask |= _range_mask(*channel_range)
+        return mask
+
+    def _filter_channel_id(self, value):
+        return self._filter_channels([value])
+
+    def _filter_tree_id(self, value):
+        return _range_mask(*self.tree_ranges.get(int(value), (0, 0)))
+
+    def _filter_kind(self, value):
+        if value == "content":
+            return self.all & ~self.kinds.get(content_kinds.TOPIC, 0)
+        return self.kinds.get(value, 0)
+
+    def _filter_kind_in(self, value):
+        mask = 0
+        for kind in value.split(","):
+            mask |= self.kinds.get(kind, 0)
+        return mask
+
+    def _filter_languages(self, value):
+        mask = 0
+        for lang_id in value:
+            mask |= self.languages.get(lang_id, 0)
+        return mask
+
+    def _filter_include_coach_content(self, value):
+        if value:
+            return self.all
+        return self.all & ~self.coach_content
+
+    def _filter_lft__gt(self, value):
+        mask = 0
+        for tree_id in self.tree_ranges:
+            mask |= self._lft_range(tree_id, int(value), None)
+        return mask
+
+    def _filter_descendant_of(self, value):
+        node = self._get_node(value)
+        if node is None:
+            return 0
+        return self._lft_range(node["tree_id"], node["lft"], node["rght"])
+
+    def _filter_parent(self, value):
+        node = self._get_node(value)
+        if node is None:
+            return 0
+        return self._lft_range(node["tree_id"], node["lft"], node["rght"]) & self.levels.get(
+            node["level"] + 1, 0
+        )
+
+    def _filter_labels(self, field_name, value):
+        """
+        Mirrors ContentNodeQueryset.has_all_labels, matching nodes with any of the labels
+        in each bitmask field, and all of the bitmask fields.
+        """
+        masks = {}
+        for label in value.split(","):
+            info = metadata_bitmasks[field_name].get(label)
+            if info is not None:
+                bitmask_field_name = info["bitmask_field_name"]
+                masks[bitmask_field_name] = masks.get(bitmask_field_name, 0) | self.labels[
+                    (bitmask_field_name, info["bits"])
+                ]
+        mask = self.all
+        for label_mask in masks.values():
+            mask &= label_mask
+        return mask
+
+    def filter(self, params):
+        """
+        :param params: The cleaned data of a ContentNodeFilter
+        :return: A bitset of the rows that match all of the filters,
+                 or None if any of the filters is not supported by the index.
+        """
+        matches = self.all
+        for name, value in params.items():
+            if value is None or value == "" or value == []:
+                continue
+            if name in metadata_bitmasks:
+                mask = self._filter_labels(name, value)
+            else:
+                filter_method = getattr(self, "_filter_{}".format(name), None)
+                if filter_method is None:
+                    return None
+                mask = filter_method(value)
+            matches &= mask
+            if not matches:
+                break
+        return matches
+
+    def _iter_tree(self, chunk, start):
+        while chunk:
+            low_bit = chunk & -chunk
+            position = start + low_bit.bit_length() - 1
+            chunk ^= low_bit
+            yield self.lfts[position], self.get_id(position)
+
+    def iter_matches(self, matches, lft__gt=None):
+        """
+        Iterates over the lft and id of the matching rows in (lft, id) order,
+        the order of the OptionalContentNodePagination, lazily merging the rows of each tree.
+
+        :param matches: A bitset of the rows to iterate over
+        :param lft__gt: Only iterate over rows with a lft greater than this
+        """
+        iterators = []
+        for start, end in self.tree_ranges.values():
+            if lft__gt is not None:
+                start = bisect_right(self.lfts, lft__gt, start, end)
+            chunk = (matches >> start) & _range_mask(0, end - start)
+            if chunk:
+                iterators.append(self._iter_tree(chunk, start))
+        return heapq.merge(*iterators)
+
+    def get_labels(self, matches):
+        """
+        The same output as kolibri_public.search.get_available_metadata_labels,
+        for the nodes in the matching rows.
+        """
+        output = {}
+        for field_name, infos in bitmask_fieldnames.items():
+            for info in infos:
+                labels = output.setdefault(info["field_name"], [])
+                if matches & self.labels[(field_name, info["bits"])]:
+                    labels.append(info["label"])
+        output["languages"] = [
+            {"id": lang_id, "lang_name": self.language_names.get(lang_id)}
+            for lang_id, mask in self.languages.items()
+            if matches & mask
+        ]
+        output["channels"] = [
+            {"id": channel_id, "name": self.channel_names[channel_id]}
+            for channel_id, channel_range in self.channel_ranges.items()
+            if channel_id in self.channel_names and matches & _range_mask(*channel_range)
+        ]
+        return output
+
+
+_catalog_index = None
+_build_lock = threading.Lock()
+
+
+def _build_catalog_index(version):
+    global _catalog_index
+    try:
+        _catalog_index = CatalogIndex.build(version=version)
+        logger.info("Built public catalog index of {} nodes".format(_catalog_index.num_rows))
+    except Exception as e:
+        logger.exception("Failed to build public catalog index")
+        report_exception(e)
+    finally:
+        _build_lock.release()
+        connection.close()
+
+
+def get_catalog_index():
+    """
+    :return: The catalog index of this process if it is enabled and up to date, otherwise None.
+             If it is not up to date, a rebuild is started in the background.
+    """
+    if not settings.PUBLIC_CATALOG_INDEX:
+        return None
+    version = cache.get_or_set(CATALOG_INDEX_VERSION_KEY, _new_version, timeout=None)
+    catalog_index = _catalog_index
+    if catalog_index is not None and catalog_index.version == version:
+        return catalog_index
+    if _build_lock.acquire(blocking=False):
+        threading.Thread(target=_build_catalog_index, args=(version,), daemon=True).start()
+    return None
+
+
+def invalidate_catalog_index():
+    """
+    Marks the catalog indexes of all processes as out of date, to be called whenever
+    the public ContentNodes change.
+    """
+    cache.set(CATALOG_INDEX_VERSION_KEY, _new_version(), timeout=None)
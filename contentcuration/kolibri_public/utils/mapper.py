@@ -1,11 +1,15 @@
+from django.db import connections
+from django.db import router
 from django.db import transaction
+from django.db.models import AutoField
 from kolibri_content import models as kolibri_content_models
 from kolibri_public import models as kolibri_public_models
 from kolibri_public.search import annotate_label_bitmasks
 from kolibri_public.utils.annotation import set_channel_metadata_fields
-from le_utils.constants import content_kinds
+from kolibri_public.utils.catalog_index import invalidate_catalog_index
 
 
+# The number of nodes that are read from the content database and inserted together
 BATCH_SIZE = 1000
 
 
@@ -15,6 +19,10 @@ class ChannelMapper(object):
     and maps them to models in the kolibri_public app.
     Uses the ChannelMetadata as the starting point as all other information is
     Foreign Keyed from the root ContentNode.
+
+    The rows of the tree are read from the content database in chunks of nodes in
+    tree order, as tuples of values, and inserted with a single INSERT per model
+    for each chunk, without instantiating any models for them.
     """
 
     def __init__(self, channel, public=True):
@@ -50,6 +58,7 @@ class ChannelMapper(object):
             self.mapped_channel.save_base(raw=True)
             annotate_label_bitmasks(self.mapped_root.get_descendants(include_self=True))
             set_channel_metadata_fields(self.mapped_channel.id, public=self.public)
+            transaction.on_commit(invalidate_catalog_index)
 
     def _map_model(self, source, Model):
         properties = {}
@@ -62,29 +71,60 @@ class ChannelMapper(object):
 
         return Model(**properties)
 
-    def _map_and_bulk_create_model(self, sources, Model):
-        cloned_sources = [self._map_model(source, Model) for source in sources]
-
-        Model.objects.bulk_create(cloned_sources, ignore_conflicts=True)
-
-    def _map_node(self, source):
-        return self._map_model(source, kolibri_public_models.ContentNode)
-
-    def _recurse_to_create_tree(
-        self,
-        source,
-        nodes_by_parent,
-    ):
-        nodes_to_create = [self._map_node(source)]
+    def _get_fields(self, SourceModel, Model):
+        """
+        :return: A tuple of the fields of Model that are copied from the columns of SourceModel with
+            the names of the columns to read them from, and of the other fields of Model with the
+            values that they are set to, which are their overrides or their defaults. Auto incremented
+            ids, of the tags of the nodes, are left for the database to set, so that they do not conflict
+            with the ids of the tags of other channels.
+        """
+        source_columns = {field.column: field.attname for field in SourceModel._meta.concrete_fields}
+        overrides = self.overrides.get(Model, {})
+        copied_fields = []
+        other_fields = []
+        for field in Model._meta.concrete_fields:
+            if isinstance(field, AutoField):
+                continue
+            if field.column in overrides:
+                other_fields.append((field, overrides[field.column]))
+            elif field.column in source_columns:
+                copied_fields.append((field, source_columns[field.column]))
+            else:
+                other_fields.append((field, field.get_default()))
+        return copied_fields, other_fields
+
+    def _copy_rows(self, queryset, Model, ignore_conflicts=True):
+        """
+        Inserts the rows of the queryset of a kolibri_content model as rows of Model.
 
-        if source.kind == content_kinds.TOPIC and source.id in nodes_by_parent:
-            children = sorted(nodes_by_parent[source.id], key=lambda x: x.lft)
-            for child in children:
-                nodes_to_create.extend(self._recurse_to_create_tree(
-                    child,
-                    nodes_by_parent,
-                ))
-        return nodes_to_create
+        :return: The values that were read for the rows, in the order of the fields of Model that are copied
+        """
+        copied_fields, other_fields = self._get_fields(queryset.model, Model)
+        rows = list(queryset.values_list(*(attname for _, attname in copied_fields)))
+        if not rows:
+            return rows
+
+        connection = connections[router.db_for_write(Model)]
+        fields = [field for field, _ in copied_fields] + [field for field, _ in other_fields]
+        other_values = [value for _, value in other_fields]
+        params = []
+        for row in rows:
+            params.extend(
+                field.get_db_prep_save(value, connection) for field, value in zip(fields, row + tuple(other_values))
+            )
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) VALUES {values}{on_conflict}".format(
+                    table=qn(Model._meta.db_table),
+                    columns=", ".join(qn(field.column) for field in fields),
+                    values=", ".join(["({})".format(", ".join(["%s"] * len(fields)))] * len(rows)),
+                    on_conflict=" ON CONFLICT DO NOTHING" if ignore_conflicts else "",
+                ),
+                params,
+            )
+        return rows
 
     def map_root(
         self,
@@ -98,108 +138,70 @@ class ChannelMapper(object):
         if batch_size is None:
             batch_size = BATCH_SIZE
 
-        return self._map(
-            root,
-            batch_size,
-            progress_tracker=progress_tracker,
-        )[0]
-
-    def _map(
-        self,
-        node,
-        batch_size,
-        progress_tracker=None,
-    ):
-        """
-        :type progress_tracker: contentcuration.utils.celery.ProgressTracker|None
-        """
-        if node.rght - node.lft < batch_size:
-            copied_nodes = self._deep_map(
-                node,
+        source_nodes = kolibri_content_models.ContentNode.objects.filter(
+            tree_id=root.tree_id, lft__gte=root.lft, rght__lte=root.rght
+        ).order_by("lft")
+        lft_index = [attname for _, attname in self._get_fields(
+            kolibri_content_models.ContentNode, kolibri_public_models.ContentNode
+        )[0]].index("lft")
+
+        lft = root.lft - 1
+        while True:
+            nodes = self._copy_rows(
+                source_nodes.filter(lft__gt=lft)[:batch_size],
+                kolibri_public_models.ContentNode,
+                ignore_conflicts=False,
             )
-            if progress_tracker:
-                progress_tracker.increment(len(copied_nodes))
-            return copied_nodes
-        node_copy = self._shallow_map(
-            node,
-        )
-        if progress_tracker:
-            progress_tracker.increment()
-        children = node.get_children().order_by("lft")
-        for child in children:
-            self._map(
-                child,
-                batch_size,
-                progress_tracker=progress_tracker,
+            if not nodes:
+                break
+            first_lft = nodes[0][lft_index]
+            lft = nodes[-1][lft_index]
+            self._copy_associated_objects(
+                {"contentnode__tree_id": root.tree_id, "contentnode__lft__gte": first_lft, "contentnode__lft__lte": lft}
             )
-        return [node_copy]
+            if progress_tracker:
+                progress_tracker.increment(len(nodes))
 
-    def _copy_tags(self, node_ids):
-        source_tags_mappings = kolibri_content_models.ContentNode.tags.through.objects.filter(
-            contentnode_id__in=node_ids
-        )
+        return kolibri_public_models.ContentNode.objects.get(pk=root.pk)
 
-        source_tags = kolibri_content_models.ContentTag.objects.filter(
-            id__in=source_tags_mappings.values_list("contenttag_id", flat=True)
+    def _copy_tags(self, node_filters):
+        self._copy_rows(
+            kolibri_content_models.ContentTag.objects.filter(
+                **{"tagged_content__" + key[len("contentnode__"):]: value for key, value in node_filters.items()}
+            ).distinct(),
+            kolibri_public_models.ContentTag,
         )
 
-        self._map_and_bulk_create_model(source_tags, kolibri_public_models.ContentTag)
-
-        self._map_and_bulk_create_model(source_tags_mappings, kolibri_public_models.ContentNode.tags.through)
-
-    def _copy_assessment_metadata(self, node_ids):
-        node_assessmentmetadata = kolibri_content_models.AssessmentMetaData.objects.filter(contentnode_id__in=node_ids)
-
-        self._map_and_bulk_create_model(node_assessmentmetadata, kolibri_public_models.AssessmentMetaData)
-
-    def _copy_files(self, node_ids):
-        node_files = kolibri_content_models.File.objects.filter(contentnode_id__in=node_ids)
-
-        local_files = kolibri_content_models.LocalFile.objects.filter(id__in=node_files.values_list("local_file_id", flat=True))
-
-        self._map_and_bulk_create_model(local_files, kolibri_public_models.LocalFile)
-
-        self._map_and_bulk_create_model(node_files, kolibri_public_models.File)
-
-    def _copy_associated_objects(self, nodes):
-        node_ids = [node.id for node in nodes]
-
-        self._copy_files(node_ids)
-
-        self._copy_assessment_metadata(node_ids)
-
-        self._copy_tags(node_ids)
-
-    def _shallow_map(
-        self,
-        node,
-    ):
-        mapped_node = self._map_node(node)
-
-        mapped_node.save_base(raw=True)
-
-        self._copy_associated_objects([node])
-        return mapped_node
+        self._copy_rows(
+            kolibri_content_models.ContentNode.tags.through.objects.filter(**node_filters),
+            kolibri_public_models.ContentNode.tags.through,
+        )
 
-    def _deep_map(
-        self,
-        node,
-    ):
-        source_nodes = node.get_descendants(include_self=True)
+    def _copy_assessment_metadata(self, node_filters):
+        self._copy_rows(
+            kolibri_content_models.AssessmentMetaData.objects.filter(**node_filters),
+            kolibri_public_models.AssessmentMetaData,
+        )
 
-        nodes_by_parent = {}
-        for source_node in source_nodes:
-            if source_node.parent_id not in nodes_by_parent:
-                nodes_by_parent[source_node.parent_id] = []
-            nodes_by_parent[source_node.parent_id].append(source_node)
+    def _copy_files(self, node_filters):
+        self._copy_rows(
+            kolibri_content_models.LocalFile.objects.filter(
+                **{"files__" + key: value for key, value in node_filters.items()}
+            ).distinct(),
+            kolibri_public_models.LocalFile,
+        )
 
-        nodes_to_create = self._recurse_to_create_tree(
-            node,
-            nodes_by_parent,
+        self._copy_rows(
+            kolibri_content_models.File.objects.filter(**node_filters),
+            kolibri_public_models.File,
         )
 
-        mapped_nodes = kolibri_public_models.ContentNode.objects.bulk_create(nodes_to_create)
+    def _copy_associated_objects(self, node_filters):
+        """
+        :param node_filters: The filters on the content node of the objects that are copied, for the nodes of a chunk
+        """
+        self._copy_files(node_filters)
 
-        self._copy_associated_objects(source_nodes)
+        self._copy_assessment_metadata(node_filters)
 
-        return mapped_nodes
+        self._copy_tags(node_filters)
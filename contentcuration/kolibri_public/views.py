@@ -8,15 +8,20 @@ https://github.com/learningequality/kolibri/blob/b8ef7212f9ab44660e2c7cabeb01223
 """
 import logging
 import re
+import uuid
 from collections import OrderedDict
 from functools import reduce
 
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.aggregates import JSONBAgg
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import Exists
-from django.db.models import F
 from django.db.models import Max
 from django.db.models import OuterRef
 from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models.functions import JSONObject
 from django.http import Http404
 from django.utils.cache import patch_cache_control
 from django.utils.cache import patch_response_headers
@@ -34,6 +39,7 @@ from django_filters.rest_framework import UUIDFilter
 from kolibri_public import models
 from kolibri_public.search import get_available_metadata_labels
 from kolibri_public.stopwords import stopwords_set
+from kolibri_public.utils.catalog_index import get_catalog_index
 from le_utils.constants import content_kinds
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -359,6 +365,30 @@ def _split_text_field(text):
     return text.split(",") if text else []
 
 
+def _language_json(field_name):
+    # Use native_name for lang_name to map from the content curation model
+    # to how we want to expose it for Kolibri.
+    return JSONObject(
+        id=field_name + "_id",
+        lang_code=field_name + "__lang_code",
+        lang_subcode=field_name + "__lang_subcode",
+        lang_name=field_name + "__native_name",
+        lang_direction=field_name + "__lang_direction",
+    )
+
+
+def _map_language_json(lang):
+    if lang is None or lang["id"] is None:
+        return None
+    return lang
+
+
+CONTENTNODE_PAYLOAD_CACHE_KEY = "public-contentnode:{channel_id}:{version}:{node_id}"
+
+# 5 minutes, the same as the caching of the metadata endpoints
+CONTENTNODE_PAYLOAD_CACHE_TIMEOUT = 300
+
+
 class BaseContentNodeMixin(object):
     """
     A base mixin for viewsets that need to return the same format of data
@@ -412,72 +442,131 @@ class BaseContentNodeMixin(object):
     def get_queryset(self):
         return models.ContentNode.objects.filter(available=True)
 
-    def get_related_data_maps(self, items, queryset):
-        assessmentmetadata_map = {
-            a["contentnode"]: a
-            for a in models.AssessmentMetaData.objects.filter(
-                contentnode__in=queryset
-            ).values(
-                "assessment_item_ids",
-                "number_of_assessments",
-                "mastery_model",
-                "randomize",
-                "is_manipulable",
-                "contentnode",
-            )
-        }
-
-        files_map = {}
-
-        files = list(
-            models.File.objects.filter(contentnode__in=queryset).values(
-                "id",
-                "contentnode",
-                "local_file__id",
-                "priority",
-                "local_file__available",
-                "local_file__file_size",
-                "local_file__extension",
-                "preset",
-                "lang_id",
-                "supplementary",
-                "thumbnail",
-            )
+    def serialize(self, queryset):
+        """
+        Serialize the nodes, reusing the cached payloads of nodes that have already been
+        serialized for the current version of their channel, so that browsing the same
+        parts of a channel from many devices only serializes each node once.
+        """
+        nodes = list(
+            queryset.annotate(
+                channel_version=Subquery(
+                    models.ChannelMetadata.objects.filter(id=OuterRef("channel_id")).values("version")[:1]
+                )
+            ).values_list("id", "channel_id", "channel_version")
         )
-
-        lang_ids = set([obj["lang_id"] for obj in items + files])
-
-        languages_map = {
-            lang["id"]: lang
-            # Add an annotation for lang_name to map to native_name to map from content curation model
-            # to how we want to expose it for Kolibri.
-            for lang in models.Language.objects.filter(id__in=lang_ids).annotate(lang_name=F("native_name")).values(
-                "id", "lang_code", "lang_subcode", "lang_name", "lang_direction"
+        if not nodes:
+            return []
+        keys = {
+            node_id: CONTENTNODE_PAYLOAD_CACHE_KEY.format(
+                channel_id=channel_id, version=version, node_id=node_id
             )
+            for node_id, channel_id, version in nodes
         }
+        payloads = cache.get_many(list(keys.values()))
+        missing_ids = [node_id for node_id, key in keys.items() if key not in payloads]
+        if missing_ids:
+            missing_payloads = {
+                keys[item["id"]]: item
+                for item in super(BaseContentNodeMixin, self).serialize(
+                    queryset.filter(id__in=missing_ids)
+                )
+            }
+            cache.set_many(missing_payloads, timeout=CONTENTNODE_PAYLOAD_CACHE_TIMEOUT)
+            payloads.update(missing_payloads)
+        return [payloads[keys[node_id]] for node_id, _, _ in nodes if keys[node_id] in payloads]
 
-        for f in files:
-            contentnode_id = f.pop("contentnode")
-            if contentnode_id not in files_map:
-                files_map[contentnode_id] = []
-            lang_id = f.pop("lang_id")
-            f["lang"] = languages_map.get(lang_id)
-            files_map[contentnode_id].append(map_file(f))
-
+    def get_related_data_maps(self, items, queryset):
+        """
+        Load the assessment metadata, files, languages and tags of the items in a single query,
+        aggregating them as JSON onto the ids of the items.
+        """
+        assessmentmetadata_map = {}
+        files_map = {}
+        languages_map = {}
         tags_map = {}
 
-        for t in (
-            models.ContentTag.objects.filter(tagged_content__in=queryset)
-            .values(
-                "tag_name",
-                "tagged_content",
+        for related in (
+            models.ContentNode.objects.filter(id__in=[item["id"] for item in items])
+            .order_by()
+            .values("id")
+            .annotate(
+                node_lang=_language_json("lang"),
+                assessmentmetadata_json=Subquery(
+                    models.AssessmentMetaData.objects.filter(contentnode_id=OuterRef("id"))
+                    .values(
+                        json=JSONObject(
+                            assessment_item_ids="assessment_item_ids",
+                            number_of_assessments="number_of_assessments",
+                            mastery_model="mastery_model",
+                            randomize="randomize",
+                            is_manipulable="is_manipulable",
+                        )
+                    )[:1]
+                ),
+                files_json=Subquery(
+                    models.File.objects.filter(contentnode_id=OuterRef("id"))
+                    .order_by()
+                    .values("contentnode_id")
+                    .annotate(
+                        json=JSONBAgg(
+                            JSONObject(
+                                id="id",
+                                priority="priority",
+                                preset="preset",
+                                supplementary="supplementary",
+                                thumbnail="thumbnail",
+                                lang=_language_json("lang"),
+                                **{
+                                    "local_file__id": "local_file__id",
+                                    "local_file__available": "local_file__available",
+                                    "local_file__file_size": "local_file__file_size",
+                                    "local_file__extension": "local_file__extension",
+                                }
+                            )
+                        )
+                    )
+                    .values("json")
+                ),
+                tags_json=Subquery(
+                    models.ContentNode.tags.through.objects.filter(contentnode_id=OuterRef("id"))
+                    .order_by()
+                    .values("contentnode_id")
+                    .annotate(
+                        tag_names=ArrayAgg(
+                            "contenttag__tag_name", ordering=("contenttag__tag_name",)
+                        )
+                    )
+                    .values("tag_names")
+                ),
             )
-            .order_by("tag_name")
         ):
-            if t["tagged_content"] not in tags_map:
-                tags_map[t["tagged_content"]] = [t["tag_name"]]
-            else:
-                tags_map[t["tagged_content"]].append(t["tag_name"])
+            contentnode_id = related["id"]
+            lang = _map_language_json(related["node_lang"])
+            if lang:
+                languages_map[lang["id"]] = lang
+
+            assessmentmetadata = related["assessmentmetadata_json"]
+            if assessmentmetadata is not None:
+                for field_name in ("assessment_item_ids", "mastery_model"):
+                    # These are text fields on the Kolibri models, so are aggregated as JSON strings
+                    assessmentmetadata[field_name] = models.AssessmentMetaData._meta.get_field(
+                        field_name
+                    ).to_python(assessmentmetadata[field_name])
+                assessmentmetadata["contentnode"] = contentnode_id
+                assessmentmetadata_map[contentnode_id] = assessmentmetadata
+
+            files_map[contentnode_id] = []
+            for f in related["files_json"] or []:
+                # UUIDs are aggregated in their hyphenated form
+                f["id"] = uuid.UUID(f["id"]).hex
+                f["lang"] = _map_language_json(f["lang"])
+                if f["lang"]:
+                    languages_map[f["lang"]["id"]] = f["lang"]
+                files_map[contentnode_id].append(map_file(f))
+
+            if related["tags_json"]:
+                tags_map[contentnode_id] = related["tags_json"]
 
         return assessmentmetadata_map, files_map, languages_map, tags_map
 
@@ -512,6 +601,7 @@ class BaseContentNodeMixin(object):
 class OptionalContentNodePagination(ValuesViewsetCursorPagination):
     ordering = ("lft", "id")
     page_size_query_param = "max_results"
+    labels = None
 
     def paginate_queryset(self, queryset, request, view=None):
         # Record the queryset for use in returning available filters
@@ -520,13 +610,66 @@ class OptionalContentNodePagination(ValuesViewsetCursorPagination):
             queryset, request, view=view
         )
 
+    def paginate_catalog_index(self, catalog_index, matches, request, view=None):
+        """
+        Paginate the matching rows of the catalog index in the same way as `paginate_queryset`
+        paginates a queryset, returning the ids of the nodes in the page, or None if pagination
+        is not configured or the cursor is a reverse cursor, which the index does not support.
+        This follows:
+        https://github.com/encode/django-rest-framework/blob/6ea95b6ad1bc0d4a4234a267b1ba32701878c6bb/rest_framework/pagination.py#L589
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+        if reverse:
+            return None
+
+        try:
+            lft__gt = int(current_position) if current_position is not None else None
+        except ValueError:
+            return None
+
+        results = []
+        for i, (lft, node_id) in enumerate(catalog_index.iter_matches(matches, lft__gt=lft__gt)):
+            if i >= offset:
+                results.append({"lft": lft, "id": node_id})
+            if len(results) > self.page_size:
+                break
+        self.page = results[: self.page_size]
+
+        if len(results) > len(self.page):
+            self.has_next = True
+            self.next_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            self.has_next = False
+            self.next_position = None
+        self.has_previous = (current_position is not None) or (offset > 0)
+        self.previous_position = current_position
+
+        self.request = request
+        self.queryset = None
+        self.labels = catalog_index.get_labels(matches)
+        return [item["id"] for item in self.page]
+
     def get_paginated_response(self, data):
         return Response(
             OrderedDict(
                 [
                     ("more", self.get_more()),
                     ("results", data),
-                    ("labels", get_available_metadata_labels(self.queryset)),
+                    (
+                        "labels",
+                        self.labels
+                        if self.labels is not None
+                        else get_available_metadata_labels(self.queryset),
+                    ),
                 ]
             )
         )
@@ -555,6 +698,43 @@ class OptionalContentNodePagination(ValuesViewsetCursorPagination):
 class ContentNodeViewset(BaseContentNodeMixin, ReadOnlyValuesViewset):
     pagination_class = OptionalContentNodePagination
 
+    def list_from_catalog_index(self, request):
+        """
+        Answer paginated list requests from the in memory catalog index, if it is available
+        and supports all of the requested filters, returning None otherwise.
+        """
+        catalog_index = get_catalog_index()
+        if catalog_index is None:
+            return None
+        filterset = self.filterset_class(
+            request.query_params, queryset=self.get_queryset(), request=request
+        )
+        if not filterset.is_valid():
+            # Let the filter backend raise the validation error
+            return None
+        matches = catalog_index.filter(
+            {
+                name: value
+                for name, value in filterset.form.cleaned_data.items()
+                if name in request.query_params
+            }
+        )
+        if matches is None:
+            return None
+        page_ids = self.paginator.paginate_catalog_index(
+            catalog_index, matches, request, view=self
+        )
+        if page_ids is None:
+            return None
+        queryset = self.get_queryset().filter(id__in=page_ids).order_by(*self.paginator.ordering)
+        return self.get_paginated_response(self.serialize(queryset))
+
+    def list(self, request, *args, **kwargs):
+        response = self.list_from_catalog_index(request)
+        if response is not None:
+            return response
+        return super(ContentNodeViewset, self).list(request, *args, **kwargs)
+
 
 # The max recursed page size should be less than 25 for a couple of reasons:
 # 1. At this size the query appears to be relatively performant, and will deliver most of the tree
@@ -6,7 +6,6 @@ from django.db.models import TextField
 from django.db.models import Value
 from django.http import HttpResponseNotFound
 from django.utils.translation import gettext_lazy as _
-from django.views.decorators.cache import cache_page
 from kolibri_content.constants.schema_versions import MIN_CONTENT_SCHEMA_VERSION
 from rest_framework import viewsets
 from rest_framework.decorators import api_view
@@ -17,6 +16,7 @@ from rest_framework.response import Response
 from contentcuration.decorators import cache_no_user_data
 from contentcuration.models import Channel
 from contentcuration.serializers import PublicChannelSerializer
+from contentcuration.utils.cache import public_channels_cache
 
 
 def _get_channel_list(version, params, identifier=None):
@@ -51,7 +51,7 @@ def _get_channel_list_v1(params, identifier=None):
         .distinct()
 
 
-@cache_page(settings.PUBLIC_CHANNELS_CACHE_DURATION, key_prefix='get_public_channel_list')
+@public_channels_cache.cache_page(settings.PUBLIC_CHANNELS_CACHE_DURATION)
 @api_view(['GET'])
 @permission_classes((AllowAny,))
 @cache_no_user_data
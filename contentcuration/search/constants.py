@@ -14,3 +14,12 @@ CONTENTNODE_AUTHOR_TSVECTOR = SearchVector(*CONTENTNODE_AUTHOR_TSVECTOR_FIELDS,
 # Channel vector and search fields.
 CHANNEL_KEYWORDS_TSVECTOR_FIELDS = ("id", "main_tree__tree_id", "name", "description", "tagline", "primary_channel_token")
 CHANNEL_KEYWORDS_TSVECTOR = SearchVector(*CHANNEL_KEYWORDS_TSVECTOR_FIELDS, config=POSTGRES_FTS_CONFIG)
+
+# ContentNode fields that are copied to the search table for filtering, by the names of the search table fields.
+CONTENTNODE_FILTER_FIELDS = {
+    "kind_id": "kind_id",
+    "language_code": "language__lang_code",
+    "license_id": "license_id",
+    "role_visibility": "role_visibility",
+    "created": "created",
+}
@@ -0,0 +1,190 @@
+"""
+Keeps the ContentNodeFullTextSearch table up to date with the edits to the main trees of channels,
+so that search results are fresh without waiting for the channels to be published.
+
+As changes to content nodes are applied, the ids of the nodes whose tsvectors they affect are added
+to a Redis set for the channel, along with the ids of the nodes whose whole subtrees they affect, as
+they were moved or copied. Once all of the changes to a channel have been applied, its queued nodes
+are popped and their tsvectors recomputed in batches, replacing their rows in the table. Publishing
+a channel still updates the tsvectors of all of its changed nodes.
+"""
+import logging
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from search.constants import CONTENTNODE_AUTHOR_TSVECTOR_FIELDS
+from search.constants import CONTENTNODE_FILTER_FIELDS
+from search.constants import CONTENTNODE_KEYWORDS_TSVECTOR_FIELDS
+from search.models import ContentNodeFullTextSearch
+from search.utils import get_fts_annotated_contentnode_qs
+from search.utils import get_fts_filter_fields
+
+from contentcuration.models import Channel
+from contentcuration.models import ContentNode
+from contentcuration.utils.cache import get_redis_client
+from contentcuration.utils.sentry import report_exception
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+from contentcuration.viewsets.sync.constants import COPIED
+from contentcuration.viewsets.sync.constants import CREATED
+from contentcuration.viewsets.sync.constants import MOVED
+from contentcuration.viewsets.sync.constants import UPDATED
+
+
+logger = logging.getLogger(__name__)
+
+# The Redis sets of the ids of the nodes of a channel to update the tsvectors of, and of the ids of
+# the nodes to update the tsvectors of the whole subtrees of
+NODE_QUEUE_KEY = "search_index_nodes:{}"
+SUBTREE_QUEUE_KEY = "search_index_subtrees:{}"
+
+BATCH_SIZE = 1000
+
+# The fields of a node that its tsvectors are computed from, that are copied for filtering, or that decide
+# whether it is indexed
+INDEXED_FIELDS = set(
+    CONTENTNODE_KEYWORDS_TSVECTOR_FIELDS
+    + CONTENTNODE_AUTHOR_TSVECTOR_FIELDS
+    + ("language", "license", "role_visibility", "complete")
+)
+
+
+def _is_indexed_update(mods):
+    return any(field in INDEXED_FIELDS or field.startswith("tags.") for field in mods)
+
+
+def queue_contentnode_tsvector_updates(channel_id, node_ids=(), subtree_ids=()):
+    """
+    Queues the tsvectors of the nodes, and of the whole subtrees of the nodes with subtree_ids, to be
+    updated by `update_queued_contentnode_tsvectors`, or updates them straight away if the cache is
+    not a Redis cache to queue them in
+    """
+    redis_client = get_redis_client(cache)
+    if redis_client is None:
+        update_contentnode_tsvectors(channel_id, node_ids, subtree_ids=subtree_ids)
+        return
+    pipeline = redis_client.pipeline()
+    if node_ids:
+        pipeline.sadd(cache.make_key(NODE_QUEUE_KEY.format(channel_id)), *node_ids)
+    if subtree_ids:
+        pipeline.sadd(cache.make_key(SUBTREE_QUEUE_KEY.format(channel_id)), *subtree_ids)
+    pipeline.execute()
+
+
+def queue_search_index_changes(changes):
+    """
+    Queues the updates of the tsvectors of the nodes that the applied changes affect. Deleted nodes
+    need no update, as their rows are deleted along with them.
+    """
+    node_ids = defaultdict(set)
+    subtree_ids = defaultdict(set)
+    for change in changes:
+        if change.table != CONTENTNODE or not change.channel_id:
+            continue
+        key = change.kwargs.get("key")
+        if change.change_type == CREATED or (
+            change.change_type == UPDATED and _is_indexed_update(change.kwargs.get("mods", {}))
+        ):
+            node_ids[change.channel_id].add(key)
+        elif change.change_type in (MOVED, COPIED):
+            subtree_ids[change.channel_id].add(key)
+    for channel_id in set(node_ids).union(subtree_ids):
+        queue_contentnode_tsvector_updates(
+            channel_id, node_ids=node_ids[channel_id], subtree_ids=subtree_ids[channel_id]
+        )
+
+
+def _set_contentnode_tsvectors(channel_id, tree_id, public, node_ids):
+    nodes = list(
+        get_fts_annotated_contentnode_qs(channel_id)
+        .filter(id__in=node_ids, tree_id=tree_id, complete=True)
+        .values("id", "keywords_tsvector", "author_tsvector", *CONTENTNODE_FILTER_FIELDS.values())
+        .order_by()
+    )
+    with transaction.atomic():
+        # Replace the rows of the nodes, which may be in another channel if the nodes were moved
+        ContentNodeFullTextSearch.objects.filter(contentnode_id__in=node_ids).delete()
+        ContentNodeFullTextSearch.objects.bulk_create(
+            ContentNodeFullTextSearch(
+                contentnode_id=node["id"],
+                channel_id=channel_id,
+                keywords_tsvector=node["keywords_tsvector"],
+                author_tsvector=node["author_tsvector"],
+                public=public,
+                **get_fts_filter_fields(node)
+            )
+            for node in nodes
+        )
+    return len(nodes)
+
+
+def update_contentnode_tsvectors(channel_id, node_ids, subtree_ids=()):
+    """
+    Updates the tsvectors of the nodes of the main tree of a channel, and of all the nodes in the
+    subtrees of the nodes with subtree_ids, and removes the rows of nodes that are no longer in it
+    or are incomplete
+
+    :return: The number of tsvectors that were set
+    """
+    channel = Channel.objects.filter(pk=channel_id).values("main_tree__tree_id", "public", "deleted").first()
+    if channel is None or channel["main_tree__tree_id"] is None:
+        return 0
+    tree_id = channel["main_tree__tree_id"]
+    public = channel["public"] and not channel["deleted"]
+
+    count = 0
+    node_ids = list(node_ids)
+    for i in range(0, len(node_ids), BATCH_SIZE):
+        count += _set_contentnode_tsvectors(channel_id, tree_id, public, node_ids[i:i + BATCH_SIZE])
+
+    if not subtree_ids:
+        return count
+    for lft, rght in ContentNode.objects.filter(tree_id=tree_id, id__in=subtree_ids).values_list("lft", "rght"):
+        descendant_ids = list(
+            ContentNode.objects.filter(tree_id=tree_id, lft__gte=lft, rght__lte=rght).values_list("id", flat=True)
+        )
+        for i in range(0, len(descendant_ids), BATCH_SIZE):
+            count += _set_contentnode_tsvectors(channel_id, tree_id, public, descendant_ids[i:i + BATCH_SIZE])
+    # Moves may have taken nodes, and their descendants, out of the main tree, such as into the trash tree
+    ContentNodeFullTextSearch.objects.filter(channel_id=channel_id).exclude(contentnode__tree_id=tree_id).delete()
+    return count
+
+
+def update_queued_contentnode_tsvectors(channel_id):
+    """
+    Pops the queued nodes of the channel in batches and updates their tsvectors
+
+    :return: The number of tsvectors that were set
+    """
+    redis_client = get_redis_client(cache)
+    if redis_client is None:
+        return 0
+    node_key = cache.make_key(NODE_QUEUE_KEY.format(channel_id))
+    subtree_key = cache.make_key(SUBTREE_QUEUE_KEY.format(channel_id))
+
+    count = 0
+    while True:
+        node_ids = [node_id.decode() for node_id in redis_client.spop(node_key, BATCH_SIZE)]
+        subtree_ids = [node_id.decode() for node_id in redis_client.spop(subtree_key, BATCH_SIZE)]
+        if not node_ids and not subtree_ids:
+            return count
+        try:
+            count += update_contentnode_tsvectors(channel_id, node_ids, subtree_ids=subtree_ids)
+        except Exception:
+            # Put the nodes back, for the next time that the queue of the channel is processed
+            queue_contentnode_tsvector_updates(channel_id, node_ids=node_ids, subtree_ids=subtree_ids)
+            raise
+
+
+def try_update_queued_contentnode_tsvectors(channel_id):
+    """
+    Updates the queued tsvectors of a channel, logging rather than raising any errors, for use after
+    operations that should not fail because the search index could not be updated. The tsvectors
+    stay queued until the queue of the channel is processed again, or the channel is published.
+    """
+    try:
+        return update_queued_contentnode_tsvectors(channel_id)
+    except Exception as e:
+        logger.exception("Failed to update the search index of channel {}".format(channel_id))
+        report_exception(e)
+        return None
@@ -7,8 +7,11 @@ import time
 from django.core.management.base import BaseCommand
 from django.db.models import Exists
 from django.db.models import OuterRef
+from search.constants import CONTENTNODE_FILTER_FIELDS
 from search.models import ContentNodeFullTextSearch
 from search.utils import get_fts_annotated_contentnode_qs
+from search.utils import get_fts_filter_fields
+from search.utils import is_channel_public
 
 from contentcuration.models import Channel
 
@@ -46,8 +49,9 @@ class Command(BaseCommand):
             tsvector_not_already_inserted_query = ~Exists(ContentNodeFullTextSearch.objects.filter(contentnode_id=OuterRef("id")))
             tsvector_nodes_query = (get_fts_annotated_contentnode_qs(channel["id"])
                                     .filter(tsvector_not_already_inserted_query, tree_id=channel["main_tree__tree_id"], complete=True, **publish_filter_dict)
-                                    .values("id", "channel_id", "keywords_tsvector", "author_tsvector")
+                                    .values("id", "channel_id", "keywords_tsvector", "author_tsvector", *CONTENTNODE_FILTER_FIELDS.values())
                                     .order_by())
+            public = is_channel_public(channel["id"])
 
             insertable_nodes_tsvector = list(tsvector_nodes_query[:CHUNKSIZE])
 
@@ -57,7 +61,8 @@ class Command(BaseCommand):
                 insert_objs = list()
                 for node in insertable_nodes_tsvector:
                     obj = ContentNodeFullTextSearch(contentnode_id=node["id"], channel_id=node["channel_id"],
-                                                    keywords_tsvector=node["keywords_tsvector"], author_tsvector=node["author_tsvector"])
+                                                    keywords_tsvector=node["keywords_tsvector"], author_tsvector=node["author_tsvector"],
+                                                    public=public, **get_fts_filter_fields(node))
                     insert_objs.append(obj)
 
                 inserted_objs_list = ContentNodeFullTextSearch.objects.bulk_create(insert_objs)
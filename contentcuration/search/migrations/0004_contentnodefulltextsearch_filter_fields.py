@@ -0,0 +1,77 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.contrib.postgres.operations import BtreeGinExtension
+from django.db import migrations
+from django.db import models
+
+
+# Copies the filter fields of the existing rows from their nodes, and whether their channels are public
+BACKFILL_FILTER_FIELDS_SQL = """
+UPDATE search_contentnodefulltextsearch AS fts
+SET kind_id = node.kind_id,
+    language_code = language.lang_code,
+    license_id = node.license_id,
+    role_visibility = node.role_visibility,
+    created = node.created,
+    public = (channel.public AND NOT channel.deleted)
+FROM contentcuration_contentnode AS node
+LEFT OUTER JOIN contentcuration_language AS language ON language.id = node.language_id,
+contentcuration_channel AS channel
+WHERE node.id = fts.contentnode_id AND channel.id = fts.channel_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('search', '0003_fulltextsearch'),
+    ]
+
+    operations = [
+        BtreeGinExtension(),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='kind_id',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='language_code',
+            field=models.CharField(blank=True, max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='license_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='role_visibility',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='created',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentnodefulltextsearch',
+            name='public',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunSQL(BACKFILL_FILTER_FIELDS_SQL, reverse_sql=migrations.RunSQL.noop),
+        AddIndexConcurrently(
+            model_name='contentnodefulltextsearch',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['public', 'keywords_tsvector'], name='node_public_keywords__gin_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='contentnodefulltextsearch',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['channel', 'keywords_tsvector'], name='node_channel_keywords__gin_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='contentnodefulltextsearch',
+            index=models.Index(fields=['public', 'kind_id', 'created'], name='node_public_kind_created_idx'),
+        ),
+    ]
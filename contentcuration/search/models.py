@@ -37,9 +37,26 @@ class ContentNodeFullTextSearch(models.Model):
     # This stores the author as tsvector.
     author_tsvector = SearchVectorField(null=True, blank=True)
 
+    # Copies of the fields of the contentnode that searches are filtered by, so that filtering
+    # doesn't have to join the contentnode table for every row that matches the keywords.
+    kind_id = models.CharField(max_length=200, null=True, blank=True)
+    language_code = models.CharField(max_length=3, null=True, blank=True)
+    license_id = models.IntegerField(null=True, blank=True)
+    role_visibility = models.CharField(max_length=50, null=True, blank=True)
+    created = models.DateTimeField(null=True, blank=True)
+
+    # Whether the channel is public and not deleted, kept up to date as the channel changes.
+    public = models.BooleanField(default=False)
+
     class Meta:
         indexes = [GinIndex(fields=["keywords_tsvector"], name="node_keywords_tsv__gin_idx"),
-                   GinIndex(fields=["author_tsvector"], name="node_author_tsv__gin_idx")]
+                   GinIndex(fields=["author_tsvector"], name="node_author_tsv__gin_idx"),
+                   # Composite indexes (through btree_gin) for keyword searches across public channels,
+                   # and inside a list of channels, which are the vast majority of searches.
+                   GinIndex(fields=["public", "keywords_tsvector"], name="node_public_keywords__gin_idx"),
+                   GinIndex(fields=["channel", "keywords_tsvector"], name="node_channel_keywords__gin_idx"),
+                   # For searches across public channels by filters alone.
+                   models.Index(fields=["public", "kind_id", "created"], name="node_public_kind_created_idx")]
 
 
 class ChannelFullTextSearch(models.Model):
@@ -0,0 +1,97 @@
+from __future__ import absolute_import
+
+from search.indexing import queue_contentnode_tsvector_updates
+from search.indexing import update_contentnode_tsvectors
+from search.indexing import update_queued_contentnode_tsvectors
+from search.models import ContentNodeFullTextSearch
+from search.utils import get_fts_search_query
+
+from contentcuration.models import ContentNode
+from contentcuration.tests import testdata
+from contentcuration.tests.base import StudioAPITestCase
+from contentcuration.tests.viewsets.base import generate_update_event
+from contentcuration.tests.viewsets.base import SyncTestMixin
+from contentcuration.viewsets.sync.constants import CONTENTNODE
+
+
+class SearchIndexingTestCase(SyncTestMixin, StudioAPITestCase):
+    def setUp(self):
+        super(SearchIndexingTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+        self.client.force_authenticate(user=self.user)
+        self.node = self.channel.main_tree.get_descendants().exclude(kind_id="topic").first()
+        self.node.complete = True
+        self.node.save()
+
+    def _is_indexed(self, node_id, keywords):
+        return ContentNodeFullTextSearch.objects.filter(
+            contentnode_id=node_id, keywords_tsvector=get_fts_search_query(keywords)
+        ).exists()
+
+    def test_update_contentnode_tsvectors(self):
+        self.node.title = "Photosynthesis"
+        self.node.save()
+        self.assertEqual(update_contentnode_tsvectors(self.channel.id, [self.node.id]), 1)
+        self.assertTrue(self._is_indexed(self.node.id, "photosynthesis"))
+
+        ContentNode.objects.filter(pk=self.node.id).update(complete=False)
+        self.assertEqual(update_contentnode_tsvectors(self.channel.id, [self.node.id]), 0)
+        self.assertFalse(ContentNodeFullTextSearch.objects.filter(contentnode_id=self.node.id).exists())
+
+    def test_update_subtrees(self):
+        root = self.channel.main_tree
+        root.get_descendants().update(complete=True)
+        update_contentnode_tsvectors(self.channel.id, [], subtree_ids=[root.id])
+        self.assertEqual(
+            ContentNodeFullTextSearch.objects.filter(channel_id=self.channel.id).count(),
+            root.get_descendants(include_self=True).filter(complete=True).count(),
+        )
+
+        topic = root.get_descendants().filter(kind_id="topic").first()
+        topic.move_to(self.channel.trash_tree, "last-child")
+        update_contentnode_tsvectors(self.channel.id, [], subtree_ids=[topic.id])
+        self.assertFalse(
+            ContentNodeFullTextSearch.objects.filter(
+                contentnode__tree_id=self.channel.trash_tree.tree_id
+            ).exists()
+        )
+
+    def test_queued_updates(self):
+        self.node.title = "Photosynthesis"
+        self.node.save()
+        queue_contentnode_tsvector_updates(self.channel.id, node_ids=[self.node.id])
+        self.assertFalse(self._is_indexed(self.node.id, "photosynthesis"))
+        self.assertEqual(update_queued_contentnode_tsvectors(self.channel.id), 1)
+        self.assertTrue(self._is_indexed(self.node.id, "photosynthesis"))
+        self.assertEqual(update_queued_contentnode_tsvectors(self.channel.id), 0)
+
+    def test_updated_by_changes(self):
+        response = self.sync_changes(
+            [generate_update_event(self.node.id, CONTENTNODE, {"title": "Photosynthesis"}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(self._is_indexed(self.node.id, "photosynthesis"))
+
+        response = self.sync_changes(
+            [generate_update_event(self.node.id, CONTENTNODE, {"tags.chlorophyll": True}, channel_id=self.channel.id)]
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(self._is_indexed(self.node.id, "chlorophyll"))
+
+    def test_sets_filter_fields(self):
+        self.channel.public = True
+        self.channel.save()
+        update_contentnode_tsvectors(self.channel.id, [self.node.id])
+        row = ContentNodeFullTextSearch.objects.get(contentnode_id=self.node.id)
+        self.assertEqual(row.kind_id, self.node.kind_id)
+        self.assertEqual(row.license_id, self.node.license_id)
+        self.assertEqual(row.role_visibility, self.node.role_visibility)
+        self.assertEqual(row.created, self.node.created)
+        self.assertTrue(row.public)
+
+        self.channel.public = False
+        self.channel.save()
+        row.refresh_from_db()
+        self.assertFalse(row.public)
@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
+import mock
 from django.urls import reverse
+from search.models import ContentNodeFullTextSearch
+from search.viewsets.contentnode import SearchPaginator
 
 from contentcuration.models import Channel
 from contentcuration.models import ContentNode
@@ -110,3 +113,47 @@ class SearchViewsetTestCase(StudioAPITestCase):
                 self.assertEqual(result["id"], editable_video_node.id)
             elif channel_list == "view":
                 self.assertEqual(result["id"], viewable_video_node.id)
+
+    def test_filter_kinds(self):
+        kind = ContentNodeFullTextSearch.objects.filter(channel_id=self.channel.id).values_list("kind_id", flat=True).first()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse("search-list"), data={"channel_list": "edit", "kinds": kind}, format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(response.data["results"], [])
+        self.assertTrue(all(result["kind__kind"] == kind for result in response.data["results"]))
+
+    def test_filter_channels_by_public(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            reverse("search-list"), data={"channel_list": "public"}, format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["results"], [])
+
+        self.channel.public = True
+        self.channel.save()
+        response = self.client.get(
+            reverse("search-list"), data={"channel_list": "public"}, format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(response.data["results"], [])
+
+        self.channel.deleted = True
+        self.channel.save()
+        response = self.client.get(
+            reverse("search-list"), data={"channel_list": "public"}, format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["results"], [])
+
+    def test_bounded_count(self):
+        self.client.force_authenticate(user=self.user)
+        with mock.patch.object(SearchPaginator, "max_count", 2):
+            response = self.client.get(
+                reverse("search-list"), data={"channel_list": "edit", "page_size": 1}, format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(response.data["total_pages"], 2)
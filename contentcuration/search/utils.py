@@ -3,6 +3,7 @@ from django.contrib.postgres.search import SearchQuery
 from django.db.models import Value
 from search.constants import CHANNEL_KEYWORDS_TSVECTOR
 from search.constants import CONTENTNODE_AUTHOR_TSVECTOR
+from search.constants import CONTENTNODE_FILTER_FIELDS
 from search.constants import CONTENTNODE_KEYWORDS_TSVECTOR
 from search.constants import POSTGRES_FTS_CONFIG
 
@@ -28,6 +29,23 @@ def get_fts_annotated_contentnode_qs(channel_id):
     )
 
 
+def get_fts_filter_fields(node):
+    """
+    Returns the values of the filter fields of a search table row from the values of a node,
+    as returned by `.values(*CONTENTNODE_FILTER_FIELDS.values())`.
+    """
+    return {field: node[lookup] for field, lookup in CONTENTNODE_FILTER_FIELDS.items()}
+
+
+def is_channel_public(channel_id):
+    """
+    Returns whether the nodes of a channel should be found by searches across public channels.
+    """
+    from contentcuration.models import Channel
+
+    return Channel.objects.filter(pk=channel_id, public=True, deleted=False).exists()
+
+
 def get_fts_annotated_channel_qs():
     """
     Returns a `Channel` queryset annotated with fields required for full text search.
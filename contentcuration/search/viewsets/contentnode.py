@@ -1,5 +1,6 @@
 import re
 
+from django.core.paginator import Paginator
 from django.db.models import ExpressionWrapper
 from django.db.models import F
 from django.db.models import IntegerField
@@ -7,6 +8,7 @@ from django.db.models import OuterRef
 from django.db.models import Subquery
 from django.db.models import Value
 from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django_filters.rest_framework import BooleanFilter
 from django_filters.rest_framework import CharFilter
 from le_utils.constants import content_kinds
@@ -18,6 +20,7 @@ from search.utils import get_fts_search_query
 from contentcuration.models import Channel
 from contentcuration.models import File
 from contentcuration.utils.pagination import ValuesViewsetPageNumberPagination
+from contentcuration.utils.pagination import ValuesViewsetPaginator
 from contentcuration.viewsets.base import ReadOnlyValuesViewset
 from contentcuration.viewsets.base import RequiredFilterSet
 from contentcuration.viewsets.common import NotNullMapArrayAgg
@@ -25,7 +28,27 @@ from contentcuration.viewsets.common import UUIDFilter
 from contentcuration.viewsets.common import UUIDInFilter
 
 
+class SearchPaginator(ValuesViewsetPaginator):
+    """
+    Paginates search results without counting all of their matches, which for searches across
+    all public channels can be a large part of the search table, by counting up to `max_count`.
+    """
+
+    max_count = 1000
+
+    def __init__(self, object_list, *args, **kwargs):
+        self.queryset = object_list
+        # Every node has a single search row, and filtering the rows doesn't join any other tables,
+        # so unlike the results of other values viewsets, they don't have to be made distinct
+        Paginator.__init__(self, object_list.values_list("pk", flat=True), *args, **kwargs)
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.max_count].count()
+
+
 class ListPagination(ValuesViewsetPageNumberPagination):
+    django_paginator_class = SearchPaginator
     page_size = 25
     page_size_query_param = "page_size"
     max_page_size = 100
@@ -47,18 +70,20 @@ class ContentNodeFilter(RequiredFilterSet):
 
     def filter_channel_list(self, queryset, name, value):
         user = not self.request.user.is_anonymous and self.request.user
-        channel_ids = []
 
         if value == "public":
-            channel_ids = Channel.get_public_channels().values_list("id", flat=True)
-        elif value == "edit" and user:
-            channel_ids = user.editable_channels.filter(deleted=False).values_list("id", flat=True)
+            return queryset.filter(public=True)
+
+        if value == "edit" and user:
+            channels = user.editable_channels
         elif value == "bookmark" and user:
-            channel_ids = user.bookmarked_channels.filter(deleted=False).values_list("id", flat=True)
+            channels = user.bookmarked_channels
         elif value == "view" and user:
-            channel_ids = user.view_only_channels.filter(deleted=False).values_list("id", flat=True)
+            channels = user.view_only_channels
+        else:
+            return queryset.none()
 
-        return queryset.filter(channel_id__in=list(channel_ids))
+        return queryset.filter(channel_id__in=channels.filter(deleted=False).values_list("id", flat=True))
 
     def filter_keywords(self, queryset, name, value):
         return queryset.filter(keywords_tsvector=get_fts_search_query(value))
@@ -67,30 +92,30 @@ class ContentNodeFilter(RequiredFilterSet):
         return queryset.filter(author_tsvector=get_fts_search_query(value))
 
     def filter_languages(self, queryset, name, value):
-        return queryset.filter(contentnode__language__lang_code__in=value.split(","))
+        return queryset.filter(language_code__in=value.split(","))
 
     def filter_licenses(self, queryset, name, value):
         licenses = [int(li) for li in value.split(",")]
-        return queryset.filter(contentnode__license__in=licenses)
+        return queryset.filter(license_id__in=licenses)
 
     def filter_kinds(self, queryset, name, value):
-        return queryset.filter(contentnode__kind_id__in=value.split(","))
+        return queryset.filter(kind_id__in=value.split(","))
 
     def filter_coach(self, queryset, name, value):
-        return queryset.filter(contentnode__role_visibility=roles.COACH)
+        return queryset.filter(role_visibility=roles.COACH)
 
     def filter_resources(self, queryset, name, value):
-        return queryset.exclude(contentnode__kind_id=content_kinds.TOPIC)
+        return queryset.exclude(kind_id=content_kinds.TOPIC)
 
     def filter_assessments(self, queryset, name, value):
-        return queryset.filter(contentnode__kind_id=content_kinds.EXERCISE)
+        return queryset.filter(kind_id=content_kinds.EXERCISE)
 
     def filter_created_after(self, queryset, name, value):
         date = re.search(r"(\d{4})-0?(\d+)-(\d+)", value)
         return queryset.filter(
-            contentnode__created__year__gte=date.group(1),
-            contentnode__created__month__gte=date.group(2),
-            contentnode__created__day__gte=date.group(3),
+            created__year__gte=date.group(1),
+            created__month__gte=date.group(2),
+            created__day__gte=date.group(3),
         )
 
 
@@ -108,7 +133,7 @@ class SearchContentNodeViewSet(ReadOnlyValuesViewset):
         "description": "contentnode__description",
         "author": "contentnode__author",
         "provider": "contentnode__provider",
-        "kind__kind": "contentnode__kind__kind",
+        "kind__kind": "kind_id",
         "thumbnail_encoding": "contentnode__thumbnail_encoding",
         "published": "contentnode__published",
         "modified": "contentnode__modified",
@@ -124,7 +149,7 @@ class SearchContentNodeViewSet(ReadOnlyValuesViewset):
         "contentnode__description",
         "contentnode__author",
         "contentnode__provider",
-        "contentnode__kind__kind",
+        "kind_id",
         "contentnode__thumbnail_encoding",
         "contentnode__published",
         "contentnode__modified",
@@ -154,11 +179,7 @@ class SearchContentNodeViewSet(ReadOnlyValuesViewset):
                     "name"
                 )[:1]
             ),
-            Subquery(
-                Channel.objects.filter(main_tree__tree_id=OuterRef("contentnode__tree_id")).values(
-                    "name"
-                )[:1]
-            ),
+            F("channel__name"),
         )
 
         queryset = queryset.annotate(